@@ -0,0 +1,111 @@
+"""
+Бенчмарк: количество SQL-выражений на одно сообщение при учете статистики
+
+Сравнивает старую схему increment_user_message_count/increment_message_count
+(COUNT, SELECT, затем UPDATE или INSERT) с текущей реализацией Database
+на основе INSERT ... ON CONFLICT DO UPDATE.
+
+Запуск из корня проекта:
+    python benchmarks/stats_upsert.py [сообщений] [пользователей]
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("BASE_PATH", tempfile.mkdtemp(prefix="pixel_bench_"))
+
+from databases.database import Database  # noqa: E402
+from databases.connection_pool import close_all_pools  # noqa: E402
+
+# Служебные выражения потока-писателя (транзакции и точки сохранения)
+SERVICE_PREFIXES = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA")
+
+
+def _legacy_increment(db, chat_id, user_id, date):
+    """Последовательность выражений старой реализации (без дубликатов в таблице)"""
+    row = db.execute("SELECT message_count FROM daily_stats WHERE chat_id = ? AND date = ?",
+                     (chat_id, date)).fetchone()
+    if row:
+        db.execute("UPDATE daily_stats SET message_count = message_count + 1 WHERE chat_id = ? AND date = ?",
+                   (chat_id, date))
+    else:
+        db.execute("INSERT INTO daily_stats (chat_id, date, message_count) VALUES (?, ?, 1)", (chat_id, date))
+    db.commit()
+
+    record_count = db.execute("SELECT COUNT(*) FROM user_daily_stats WHERE chat_id = ? AND user_id = ? AND date = ?",
+                              (chat_id, user_id, date)).fetchone()[0]
+    if record_count == 1:
+        row = db.execute("SELECT message_count FROM user_daily_stats WHERE chat_id = ? AND user_id = ? AND date = ?",
+                         (chat_id, user_id, date)).fetchone()
+        db.execute("""UPDATE user_daily_stats SET message_count = ?, username = ?, first_name = ?, last_name = ?
+                      WHERE chat_id = ? AND user_id = ? AND date = ?""",
+                   (row[0] + 1, "u", "f", None, chat_id, user_id, date))
+    else:
+        db.execute("""INSERT INTO user_daily_stats (chat_id, user_id, date, message_count, username, first_name, last_name)
+                      VALUES (?, ?, ?, 1, ?, ?, ?)""", (chat_id, user_id, date, "u", "f", None))
+    db.commit()
+
+
+def bench_legacy(path, messages, users):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    counter = [0]
+    conn.set_trace_callback(lambda sql: counter.__setitem__(0, counter[0] + (not sql.lstrip().upper().startswith(SERVICE_PREFIXES))))
+    started = time.perf_counter()
+    for i in range(messages):
+        _legacy_increment(conn, -100, i % users, "2025-01-01")
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return counter[0], elapsed
+
+
+async def bench_upsert(path, messages, users):
+    database = Database(path)
+    await database.init_db()
+    # Прогрев, чтобы открылись соединение потока-писателя и пула
+    await database.increment_message_count(-1, "2000-01-01")
+
+    counter = [0]
+    for conn in database._pool._connections:
+        conn.set_trace_callback(lambda sql: counter.__setitem__(0, counter[0] + (not sql.lstrip().upper().startswith(SERVICE_PREFIXES))))
+
+    async def one(i):
+        await database.increment_message_count(-100, "2025-01-01")
+        await database.increment_user_message_count(-100, i % users, "u", "f", None, date="2025-01-01")
+
+    # Сообщения приходят параллельно из разных апдейтов - писатель группирует их в транзакции
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    elapsed = time.perf_counter() - started
+    return counter[0], elapsed
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    workdir = Path(tempfile.mkdtemp(prefix="pixel_bench_"))
+
+    upsert_path = str(workdir / "upsert.db")
+    upsert_statements, upsert_time = asyncio.run(bench_upsert(upsert_path, messages, users))
+    close_all_pools()
+
+    # Старая схема на той же структуре таблиц, но без уникальных индексов
+    legacy_path = str(workdir / "legacy.db")
+    with sqlite3.connect(upsert_path) as src, sqlite3.connect(legacy_path) as dst:
+        for (sql,) in src.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name IN ('daily_stats', 'user_daily_stats')"):
+            dst.execute(sql)
+    legacy_statements, legacy_time = bench_legacy(legacy_path, messages, users)
+
+    print(f"Сообщений: {messages}, пользователей: {users}")
+    print(f"{'':<10}{'выражений/сообщ.':>18}{'мкс/сообщ.':>14}")
+    print(f"{'до':<10}{legacy_statements / messages:>18.2f}{legacy_time / messages * 1e6:>14.1f}")
+    print(f"{'после':<10}{upsert_statements / messages:>18.2f}{upsert_time / messages * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Бенчмарк: поиск похожих сообщений в защите от рейдов
+
+Моделирует чат с обычной перепиской и рейдом, где несколько аккаунтов
+шлют вариации одного текста. Сравнивает LSH-индекс utils.text_similarity
+с попарным сравнением SequenceMatcher по окну: время проверки одного
+сообщения, доля найденных сообщений рейда и ложные срабатывания.
+
+Запуск из корня проекта:
+    python benchmarks/text_similarity.py [сообщений в минуту] [минут]
+"""
+import random
+import statistics
+import sys
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from raid_protection import RaidProtection  # noqa: E402
+from utils.text_similarity import TextSimilarityIndex  # noqa: E402
+
+WINDOW = 30
+THRESHOLD = 0.7
+# Сколько сообщений проверять попарным методом (он квадратичный по окну)
+NAIVE_SAMPLE = 300
+
+WORDS = (
+    "привет как дела что нового сегодня вечером будет стрим кто идет играть "
+    "скинь ссылку на видео я думаю это хорошая идея давайте обсудим завтра "
+    "погода отличная купил новый телефон посмотрите мем смешно очень согласен"
+).split()
+
+RAID_TEXT = "Заходите в наш канал, там раздают бесплатные подписки и призы каждый день"
+
+
+def normal_message(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+
+
+def raid_message(rng: random.Random) -> str:
+    """Вариация текста рейда: замена пары символов, эмодзи и суффикс"""
+    chars = list(RAID_TEXT)
+    for _ in range(2):
+        chars[rng.randrange(len(chars))] = rng.choice("аеоиxyz ")
+    return "".join(chars) + rng.choice(["", " 🔥", "!!!", f" #{rng.randint(1, 99)}"])
+
+
+def build_stream(per_minute: int, minutes: int, seed: int = 7):
+    """(время, user_id, текст, это рейд) с рейдом в середине"""
+    rng = random.Random(seed)
+    total = per_minute * minutes
+    raid_start, raid_end = total // 2, total // 2 + per_minute // 10
+    stream = []
+    for i in range(total):
+        ts = 1_000_000 + i * 60 / per_minute
+        if raid_start <= i < raid_end:
+            stream.append((ts, 10_000 + rng.randrange(50), raid_message(rng), True))
+        else:
+            stream.append((ts, rng.randrange(500), normal_message(rng), False))
+    return stream
+
+
+def bench_lsh(stream, normalize):
+    index = TextSimilarityIndex()
+    timings, found, false_hits = [], 0, 0
+    for ts, user_id, text, is_raid in stream:
+        normalized = normalize(text)
+        started = time.perf_counter()
+        similar = index.check_and_add(-100, user_id, normalized, WINDOW, THRESHOLD, now=ts)
+        timings.append(time.perf_counter() - started)
+        hit = similar.total > 0
+        if is_raid:
+            found += hit
+        elif hit and similar.other_users and len(normalized) >= 24:
+            false_hits += 1
+    return timings, found, false_hits
+
+
+def bench_naive(stream, normalize):
+    """Попарное сравнение с сообщениями окна (как пришлось бы делать через SequenceMatcher)"""
+    window, timings = [], []
+    for ts, user_id, text, _ in stream[:NAIVE_SAMPLE]:
+        normalized = normalize(text)
+        started = time.perf_counter()
+        window = [(t, s) for t, s in window if t >= ts - WINDOW]
+        any(SequenceMatcher(None, normalized, s).ratio() >= THRESHOLD for _, s in window)
+        window.append((ts, normalized))
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"{name:<18} среднее {statistics.mean(timings) * 1e6:8.1f} мкс   p99 {p99 * 1e6:8.1f} мкс")
+
+
+def main():
+    per_minute = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    minutes = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    normalize = RaidProtection()._normalize_text
+    stream = build_stream(per_minute, minutes)
+    raid_total = sum(1 for item in stream if item[3])
+
+    print(f"Сообщений: {len(stream)} ({per_minute}/мин, окно {WINDOW} сек, порог {THRESHOLD}), "
+          f"из них рейд: {raid_total}")
+    timings, found, false_hits = bench_lsh(stream, normalize)
+    report("LSH-индекс", timings)
+    naive = bench_naive(stream, normalize)
+    report("SequenceMatcher", naive)
+    print(f"Найдено похожих для сообщений рейда: {found}/{raid_total} (у первого пары еще нет)")
+    print(f"Ложные совпадения между пользователями в обычной переписке: {false_hits}")
+
+
+if __name__ == "__main__":
+    main()
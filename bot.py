@@ -32,6 +32,20 @@ from databases.reputation_db import reputation_db
 from databases.network_db import network_db
 from databases.raid_protection_db import raid_protection_db
 from databases.utilities_db import utilities_db
+from databases.broadcast_db import broadcast_db
+from databases.connection_pool import close_all_pools, get_all_pool_stats
+from databases.settings_cache import chat_settings_cache
+from databases.rank_cache import rank_cache
+from utils.member_cache import member_cache, MemberCacheRequestMiddleware
+from utils.rate_limiter import api_rate_limiter, RateLimitRequestMiddleware
+from utils.chat_refresh import chat_refresh
+from utils.raid_windows import raid_windows
+from utils.raid_lockdown import raid_lockdown
+from utils.join_rate import join_rate
+from utils.render_service import render_service
+from utils.font_registry import font_registry
+from utils.avatar_cache import avatar_cache
+from utils.chart_cache import chart_cache
 from raid_protection import raid_protection
 from scheduler import TaskScheduler
 from utils.notifications import (
@@ -41,6 +55,7 @@ from utils.notifications import (
     set_bot_instance as set_notifications_bot
 )
 from utils.permissions import set_bot_instance as set_permissions_bot
+from middleware.update_context import update_context_middleware
 from middleware.settings_guard import SettingsGuardMiddleware
 from middleware.command_spam import CommandSpamMiddleware
 from middleware.auto_spam_detection import AutoSpamDetectionMiddleware
@@ -69,6 +84,8 @@ if not BOT_TOKEN:
     )
 
 bot = Bot(token=BOT_TOKEN)
+bot.session.middleware(MemberCacheRequestMiddleware())
+bot.session.middleware(RateLimitRequestMiddleware(api_rate_limiter))
 dp = Dispatcher()
 
 scheduler = TaskScheduler(bot_instance=bot)
@@ -78,6 +95,9 @@ shutdown_event = asyncio.Event()
 set_notifications_bot(bot)
 set_permissions_bot(bot)
 
+# UpdateContextMiddleware - первым: остальные middleware и обработчики берут из него update_context
+dp.message.outer_middleware(update_context_middleware)
+dp.callback_query.outer_middleware(update_context_middleware)
 dp.callback_query.middleware(SettingsGuardMiddleware())
 dp.message.outer_middleware(AutoSpamDetectionMiddleware())
 dp.message.outer_middleware(CommandSpamMiddleware())
@@ -171,6 +191,16 @@ async def main(test_mode: bool = False):
     setup_signal_handlers()
     
     try:
+        # Шрифт ищется один раз, процессы рендеринга получают найденный путь при fork
+        font_path = font_registry.resolve()
+        if font_path:
+            logger.info(f"Шрифт графиков: {font_path}")
+        # Процессы рендеринга создаются до открытия пулов БД и фоновых потоков
+        render_service.start()
+        restored_avatars = avatar_cache.restore()
+        if restored_avatars:
+            logger.info(f"Восстановлено записей кэша аватарок: {restored_avatars}")
+        
         await db.init_db()
         
         logger.info("Проверка целостности базы данных...")
@@ -191,12 +221,22 @@ async def main(test_mode: bool = False):
         await network_db.init_db()
         await raid_protection_db.init_db()
         await utilities_db.init_db()
+        await broadcast_db.init_db()
         logger.info("Базы данных инициализированы")
         
         from utils.gifs import init_gifs_settings_file
         init_gifs_settings_file()
         
         raid_protection.set_bot(bot)
+        restored_windows = raid_windows.restore()
+        if restored_windows:
+            logger.info(f"Восстановлено окон активности защиты от рейдов: {restored_windows}")
+        restored_rates = join_rate.restore()
+        if restored_rates:
+            logger.info(f"Восстановлено базовых уровней входов и сообщений: {restored_rates}")
+        resumed_lockdowns = await raid_lockdown.resume()
+        if resumed_lockdowns:
+            logger.info(f"Возобновлено локдаунов чатов: {resumed_lockdowns}")
         logger.info("Система защиты от рейдов инициализирована")
         
         await db.cleanup_duplicate_chats()
@@ -204,12 +244,12 @@ async def main(test_mode: bool = False):
         
         await db.cleanup_old_stats(90)
         await db.cleanup_old_user_stats(90)
+        await db.compact_hourly_stats()
         logger.info("Старые записи статистики очищены")
         
         expired_count = await moderation_db.cleanup_expired_punishments()
         logger.info(f"Очищено {expired_count} истекших наказаний")
         
-        await raid_protection_db.cleanup_old_activity(1)
         await raid_protection_db.cleanup_old_joins(2)
         await raid_protection_db.cleanup_old_deleted_messages(5)
         logger.info("Старые записи защиты от рейдов очищены")
@@ -273,6 +313,100 @@ async def main(test_mode: bool = False):
             except Exception as e:
                 logger.debug(f"Ошибка при закрытии сессии бота: {e}")
             
+            # Записываем накопленную статистику сообщений до закрытия пулов
+            try:
+                flushed = await db.flush_message_stats()
+                if flushed:
+                    logger.info(f"Записано {flushed} сообщений статистики из буфера")
+            except Exception as e:
+                logger.error(f"Ошибка при записи статистики сообщений: {e}")
+            
+            pool_stats = get_all_pool_stats()
+            context_stats = update_context_middleware.get_stats()
+            if context_stats['contexts']:
+                total_queries = sum(stats['total_tasks'] for stats in pool_stats)
+                logger.info(
+                    f"Контекст обновлений: {context_stats['contexts']} обновлений, "
+                    f"запросов к БД на обновление {total_queries / context_stats['contexts']:.2f}; "
+                    f"ранг загружен {context_stats['rank_loads']}, переиспользован {context_stats['rank_reuses']}; "
+                    f"муты загружены {context_stats['mute_loads']}, переиспользованы {context_stats['mute_reuses']}"
+                )
+            for stats in pool_stats:
+                logger.info(
+                    f"Пул БД {stats['db_path']}: соединений {stats['open_connections']}/{stats['max_connections']}, "
+                    f"запросов {stats['total_tasks']}, ожидание avg {stats['avg_wait_ms']:.2f} мс / max {stats['max_wait_ms']:.2f} мс, "
+                    f"записей {stats['writes_total']} в {stats['write_batches']} транзакциях"
+                )
+            cache_stats = chat_settings_cache.get_stats()
+            logger.info(
+                f"Кэш настроек чатов: {cache_stats['size']}/{cache_stats['max_size']} чатов, "
+                f"попаданий {cache_stats['hits']}, промахов {cache_stats['misses']} "
+                f"(hit rate {cache_stats['hit_rate']:.1%}), вытеснений {cache_stats['evictions']}"
+            )
+            rank_stats = rank_cache.get_stats()
+            logger.info(
+                f"Кэш рангов: {rank_stats['ranks']} рангов (hit rate {rank_stats['rank_hit_rate']:.1%}), "
+                f"{rank_stats['chats_with_permissions']} карт прав (hit rate {rank_stats['permission_hit_rate']:.1%})"
+            )
+            member_stats = member_cache.get_stats()
+            logger.info(
+                f"Кэш участников: {member_stats['size']} записей, сэкономлено запросов get_chat_member "
+                f"{member_stats['hits']} из {member_stats['hits'] + member_stats['api_calls']} "
+                f"({member_stats['saved_ratio']:.1%}), обновлений из событий {member_stats['event_updates']}"
+            )
+            limiter_stats = api_rate_limiter.get_stats()
+            logger.info(
+                "Запросы к Bot API: " + ", ".join(
+                    f"{lane} {stats['requests']} (ожидали {stats['waited']}, "
+                    f"среднее {stats['avg_wait_ms']} мс, макс {stats['max_wait_ms']} мс)"
+                    for lane, stats in limiter_stats['lanes'].items()
+                ) + f"; 429: {limiter_stats['retry_after']}, повторено {limiter_stats['retried']}"
+            )
+            saved_windows = raid_windows.snapshot()
+            logger.info(f"Окна активности защиты от рейдов сохранены: {saved_windows}")
+            saved_rates = join_rate.snapshot()
+            rate_stats = join_rate.get_stats()
+            logger.info(
+                f"Базовые уровни входов сохранены: {saved_rates} моделей, обучено {rate_stats['learned']}, "
+                f"аномалий {rate_stats['anomalies']}"
+            )
+            lockdown_stats = raid_lockdown.get_stats()
+            logger.info(
+                f"Локдауны: включено {lockdown_stats['engaged']}, снято {lockdown_stats['lifted']}, "
+                f"активных {lockdown_stats['active']} (возобновятся при запуске), "
+                f"обработано участников {lockdown_stats['punished']}"
+            )
+            render_stats = render_service.get_stats()
+            logger.info(
+                f"Рендеринг графиков: {render_stats['completed']} из {render_stats['submitted']}, "
+                f"время рендеринга avg {render_stats['avg_render_ms']} мс / max {render_stats['max_render_ms']} мс, "
+                f"ответа avg {render_stats['avg_total_ms']} мс / max {render_stats['max_total_ms']} мс, "
+                f"макс. задач в пуле {render_stats['max_in_flight']}, отказов (пул занят) {render_stats['busy']}, "
+                f"timeout {render_stats['timeouts']}, ошибок {render_stats['failures']}"
+            )
+            render_service.shutdown()
+            chart_stats = chart_cache.get_stats()
+            logger.info(
+                f"Кэш графиков топа: {chart_stats['size']}/{chart_stats['max_size']}, отправлено по file_id "
+                f"{chart_stats['hits']}, нарисовано {chart_stats['misses']} (hit rate {chart_stats['hit_rate']:.1%}), "
+                f"устарело {chart_stats['invalidations']}, отклонено file_id {chart_stats['rejected']}"
+            )
+            saved_avatars = avatar_cache.snapshot()
+            avatar_stats = avatar_cache.get_stats()
+            logger.info(
+                f"Кэш аватарок: индекс сохранен ({saved_avatars} пользователей), миниатюр в памяти "
+                f"{avatar_stats['thumbnails']}; из памяти {avatar_stats['memory_hits']}, с диска {avatar_stats['disk_hits']}, "
+                f"без фото {avatar_stats['negative_hits']}, перепроверок {avatar_stats['revalidations']} "
+                f"(фото не сменилось {avatar_stats['unchanged']}), скачано {avatar_stats['downloads']}, "
+                f"ошибок {avatar_stats['errors']}"
+            )
+            refresh_stats = chat_refresh.get_stats()
+            logger.info(
+                f"Обновление чатов: {refresh_stats['refreshes']} обновлений, "
+                f"без записи в БД {refresh_stats['writes_skipped']}, ожидают по событиям {refresh_stats['dirty']}"
+            )
+            close_all_pools()
+            
             logger.info("✓ Бот остановлен")
         except Exception as e:
             logger.error(f"Ошибка при остановке бота: {e}")
@@ -308,6 +442,7 @@ async def send_notifications_and_exit(notification_type: str):
         except Exception as e:
             logger.debug(f"Ошибка при закрытии соединения: {e}")
         
+        close_all_pools()
         cleanup_pycache()
         
         logger.info("Работа бота завершена")
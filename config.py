@@ -47,6 +47,131 @@ data_dir.mkdir(parents=True, exist_ok=True)
 DATABASE_PATH = str(data_dir / 'pixel_bot.db')
 TIMEZONE_DB_PATH = str(data_dir / 'timezones.db')
 
+# Настройки пула соединений SQLite
+DB_POOL = {
+    'max_connections': int(os.getenv("DB_POOL_MAX_CONNECTIONS", "4")),  # потоков/соединений на файл БД
+    'cached_statements': 256,  # размер кэша подготовленных выражений на соединение
+    'busy_timeout_ms': 30000,  # ожидание блокировки записи
+    'cache_size_kb': 64000,    # 64MB page cache
+    'write_batch_ms': int(os.getenv("DB_WRITE_BATCH_MS", "10")),     # окно сбора пачки записи
+    'write_batch_max': int(os.getenv("DB_WRITE_BATCH_MAX", "200")),  # максимум операций в одной транзакции
+}
+
+# Отложенная запись статистики сообщений
+MESSAGE_STATS = {
+    'flush_interval': int(os.getenv("MESSAGE_STATS_FLUSH_INTERVAL", "5")),  # секунд между сбросами в БД
+    'max_pending_keys': 50000,  # лимит ключей в памяти, при превышении сброс выполняется досрочно
+    'hourly_retention_days': int(os.getenv("MESSAGE_STATS_HOURLY_RETENTION_DAYS", "14")),  # суток хранения почасовых счетчиков
+}
+
+# Кэш настроек чатов (снимок всех настроек чата для горячего пути)
+CHAT_SETTINGS_CACHE = {
+    'max_size': int(os.getenv("CHAT_SETTINGS_CACHE_SIZE", "5000")),  # максимум чатов в кэше (LRU)
+    'ttl': int(os.getenv("CHAT_SETTINGS_CACHE_TTL", "600")),  # секунд до принудительного перечитывания
+}
+
+# Кэш эффективных рангов и прав рангов
+RANK_CACHE = {
+    'ttl': int(os.getenv("RANK_CACHE_TTL", "60")),  # секунд жизни записи
+    'max_size': 20000,  # максимум записей рангов (LRU)
+}
+
+# Кэш статусов участников чатов (get_chat_member)
+MEMBER_CACHE = {
+    'ttl': int(os.getenv("MEMBER_CACHE_TTL", "300")),  # секунд жизни записи без обновлений chat_member
+    'max_size': 50000,  # максимум записей (LRU)
+}
+
+# Лимиты исходящих запросов к Bot API (utils/rate_limiter.py)
+RATE_LIMITS = {
+    'global_per_second': float(os.getenv("API_RATE_GLOBAL_PER_SECOND", "30")),  # все запросы бота
+    'group_per_minute': float(os.getenv("API_RATE_GROUP_PER_MINUTE", "20")),  # сообщений в одну группу
+    'group_burst': 10,  # сообщений в группу подряд без ожидания
+    'private_per_second': 1,  # сообщений в один личный чат
+    'private_burst': 3,
+    'max_retries': 3,  # автоматических повторов после 429
+    'max_retry_wait': 60,  # retry_after больше этого (сек) не ждем, а пробрасываем ошибку
+}
+
+# Рассылки уведомлений во все чаты (utils/broadcast.py)
+BROADCAST = {
+    'concurrency': int(os.getenv("BROADCAST_CONCURRENCY", "30")),  # параллельных отправок (темп задает RATE_LIMITS)
+    'resume_hours': 6,  # незавершенная рассылка того же текста младше этого продолжается
+    'max_attempts': 3,  # попыток отправки в чат при 429 и сетевых ошибках
+    'retention_days': 30,  # хранение истории доставки
+}
+
+# Фоновое обновление информации о чатах (utils/chat_refresh.py)
+CHAT_REFRESH = {
+    'api_calls_per_minute': int(os.getenv("CHAT_REFRESH_API_CALLS_PER_MINUTE", "60")),  # бюджет запросов к API
+    'min_interval': 600,  # секунд между обновлениями чата без событий
+    'max_age': 21600,  # условный возраст чата, не обновлявшегося с запуска
+}
+
+# Окна активности защиты от рейдов в памяти (utils/raid_windows.py)
+RAID_WINDOWS = {
+    'max_events': 64,  # событий в окне (чат, пользователь, тип)
+    'idle_seconds': 600,  # окно без событий дольше этого удаляется
+    'purge_seconds': 0,  # при рейде удалять сообщения участника не только за окно правила, но и за это время
+    'snapshot_path': str(data_dir / 'raid_windows.json'),  # сохранение окон между перезапусками
+}
+
+# Обученные базовые уровни входов и сообщений по чатам (utils/join_rate.py)
+JOIN_RATE = {
+    'bucket_seconds': 60,  # корзина подсчета событий
+    'baseline_minutes': 360,  # период сглаживания базового уровня (EWMA)
+    'warmup_minutes': 60,  # до этого действует фиксированный mass_join_limit
+    'z_threshold': float(os.getenv("JOIN_RATE_Z_THRESHOLD", "4.0")),  # стандартных отклонений до аномалии
+    'min_joins': 5,  # минимум входов за mass_join_window (не ниже mass_join_limit чата)
+    'long_window': 900,  # длинное окно для медленных рейдов, секунд
+    'long_min_joins': 15,  # минимум входов за длинное окно
+    'idle_days': 7,  # модель чата без событий дольше этого удаляется
+    'snapshot_path': str(data_dir / 'join_rate.json'),  # сохранение моделей между перезапусками
+}
+
+# Локдаун чата при массовом входе (utils/raid_lockdown.py); включается в настройках Анти-Спама
+RAID_LOCKDOWN = {
+    'check_interval': 5,  # секунд между проверками, не пора ли снять локдаун
+    'restrict_hours': int(os.getenv("RAID_LOCKDOWN_RESTRICT_HOURS", "24")),  # ограничение участников рейда
+    'min_persist_step': 30,  # продление локдауна пишется в БД не чаще этого шага, секунд
+}
+
+# Шрифты графиков (utils/font_registry.py)
+FONTS = {
+    'path': os.getenv("FONT_PATH") or None,  # закрепить файл шрифта с кириллицей (иначе поиск при запуске)
+    'cache_size': 32,  # загруженных шрифтов (начертание, размер) в каждом процессе
+}
+
+# Кэш аватарок для графиков топа (utils/avatar_cache.py)
+AVATAR_CACHE = {
+    'directory': str(data_dir / 'avatars'),  # миниатюры <file_unique_id>.png и индекс
+    'ttl_hours': 24,  # фото пользователя перепроверяется не чаще
+    'negative_ttl_hours': 6,  # пользователь без фото перепроверяется не чаще
+    'memory_size': 512,  # миниатюр в памяти
+    'disk_max_age_days': 30,  # миниатюры, не читавшиеся дольше, удаляются
+}
+
+# Формат графиков (utils/image_generator.py): размер загрузки против качества
+CHART_OUTPUT = {
+    'format': os.getenv("CHART_FORMAT", "png"),  # png / webp (без потерь) / jpeg
+    'resolution': os.getenv("CHART_RESOLUTION", "full"),  # full 2880 px / hd 1920 px / compact 1440 px
+    'jpeg_quality': 92,  # качество JPEG (цвет без прореживания)
+    'png_compress_level': 6,  # сжатие PNG 0-9: меньше - быстрее, но больше файл
+}
+
+# Повторная отправка неизменившихся графиков топа по file_id (utils/chart_cache.py)
+CHART_CACHE = {
+    'max_size': 256,  # графиков (чат, период, часовой пояс)
+    'max_age': 3600,  # секунд; старше - график рисуется заново (новые аватарки)
+}
+
+# Рендеринг графиков в пуле процессов (utils/render_service.py)
+RENDER = {
+    'workers': int(os.getenv("RENDER_WORKERS", "2")),  # процессов рендеринга
+    'max_queue': 8,  # задач, ожидающих свободный процесс; сверх этого - ответ текстом
+    'timeout': 20,  # секунд ожидания графика, затем ответ текстом
+}
+
 # Настройки бота
 BOT_NAME = "Pixel" 
 BOT_DESCRIPTION = "Чат-менеджер для управления группами в Telegram"
@@ -61,7 +186,8 @@ RAID_PROTECTION = {
     'duplicate_text_window': 30, # seconds
     'mass_join_limit': 10,    # new members in time window
     'mass_join_window': 60,   # seconds
-    'similarity_threshold': 0.7 # text similarity threshold (0-1)
+    'similarity_threshold': 0.7, # text similarity threshold (0-1)
+    'coordinated_text_limit': 0 # different accounts posting similar text in time window (0 = off, min 5)
 }
 
 # Top Chats Settings Defaults
@@ -0,0 +1,230 @@
+"""
+Состояние рассылок по чатам
+
+Рассылка (utils/broadcast.py) записывает статус доставки в каждый чат, поэтому
+прерванная рассылка того же текста при следующем запуске продолжается
+только по неотправленным чатам.
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from databases.connection_pool import get_pool
+from databases.migrations import apply_migrations
+
+logger = logging.getLogger(__name__)
+
+# Импортируем BASE_PATH из config, если доступен
+try:
+    from config import BASE_PATH
+except ImportError:
+    # Если файл в databases/, то корень проекта на уровень выше
+    BASE_PATH = Path(__file__).parent.parent.absolute()
+
+# Статусы доставки
+STATUS_PENDING = 'pending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+# Бот исключен или чат удален - чат деактивируется
+STATUS_GONE = 'gone'
+
+
+def _migration_initial_schema(db):
+    """Рассылки и статусы доставки по чатам"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            broadcast_key TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            finished_at TEXT,
+            total INTEGER DEFAULT 0
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            broadcast_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            message_id INTEGER,
+            error TEXT,
+            updated_at TEXT,
+            PRIMARY KEY (broadcast_id, chat_id)
+        ) WITHOUT ROWID
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_broadcasts_key ON broadcasts (broadcast_key, finished_at)")
+
+
+# Порядок миграций менять нельзя - только дописывать новые в конец
+MIGRATIONS = [
+    (1, 'Рассылки и статусы доставки', _migration_initial_schema),
+]
+
+
+def broadcast_key(text: str) -> str:
+    """Ключ рассылки: одинаковый текст - та же рассылка"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class BroadcastDatabase:
+    """Класс для работы с состоянием рассылок"""
+
+    def __init__(self, db_path: str = None):
+        if db_path is None:
+            db_path = str(BASE_PATH / 'data' / 'broadcasts.db')
+        self.db_path = db_path
+        # Создаем директорию data если её нет
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._pool = get_pool(self.db_path)
+
+    async def init_db(self):
+        """Инициализация базы данных: применение миграций схемы"""
+        def _init_sync():
+            with self._pool.connect() as db:
+                version = apply_migrations(db, MIGRATIONS, 'broadcasts')
+                logger.info(f"База данных рассылок инициализирована (схема v{version})")
+
+        await self._pool.run(_init_sync)
+
+    async def start_broadcast(self, key: str, chat_ids: List[int],
+                              resume_hours: float) -> Tuple[int, List[int], bool]:
+        """
+        Начать рассылку или продолжить незавершенную с тем же ключом.
+
+        Незавершенная рассылка младше resume_hours продолжается: новые чаты
+        добавляются, уже обработанные пропускаются.
+
+        Returns:
+            (id рассылки, чаты для отправки, продолжена ли прерванная рассылка)
+        """
+        def _start_sync():
+            with self._pool.connect() as db:
+                now = datetime.now()
+                resume_after = (now - timedelta(hours=resume_hours)).isoformat()
+                cursor = db.execute("""
+                    SELECT id FROM broadcasts
+                    WHERE broadcast_key = ? AND finished_at IS NULL AND created_at >= ?
+                    ORDER BY id DESC LIMIT 1
+                """, (key, resume_after))
+                row = cursor.fetchone()
+                resumed = row is not None
+                if resumed:
+                    broadcast_id = row[0]
+                else:
+                    # Старые незавершенные рассылки того же текста больше не продолжаем
+                    db.execute("""
+                        UPDATE broadcasts SET finished_at = ?
+                        WHERE broadcast_key = ? AND finished_at IS NULL
+                    """, (now.isoformat(), key))
+                    cursor = db.execute(
+                        "INSERT INTO broadcasts (broadcast_key, created_at) VALUES (?, ?)",
+                        (key, now.isoformat())
+                    )
+                    broadcast_id = cursor.lastrowid
+
+                db.executemany("""
+                    INSERT OR IGNORE INTO broadcast_deliveries (broadcast_id, chat_id, status)
+                    VALUES (?, ?, 'pending')
+                """, [(broadcast_id, chat_id) for chat_id in chat_ids])
+                db.execute("""
+                    UPDATE broadcasts
+                    SET total = (SELECT COUNT(*) FROM broadcast_deliveries WHERE broadcast_id = ?)
+                    WHERE id = ?
+                """, (broadcast_id, broadcast_id))
+                cursor = db.execute("""
+                    SELECT chat_id FROM broadcast_deliveries
+                    WHERE broadcast_id = ? AND status = 'pending'
+                """, (broadcast_id,))
+                pending = [r[0] for r in cursor.fetchall()]
+                db.commit()
+                return broadcast_id, pending, resumed
+
+        return await self._pool.write(_start_sync)
+
+    async def save_results(self, broadcast_id: int,
+                           results: Iterable[Tuple[int, str, Optional[int], Optional[str]]]) -> bool:
+        """Записать пачку результатов (chat_id, статус, message_id, ошибка) одной транзакцией"""
+        rows = [
+            (status, message_id, error, datetime.now().isoformat(), broadcast_id, chat_id)
+            for chat_id, status, message_id, error in results
+        ]
+        if not rows:
+            return True
+
+        def _save_sync():
+            try:
+                with self._pool.connect() as db:
+                    db.executemany("""
+                        UPDATE broadcast_deliveries
+                        SET status = ?, message_id = ?, error = ?, updated_at = ?
+                        WHERE broadcast_id = ? AND chat_id = ?
+                    """, rows)
+                    db.commit()
+                    return True
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении результатов рассылки {broadcast_id}: {e}")
+                return False
+
+        return await self._pool.write(_save_sync)
+
+    async def finish_broadcast(self, broadcast_id: int) -> bool:
+        """Отметить рассылку завершенной"""
+        def _finish_sync():
+            try:
+                with self._pool.connect() as db:
+                    db.execute(
+                        "UPDATE broadcasts SET finished_at = ? WHERE id = ?",
+                        (datetime.now().isoformat(), broadcast_id)
+                    )
+                    db.commit()
+                    return True
+            except Exception as e:
+                logger.error(f"Ошибка при завершении рассылки {broadcast_id}: {e}")
+                return False
+
+        return await self._pool.write(_finish_sync)
+
+    async def get_broadcast_stats(self, broadcast_id: int) -> Dict[str, int]:
+        """Число чатов по статусам доставки"""
+        def _stats_sync():
+            try:
+                with self._pool.connect() as db:
+                    cursor = db.execute("""
+                        SELECT status, COUNT(*) FROM broadcast_deliveries
+                        WHERE broadcast_id = ? GROUP BY status
+                    """, (broadcast_id,))
+                    return dict(cursor.fetchall())
+            except Exception as e:
+                logger.error(f"Ошибка при получении статистики рассылки {broadcast_id}: {e}")
+                return {}
+
+        return await self._pool.run(_stats_sync)
+
+    async def cleanup_old_broadcasts(self, days_to_keep: int = 30) -> bool:
+        """Удаление завершенных рассылок старше указанного количества дней"""
+        def _cleanup_sync():
+            try:
+                with self._pool.connect() as db:
+                    cutoff = (datetime.now() - timedelta(days=days_to_keep)).isoformat()
+                    db.execute("""
+                        DELETE FROM broadcast_deliveries WHERE broadcast_id IN (
+                            SELECT id FROM broadcasts WHERE finished_at IS NOT NULL AND created_at < ?
+                        )
+                    """, (cutoff,))
+                    db.execute(
+                        "DELETE FROM broadcasts WHERE finished_at IS NOT NULL AND created_at < ?",
+                        (cutoff,)
+                    )
+                    db.commit()
+                    return True
+            except Exception as e:
+                logger.error(f"Ошибка при очистке старых рассылок: {e}")
+                return False
+
+        return await self._pool.write(_cleanup_sync)
+
+
+# Глобальный экземпляр базы данных рассылок
+broadcast_db = BroadcastDatabase()
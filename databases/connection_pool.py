@@ -0,0 +1,452 @@
+"""
+Пул соединений SQLite, общий для всех модулей баз данных
+
+Каждый файл базы данных обслуживается собственным пулом потоков.
+У каждого потока пула есть одно долгоживущее соединение, PRAGMA
+применяются один раз при его создании, а не при каждом запросе.
+
+Все записи в файл проходят через единственный поток-писатель пула:
+операции из очереди выполняются пачками в одной транзакции (group commit),
+а ожидающие их корутины получают результат после фиксации пачки.
+Ошибка операции откатывает только её точку сохранения; если SQLite прервал
+транзакцию целиком, все операции пачки получают WriteBatchAborted.
+"""
+import sqlite3
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Импортируем настройки пула из config, если доступен
+try:
+    from config import DB_POOL
+except ImportError:
+    DB_POOL = {
+        'max_connections': 4,
+        'cached_statements': 256,
+        'busy_timeout_ms': 30000,
+        'cache_size_kb': 64000,
+        'write_batch_ms': 10,
+        'write_batch_max': 200,
+    }
+
+
+class WriteBatchAborted(sqlite3.Error):
+    """Транзакция пачки прервана целиком - ни одна операция пачки не зафиксирована"""
+
+
+class _BatchConnection:
+    """
+    Соединение потока-писателя, которое видят операции записи.
+
+    commit() внутри операции ничего не делает - транзакцию фиксирует писатель
+    после всей пачки. Исключение внутри with или rollback() помечают операцию
+    как неудачную, и писатель откатывает только её точку сохранения.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self.failed = False
+
+    def execute(self, *args):
+        return self._conn.execute(*args)
+
+    def executemany(self, *args):
+        return self._conn.executemany(*args)
+
+    def cursor(self, *args):
+        return self._conn.cursor(*args)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.failed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.failed = True
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений для одного файла базы данных"""
+
+    def __init__(self, db_path: str, max_connections: int = None):
+        self.db_path = db_path
+        self.max_connections = max_connections or DB_POOL.get('max_connections', 4)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Все открытые соединения пула (для закрытия при остановке/восстановлении)
+        self._connections: List[sqlite3.Connection] = []
+        # Поколение соединений: увеличивается при reset(), потоки переподключаются
+        self._generation = 0
+
+        # Поток-писатель и его очередь операций
+        self._write_queue: "queue.Queue" = queue.Queue()
+        self._writer_thread: Optional[threading.Thread] = None
+        self._writer_conn: Optional[_BatchConnection] = None
+        self._write_batch_ms = DB_POOL.get('write_batch_ms', 10)
+        self._write_batch_max = DB_POOL.get('write_batch_max', 200)
+
+        # Метрики
+        self._total_tasks = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._total_exec_time = 0.0
+        self._connections_opened = 0
+        self._writes_total = 0
+        self._writes_failed = 0
+        self._batches_total = 0
+        self._batch_commit_time = 0.0
+        self._max_batch_size = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Ленивое создание пула потоков"""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_connections,
+                        thread_name_prefix=f"sqlite-{Path(self.db_path).stem}"
+                    )
+        return self._executor
+
+    def _open_connection(self, isolation_level: Optional[str] = "") -> sqlite3.Connection:
+        """Открыть новое соединение и применить PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_POOL.get('busy_timeout_ms', 30000) / 1000,
+            cached_statements=DB_POOL.get('cached_statements', 256),
+            check_same_thread=False,
+            isolation_level=isolation_level
+        )
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA cache_size=-{int(DB_POOL.get('cache_size_kb', 64000))}")
+            conn.execute(f"PRAGMA busy_timeout={int(DB_POOL.get('busy_timeout_ms', 30000))}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+        except Exception:
+            pass  # Игнорируем ошибки, если PRAGMA не поддерживается
+
+        with self._lock:
+            self._connections.append(conn)
+            self._connections_opened += 1
+        logger.debug(f"Открыто соединение с {self.db_path} (поток {threading.current_thread().name})")
+        return conn
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Получить соединение текущего потока.
+
+        Соединение не закрывается после использования. Его можно использовать
+        как контекстный менеджер (with pool.connect() as db:) - при выходе
+        транзакция фиксируется или откатывается, как у sqlite3.connect().
+        В потоке-писателе возвращается соединение текущей пачки записи.
+        """
+        if self._writer_thread is not None and threading.current_thread() is self._writer_thread:
+            return self._writer_conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'generation', -1) != self._generation:
+            conn = self._open_connection()
+            self._local.conn = conn
+            self._local.generation = self._generation
+        return conn
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """Выполнить синхронную функцию в потоке пула"""
+        submitted_at = time.perf_counter()
+
+        def _timed():
+            started_at = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                finished_at = time.perf_counter()
+                wait_time = started_at - submitted_at
+                with self._lock:
+                    self._total_tasks += 1
+                    self._total_wait_time += wait_time
+                    self._total_exec_time += finished_at - started_at
+                    if wait_time > self._max_wait_time:
+                        self._max_wait_time = wait_time
+
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), _timed)
+
+    def _ensure_writer(self):
+        """Ленивый запуск потока-писателя (и перезапуск, если поток завершился)"""
+        writer = self._writer_thread
+        if writer is None or not writer.is_alive():
+            with self._lock:
+                writer = self._writer_thread
+                if writer is None or not writer.is_alive():
+                    if writer is not None:
+                        logger.error(f"Поток-писатель {self.db_path} завершился, перезапускаем")
+                        # Соединение погибшего писателя может держать незавершенную транзакцию
+                        self._discard_writer_conn()
+                    self._writer_thread = threading.Thread(
+                        target=self._writer_loop,
+                        name=f"sqlite-writer-{Path(self.db_path).stem}",
+                        daemon=True
+                    )
+                    self._writer_thread.start()
+
+    def submit_write(self, func: Callable[..., Any], *args) -> asyncio.Future:
+        """
+        Поставить операцию записи в очередь писателя.
+
+        Возвращает future, который разрешается результатом func после того,
+        как пачка с этой операцией зафиксирована.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._ensure_writer()
+        self._write_queue.put((func, args, future, loop))
+        return future
+
+    async def write(self, func: Callable[..., Any], *args) -> Any:
+        """Выполнить операцию записи через поток-писатель и дождаться фиксации"""
+        return await self.submit_write(func, *args)
+
+    def _writer_loop(self):
+        """Основной цикл потока-писателя: собирает пачки и фиксирует их одной транзакцией"""
+        generation = None
+        running = True
+        while running:
+            item = self._write_queue.get()
+            if item is None:
+                break
+
+            # Операции, взятые из очереди в текущую пачку
+            taken = [item]
+            batch = []
+            try:
+                if generation != self._generation or self._writer_conn is None:
+                    generation = self._generation
+                    self._writer_conn = _BatchConnection(self._open_connection(isolation_level=None))
+                conn = self._writer_conn._conn
+                conn.execute("BEGIN IMMEDIATE")
+
+                deadline = time.monotonic() + self._write_batch_ms / 1000
+                while True:
+                    batch.append(self._execute_in_batch(conn, item))
+                    if len(batch) >= self._write_batch_max:
+                        break
+                    timeout = deadline - time.monotonic()
+                    try:
+                        item = self._write_queue.get(timeout=timeout) if timeout > 0 else self._write_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        running = False
+                        break
+                    taken.append(item)
+
+                started_at = time.perf_counter()
+                conn.execute("COMMIT")
+            except Exception as e:
+                self._fail_batch(taken, e)
+                continue
+
+            with self._lock:
+                self._batches_total += 1
+                self._writes_total += len(batch)
+                self._writes_failed += sum(1 for _, _, error in batch if error is not None)
+                self._batch_commit_time += time.perf_counter() - started_at
+                if len(batch) > self._max_batch_size:
+                    self._max_batch_size = len(batch)
+
+            for entry, result, error in batch:
+                self._resolve(entry, result=result, error=error)
+
+    def _fail_batch(self, taken: list, error: Exception):
+        """Пачка не зафиксирована: откатить транзакцию и передать ошибку всем её операциям"""
+        logger.error(f"Пачка записи ({len(taken)} операций) в {self.db_path} не зафиксирована: {error}")
+        proxy = self._writer_conn
+        if proxy is not None:
+            try:
+                if proxy._conn.in_transaction:
+                    proxy._conn.execute("ROLLBACK")
+            except Exception as e:
+                # Соединение неработоспособно - следующая пачка откроет новое
+                logger.error(f"Не удалось откатить транзакцию записи в {self.db_path}: {e}")
+                with self._lock:
+                    self._discard_writer_conn()
+        with self._lock:
+            self._writes_total += len(taken)
+            self._writes_failed += len(taken)
+        for entry in taken:
+            self._resolve(entry, error=error)
+
+    def _discard_writer_conn(self):
+        """Закрыть соединение писателя (незавершенная транзакция откатывается). Вызывается под _lock"""
+        proxy = self._writer_conn
+        self._writer_conn = None
+        if proxy is None:
+            return
+        if proxy._conn in self._connections:
+            self._connections.remove(proxy._conn)
+        try:
+            proxy._conn.close()
+        except Exception as e:
+            logger.debug(f"Ошибка при закрытии соединения писателя {self.db_path}: {e}")
+
+    def _execute_in_batch(self, conn: sqlite3.Connection, item):
+        """
+        Выполнить одну операцию пачки внутри собственной точки сохранения.
+
+        Ошибка операции откатывает только её точку сохранения. Если транзакция
+        пачки прервана целиком, выбрасывается WriteBatchAborted.
+        """
+        func, args, _, _ = item
+        proxy = self._writer_conn
+        proxy.failed = False
+        try:
+            conn.execute("SAVEPOINT write_op")
+        except sqlite3.Error as e:
+            self._check_transaction(conn, e)
+            return item, None, e
+        try:
+            result = func(*args)
+        except Exception as e:
+            self._rollback_savepoint(conn, e)
+            return item, None, e
+        if proxy.failed:
+            self._rollback_savepoint(conn, None)
+            return item, result, None
+        try:
+            conn.execute("RELEASE write_op")
+        except sqlite3.Error as e:
+            self._rollback_savepoint(conn, e)
+            return item, None, e
+        return item, result, None
+
+    def _rollback_savepoint(self, conn: sqlite3.Connection, error: Optional[BaseException]):
+        """Откатить изменения неудачной операции, не затрагивая остальную пачку"""
+        try:
+            conn.execute("ROLLBACK TO write_op")
+            conn.execute("RELEASE write_op")
+        except sqlite3.Error as e:
+            # Точки сохранения нет - SQLite откатил транзакцию вместе с предыдущими операциями
+            raise WriteBatchAborted(f"Транзакция пачки записи прервана: {error or e}") from (error or e)
+        self._check_transaction(conn, error)
+
+    @staticmethod
+    def _check_transaction(conn: sqlite3.Connection, error: Optional[BaseException]):
+        """Транзакция пачки должна быть открыта, иначе предыдущие операции пачки потеряны"""
+        if not conn.in_transaction:
+            raise WriteBatchAborted(f"Транзакция пачки записи прервана: {error}") from error
+
+    @staticmethod
+    def _resolve(item, result: Any = None, error: Optional[BaseException] = None):
+        """Передать результат операции в future ожидающей корутины"""
+        _, _, future, loop = item
+
+        def _set():
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        try:
+            loop.call_soon_threadsafe(_set)
+        except RuntimeError:
+            # Цикл событий уже закрыт
+            pass
+
+    def reset(self):
+        """Закрыть все соединения (например, перед заменой файла БД при восстановлении)"""
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+            self._generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.debug(f"Ошибка при закрытии соединения с {self.db_path}: {e}")
+
+    def close(self):
+        """Дождаться записи очереди, остановить потоки пула и закрыть все соединения"""
+        writer = self._writer_thread
+        if writer is not None:
+            self._write_queue.put(None)
+            writer.join()
+            self._writer_thread = None
+            self._writer_conn = None
+        executor = self._executor
+        self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.reset()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики пула: размер и время ожидания свободного потока"""
+        with self._lock:
+            total = self._total_tasks
+            return {
+                'db_path': self.db_path,
+                'max_connections': self.max_connections,
+                'open_connections': len(self._connections),
+                'connections_opened': self._connections_opened,
+                'total_tasks': total,
+                'avg_wait_ms': (self._total_wait_time / total * 1000) if total else 0.0,
+                'max_wait_ms': self._max_wait_time * 1000,
+                'avg_exec_ms': (self._total_exec_time / total * 1000) if total else 0.0,
+                'write_queue_size': self._write_queue.qsize(),
+                'writes_total': self._writes_total,
+                'writes_failed': self._writes_failed,
+                'write_batches': self._batches_total,
+                'avg_batch_size': (self._writes_total / self._batches_total) if self._batches_total else 0.0,
+                'max_batch_size': self._max_batch_size,
+                'avg_commit_ms': (self._batch_commit_time / self._batches_total * 1000) if self._batches_total else 0.0,
+            }
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """Получить общий пул для файла базы данных (один пул на файл)"""
+    key = str(Path(db_path).absolute())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path)
+            _pools[key] = pool
+        return pool
+
+
+def get_all_pool_stats() -> List[Dict[str, Any]]:
+    """Метрики всех пулов"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.get_stats() for pool in pools]
+
+
+def close_all_pools():
+    """Закрыть все пулы (вызывается при остановке бота)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        try:
+            pool.close()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии пула {pool.db_path}: {e}")
@@ -3,25 +3,520 @@
 """
 import sqlite3
 import asyncio
+import json
 import logging
 import os
 import shutil
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, List, Dict, Any
-from config import DATABASE_PATH, DEBUG
+from typing import Optional, List, Dict, Any, Callable, Tuple
+from config import DATABASE_PATH, DEBUG, MESSAGE_STATS
+from databases.connection_pool import get_pool
+from databases.migrations import add_column, apply_migrations
+from databases.rank_cache import rank_cache
+from databases.settings_cache import chat_settings_cache
+from databases.stats_buffer import MessageStatsBuffer
 
 logger = logging.getLogger(__name__)
 
+# Попыток согласованного чтения БД и буфера статистики до чтения под блокировкой сброса
+STATS_READ_ATTEMPTS = 3
 
-def _apply_pragma_settings(db):
-    """Применить настройки производительности SQLite к соединению"""
+
+def _merge_pending_user_counts(rows: list, pending_rows: list, pending: Dict[int, list], limit: int) -> list:
+    """
+    Объединить топ пользователей из БД с несохраненными счетчиками буфера.
+
+    rows - топ из БД (user_id, username, first_name, last_name, message_count),
+    pending_rows - строки БД для пользователей из буфера (могут не входить в топ),
+    pending - user_id -> [количество, username, first_name, last_name].
+    """
+    merged = {row[0]: list(row) for row in rows}
+    for row in pending_rows:
+        merged[row[0]] = list(row)
+    for user_id, (count, username, first_name, last_name) in pending.items():
+        row = merged.get(user_id)
+        if row is None:
+            merged[user_id] = [user_id, username, first_name, last_name, count]
+        else:
+            row[1] = username or row[1]
+            row[2] = first_name or row[2]
+            row[3] = last_name or row[3]
+            row[4] = (row[4] or 0) + count
+    return sorted(merged.values(), key=lambda row: row[4], reverse=True)[:limit]
+
+
+def _fetch_user_rows(db, where_sql: str, params: tuple, user_ids: list) -> list:
+    """Суммы user_daily_stats по конкретным пользователям (пакетами, с учетом лимита параметров SQLite)"""
+    rows = []
+    for i in range(0, len(user_ids), 500):
+        chunk = user_ids[i:i + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        cursor = db.execute(f"""
+            SELECT user_id, MAX(username), MAX(first_name), MAX(last_name), SUM(message_count)
+            FROM user_daily_stats
+            WHERE {where_sql} AND user_id IN ({placeholders})
+            GROUP BY user_id
+        """, params + tuple(chunk))
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def _migration_unique_stats(db):
+    """
+    Схлопнуть дубликаты счетчиков и создать уникальные индексы.
+
+    В старых базах уникального индекса могло не быть, и в daily_stats/user_daily_stats
+    накопились дубликаты. Счетчики дубликатов суммируются в запись с максимальным rowid,
+    остальные удаляются. После этого счетчики обновляются одним UPSERT.
+    """
+    cursor = db.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type = 'index' AND name IN ('idx_daily_stats_unique', 'idx_user_daily_stats_unique')
+    """)
+    existing = {row[0] for row in cursor.fetchall()}
+    
+    if 'idx_daily_stats_unique' not in existing:
+        db.execute("""
+            UPDATE daily_stats
+            SET message_count = (
+                SELECT SUM(d2.message_count) FROM daily_stats d2
+                WHERE d2.chat_id = daily_stats.chat_id AND d2.date = daily_stats.date
+            )
+            WHERE rowid IN (
+                SELECT MAX(rowid) FROM daily_stats
+                GROUP BY chat_id, date HAVING COUNT(*) > 1
+            )
+        """)
+        cursor = db.execute("""
+            DELETE FROM daily_stats
+            WHERE rowid NOT IN (SELECT MAX(rowid) FROM daily_stats GROUP BY chat_id, date)
+        """)
+        if cursor.rowcount:
+            logger.info(f"Схлопнуто {cursor.rowcount} дубликатов daily_stats")
+        db.execute("""
+            CREATE UNIQUE INDEX idx_daily_stats_unique ON daily_stats (chat_id, date)
+        """)
+        # Неуникальный индекс по тем же колонкам больше не нужен
+        db.execute("DROP INDEX IF EXISTS idx_daily_stats_chat_date")
+    
+    if 'idx_user_daily_stats_unique' not in existing:
+        db.execute("""
+            UPDATE user_daily_stats
+            SET message_count = (
+                SELECT SUM(u2.message_count) FROM user_daily_stats u2
+                WHERE u2.chat_id = user_daily_stats.chat_id
+                  AND u2.user_id = user_daily_stats.user_id
+                  AND u2.date = user_daily_stats.date
+            )
+            WHERE rowid IN (
+                SELECT MAX(rowid) FROM user_daily_stats
+                GROUP BY chat_id, user_id, date HAVING COUNT(*) > 1
+            )
+        """)
+        cursor = db.execute("""
+            DELETE FROM user_daily_stats
+            WHERE rowid NOT IN (SELECT MAX(rowid) FROM user_daily_stats GROUP BY chat_id, user_id, date)
+        """)
+        if cursor.rowcount:
+            logger.info(f"Схлопнуто {cursor.rowcount} дубликатов user_daily_stats")
+        db.execute("""
+            CREATE UNIQUE INDEX idx_user_daily_stats_unique ON user_daily_stats (chat_id, user_id, date)
+        """)
+
+
+
+# Окна сводки активности чатов (дней) - колонки messages_N/active_days_N в chat_activity
+ACTIVITY_WINDOWS = (1, 3, 7, 30)
+
+_CHAT_ACTIVITY_COLUMNS = ", ".join(f"messages_{n}, active_days_{n}" for n in ACTIVITY_WINDOWS)
+
+# Новый день чата (дата новее last_active_date) добавляет по активному дню в окна, куда он попал
+_CHAT_ACTIVITY_UPSERT = f"""
+    INSERT INTO chat_activity (chat_id, {_CHAT_ACTIVITY_COLUMNS}, last_active_date)
+    VALUES ({', '.join('?' * (2 + 2 * len(ACTIVITY_WINDOWS)))})
+    ON CONFLICT(chat_id) DO UPDATE SET
+""" + ",\n".join(
+    f"""        messages_{n} = messages_{n} + excluded.messages_{n},
+        active_days_{n} = active_days_{n} + CASE
+            WHEN excluded.last_active_date > COALESCE(last_active_date, '') THEN excluded.active_days_{n} ELSE 0
+        END"""
+    for n in ACTIVITY_WINDOWS
+) + """,
+        last_active_date = MAX(COALESCE(last_active_date, ''), excluded.last_active_date)
+"""
+
+
+def _activity_cutoffs(base_date: str) -> Dict[int, str]:
+    """Первая дата каждого окна: как date(base_date, '-N days') в SQLite"""
+    base = datetime.strptime(base_date, '%Y-%m-%d')
+    return {n: (base - timedelta(days=n)).strftime('%Y-%m-%d') for n in ACTIVITY_WINDOWS}
+
+
+def _rebuild_chat_activity(db, base_date: str):
+    """Пересчитать chat_activity из daily_stats (раз в сутки и после удаления статистики)"""
+    cutoffs = _activity_cutoffs(base_date)
+    sums = ",\n".join(
+        "SUM(CASE WHEN date >= ? THEN message_count ELSE 0 END), SUM(CASE WHEN date >= ? THEN 1 ELSE 0 END)"
+        for _ in ACTIVITY_WINDOWS
+    )
+    params = [cutoff for n in ACTIVITY_WINDOWS for cutoff in (cutoffs[n], cutoffs[n])]
+    params.append(cutoffs[max(ACTIVITY_WINDOWS)])
+    db.execute("DELETE FROM chat_activity")
+    db.execute(f"""
+        INSERT INTO chat_activity (chat_id, {_CHAT_ACTIVITY_COLUMNS}, last_active_date)
+        SELECT chat_id, {sums}, MAX(date)
+        FROM daily_stats
+        WHERE date >= ?
+        GROUP BY chat_id
+    """, params)
+
+
+def _add_chat_activity(db, chat_rows: list, base_date: str):
+    """Добавить записанные счетчики daily_stats (chat_id, date, количество) в chat_activity"""
+    cutoffs = _activity_cutoffs(base_date)
+    rows = []
+    # По возрастанию даты, чтобы новый день чата учитывался как активный один раз
+    for chat_id, date, count in sorted(chat_rows, key=lambda row: row[1]):
+        values = [chat_id]
+        for n in ACTIVITY_WINDOWS:
+            inside = date >= cutoffs[n]
+            values.extend((count if inside else 0, 1 if inside else 0))
+        values.append(date)
+        rows.append(values)
+    db.executemany(_CHAT_ACTIVITY_UPSERT, rows)
+
+
+def _migration_chat_activity(db):
+    """Сводка активности чатов за 1/3/7/30 дней для топа чатов"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS chat_activity (
+            chat_id INTEGER PRIMARY KEY,
+            messages_1 INTEGER NOT NULL DEFAULT 0,
+            active_days_1 INTEGER NOT NULL DEFAULT 0,
+            messages_3 INTEGER NOT NULL DEFAULT 0,
+            active_days_3 INTEGER NOT NULL DEFAULT 0,
+            messages_7 INTEGER NOT NULL DEFAULT 0,
+            active_days_7 INTEGER NOT NULL DEFAULT 0,
+            messages_30 INTEGER NOT NULL DEFAULT 0,
+            active_days_30 INTEGER NOT NULL DEFAULT 0,
+            last_active_date TEXT
+        )
+    """)
+    for days in (1, 3, 7, 30):
+        db.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_chat_activity_{days}
+            ON chat_activity (messages_{days}, active_days_{days})
+        """)
+    # Заполняется при первом обращении (Database._ensure_chat_activity)
+
+
+def _migration_hourly_stats(db):
+    """Почасовые счетчики сообщений пользователей (utc_hour - часы от начала эпохи)"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS user_hourly_stats (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            utc_hour INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, user_id, utc_hour)
+        ) WITHOUT ROWID
+    """)
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_hourly_stats_chat_hour
+        ON user_hourly_stats (chat_id, utc_hour, user_id, message_count)
+    """)
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_hourly_stats_hour
+        ON user_hourly_stats (utc_hour)
+    """)
+
+
+# Файл, в котором настройки топа хранились до переноса в таблицу chats
+TOP_CHATS_SETTINGS_JSON = Path("data/top_chats_settings.json")
+
+
+def _migration_top_settings_json(db):
+    """Перенос настроек топа из data/top_chats_settings.json в колонки chats"""
+    if not TOP_CHATS_SETTINGS_JSON.exists():
+        return
     try:
-        db.execute("PRAGMA journal_mode=WAL")
-        db.execute("PRAGMA synchronous=NORMAL")
-        db.execute("PRAGMA cache_size=-64000")  # 64MB cache
-    except Exception:
-        pass  # Игнорируем ошибки, если PRAGMA не поддерживается
+        with open(TOP_CHATS_SETTINGS_JSON, 'r', encoding='utf-8') as f:
+            all_settings = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Не удалось прочитать {TOP_CHATS_SETTINGS_JSON}, настройки топа не перенесены: {e}")
+        return
+    
+    migrated = 0
+    for chat_key, chat_settings in all_settings.items():
+        if not isinstance(chat_settings, dict):
+            continue
+        try:
+            chat_id = int(chat_key)
+            updates = []
+            params = []
+            if chat_settings.get('show_in_top') in ('always', 'public_only', 'never'):
+                updates.append("show_in_top = ?")
+                params.append(chat_settings['show_in_top'])
+            if 'show_private_label' in chat_settings:
+                updates.append("show_private_label = ?")
+                params.append(1 if chat_settings['show_private_label'] else 0)
+            if 'min_activity_threshold' in chat_settings:
+                updates.append("min_activity_threshold = ?")
+                params.append(int(chat_settings['min_activity_threshold']))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Пропущены некорректные настройки топа для чата {chat_key}: {e}")
+            continue
+        if updates:
+            params.append(chat_id)
+            cursor = db.execute(f"UPDATE chats SET {', '.join(updates)} WHERE chat_id = ?", params)
+            migrated += cursor.rowcount
+    logger.info(f"Настройки топа перенесены из JSON в БД для {migrated} чатов")
+
+
+def _local_day_hours(timezone_offset: int) -> Tuple[int, int]:
+    """Границы сегодняшних суток в часовом поясе UTC+offset в виде UTC-часов [начало, конец)"""
+    local_hour = int(time.time() // 3600) + timezone_offset
+    start = local_hour - local_hour % 24 - timezone_offset
+    return start, start + 24
+
+
+def _fetch_user_hour_rows(db, chat_id: int, start_hour: int, end_hour: int, user_ids: list) -> list:
+    """Суммы user_hourly_stats по конкретным пользователям (пакетами, с учетом лимита параметров SQLite)"""
+    rows = []
+    for i in range(0, len(user_ids), 500):
+        chunk = user_ids[i:i + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        cursor = db.execute(f"""
+            SELECT h.user_id, u.username, u.first_name, u.last_name, SUM(h.message_count)
+            FROM user_hourly_stats h
+            LEFT JOIN users u ON u.user_id = h.user_id
+            WHERE h.chat_id = ? AND h.utc_hour >= ? AND h.utc_hour < ? AND h.user_id IN ({placeholders})
+            GROUP BY h.user_id
+        """, (chat_id, start_hour, end_hour) + tuple(chunk))
+        rows.extend(cursor.fetchall())
+    return rows
+
+def _migration_initial_schema(db):
+    """Базовые таблицы и индексы"""
+    # Таблица для хранения информации о чатах
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id INTEGER PRIMARY KEY,
+            chat_title TEXT,
+            owner_id INTEGER,
+            added_date TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            has_admin_rights BOOLEAN DEFAULT 0,
+            russian_commands_prefix BOOLEAN DEFAULT 0
+        )
+    """)
+    
+    # Таблица черного списка чатов
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS blacklisted_chats (
+            chat_id INTEGER PRIMARY KEY,
+            reason TEXT,
+            added_at TEXT
+        )
+    """)
+    
+    # Таблица для хранения информации о пользователях
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            is_bot BOOLEAN DEFAULT 0,
+            last_seen TEXT,
+            mention_ping_enabled BOOLEAN DEFAULT 1
+        )
+    """)
+    
+    # Таблица для статистики сообщений по дням
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            date TEXT,
+            message_count INTEGER DEFAULT 0,
+            FOREIGN KEY (chat_id) REFERENCES chats (chat_id)
+        )
+    """)
+    
+    # Таблица для статистики пользователей по дням
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS user_daily_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            date TEXT,
+            message_count INTEGER DEFAULT 0,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            FOREIGN KEY (chat_id) REFERENCES chats (chat_id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    """)
+    
+    # Таблица метаданных пользователя в чате (дата первого появления)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS user_chat_meta (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            first_seen TEXT,
+            UNIQUE(chat_id, user_id)
+        )
+    """)
+    
+    # Таблица для запросов на вступление в чаты
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS chat_join_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            request_date TEXT,
+            status TEXT DEFAULT 'pending',
+            invite_link TEXT,
+            admin_message_id INTEGER,
+            FOREIGN KEY (chat_id) REFERENCES chats (chat_id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    """)
+    
+    # Таблица для рангов модераторов
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS chat_moderators (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            rank INTEGER,
+            assigned_by INTEGER,
+            assigned_date TEXT,
+            UNIQUE(chat_id, user_id),
+            FOREIGN KEY (chat_id) REFERENCES chats (chat_id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (assigned_by) REFERENCES users (user_id)
+        )
+    """)
+    
+    # Таблица для прав рангов
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS rank_permissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            rank INTEGER,
+            permission_type TEXT,
+            permission_value BOOLEAN DEFAULT 1,
+            UNIQUE(chat_id, rank, permission_type),
+            FOREIGN KEY (chat_id) REFERENCES chats (chat_id)
+        )
+    """)
+    
+    # Таблица для настроек статистики
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS chat_stat_settings (
+            chat_id INTEGER PRIMARY KEY,
+            stats_enabled BOOLEAN DEFAULT 1,
+            count_media BOOLEAN DEFAULT 1,
+            FOREIGN KEY (chat_id) REFERENCES chats (chat_id)
+        )
+    """)
+    
+    # Таблица для отслеживания времени последнего сообщения
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS user_last_message (
+            chat_id INTEGER,
+            user_id INTEGER,
+            last_message_time TEXT,
+            PRIMARY KEY (chat_id, user_id),
+            FOREIGN KEY (chat_id) REFERENCES chats (chat_id)
+        )
+    """)
+    
+    # Индексы для прав рангов
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_rank_permissions_chat_rank 
+        ON rank_permissions (chat_id, rank)
+    """)
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_rank_permissions_chat_type 
+        ON rank_permissions (chat_id, permission_type)
+    """)
+    
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_daily_stats_chat_date 
+        ON user_daily_stats (chat_id, date)
+    """)
+    
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_daily_stats_user_date 
+        ON user_daily_stats (user_id, date)
+    """)
+    
+    # Композитный индекс для оптимизации GROUP BY запросов в top командах
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_daily_stats_chat_date_user_count 
+        ON user_daily_stats (chat_id, date, user_id, message_count)
+    """)
+    
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_chat_meta_chat_user
+        ON user_chat_meta (chat_id, user_id)
+    """)
+    
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_moderators_chat_user
+        ON chat_moderators (chat_id, user_id)
+    """)
+    
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_moderators_chat_rank
+        ON chat_moderators (chat_id, rank)
+    """)
+
+
+def _migration_added_columns(db):
+    """Колонки, которые раньше добавлялись через ALTER TABLE при каждом запуске"""
+    add_column(db, 'chats', 'has_admin_rights', 'BOOLEAN DEFAULT 0')
+    add_column(db, 'chats', 'russian_commands_prefix', 'BOOLEAN DEFAULT 0')
+    add_column(db, 'chats', 'chat_type', 'TEXT')
+    add_column(db, 'chats', 'member_count', 'INTEGER')
+    add_column(db, 'chats', 'is_public', 'BOOLEAN DEFAULT 0')
+    add_column(db, 'chats', 'username', 'TEXT')
+    add_column(db, 'chats', 'invite_link', 'TEXT')
+    add_column(db, 'chats', 'hints_mode', 'INTEGER DEFAULT 0')
+    add_column(db, 'chats', 'frozen_at', 'TEXT')
+    # Настройки топа
+    add_column(db, 'chats', 'show_in_top', "TEXT DEFAULT 'public_only'")
+    add_column(db, 'chats', 'show_private_label', 'BOOLEAN DEFAULT 0')
+    add_column(db, 'chats', 'min_activity_threshold', 'INTEGER DEFAULT 0')
+    # Авто-принятие заявок и уведомления о нем
+    add_column(db, 'chats', 'auto_accept_join_requests', 'BOOLEAN DEFAULT 0')
+    add_column(db, 'chats', 'auto_accept_notify', 'BOOLEAN DEFAULT 0')
+    add_column(db, 'chats', 'rules_text', 'TEXT')
+    
+    add_column(db, 'user_daily_stats', 'last_name', 'TEXT')
+    add_column(db, 'users', 'mention_ping_enabled', 'BOOLEAN DEFAULT 1')
+    
+    add_column(db, 'chat_stat_settings', 'count_media', 'BOOLEAN DEFAULT 1')
+    add_column(db, 'chat_stat_settings', 'profile_enabled', 'BOOLEAN DEFAULT 1')
+    add_column(db, 'chat_stat_settings', 'userinfo_enabled', 'BOOLEAN DEFAULT 1')
+
+
+# Порядок миграций менять нельзя - только дописывать новые в конец
+MIGRATIONS = [
+    (1, 'Базовые таблицы и индексы', _migration_initial_schema),
+    (2, 'Колонки настроек чатов и статистики', _migration_added_columns),
+    (3, 'Уникальные индексы счетчиков статистики', _migration_unique_stats),
+    (4, 'Сводка активности чатов для топа', _migration_chat_activity),
+    (5, 'Почасовые счетчики сообщений', _migration_hourly_stats),
+    (6, 'Настройки топа из JSON в таблицу chats', _migration_top_settings_json),
+]
 
 
 class Database:
@@ -29,385 +524,33 @@ class Database:
     
     def __init__(self, db_path: str = DATABASE_PATH):
         self.db_path = db_path
+        self._pool = get_pool(self.db_path)
         self._corruption_detected = False
         self._recovery_in_progress = False
+        # Отложенная запись счетчиков сообщений
+        self._stats_buffer = MessageStatsBuffer(max_keys=MESSAGE_STATS['max_pending_keys'])
+        self._stats_flush_lock = asyncio.Lock()
+        self._stats_flush_task: Optional[asyncio.Task] = None
+        # Дата (UTC), на которую посчитаны окна chat_activity; None - сводку нужно пересчитать
+        self._activity_date: Optional[str] = None
+        self._activity_version = 0
+        # Первый UTC-час, с которого ведутся почасовые счетчики (раньше - только дневные)
+        self._hourly_since: Optional[int] = None
     
     async def init_db(self):
-        """Инициализация базы данных и создание таблиц"""
+        """Инициализация базы данных: применение миграций схемы"""
         def _init_sync():
-            # Проверяем, существует ли файл базы данных
-            import os
             if not os.path.exists(self.db_path):
                 logger.info(f"Файл базы данных {self.db_path} не найден, создаем новую базу данных...")
             
-            with sqlite3.connect(self.db_path) as db:
-                # Применяем настройки производительности SQLite
-                _apply_pragma_settings(db)
-                db.commit()
-                
-                # Таблица для хранения информации о чатах
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS chats (
-                        chat_id INTEGER PRIMARY KEY,
-                        chat_title TEXT,
-                        owner_id INTEGER,
-                        added_date TEXT,
-                        is_active BOOLEAN DEFAULT 1,
-                        has_admin_rights BOOLEAN DEFAULT 0,
-                        russian_commands_prefix BOOLEAN DEFAULT 0
-                    )
-                """)
-                
-                # Добавляем колонку has_admin_rights если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN has_admin_rights BOOLEAN DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку russian_commands_prefix если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN russian_commands_prefix BOOLEAN DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку chat_type если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN chat_type TEXT")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку member_count если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN member_count INTEGER")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку is_public если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN is_public BOOLEAN DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку username если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN username TEXT")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку invite_link если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN invite_link TEXT")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Таблица черного списка чатов
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS blacklisted_chats (
-                        chat_id INTEGER PRIMARY KEY,
-                        reason TEXT,
-                        added_at TEXT
-                    )
-                """)
-                
-                # Добавляем колонку hints_mode если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN hints_mode INTEGER DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку frozen_at если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN frozen_at TEXT")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонки для настроек топа
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN show_in_top TEXT DEFAULT 'public_only'")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN show_private_label BOOLEAN DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN min_activity_threshold INTEGER DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку авто-принятия заявок если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN auto_accept_join_requests BOOLEAN DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку уведомлений при авто-принятии, если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN auto_accept_notify BOOLEAN DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку rules_text если её нет
-                try:
-                    db.execute("ALTER TABLE chats ADD COLUMN rules_text TEXT")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Таблица для хранения информации о пользователях
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        first_name TEXT,
-                        last_name TEXT,
-                        is_bot BOOLEAN DEFAULT 0,
-                        last_seen TEXT,
-                        mention_ping_enabled BOOLEAN DEFAULT 1
-                    )
-                """)
-                
-                # Таблица для статистики сообщений по дням
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS daily_stats (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        date TEXT,
-                        message_count INTEGER DEFAULT 0,
-                        FOREIGN KEY (chat_id) REFERENCES chats (chat_id)
-                    )
-                """)
-                
-                # Таблица для статистики пользователей по дням
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS user_daily_stats (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        date TEXT,
-                        message_count INTEGER DEFAULT 0,
-                        username TEXT,
-                        first_name TEXT,
-                        last_name TEXT,
-                        FOREIGN KEY (chat_id) REFERENCES chats (chat_id),
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                """)
-                
-                # Добавляем колонку last_name если её нет
-                try:
-                    db.execute("ALTER TABLE user_daily_stats ADD COLUMN last_name TEXT")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-
-                # Таблица метаданных пользователя в чате (дата первого появления)
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS user_chat_meta (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        first_seen TEXT,
-                        UNIQUE(chat_id, user_id)
-                    )
-                """)
-                
-                # Таблица для запросов на вступление в чаты
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS chat_join_requests (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        request_date TEXT,
-                        status TEXT DEFAULT 'pending',
-                        invite_link TEXT,
-                        admin_message_id INTEGER,
-                        FOREIGN KEY (chat_id) REFERENCES chats (chat_id),
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                """)
+            with self._pool.connect() as db:
+                version = apply_migrations(db, MIGRATIONS, 'database')
                 
-                # Таблица для рангов модераторов
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS chat_moderators (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        rank INTEGER,
-                        assigned_by INTEGER,
-                        assigned_date TEXT,
-                        UNIQUE(chat_id, user_id),
-                        FOREIGN KEY (chat_id) REFERENCES chats (chat_id),
-                        FOREIGN KEY (user_id) REFERENCES users (user_id),
-                        FOREIGN KEY (assigned_by) REFERENCES users (user_id)
-                    )
-                """)
-                
-                # Таблица для прав рангов
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS rank_permissions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        rank INTEGER,
-                        permission_type TEXT,
-                        permission_value BOOLEAN DEFAULT 1,
-                        UNIQUE(chat_id, rank, permission_type),
-                        FOREIGN KEY (chat_id) REFERENCES chats (chat_id)
-                    )
-                """)
-                
-                # Таблица для настроек статистики
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS chat_stat_settings (
-                        chat_id INTEGER PRIMARY KEY,
-                        stats_enabled BOOLEAN DEFAULT 1,
-                        count_media BOOLEAN DEFAULT 1,
-                        FOREIGN KEY (chat_id) REFERENCES chats (chat_id)
-                    )
-                """)
-                
-                # Таблица для отслеживания времени последнего сообщения
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS user_last_message (
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        last_message_time TEXT,
-                        PRIMARY KEY (chat_id, user_id),
-                        FOREIGN KEY (chat_id) REFERENCES chats (chat_id)
-                    )
-                """)
-                
-                
-                # Создаем индексы для быстрого поиска
-                db.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_daily_stats_chat_date 
-                    ON daily_stats (chat_id, date)
-                """)
-                
-                # Индексы для прав рангов
-                db.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_rank_permissions_chat_rank 
-                    ON rank_permissions (chat_id, rank)
-                """)
-                db.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_rank_permissions_chat_type 
-                    ON rank_permissions (chat_id, permission_type)
-                """)
-                
-                db.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_user_daily_stats_chat_date 
-                    ON user_daily_stats (chat_id, date)
-                """)
-                
-                db.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_user_daily_stats_user_date 
-                    ON user_daily_stats (user_id, date)
-                """)
-                
-                # Композитный индекс для оптимизации GROUP BY запросов в top командах
-                db.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_user_daily_stats_chat_date_user_count 
-                    ON user_daily_stats (chat_id, date, user_id, message_count)
-                """)
-                
-                # Уникальный индекс для предотвращения дубликатов (chat_id, user_id, date)
-                try:
-                    db.execute("""
-                        CREATE UNIQUE INDEX IF NOT EXISTS idx_user_daily_stats_unique 
-                        ON user_daily_stats (chat_id, user_id, date)
-                    """)
-                except sqlite3.OperationalError as e:
-                    # Если индекс уже существует или есть дубликаты, пропускаем
-                    # Дубликаты будут очищены при следующем запуске cleanup_duplicate_chats
-                    logger.debug(f"Не удалось создать уникальный индекс user_daily_stats: {e}")
-
-                db.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_user_chat_meta_chat_user
-                    ON user_chat_meta (chat_id, user_id)
-                """)
-                
-                db.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_chat_moderators_chat_user
-                    ON chat_moderators (chat_id, user_id)
-                """)
-                
-                db.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_chat_moderators_chat_rank
-                    ON chat_moderators (chat_id, rank)
-                """)
-                
-                
-                # Убедимся, что в таблице есть колонка count_media
-                cursor = db.execute("PRAGMA table_info(chat_stat_settings)")
-                columns = [column[1] for column in cursor.fetchall()]
-                if 'count_media' not in columns:
-                    try:
-                        db.execute("ALTER TABLE chat_stat_settings ADD COLUMN count_media BOOLEAN DEFAULT 1")
-                        db.commit()
-                    except sqlite3.OperationalError:
-                        pass
-                
-                # Убедимся, что в таблице users есть колонка mention_ping_enabled
-                cursor = db.execute("PRAGMA table_info(users)")
-                user_columns = [column[1] for column in cursor.fetchall()]
-                if 'mention_ping_enabled' not in user_columns:
-                    try:
-                        db.execute("ALTER TABLE users ADD COLUMN mention_ping_enabled BOOLEAN DEFAULT 1")
-                        db.commit()
-                    except sqlite3.OperationalError:
-                        pass
-                
-                # Убедимся, что в таблице chat_stat_settings есть колонка profile_enabled
-                cursor = db.execute("PRAGMA table_info(chat_stat_settings)")
-                stat_columns = [column[1] for column in cursor.fetchall()]
-                if 'profile_enabled' not in stat_columns:
-                    try:
-                        db.execute("ALTER TABLE chat_stat_settings ADD COLUMN profile_enabled BOOLEAN DEFAULT 1")
-                        db.commit()
-                    except sqlite3.OperationalError:
-                        pass
-                
-                # Убедимся, что в таблице chat_stat_settings есть колонка userinfo_enabled
-                cursor = db.execute("PRAGMA table_info(chat_stat_settings)")
-                stat_columns = [column[1] for column in cursor.fetchall()]
-                if 'userinfo_enabled' not in stat_columns:
-                    try:
-                        db.execute("ALTER TABLE chat_stat_settings ADD COLUMN userinfo_enabled BOOLEAN DEFAULT 1")
-                        db.commit()
-                    except sqlite3.OperationalError:
-                        pass
+                # applied_at записан локальным временем (datetime.now())
+                cursor = db.execute("SELECT applied_at FROM schema_version WHERE version = 5")
+                row = cursor.fetchone()
+                if row and row[0]:
+                    self._hourly_since = int(datetime.fromisoformat(row[0]).timestamp() // 3600) + 1
                 
                 # Создаем настройки по умолчанию для всех чатов, у которых их еще нет
                 db.execute("""
@@ -415,48 +558,16 @@ class Database:
                     SELECT chat_id, 1, 1, 1, 1 FROM chats
                 """)
                 
-                # Проверяем, существует ли таблица user_last_message
-                cursor = db.execute("""
-                    SELECT name FROM sqlite_master 
-                    WHERE type='table' AND name='user_last_message'
-                """)
-                if not cursor.fetchone():
-                    # Таблица не существует, создаем её
-                    logger.info("Создаем таблицу user_last_message...")
-                    db.execute("""
-                        CREATE TABLE user_last_message (
-                            chat_id INTEGER,
-                            user_id INTEGER,
-                            last_message_time TEXT,
-                            PRIMARY KEY (chat_id, user_id),
-                            FOREIGN KEY (chat_id) REFERENCES chats (chat_id)
-                        )
-                    """)
-                    logger.info("Таблица user_last_message создана")
-                
-                # Убедимся, что композитный индекс существует (для существующих баз данных)
-                cursor = db.execute("""
-                    SELECT name FROM sqlite_master 
-                    WHERE type='index' AND name='idx_user_daily_stats_chat_date_user_count'
-                """)
-                if not cursor.fetchone():
-                    logger.info("Создаем композитный индекс для оптимизации top запросов...")
-                    db.execute("""
-                        CREATE INDEX idx_user_daily_stats_chat_date_user_count 
-                        ON user_daily_stats (chat_id, date, user_id, message_count)
-                    """)
-                    logger.info("Композитный индекс создан")
-                
                 db.commit()
-                logger.info("База данных инициализирована")
+                logger.info(f"База данных инициализирована (схема v{version})")
         
-        await asyncio.get_event_loop().run_in_executor(None, _init_sync)
+        await self._pool.run(_init_sync)
     
     async def check_integrity(self) -> bool:
         """Проверка целостности базы данных"""
         def _check_integrity_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("PRAGMA integrity_check")
                     result = cursor.fetchone()
                     # Если результат "ok", база цела
@@ -465,7 +576,7 @@ class Database:
                 logger.error(f"Ошибка при проверке целостности базы данных: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _check_integrity_sync)
+        return await self._pool.run(_check_integrity_sync)
     
     async def recover_database(self) -> bool:
         """Восстановление поврежденной базы данных"""
@@ -476,6 +587,9 @@ class Database:
                     logger.error(f"База данных не найдена: {self.db_path}")
                     return False
                 
+                # Закрываем соединения пула перед заменой файла базы данных
+                self._pool.reset()
+                
                 # Создаем резервную копию перед восстановлением
                 backup_path = db_path.with_suffix(f".backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
                 logger.info(f"Создание резервной копии: {backup_path}")
@@ -524,7 +638,7 @@ class Database:
                 logger.error(f"Критическая ошибка при восстановлении базы данных: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _recover_sync)
+        return await self._pool.run(_recover_sync)
     
     def _is_database_corrupted_error(self, error: Exception) -> bool:
         """Проверяет, является ли ошибка признаком повреждения базы данных"""
@@ -560,7 +674,7 @@ class Database:
         """Добавление чата в базу данных"""
         def _add_chat_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT OR REPLACE INTO chats (chat_id, chat_title, owner_id, added_date, is_active)
                         VALUES (?, ?, ?, ?, 1)
@@ -572,13 +686,15 @@ class Database:
                 logger.error(f"Ошибка при добавлении чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_chat_sync)
+        result = await self._pool.write(_add_chat_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def remove_chat(self, chat_id: int) -> bool:
         """Удаление чата из базы данных"""
         def _remove_chat_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         UPDATE chats SET is_active = 0 WHERE chat_id = ?
                     """, (chat_id,))
@@ -589,62 +705,39 @@ class Database:
                 logger.error(f"Ошибка при удалении чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _remove_chat_sync)
+        result = await self._pool.write(_remove_chat_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def get_chat(self, chat_id: int) -> Optional[Dict[str, Any]]:
         """Получение информации о чате"""
         def _get_chat_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
-                    # Проверяем, какие колонки есть
-                    cursor_info = db.execute("PRAGMA table_info(chats)")
-                    columns = [col[1] for col in cursor_info.fetchall()]
-                    has_username = "username" in columns
-                    has_invite_link = "invite_link" in columns
-                    
-                    # Проверяем наличие колонки frozen_at
-                    has_frozen_at = "frozen_at" in columns
-                    
-                    # Формируем SELECT с учетом доступных колонок
-                    select_fields = ["chat_id", "chat_title", "owner_id", "added_date", "is_active"]
-                    if has_username:
-                        select_fields.append("username")
-                    if has_invite_link:
-                        select_fields.append("invite_link")
-                    if has_frozen_at:
-                        select_fields.append("frozen_at")
-                    
-                    query = f"""
-                        SELECT {', '.join(select_fields)}
+                with self._pool.connect() as db:
+                    cursor = db.execute("""
+                        SELECT chat_id, chat_title, owner_id, added_date, is_active,
+                               username, invite_link, frozen_at
                         FROM chats WHERE chat_id = ?
-                    """
-                    cursor = db.execute(query, (chat_id,))
+                    """, (chat_id,))
                     
                     row = cursor.fetchone()
                     if row:
-                        result = {
+                        return {
                             'chat_id': row[0],
                             'chat_title': row[1],
                             'owner_id': row[2],
                             'added_date': row[3],
-                            'is_active': bool(row[4])
+                            'is_active': bool(row[4]),
+                            'username': row[5],
+                            'invite_link': row[6],
+                            'frozen_at': row[7]
                         }
-                        idx = 5
-                        if has_username:
-                            result['username'] = row[idx]
-                            idx += 1
-                        if has_invite_link:
-                            result['invite_link'] = row[idx] if idx < len(row) else None
-                            idx += 1
-                        if has_frozen_at:
-                            result['frozen_at'] = row[idx] if idx < len(row) else None
-                        return result
                     return None
             except Exception as e:
                 logger.error(f"Ошибка при получении чата {chat_id}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_chat_sync)
+        return await self._pool.run(_get_chat_sync)
     
     async def get_chat_owner(self, chat_id: int) -> Optional[int]:
         """Получение ID владельца чата"""
@@ -655,7 +748,7 @@ class Database:
         """Получить настройку префикса для русских команд"""
         def _get_setting_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT russian_commands_prefix FROM chats WHERE chat_id = ?
                     """, (chat_id,))
@@ -665,13 +758,13 @@ class Database:
                 logger.error(f"Ошибка при получении настройки префикса русских команд: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_setting_sync)
+        return await self._pool.run(_get_setting_sync)
     
     async def set_russian_commands_prefix_setting(self, chat_id: int, enabled: bool) -> bool:
         """Установить настройку префикса для русских команд"""
         def _set_setting_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         UPDATE chats SET russian_commands_prefix = ? WHERE chat_id = ?
                     """, (enabled, chat_id))
@@ -681,13 +774,15 @@ class Database:
                 logger.error(f"Ошибка при установке настройки префикса русских команд: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _set_setting_sync)
+        result = await self._pool.write(_set_setting_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def get_rules_text(self, chat_id: int) -> Optional[str]:
         """Получить текст правил чата"""
         def _get_rules_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT rules_text FROM chats WHERE chat_id = ?
                     """, (chat_id,))
@@ -697,13 +792,13 @@ class Database:
                 logger.error(f"Ошибка при получении правил чата {chat_id}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_rules_sync)
+        return await self._pool.run(_get_rules_sync)
     
     async def set_rules_text(self, chat_id: int, rules_text: Optional[str]) -> bool:
         """Установить текст правил чата"""
         def _set_rules_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         UPDATE chats SET rules_text = ? WHERE chat_id = ?
                     """, (rules_text, chat_id))
@@ -713,13 +808,15 @@ class Database:
                 logger.error(f"Ошибка при установке правил чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _set_rules_sync)
+        result = await self._pool.write(_set_rules_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def get_hints_mode(self, chat_id: int) -> int:
         """Получить режим подсказок для чата"""
         def _get_hints_mode_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT hints_mode FROM chats WHERE chat_id = ?
                     """, (chat_id,))
@@ -729,13 +826,13 @@ class Database:
                 logger.error(f"Ошибка при получении режима подсказок: {e}")
                 return 0
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_hints_mode_sync)
+        return await self._pool.run(_get_hints_mode_sync)
     
     async def set_hints_mode(self, chat_id: int, mode: int) -> bool:
         """Установить режим подсказок для чата"""
         def _set_hints_mode_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         UPDATE chats SET hints_mode = ? WHERE chat_id = ?
                     """, (mode, chat_id))
@@ -745,7 +842,9 @@ class Database:
                 logger.error(f"Ошибка при установке режима подсказок: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _set_hints_mode_sync)
+        result = await self._pool.write(_set_hints_mode_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def add_user(self, user_id: int, username: str = None, 
                       first_name: str = None, last_name: str = None, 
@@ -753,7 +852,7 @@ class Database:
         """Добавление пользователя в базу данных"""
         def _add_user_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Сохраняем существующее значение mention_ping_enabled если пользователь уже существует
                     db.execute("""
                         INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, is_bot, last_seen, mention_ping_enabled)
@@ -765,13 +864,13 @@ class Database:
                 logger.error(f"Ошибка при добавлении пользователя {user_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_user_sync)
+        return await self._pool.write(_add_user_sync)
     
     async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Получение информации о пользователе"""
         def _get_user_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT user_id, username, first_name, last_name, is_bot, last_seen, mention_ping_enabled
                         FROM users WHERE user_id = ?
@@ -792,13 +891,13 @@ class Database:
                 logger.error(f"Ошибка при получении пользователя {user_id}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_user_sync)
+        return await self._pool.run(_get_user_sync)
     
     async def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         """Получение информации о пользователе по username"""
         def _get_user_by_username_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT user_id, username, first_name, last_name, is_bot, last_seen
                         FROM users WHERE username = ?
@@ -818,13 +917,13 @@ class Database:
                 logger.error(f"Ошибка при получении пользователя по username {username}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_user_by_username_sync)
+        return await self._pool.run(_get_user_by_username_sync)
     
     async def get_all_active_chats(self) -> List[Dict[str, Any]]:
         """Получение всех активных чатов"""
         def _get_all_chats_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT chat_id, chat_title, owner_id, added_date
                         FROM chats WHERE is_active = 1
@@ -844,19 +943,19 @@ class Database:
                 logger.error(f"Ошибка при получении списка чатов: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_all_chats_sync)
+        return await self._pool.run(_get_all_chats_sync)
 
     async def is_chat_blacklisted(self, chat_id: int) -> bool:
         def _get_sync():
-            with sqlite3.connect(self.db_path) as db:
+            with self._pool.connect() as db:
                 cur = db.execute("SELECT 1 FROM blacklisted_chats WHERE chat_id = ?", (chat_id,))
                 return cur.fetchone() is not None
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
 
     async def add_chat_to_blacklist(self, chat_id: int, reason: str | None = None) -> bool:
         def _set_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute(
                         "INSERT OR REPLACE INTO blacklisted_chats (chat_id, reason, added_at) VALUES (?, ?, ?)",
                         (chat_id, reason, datetime.now().isoformat())
@@ -866,33 +965,33 @@ class Database:
             except Exception as e:
                 logger.error(f"Ошибка при добавлении чата {chat_id} в ЧС: {e}")
                 return False
-        return await asyncio.get_event_loop().run_in_executor(None, _set_sync)
+        return await self._pool.write(_set_sync)
 
     async def remove_chat_from_blacklist(self, chat_id: int) -> bool:
         def _del_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("DELETE FROM blacklisted_chats WHERE chat_id = ?", (chat_id,))
                     db.commit()
                     return True
             except Exception as e:
                 logger.error(f"Ошибка при удалении чата {chat_id} из ЧС: {e}")
                 return False
-        return await asyncio.get_event_loop().run_in_executor(None, _del_sync)
+        return await self._pool.write(_del_sync)
 
     async def list_blacklisted_chats(self) -> list[dict]:
         def _list_sync():
-            with sqlite3.connect(self.db_path) as db:
+            with self._pool.connect() as db:
                 cur = db.execute("SELECT chat_id, reason, added_at FROM blacklisted_chats ORDER BY added_at DESC")
                 rows = cur.fetchall()
                 return [{"chat_id": r[0], "reason": r[1], "added_at": r[2]} for r in rows]
-        return await asyncio.get_event_loop().run_in_executor(None, _list_sync)
+        return await self._pool.run(_list_sync)
 
     async def get_auto_accept_join_requests(self, chat_id: int) -> bool:
         """Получить настройку авто-принятия заявок в чат."""
         def _get_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cur = db.execute(
                         "SELECT auto_accept_join_requests FROM chats WHERE chat_id = ?",
                         (chat_id,)
@@ -902,13 +1001,13 @@ class Database:
             except Exception as e:
                 logger.error(f"Ошибка при получении авто-принятия заявок для чата {chat_id}: {e}")
                 return False
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
 
     async def set_auto_accept_join_requests(self, chat_id: int, enabled: bool) -> bool:
         """Установить настройку авто-принятия заявок в чат."""
         def _set_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute(
                         "UPDATE chats SET auto_accept_join_requests = ? WHERE chat_id = ?",
                         (1 if enabled else 0, chat_id)
@@ -918,13 +1017,15 @@ class Database:
             except Exception as e:
                 logger.error(f"Ошибка при установке авто-принятия заявок для чата {chat_id}: {e}")
                 return False
-        return await asyncio.get_event_loop().run_in_executor(None, _set_sync)
+        result = await self._pool.write(_set_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
 
     async def get_auto_accept_notify(self, chat_id: int) -> bool:
         """Получить настройку уведомлений при авто-принятии заявок."""
         def _get_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cur = db.execute(
                         "SELECT auto_accept_notify FROM chats WHERE chat_id = ?",
                         (chat_id,)
@@ -934,13 +1035,13 @@ class Database:
             except Exception as e:
                 logger.error(f"Ошибка при получении настройки авто-уведомлений для чата {chat_id}: {e}")
                 return False
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
 
     async def set_auto_accept_notify(self, chat_id: int, enabled: bool) -> bool:
         """Установить настройку уведомлений при авто-принятии заявок."""
         def _set_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute(
                         "UPDATE chats SET auto_accept_notify = ? WHERE chat_id = ?",
                         (1 if enabled else 0, chat_id)
@@ -950,16 +1051,17 @@ class Database:
             except Exception as e:
                 logger.error(f"Ошибка при установке настройки авто-уведомлений для чата {chat_id}: {e}")
                 return False
-        return await asyncio.get_event_loop().run_in_executor(None, _set_sync)
+        result = await self._pool.write(_set_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def get_top_chat_settings(self, chat_id: int) -> Dict[str, Any]:
         """Получить настройки показа в топе для чата"""
         def _get_settings_sync():
             try:
                 from config import TOP_CHATS_DEFAULTS
-                import json
                 
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT show_in_top, show_private_label, min_activity_threshold
                         FROM chats
@@ -975,62 +1077,20 @@ class Database:
                             'min_activity_threshold': row[2] if row[2] is not None else TOP_CHATS_DEFAULTS['min_activity_threshold']
                         }
                     
-                    # Если настроек нет в БД, пытаемся мигрировать из JSON
-                    json_path = Path("data/top_chats_settings.json")
-                    if json_path.exists():
-                        try:
-                            with open(json_path, 'r', encoding='utf-8') as f:
-                                all_settings = json.load(f)
-                            chat_settings = all_settings.get(str(chat_id), {})
-                            
-                            if chat_settings:
-                                # Мигрируем данные в БД
-                                settings_to_save = {**TOP_CHATS_DEFAULTS, **chat_settings}
-                                
-                                # Удаляем поле 'visible', если оно есть (оно не используется)
-                                settings_to_save.pop('visible', None)
-                                
-                                # Сохраняем в БД
-                                updates = []
-                                params = []
-                                
-                                if 'show_in_top' in settings_to_save:
-                                    updates.append("show_in_top = ?")
-                                    params.append(settings_to_save['show_in_top'])
-                                
-                                if 'show_private_label' in settings_to_save:
-                                    updates.append("show_private_label = ?")
-                                    params.append(1 if settings_to_save['show_private_label'] else 0)
-                                
-                                if 'min_activity_threshold' in settings_to_save:
-                                    updates.append("min_activity_threshold = ?")
-                                    params.append(int(settings_to_save['min_activity_threshold']))
-                                
-                                if updates:
-                                    params.append(chat_id)
-                                    query = f"UPDATE chats SET {', '.join(updates)} WHERE chat_id = ?"
-                                    db.execute(query, params)
-                                    db.commit()
-                                    logger.info(f"Настройки топа для чата {chat_id} мигрированы из JSON в БД")
-                                
-                                return settings_to_save
-                        except Exception as json_error:
-                            logger.warning(f"Ошибка при миграции настроек топа из JSON для чата {chat_id}: {json_error}")
-                    
-                    # Если ничего не найдено, возвращаем значения по умолчанию
+                    # Настройки из JSON перенесены миграцией 6, иначе - значения по умолчанию
                     return TOP_CHATS_DEFAULTS.copy()
             except Exception as e:
                 logger.error(f"Ошибка при получении настроек топа для чата {chat_id}: {e}")
                 from config import TOP_CHATS_DEFAULTS
                 return TOP_CHATS_DEFAULTS.copy()
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_settings_sync)
+        return await self._pool.run(_get_settings_sync)
     
     async def set_top_chat_setting(self, chat_id: int, setting_name: str, value: Any) -> bool:
         """Установить одну настройку топа для чата"""
         def _set_setting_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     if setting_name == 'show_in_top':
                         db.execute("UPDATE chats SET show_in_top = ? WHERE chat_id = ?", (value, chat_id))
                     elif setting_name == 'show_private_label':
@@ -1046,13 +1106,15 @@ class Database:
                 logger.error(f"Ошибка при установке настройки топа {setting_name} для чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _set_setting_sync)
+        result = await self._pool.write(_set_setting_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def update_top_chat_settings(self, chat_id: int, settings: Dict[str, Any]) -> bool:
         """Обновить несколько настроек топа для чата"""
         def _update_settings_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     updates = []
                     params = []
                     
@@ -1078,13 +1140,15 @@ class Database:
                 logger.error(f"Ошибка при обновлении настроек топа для чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_settings_sync)
+        result = await self._pool.write(_update_settings_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def update_admin_rights(self, chat_id: int, has_rights: bool) -> bool:
         """Обновление информации о правах администратора"""
         def _update_admin_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         UPDATE chats SET has_admin_rights = ? WHERE chat_id = ?
                     """, (has_rights, chat_id))
@@ -1094,7 +1158,9 @@ class Database:
                 logger.error(f"Ошибка при обновлении прав администратора для чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_admin_sync)
+        result = await self._pool.write(_update_admin_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def increment_message_count(self, chat_id: int, date: str = None) -> bool:
         """Увеличение счетчика сообщений за день"""
@@ -1103,42 +1169,32 @@ class Database:
             ts = datetime.utcnow().timestamp() + 10800
             date = datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d')
         
+        activity_date = self._activity_date
+        
         def _increment_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
-                    # Проверяем, есть ли запись за этот день
-                    cursor = db.execute("""
-                        SELECT message_count FROM daily_stats 
-                        WHERE chat_id = ? AND date = ?
+                with self._pool.connect() as db:
+                    db.execute("""
+                        INSERT INTO daily_stats (chat_id, date, message_count)
+                        VALUES (?, ?, 1)
+                        ON CONFLICT(chat_id, date) DO UPDATE SET message_count = message_count + 1
                     """, (chat_id, date))
-                    row = cursor.fetchone()
-                    
-                    if row:
-                        # Обновляем существующую запись
-                        db.execute("""
-                            UPDATE daily_stats SET message_count = message_count + 1
-                            WHERE chat_id = ? AND date = ?
-                        """, (chat_id, date))
-                    else:
-                        # Создаем новую запись
-                        db.execute("""
-                            INSERT INTO daily_stats (chat_id, date, message_count)
-                            VALUES (?, ?, 1)
-                        """, (chat_id, date))
-                    
+                    # Устаревшую сводку не трогаем - она будет пересчитана целиком
+                    if activity_date is not None:
+                        _add_chat_activity(db, [(chat_id, date, 1)], activity_date)
                     db.commit()
                     return True
             except Exception as e:
                 logger.error(f"Ошибка при увеличении счетчика сообщений для чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _increment_sync)
+        return await self._pool.write(_increment_sync)
     
     async def get_daily_stats(self, chat_id: int, days: int = 7) -> List[Dict[str, Any]]:
         """Получение статистики сообщений за последние N дней"""
-        def _get_stats_sync():
+        def _get_stats_sync(pending):
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT date, message_count FROM daily_stats 
                         WHERE chat_id = ? 
@@ -1146,6 +1202,13 @@ class Database:
                         LIMIT ?
                     """, (chat_id, days))
                     rows = cursor.fetchall()
+                    if pending:
+                        counts = {}
+                        for date, count in rows:
+                            counts[date] = counts.get(date, 0) + (count or 0)
+                        for date, count in pending.items():
+                            counts[date] = counts.get(date, 0) + count
+                        rows = sorted(counts.items(), reverse=True)[:days]
                     return [
                         {
                             'date': row[0],
@@ -1157,7 +1220,9 @@ class Database:
                 logger.error(f"Ошибка при получении статистики для чата {chat_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_stats_sync)
+        return await self._read_with_pending(
+            lambda: self._stats_buffer.get_chat_counts(chat_id), _get_stats_sync
+        )
     
     async def get_today_message_count(self, chat_id: int) -> int:
         """Получение количества сообщений за сегодня"""
@@ -1177,7 +1242,7 @@ class Database:
 
         def _ensure_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Пытаемся вставить, при конфликте ничего не делаем
                     db.execute(
                         """
@@ -1190,13 +1255,13 @@ class Database:
             except Exception as e:
                 logger.error(f"Ошибка при фиксации first_seen для пользователя {user_id} в чате {chat_id}: {e}")
 
-        await asyncio.get_event_loop().run_in_executor(None, _ensure_sync)
+        await self._pool.write(_ensure_sync)
 
     async def get_user_first_seen(self, chat_id: int, user_id: int) -> str | None:
         """Получить дату первого появления пользователя в чате"""
         def _get_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cur = db.execute(
                         "SELECT first_seen FROM user_chat_meta WHERE chat_id = ? AND user_id = ?",
                         (chat_id, user_id),
@@ -1207,13 +1272,13 @@ class Database:
                 logger.error(f"Ошибка при получении first_seen для пользователя {user_id} в чате {chat_id}: {e}")
                 return None
 
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
 
     async def get_user_30d_stats(self, chat_id: int, user_id: int) -> list[dict[str, int | str]]:
         """Статистика пользователя по дням за последние 30 дней в чате"""
-        def _get_sync():
+        def _get_sync(pending):
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cur = db.execute(
                         """
                         SELECT date, message_count FROM user_daily_stats
@@ -1224,18 +1289,27 @@ class Database:
                         (chat_id, user_id),
                     )
                     rows = cur.fetchall()
+                    if pending:
+                        min_date = db.execute("SELECT date('now','-29 days')").fetchone()[0]
+                        counts = dict(rows)
+                        for date, count in pending.items():
+                            if date >= min_date:
+                                counts[date] = (counts.get(date) or 0) + count
+                        rows = sorted(counts.items())
                     return [{"date": r[0], "message_count": r[1]} for r in rows]
             except Exception as e:
                 logger.error(f"Ошибка при получении 30д статистики пользователя {user_id}: {e}")
                 return []
 
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._read_with_pending(
+            lambda: self._stats_buffer.get_user_counts(chat_id, user_id), _get_sync
+        )
 
     async def get_user_7d_stats(self, chat_id: int, user_id: int) -> list[dict[str, int | str]]:
         """Статистика пользователя по дням за последние 7 дней в чате"""
-        def _get_sync():
+        def _get_sync(pending):
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cur = db.execute(
                         """
                         SELECT date, message_count FROM user_daily_stats
@@ -1246,18 +1320,27 @@ class Database:
                         (chat_id, user_id),
                     )
                     rows = cur.fetchall()
+                    if pending:
+                        min_date = db.execute("SELECT date('now','-6 days')").fetchone()[0]
+                        counts = dict(rows)
+                        for date, count in pending.items():
+                            if date >= min_date:
+                                counts[date] = (counts.get(date) or 0) + count
+                        rows = sorted(counts.items())
                     return [{"date": r[0], "message_count": r[1]} for r in rows]
             except Exception as e:
                 logger.error(f"Ошибка при получении 7д статистики пользователя {user_id}: {e}")
                 return []
 
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._read_with_pending(
+            lambda: self._stats_buffer.get_user_counts(chat_id, user_id), _get_sync
+        )
 
     async def get_user_best_day(self, chat_id: int, user_id: int) -> dict | None:
         """Лучший день пользователя (макс. сообщений) в чате"""
-        def _get_sync():
+        def _get_sync(pending):
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cur = db.execute(
                         """
                         SELECT date, message_count FROM user_daily_stats
@@ -1268,18 +1351,36 @@ class Database:
                         (chat_id, user_id),
                     )
                     row = cur.fetchone()
+                    if pending:
+                        # Лучшим может стать только день с несохраненными сообщениями
+                        dates = list(pending)
+                        placeholders = ",".join("?" * len(dates))
+                        stored = dict(db.execute(
+                            f"""
+                            SELECT date, message_count FROM user_daily_stats
+                            WHERE chat_id = ? AND user_id = ? AND date IN ({placeholders})
+                            """,
+                            (chat_id, user_id, *dates),
+                        ).fetchall())
+                        candidates = [((stored.get(date) or 0) + count, date) for date, count in pending.items()]
+                        if row:
+                            candidates.append((row[1] or 0, row[0]))
+                        count, date = max(candidates)
+                        return {"date": date, "message_count": count}
                     return {"date": row[0], "message_count": row[1]} if row else None
             except Exception as e:
                 logger.error(f"Ошибка при получении лучшего дня пользователя {user_id}: {e}")
                 return None
 
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._read_with_pending(
+            lambda: self._stats_buffer.get_user_counts(chat_id, user_id), _get_sync
+        )
 
     async def get_user_daily_stats(self, chat_id: int, user_id: int, date: str) -> Optional[dict]:
         """Получение статистики пользователя за конкретный день"""
-        def _get_sync():
+        def _get_sync(pending_count):
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cur = db.execute(
                         """
                         SELECT date, message_count FROM user_daily_stats
@@ -1289,60 +1390,79 @@ class Database:
                     )
                     row = cur.fetchone()
                     if row:
-                        return {"date": row[0], "message_count": row[1]}
+                        return {"date": row[0], "message_count": (row[1] or 0) + pending_count}
+                    if pending_count:
+                        return {"date": date, "message_count": pending_count}
                     return None
             except Exception as e:
                 logger.error(f"Ошибка при получении дневной статистики пользователя {user_id}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._read_with_pending(
+            lambda: self._stats_buffer.get_user_counts(chat_id, user_id).get(date, 0), _get_sync
+        )
 
     async def get_user_global_activity(self, user_id: int) -> dict:
         """Глобальная активность по всем чатам: сегодня и за 7 дней"""
-        def _get_sync():
+        def _get_sync(pending):
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cur = db.execute(
                         """
                         SELECT 
                           SUM(CASE WHEN date = date('now') THEN message_count ELSE 0 END) AS today_sum,
-                          SUM(CASE WHEN date >= date('now','-6 days') THEN message_count ELSE 0 END) AS week_sum
+                          SUM(CASE WHEN date >= date('now','-6 days') THEN message_count ELSE 0 END) AS week_sum,
+                          date('now'), date('now','-6 days')
                         FROM user_daily_stats
                         WHERE user_id = ?
                         """,
                         (user_id,),
                     )
-                    row = cur.fetchone()
-                    return {"today": row[0] or 0, "week": row[1] or 0}
+                    today_sum, week_sum, today, week_start = cur.fetchone()
+                    today_sum = today_sum or 0
+                    week_sum = week_sum or 0
+                    for date, count in pending.items():
+                        if date == today:
+                            today_sum += count
+                        if date >= week_start:
+                            week_sum += count
+                    return {"today": today_sum, "week": week_sum}
             except Exception as e:
                 logger.error(f"Ошибка при получении глобальной активности пользователя {user_id}: {e}")
                 return {"today": 0, "week": 0}
 
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._read_with_pending(
+            lambda: self._stats_buffer.get_user_counts_all_chats(user_id), _get_sync
+        )
     
     async def cleanup_old_stats(self, days_to_keep: int = 7) -> bool:
         """Очистка старых записей статистики (старше N дней)"""
         def _cleanup_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Вычисляем сегодняшнюю дату по Москве (UTC+3)
                     ts = datetime.utcnow().timestamp() + 10800
                     moscow_today = datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d')
                     # Удаляем записи старше указанного количества дней относительно московской даты
-                    db.execute(
+                    cursor = db.execute(
                         """
                         DELETE FROM daily_stats 
                         WHERE date < date(?, '-{} days')
                         """.format(days_to_keep),
                         (moscow_today,)
                     )
+                    deleted = cursor.rowcount
                     db.commit()
-                    return True
+                    return deleted
             except Exception as e:
                 logger.error(f"Ошибка при очистке старых записей: {e}")
-                return False
+                return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_sync)
+        deleted = await self._pool.write(_cleanup_sync)
+        # Сводка активности зависит только от последних дней - очистка за пределами окон её не меняет
+        if deleted and days_to_keep <= max(ACTIVITY_WINDOWS):
+            self._invalidate_chat_activity()
+        return deleted is not None
     
     async def reset_daily_stats(self, chat_id: int = None) -> bool:
         """Сброс ежедневной статистики за сегодня (по МСК)
@@ -1360,9 +1480,15 @@ class Database:
         now_msk = datetime.now(msk_tz)
         today = now_msk.strftime('%Y-%m-%d')
         
+        # Часы московских суток в почасовых счетчиках
+        start_hour, end_hour = _local_day_hours(3)
+        
+        # Сначала записываем накопленную статистику, иначе она вернется после сброса
+        await self.flush_message_stats()
+        
         def _reset_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     if chat_id is not None:
                         # Сбрасываем статистику для конкретного чата
                         db.execute(
@@ -1373,6 +1499,10 @@ class Database:
                             "DELETE FROM user_daily_stats WHERE chat_id = ? AND date = ?",
                             (chat_id, today)
                         )
+                        db.execute(
+                            "DELETE FROM user_hourly_stats WHERE chat_id = ? AND utc_hour >= ? AND utc_hour < ?",
+                            (chat_id, start_hour, end_hour)
+                        )
                     else:
                         # Сбрасываем статистику для всех чатов
                         db.execute(
@@ -1383,6 +1513,10 @@ class Database:
                             "DELETE FROM user_daily_stats WHERE date = ?",
                             (today,)
                         )
+                        db.execute(
+                            "DELETE FROM user_hourly_stats WHERE utc_hour >= ? AND utc_hour < ?",
+                            (start_hour, end_hour)
+                        )
                     db.commit()
                     logger.info(f"Ежедневная статистика сброшена за {today} для {'чата ' + str(chat_id) if chat_id else 'всех чатов'}")
                     return True
@@ -1390,7 +1524,9 @@ class Database:
                 logger.error(f"Ошибка при сбросе ежедневной статистики: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _reset_sync)
+        result = await self._pool.write(_reset_sync)
+        self._invalidate_chat_activity()
+        return result
     
     async def increment_user_message_count(self, chat_id: int, user_id: int, 
                                          username: str = None, first_name: str = None, 
@@ -1403,118 +1539,265 @@ class Database:
         
         def _increment_user_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
-                    # Включаем настройки производительности
-                    _apply_pragma_settings(db)
-                    
-                    # Проверяем, есть ли дубликаты для этого пользователя за этот день
-                    cursor = db.execute("""
-                        SELECT COUNT(*) FROM user_daily_stats 
-                        WHERE chat_id = ? AND user_id = ? AND date = ?
-                    """, (chat_id, user_id, date))
-                    record_count = cursor.fetchone()[0]
-                    
-                    if record_count > 1:
-                        # Есть дубликаты - удаляем их и суммируем message_count
-                        cursor = db.execute("""
-                            SELECT SUM(message_count) as total_count
-                            FROM user_daily_stats
-                            WHERE chat_id = ? AND user_id = ? AND date = ?
-                        """, (chat_id, user_id, date))
-                        total_count_row = cursor.fetchone()
-                        total_count = total_count_row[0] if total_count_row and total_count_row[0] is not None else 0
-                        
-                        # Удаляем все дубликаты, оставляем только одну запись с максимальным rowid
-                        db.execute("""
-                            DELETE FROM user_daily_stats 
-                            WHERE chat_id = ? AND user_id = ? AND date = ?
-                            AND rowid NOT IN (
-                                SELECT MAX(rowid) 
-                                FROM user_daily_stats 
-                                WHERE chat_id = ? AND user_id = ? AND date = ?
-                            )
-                        """, (chat_id, user_id, date, chat_id, user_id, date))
-                        
-                        # Обновляем оставшуюся запись с суммированным счетчиком + 1
-                        new_count = total_count + 1
-                        cursor = db.execute("""
-                            UPDATE user_daily_stats 
-                            SET message_count = ?, username = ?, first_name = ?, last_name = ?
-                            WHERE chat_id = ? AND user_id = ? AND date = ?
-                        """, (new_count, username, first_name, last_name, chat_id, user_id, date))
-                        
-                        # Если запись не была обновлена (не найдена после удаления), создаем новую
-                        if cursor.rowcount == 0:
-                            logger.warning(f"Запись не найдена после удаления дубликатов, создаем новую для user_id={user_id}, chat_id={chat_id}, date={date}")
-                            db.execute("""
-                                INSERT INTO user_daily_stats 
-                                (chat_id, user_id, date, message_count, username, first_name, last_name)
-                                VALUES (?, ?, ?, ?, ?, ?, ?)
-                            """, (chat_id, user_id, date, new_count, username, first_name, last_name))
-                    elif record_count == 1:
-                        # Запись уже существует (одна), увеличиваем счетчик
-                        cursor = db.execute("""
-                            SELECT message_count FROM user_daily_stats 
-                            WHERE chat_id = ? AND user_id = ? AND date = ?
-                        """, (chat_id, user_id, date))
-                        row = cursor.fetchone()
-                        if row and row[0] is not None:
-                            new_count = row[0] + 1
-                        else:
-                            new_count = 1
-                        db.execute("""
-                            UPDATE user_daily_stats 
-                            SET message_count = ?, username = ?, first_name = ?, last_name = ?
-                            WHERE chat_id = ? AND user_id = ? AND date = ?
-                        """, (new_count, username, first_name, last_name, chat_id, user_id, date))
-                    else:
-                        # Записи нет, создаем новую
-                        # Используем INSERT OR IGNORE для защиты от возможных конфликтов с уникальным индексом
-                        # Если запись уже существует (race condition), обновим её
-                        try:
-                            db.execute("""
-                                INSERT INTO user_daily_stats 
-                                (chat_id, user_id, date, message_count, username, first_name, last_name)
-                                VALUES (?, ?, ?, 1, ?, ?, ?)
-                            """, (chat_id, user_id, date, username, first_name, last_name))
-                        except sqlite3.IntegrityError:
-                            # Если возникла ошибка уникальности (индекс уже создан и есть запись),
-                            # обновляем существующую запись
-                            cursor = db.execute("""
-                                SELECT message_count FROM user_daily_stats 
-                                WHERE chat_id = ? AND user_id = ? AND date = ?
-                            """, (chat_id, user_id, date))
-                            row = cursor.fetchone()
-                            if row and row[0] is not None:
-                                new_count = row[0] + 1
-                            else:
-                                new_count = 1
-                            db.execute("""
-                                UPDATE user_daily_stats 
-                                SET message_count = ?, username = ?, first_name = ?, last_name = ?
-                                WHERE chat_id = ? AND user_id = ? AND date = ?
-                            """, (new_count, username, first_name, last_name, chat_id, user_id, date))
-                    
+                with self._pool.connect() as db:
+                    db.execute("""
+                        INSERT INTO user_daily_stats 
+                        (chat_id, user_id, date, message_count, username, first_name, last_name)
+                        VALUES (?, ?, ?, 1, ?, ?, ?)
+                        ON CONFLICT(chat_id, user_id, date) DO UPDATE SET
+                            message_count = message_count + 1,
+                            username = excluded.username,
+                            first_name = excluded.first_name,
+                            last_name = excluded.last_name
+                    """, (chat_id, user_id, date, username, first_name, last_name))
                     db.commit()
                     return True
             except Exception as e:
                 logger.error(f"Ошибка при увеличении счетчика сообщений пользователя {user_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _increment_user_sync)
+        return await self._pool.write(_increment_user_sync)
+    
+    async def record_message(self, chat_id: int, user_id: int, username: str = None,
+                             first_name: str = None, last_name: str = None, is_bot: bool = False,
+                             message_time: datetime = None) -> None:
+        """Учесть сообщение в статистике (запись в БД выполняется пакетно, см. flush_message_stats)"""
+        if message_time is None:
+            message_time = datetime.now()
+        # Дата по московскому времени (UTC+3)
+        ts = datetime.utcnow().timestamp() + 10800
+        date = datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d')
+        
+        self._stats_buffer.add_message(
+            chat_id, user_id, date,
+            message_time=message_time.isoformat(),
+            first_seen=message_time.strftime('%Y-%m-%d'),
+            username=username, first_name=first_name, last_name=last_name, is_bot=is_bot,
+            utc_hour=int(message_time.timestamp() // 3600)
+        )
+        
+        # Досрочный сброс при достижении лимита памяти
+        if self._stats_buffer.is_full() and (self._stats_flush_task is None or self._stats_flush_task.done()):
+            self._stats_flush_task = asyncio.create_task(self.flush_message_stats())
+    
+    async def flush_message_stats(self) -> int:
+        """Записать накопленные счетчики сообщений в БД одной транзакцией. Возвращает число сообщений"""
+        async with self._stats_flush_lock:
+            batch = self._stats_buffer.take()
+            if batch is None:
+                return 0
+            
+            chat_rows = [(chat_id, date, count) for (chat_id, date), count in batch.chat_counts.items()]
+            user_rows = [
+                (chat_id, user_id, date, entry[0], entry[1], entry[2], entry[3])
+                for (chat_id, user_id, date), entry in batch.user_counts.items()
+            ]
+            hour_rows = [(chat_id, user_id, hour, count) for (chat_id, user_id, hour), count in batch.hour_counts.items()]
+            last_message_rows = [(chat_id, user_id, ts) for (chat_id, user_id), ts in batch.last_message.items()]
+            first_seen_rows = [(chat_id, user_id, when) for (chat_id, user_id), when in batch.first_seen.items()]
+            users_rows = [(user_id,) + profile for user_id, profile in batch.users.items()]
+            
+            activity_date = datetime.utcnow().strftime('%Y-%m-%d')
+            rebuild_activity = self._activity_date != activity_date
+            activity_version = self._activity_version
+            
+            def _flush_sync():
+                try:
+                    with self._pool.connect() as db:
+                        db.executemany("""
+                            INSERT INTO daily_stats (chat_id, date, message_count)
+                            VALUES (?, ?, ?)
+                            ON CONFLICT(chat_id, date) DO UPDATE SET message_count = message_count + excluded.message_count
+                        """, chat_rows)
+                        
+                        if rebuild_activity:
+                            _rebuild_chat_activity(db, activity_date)
+                        else:
+                            _add_chat_activity(db, chat_rows, activity_date)
+                        
+                        db.executemany("""
+                            INSERT INTO user_daily_stats 
+                            (chat_id, user_id, date, message_count, username, first_name, last_name)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(chat_id, user_id, date) DO UPDATE SET
+                                message_count = message_count + excluded.message_count,
+                                username = excluded.username,
+                                first_name = excluded.first_name,
+                                last_name = excluded.last_name
+                        """, user_rows)
+                        
+                        db.executemany("""
+                            INSERT INTO user_hourly_stats (chat_id, user_id, utc_hour, message_count)
+                            VALUES (?, ?, ?, ?)
+                            ON CONFLICT(chat_id, user_id, utc_hour) DO UPDATE SET
+                                message_count = message_count + excluded.message_count
+                        """, hour_rows)
+                        
+                        db.executemany("""
+                            INSERT OR IGNORE INTO user_chat_meta (chat_id, user_id, first_seen)
+                            VALUES (?, ?, ?)
+                        """, first_seen_rows)
+                        
+                        db.executemany("""
+                            INSERT INTO user_last_message (chat_id, user_id, last_message_time)
+                            VALUES (?, ?, ?)
+                            ON CONFLICT(chat_id, user_id) DO UPDATE SET last_message_time = excluded.last_message_time
+                        """, last_message_rows)
+                        
+                        # mention_ping_enabled существующих пользователей не меняется
+                        db.executemany("""
+                            INSERT INTO users (user_id, username, first_name, last_name, is_bot, last_seen)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(user_id) DO UPDATE SET
+                                username = excluded.username,
+                                first_name = excluded.first_name,
+                                last_name = excluded.last_name,
+                                is_bot = excluded.is_bot,
+                                last_seen = excluded.last_seen
+                        """, users_rows)
+                        
+                        db.commit()
+                        return True
+                except Exception as e:
+                    logger.error(f"Ошибка при записи накопленной статистики сообщений: {e}")
+                    return False
+            
+            try:
+                success = await self._pool.write(_flush_sync)
+            except Exception as e:
+                logger.error(f"Ошибка при фиксации накопленной статистики сообщений: {e}")
+                success = False
+            
+            if success:
+                self._stats_buffer.commit(batch)
+                if rebuild_activity and activity_version == self._activity_version:
+                    self._activity_date = activity_date
+                if DEBUG:
+                    logger.debug(f"Записано {batch.message_count} сообщений статистики ({len(batch)} ключей)")
+                return batch.message_count
+            
+            self._stats_buffer.restore(batch)
+            return 0
+    
+    async def _read_with_pending(self, get_pending: Callable[[], Any], read_sync: Callable[[Any], Any]) -> Any:
+        """
+        Прочитать БД вместе с несохраненными счетчиками буфера статистики.
+        
+        read_sync выполняется в потоке пула и получает снимок буфера от get_pending.
+        Если за время чтения пакет буфера был записан в БД, его сообщения учлись бы
+        дважды (и в БД, и в снимке) или ни разу. Поэтому пока идет сброс, чтение его
+        дожидается, а если сброс начался во время чтения (сменилось поколение
+        буфера) - чтение повторяется.
+        """
+        buffer = self._stats_buffer
+        for _ in range(STATS_READ_ATTEMPTS):
+            if buffer.has_inflight():
+                async with self._stats_flush_lock:
+                    pass
+                continue
+            generation = buffer.generation
+            result = await self._pool.run(read_sync, get_pending())
+            if buffer.generation == generation:
+                return result
+        
+        # Сбросы идут один за другим - читаем, не давая начаться следующему
+        async with self._stats_flush_lock:
+            return await self._pool.run(read_sync, get_pending())
+    
+    def get_message_stats_buffer_stats(self) -> Dict[str, Any]:
+        """Метрики буфера статистики сообщений"""
+        return self._stats_buffer.get_stats()
+    
+    def _invalidate_chat_activity(self):
+        """Пометить сводку chat_activity устаревшей (после удаления или переноса daily_stats)"""
+        self._activity_date = None
+        self._activity_version += 1
+    
+    async def _ensure_chat_activity(self) -> bool:
+        """
+        Убедиться, что окна chat_activity посчитаны на сегодня (UTC).
+        
+        В течение дня сводка пополняется при записи счетчиков, а со сменой даты
+        или после удаления статистики пересчитывается из daily_stats.
+        """
+        activity_date = datetime.utcnow().strftime('%Y-%m-%d')
+        if self._activity_date == activity_date:
+            return True
+        
+        # Под блокировкой сброса статистики, чтобы не пересчитывать параллельно с записью счетчиков
+        async with self._stats_flush_lock:
+            if self._activity_date == activity_date:
+                return True
+            activity_version = self._activity_version
+            
+            def _rebuild_sync():
+                try:
+                    with self._pool.connect() as db:
+                        _rebuild_chat_activity(db, activity_date)
+                        db.commit()
+                        return True
+                except Exception as e:
+                    logger.error(f"Ошибка при пересчете сводки активности чатов: {e}")
+                    return False
+            
+            success = await self._pool.write(_rebuild_sync)
+            if success and activity_version == self._activity_version:
+                self._activity_date = activity_date
+            return success
     
     async def get_top_users_today(self, chat_id: int, limit: int = 20, timezone_offset: int = 3) -> List[Dict[str, Any]]:
         """Получение топа пользователей за сегодня с учетом часового пояса. Группирует по user_id для предотвращения дубликатов."""
+        # Сутки пользователя как 24 UTC-часа
+        start_hour, end_hour = _local_day_hours(timezone_offset)
+        if self._hourly_since is None or start_hour < self._hourly_since:
+            return await self._get_top_users_today_daily(chat_id, limit, timezone_offset)
+        
+        def _get_top_users_sync(pending):
+            try:
+                with self._pool.connect() as db:
+                    cursor = db.execute("""
+                        SELECT h.user_id, u.username, u.first_name, u.last_name, SUM(h.message_count) as message_count
+                        FROM user_hourly_stats h
+                        LEFT JOIN users u ON u.user_id = h.user_id
+                        WHERE h.chat_id = ? AND h.utc_hour >= ? AND h.utc_hour < ?
+                        GROUP BY h.user_id
+                        HAVING message_count > 0
+                        ORDER BY message_count DESC
+                        LIMIT ?
+                    """, (chat_id, start_hour, end_hour, limit))
+                    rows = cursor.fetchall()
+                    
+                    if pending:
+                        pending_rows = _fetch_user_hour_rows(db, chat_id, start_hour, end_hour, list(pending))
+                        rows = _merge_pending_user_counts(rows, pending_rows, pending, limit)
+                    
+                    return [
+                        {
+                            'user_id': row[0],
+                            'username': row[1],
+                            'first_name': row[2],
+                            'last_name': row[3],
+                            'message_count': row[4]
+                        }
+                        for row in rows
+                    ]
+            except Exception as e:
+                logger.error(f"Ошибка при получении топа пользователей для чата {chat_id}: {e}")
+                return []
+        
+        return await self._read_with_pending(
+            lambda: self._stats_buffer.get_chat_user_hour_counts(chat_id, start_hour, end_hour), _get_top_users_sync
+        )
+    
+    async def _get_top_users_today_daily(self, chat_id: int, limit: int, timezone_offset: int) -> List[Dict[str, Any]]:
+        """Топ за сегодня по дневным счетчикам (до появления почасовых; даты в user_daily_stats - московские)"""
         # Дата с учетом часового пояса пользователя
         ts = datetime.utcnow().timestamp() + (timezone_offset * 3600)
         today = datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d')
         
-        def _get_top_users_sync():
+        def _get_top_users_sync(pending):
             try:
-                with sqlite3.connect(self.db_path) as db:
-                    # Применяем настройки производительности
-                    _apply_pragma_settings(db)
-                    
+                with self._pool.connect() as db:
                     # Отладочная информация только в DEBUG режиме
                     if DEBUG:
                         logger.info(f"get_top_users_today: chat_id={chat_id}, today={today}, limit={limit}")
@@ -1546,6 +1829,10 @@ class Database:
                     """, (chat_id, today, limit))
                     rows = cursor.fetchall()
                     
+                    if pending:
+                        pending_rows = _fetch_user_rows(db, "chat_id = ? AND date = ?", (chat_id, today), list(pending))
+                        rows = _merge_pending_user_counts(rows, pending_rows, pending, limit)
+                    
                     if DEBUG:
                         logger.info(f"Найдено {len(rows)} пользователей с сообщениями > 0")
                     
@@ -1563,13 +1850,15 @@ class Database:
                 logger.error(f"Ошибка при получении топа пользователей для чата {chat_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_top_users_sync)
+        return await self._read_with_pending(
+            lambda: self._stats_buffer.get_chat_user_counts(chat_id, today, today), _get_top_users_sync
+        )
     
     async def get_top_users_last_days_global(self, days: int = 60, limit: int = 30) -> List[Dict[str, Any]]:
         """Топ пользователей по сообщениям за последние N дней по всем чатам."""
         def _get_top_users_last_days_global_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute(
                         f"""
                             SELECT 
@@ -1602,13 +1891,16 @@ class Database:
                 logger.error(f"Ошибка при получении глобального топа пользователей за {days} дней: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_top_users_last_days_global_sync)
+        return await self._pool.run(_get_top_users_last_days_global_sync)
 
     async def get_top_users_last_days(self, chat_id: int, days: int = 60, limit: int = 20) -> List[Dict[str, Any]]:
         """Топ пользователей по сообщениям за последние N дней для конкретного чата."""
-        def _get_top_users_last_days_sync():
+        from datetime import timedelta
+        min_date = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d')
+        
+        def _get_top_users_last_days_sync(pending):
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute(
                         f"""
                             SELECT 
@@ -1627,6 +1919,11 @@ class Database:
                         (chat_id, limit)
                     )
                     rows = cursor.fetchall()
+                    if pending:
+                        pending_rows = _fetch_user_rows(
+                            db, f"chat_id = ? AND date >= date('now','-{days} days')", (chat_id,), list(pending)
+                        )
+                        rows = _merge_pending_user_counts(rows, pending_rows, pending, limit)
                     return [
                         {
                             'user_id': row[0],
@@ -1641,13 +1938,15 @@ class Database:
                 logger.error(f"Ошибка при получении топа пользователей за {days} дней для чата {chat_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_top_users_last_days_sync)
+        return await self._read_with_pending(
+            lambda: self._stats_buffer.get_chat_user_counts(chat_id, min_date), _get_top_users_last_days_sync
+        )
     
     async def get_all_active_chats(self) -> List[Dict[str, Any]]:
         """Получение всех активных чатов"""
         def _get_chats_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Используем DISTINCT чтобы избежать дубликатов
                     cursor = db.execute("""
                         SELECT DISTINCT chat_id, chat_title, owner_id, added_date, has_admin_rights, chat_type, member_count
@@ -1672,15 +1971,16 @@ class Database:
                 logger.error(f"Ошибка при получении списка чатов: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_chats_sync)
+        return await self._pool.run(_get_chats_sync)
     
     async def get_all_chats_for_update(self) -> List[Dict[str, Any]]:
         """Получение всех активных чатов для обновления (включая приватные)"""
         def _get_all_chats_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
-                        SELECT DISTINCT chat_id, chat_title, owner_id, added_date, has_admin_rights, chat_type, member_count
+                        SELECT DISTINCT chat_id, chat_title, owner_id, added_date, has_admin_rights, chat_type, member_count,
+                               is_public, username, invite_link
                         FROM chats 
                         WHERE is_active = 1
                         ORDER BY added_date DESC
@@ -1694,7 +1994,10 @@ class Database:
                             'added_date': row[3],
                             'has_admin_rights': bool(row[4]),
                             'chat_type': row[5],
-                            'member_count': row[6]
+                            'member_count': row[6],
+                            'is_public': bool(row[7]) if row[7] is not None else None,
+                            'username': row[8],
+                            'invite_link': row[9]
                         }
                         for row in rows
                     ]
@@ -1702,13 +2005,13 @@ class Database:
                 logger.error(f"Ошибка при получении всех чатов для обновления: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_all_chats_sync)
+        return await self._pool.run(_get_all_chats_sync)
     
     async def get_chat_activity_stats(self, chat_id: int, days: int = 7) -> Dict[str, Any]:
         """Получение статистики активности чата за N дней"""
         def _get_stats_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Общее количество сообщений за период
                     # Граница периода относительно московской даты
                     ts = datetime.utcnow().timestamp() + 10800
@@ -1744,13 +2047,13 @@ class Database:
                 logger.error(f"Ошибка при получении статистики чата {chat_id}: {e}")
                 return {'total_messages': 0, 'active_users': 0}
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_stats_sync)
+        return await self._pool.run(_get_stats_sync)
     
     async def create_join_request(self, chat_id: int, user_id: int, admin_message_id: int = None) -> int:
         """Создание запроса на вступление в чат"""
         def _create_request_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         INSERT INTO chat_join_requests (chat_id, user_id, request_date, admin_message_id)
                         VALUES (?, ?, ?, ?)
@@ -1761,13 +2064,13 @@ class Database:
                 logger.error(f"Ошибка при создании запроса на вступление: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _create_request_sync)
+        return await self._pool.write(_create_request_sync)
     
     async def update_join_request_status(self, request_id: int, status: str, invite_link: str = None) -> bool:
         """Обновление статуса запроса на вступление"""
         def _update_request_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         UPDATE chat_join_requests 
                         SET status = ?, invite_link = ?
@@ -1779,13 +2082,13 @@ class Database:
                 logger.error(f"Ошибка при обновлении статуса запроса {request_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_request_sync)
+        return await self._pool.write(_update_request_sync)
     
     async def get_join_request(self, request_id: int) -> Optional[Dict[str, Any]]:
         """Получение информации о запросе на вступление"""
         def _get_request_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT id, chat_id, user_id, request_date, status, invite_link, admin_message_id
                         FROM chat_join_requests 
@@ -1807,13 +2110,16 @@ class Database:
                 logger.error(f"Ошибка при получении запроса {request_id}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_request_sync)
+        return await self._pool.run(_get_request_sync)
     
     async def update_chat_id(self, old_chat_id: int, new_chat_id: int) -> bool:
         """Обновление ID чата при миграции группы в супергруппу"""
+        # Сначала записываем накопленную статистику, иначе она останется под старым ID
+        await self.flush_message_stats()
+        
         def _update_chat_id_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Проверяем, существует ли уже чат с новым ID
                     cursor = db.execute("SELECT chat_id FROM chats WHERE chat_id = ?", (new_chat_id,))
                     if cursor.fetchone():
@@ -1825,8 +2131,27 @@ class Database:
                         db.execute("UPDATE chats SET chat_id = ? WHERE chat_id = ?", (new_chat_id, old_chat_id))
                     
                     # Обновляем ID в остальных таблицах
-                    db.execute("UPDATE daily_stats SET chat_id = ? WHERE chat_id = ?", (new_chat_id, old_chat_id))
-                    db.execute("UPDATE user_daily_stats SET chat_id = ? WHERE chat_id = ?", (new_chat_id, old_chat_id))
+                    # Счетчики переносятся с суммированием (уникальные индексы по chat_id)
+                    db.execute("""
+                        INSERT INTO daily_stats (chat_id, date, message_count)
+                        SELECT ?, date, message_count FROM daily_stats WHERE chat_id = ?
+                        ON CONFLICT(chat_id, date) DO UPDATE SET message_count = message_count + excluded.message_count
+                    """, (new_chat_id, old_chat_id))
+                    db.execute("DELETE FROM daily_stats WHERE chat_id = ?", (old_chat_id,))
+                    db.execute("""
+                        INSERT INTO user_daily_stats 
+                        (chat_id, user_id, date, message_count, username, first_name, last_name)
+                        SELECT ?, user_id, date, message_count, username, first_name, last_name
+                        FROM user_daily_stats WHERE chat_id = ?
+                        ON CONFLICT(chat_id, user_id, date) DO UPDATE SET message_count = message_count + excluded.message_count
+                    """, (new_chat_id, old_chat_id))
+                    db.execute("DELETE FROM user_daily_stats WHERE chat_id = ?", (old_chat_id,))
+                    db.execute("""
+                        INSERT INTO user_hourly_stats (chat_id, user_id, utc_hour, message_count)
+                        SELECT ?, user_id, utc_hour, message_count FROM user_hourly_stats WHERE chat_id = ?
+                        ON CONFLICT(chat_id, user_id, utc_hour) DO UPDATE SET message_count = message_count + excluded.message_count
+                    """, (new_chat_id, old_chat_id))
+                    db.execute("DELETE FROM user_hourly_stats WHERE chat_id = ?", (old_chat_id,))
                     db.execute("UPDATE user_chat_meta SET chat_id = ? WHERE chat_id = ?", (new_chat_id, old_chat_id))
                     db.execute("UPDATE chat_join_requests SET chat_id = ? WHERE chat_id = ?", (new_chat_id, old_chat_id))
                     
@@ -1836,13 +2161,19 @@ class Database:
                 logger.error(f"Ошибка при обновлении ID чата {old_chat_id} -> {new_chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_chat_id_sync)
+        result = await self._pool.write(_update_chat_id_sync)
+        chat_settings_cache.invalidate(old_chat_id)
+        chat_settings_cache.invalidate(new_chat_id)
+        rank_cache.invalidate_chat(old_chat_id)
+        rank_cache.invalidate_chat(new_chat_id)
+        self._invalidate_chat_activity()
+        return result
     
     async def cleanup_old_user_stats(self, days_to_keep: int = 7) -> bool:
         """Очистка старых записей пользовательской статистики"""
         def _cleanup_user_stats_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Удаляем записи старше указанного количества дней
                     db.execute("""
                         DELETE FROM user_daily_stats 
@@ -1854,66 +2185,120 @@ class Database:
                 logger.error(f"Ошибка при очистке старых записей пользовательской статистики: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_user_stats_sync)
+        return await self._pool.write(_cleanup_user_stats_sync)
+    
+    async def compact_hourly_stats(self, days_to_keep: int = MESSAGE_STATS['hourly_retention_days']) -> int:
+        """
+        Удалить почасовые счетчики старше N суток.
+        
+        Те же сообщения записываются в user_daily_stats при каждом сбросе буфера,
+        поэтому старые часы уже свернуты в дневные строки и больше не нужны.
+        Returns:
+            Количество удаленных записей
+        """
+        cutoff_hour = int(time.time() // 3600) - days_to_keep * 24
+        
+        def _compact_sync():
+            try:
+                with self._pool.connect() as db:
+                    cursor = db.execute("DELETE FROM user_hourly_stats WHERE utc_hour < ?", (cutoff_hour,))
+                    db.commit()
+                    return cursor.rowcount
+            except Exception as e:
+                logger.error(f"Ошибка при очистке почасовой статистики: {e}")
+                return 0
+        
+        return await self._pool.write(_compact_sync)
     
     async def get_top_chats_by_activity(self, days: int = 3, limit: int = 30, 
                                        exclude_chat_ids: list = None, 
                                        include_private: bool = False,
-                                       min_activity_threshold: int = 0) -> List[Dict[str, Any]]:
+                                       min_activity_threshold: int = 0,
+                                       respect_top_settings: bool = False) -> List[Dict[str, Any]]:
         """
         Получение топ чатов по активности за указанное количество дней
         
+        Для окон из ACTIVITY_WINDOWS читается готовая сводка chat_activity,
+        для остальных значений days статистика суммируется по daily_stats.
+        
         Args:
             days: Количество дней для анализа
             limit: Максимальное количество чатов в результате
             exclude_chat_ids: Список chat_id для исключения из топа
             include_private: Включать ли частные чаты (по умолчанию только публичные)
             min_activity_threshold: Минимальное количество сообщений для показа
+            respect_top_settings: Учитывать настройку show_in_top чата
+                ('never' - не показывать, 'public_only' - только если чат публичный)
         """
+        use_rollup = days in ACTIVITY_WINDOWS and await self._ensure_chat_activity()
+        
         def _get_top_chats_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Формируем условия WHERE
-                    where_conditions = [
-                        "ds.date >= date('now', '-{} days')".format(days),
-                        "c.is_active = 1"
-                    ]
+                    where_conditions = ["c.is_active = 1"]
                     
                     # Условие для публичных/частных чатов
                     if not include_private:
                         where_conditions.append("c.is_public = 1")
                     
+                    # Настройки показа в топе
+                    if respect_top_settings:
+                        where_conditions.append("COALESCE(c.show_in_top, 'public_only') != 'never'")
+                        where_conditions.append(
+                            "(COALESCE(c.show_in_top, 'public_only') != 'public_only' OR c.is_public = 1)"
+                        )
+                    
                     # Условие для исключения чатов
                     if exclude_chat_ids:
                         placeholders = ','.join(['?'] * len(exclude_chat_ids))
                         where_conditions.append(f"c.chat_id NOT IN ({placeholders})")
                     
-                    where_clause = " AND ".join(where_conditions)
-                    
                     # Параметры для запроса
                     params = []
                     if exclude_chat_ids:
                         params.extend(exclude_chat_ids)
                     
-                    # Получаем топ чатов по общему количеству сообщений за последние N дней
-                    query = f"""
-                        SELECT 
-                            ds.chat_id,
-                            c.chat_title,
-                            SUM(ds.message_count) as total_messages,
-                            COUNT(DISTINCT ds.date) as active_days,
-                            c.is_public
-                        FROM daily_stats ds
-                        JOIN chats c ON ds.chat_id = c.chat_id
-                        WHERE {where_clause}
-                        GROUP BY ds.chat_id
-                        HAVING total_messages > ?
-                        ORDER BY total_messages DESC, active_days DESC
-                        LIMIT ?
-                    """
-                    
-                    params.append(min_activity_threshold)
-                    params.append(limit)
+                    if use_rollup:
+                        # Готовые суммы за окно, порядок берется из индекса idx_chat_activity_N
+                        where_clause = " AND ".join(where_conditions)
+                        query = f"""
+                            SELECT 
+                                a.chat_id,
+                                c.chat_title,
+                                a.messages_{days} as total_messages,
+                                a.active_days_{days} as active_days,
+                                c.is_public
+                            FROM chat_activity a
+                            JOIN chats c ON a.chat_id = c.chat_id
+                            WHERE a.messages_{days} > ? AND {where_clause}
+                            ORDER BY a.messages_{days} DESC, a.active_days_{days} DESC
+                            LIMIT ?
+                        """
+                        params.insert(0, min_activity_threshold)
+                        params.append(limit)
+                    else:
+                        where_conditions.insert(0, "ds.date >= date('now', '-{} days')".format(days))
+                        where_clause = " AND ".join(where_conditions)
+                        
+                        # Получаем топ чатов по общему количеству сообщений за последние N дней
+                        query = f"""
+                            SELECT 
+                                ds.chat_id,
+                                c.chat_title,
+                                SUM(ds.message_count) as total_messages,
+                                COUNT(DISTINCT ds.date) as active_days,
+                                c.is_public
+                            FROM daily_stats ds
+                            JOIN chats c ON ds.chat_id = c.chat_id
+                            WHERE {where_clause}
+                            GROUP BY ds.chat_id
+                            HAVING total_messages > ?
+                            ORDER BY total_messages DESC, active_days DESC
+                            LIMIT ?
+                        """
+                        params.append(min_activity_threshold)
+                        params.append(limit)
                     
                     cursor = db.execute(query, params)
                     
@@ -1932,7 +2317,7 @@ class Database:
                 logger.error(f"Ошибка при получении топ чатов: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_top_chats_sync)
+        return await self._pool.run(_get_top_chats_sync)
     
     async def update_chat_info(self, chat_id: int, title: str = None, chat_type: str = None, 
                               member_count: int = None, is_active: bool = None, is_public: bool = None,
@@ -1940,7 +2325,7 @@ class Database:
         """Обновление информации о чате"""
         def _update_chat_info_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Формируем запрос обновления только для переданных полей
                     updates = []
                     params = []
@@ -1984,13 +2369,15 @@ class Database:
                 logger.error(f"Ошибка при обновлении информации о чате {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_chat_info_sync)
+        result = await self._pool.write(_update_chat_info_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def deactivate_chat(self, chat_id: int) -> bool:
         """Деактивация чата и установка времени заморозки (бот был удален)"""
         def _deactivate_chat_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     frozen_at = datetime.now().isoformat()
                     db.execute("""
                         UPDATE chats 
@@ -2004,13 +2391,41 @@ class Database:
                 logger.error(f"Ошибка при деактивации чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _deactivate_chat_sync)
-    
+        result = await self._pool.write(_deactivate_chat_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
+
+    async def deactivate_chats(self, chat_ids: List[int]) -> int:
+        """Деактивация и заморозка пачки чатов одной транзакцией (например, по итогам рассылки)"""
+        if not chat_ids:
+            return 0
+
+        def _deactivate_chats_sync():
+            try:
+                with self._pool.connect() as db:
+                    frozen_at = datetime.now().isoformat()
+                    cursor = db.executemany("""
+                        UPDATE chats
+                        SET is_active = 0, frozen_at = ?
+                        WHERE chat_id = ? AND is_active = 1
+                    """, [(frozen_at, chat_id) for chat_id in chat_ids])
+                    db.commit()
+                    logger.info(f"Деактивировано и заморожено чатов: {cursor.rowcount} (frozen_at: {frozen_at})")
+                    return cursor.rowcount
+            except Exception as e:
+                logger.error(f"Ошибка при деактивации {len(chat_ids)} чатов: {e}")
+                return 0
+
+        result = await self._pool.write(_deactivate_chats_sync)
+        for chat_id in chat_ids:
+            chat_settings_cache.invalidate(chat_id)
+        return result
+
     async def unfreeze_chat(self, chat_id: int) -> bool:
         """Разморозка чата и сброс времени заморозки (бот был добавлен обратно)"""
         def _unfreeze_chat_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         UPDATE chats 
                         SET is_active = 1, frozen_at = NULL 
@@ -2023,13 +2438,15 @@ class Database:
                 logger.error(f"Ошибка при разморозке чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _unfreeze_chat_sync)
+        result = await self._pool.write(_unfreeze_chat_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def cleanup_duplicate_chats(self) -> bool:
         """Очистка дублирующихся записей чатов"""
         def _cleanup_duplicates_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Находим дубликаты по chat_id
                     cursor = db.execute("""
                         SELECT chat_id, COUNT(*) as count
@@ -2057,73 +2474,8 @@ class Database:
                         total_cleaned += result.rowcount
                         logger.info(f"Удалено {result.rowcount} дубликатов для чата {chat_id}")
                     
-                    # Также очищаем дубликаты в daily_stats
-                    cursor = db.execute("""
-                        SELECT chat_id, date, COUNT(*) as count
-                        FROM daily_stats
-                        GROUP BY chat_id, date
-                        HAVING COUNT(*) > 1
-                    """)
-                    stats_duplicates = cursor.fetchall()
-                    
-                    for chat_id, date, count in stats_duplicates:
-                        logger.info(f"Найден дубликат статистики для чата {chat_id} на дату {date} ({count} записей)")
-                        
-                        # Оставляем только самую новую запись
-                        result = db.execute("""
-                            DELETE FROM daily_stats 
-                            WHERE chat_id = ? AND date = ?
-                            AND rowid NOT IN (
-                                SELECT MAX(rowid) 
-                                FROM daily_stats 
-                                WHERE chat_id = ? AND date = ?
-                            )
-                        """, (chat_id, date, chat_id, date))
-                        
-                        total_cleaned += result.rowcount
-                    
-                    # Очищаем дубликаты в user_daily_stats
-                    cursor = db.execute("""
-                        SELECT chat_id, user_id, date, COUNT(*) as count
-                        FROM user_daily_stats
-                        GROUP BY chat_id, user_id, date
-                        HAVING COUNT(*) > 1
-                    """)
-                    user_stats_duplicates = cursor.fetchall()
-                    
-                    for chat_id, user_id, date, count in user_stats_duplicates:
-                        logger.info(f"Найден дубликат статистики пользователя {user_id} в чате {chat_id} на дату {date} ({count} записей)")
-                        
-                        # Находим запись с максимальным message_count (или самую новую по rowid, если счетчики равны)
-                        # Сначала суммируем все message_count для этого пользователя
-                        cursor = db.execute("""
-                            SELECT SUM(message_count) as total_count
-                            FROM user_daily_stats
-                            WHERE chat_id = ? AND user_id = ? AND date = ?
-                        """, (chat_id, user_id, date))
-                        total_count_row = cursor.fetchone()
-                        total_count = total_count_row[0] if total_count_row else 0
-                        
-                        # Оставляем только одну запись с максимальным rowid, обновляем её message_count на сумму всех
-                        result = db.execute("""
-                            DELETE FROM user_daily_stats 
-                            WHERE chat_id = ? AND user_id = ? AND date = ?
-                            AND rowid NOT IN (
-                                SELECT MAX(rowid) 
-                                FROM user_daily_stats 
-                                WHERE chat_id = ? AND user_id = ? AND date = ?
-                            )
-                        """, (chat_id, user_id, date, chat_id, user_id, date))
-                        
-                        # Обновляем оставшуюся запись с правильным message_count
-                        db.execute("""
-                            UPDATE user_daily_stats
-                            SET message_count = ?
-                            WHERE chat_id = ? AND user_id = ? AND date = ?
-                        """, (total_count, chat_id, user_id, date))
-                        
-                        total_cleaned += result.rowcount
-                        logger.info(f"Удалено {result.rowcount} дубликатов для пользователя {user_id} в чате {chat_id} на дату {date}, обновлен счетчик до {total_count}")
+                    # Дубликаты daily_stats/user_daily_stats невозможны: их исключают
+                    # уникальные индексы (см. _migration_unique_stats)
                     
                     db.commit()
                     logger.info(f"Всего очищено {total_cleaned} дубликатов")
@@ -2132,13 +2484,15 @@ class Database:
                 logger.error(f"Ошибка при очистке дубликатов чатов: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_duplicates_sync)
+        result = await self._pool.write(_cleanup_duplicates_sync)
+        chat_settings_cache.clear()
+        return result
     
     async def assign_moderator(self, chat_id: int, user_id: int, rank: int, assigned_by: int) -> bool:
         """Назначение ранга модератора"""
         def _assign_moderator_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Назначаем ранг
                     db.execute("""
                         INSERT OR REPLACE INTO chat_moderators 
@@ -2171,13 +2525,16 @@ class Database:
                 logger.error(f"Ошибка при назначении модератора {user_id} в чат {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _assign_moderator_sync)
+        result = await self._pool.write(_assign_moderator_sync)
+        rank_cache.invalidate_user(chat_id, user_id)
+        rank_cache.invalidate_permissions(chat_id)
+        return result
     
     async def initialize_rank_permissions(self, chat_id: int) -> bool:
         """Инициализация прав по умолчанию для всех рангов в чате"""
         def _initialize_permissions_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     from utils.constants import DEFAULT_RANK_PERMISSIONS
                     
                     for rank, permissions in DEFAULT_RANK_PERMISSIONS.items():
@@ -2202,13 +2559,15 @@ class Database:
                 logger.error(f"Ошибка при инициализации прав для чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _initialize_permissions_sync)
+        result = await self._pool.write(_initialize_permissions_sync)
+        rank_cache.invalidate_permissions(chat_id)
+        return result
     
     async def remove_moderator(self, chat_id: int, user_id: int) -> bool:
         """Снятие ранга модератора"""
         def _remove_moderator_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         DELETE FROM chat_moderators 
                         WHERE chat_id = ? AND user_id = ?
@@ -2219,13 +2578,15 @@ class Database:
                 logger.error(f"Ошибка при снятии модератора {user_id} из чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _remove_moderator_sync)
+        result = await self._pool.write(_remove_moderator_sync)
+        rank_cache.invalidate_user(chat_id, user_id)
+        return result
     
     async def get_user_rank(self, chat_id: int, user_id: int) -> Optional[int]:
         """Получение ранга пользователя в чате"""
         def _get_user_rank_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT rank FROM chat_moderators 
                         WHERE chat_id = ? AND user_id = ?
@@ -2236,13 +2597,13 @@ class Database:
                 logger.error(f"Ошибка при получении ранга пользователя {user_id} в чате {chat_id}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_user_rank_sync)
+        return await self._pool.run(_get_user_rank_sync)
     
     async def get_chat_moderators(self, chat_id: int) -> List[Dict[str, Any]]:
         """Получение списка всех модераторов чата"""
         def _get_chat_moderators_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT cm.user_id, cm.rank, u.username, u.first_name, u.last_name
                         FROM chat_moderators cm
@@ -2265,13 +2626,13 @@ class Database:
                 logger.error(f"Ошибка при получении модераторов чата {chat_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_chat_moderators_sync)
+        return await self._pool.run(_get_chat_moderators_sync)
     
     async def update_moderator_rank(self, chat_id: int, user_id: int, new_rank: int, assigned_by: int) -> bool:
         """Обновление ранга модератора"""
         def _update_moderator_rank_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         UPDATE chat_moderators 
                         SET rank = ?, assigned_by = ?, assigned_date = ?
@@ -2283,7 +2644,9 @@ class Database:
                 logger.error(f"Ошибка при обновлении ранга модератора {user_id} в чате {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_moderator_rank_sync)
+        result = await self._pool.write(_update_moderator_rank_sync)
+        rank_cache.invalidate_user(chat_id, user_id)
+        return result
     
     # ========== МЕТОДЫ ДЛЯ РАБОТЫ С ПРАВАМИ РАНГОВ ==========
     
@@ -2291,7 +2654,7 @@ class Database:
         """Получить право для ранга в чате"""
         def _get_rank_permission_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT permission_value FROM rank_permissions 
                         WHERE chat_id = ? AND rank = ? AND permission_type = ?
@@ -2302,7 +2665,7 @@ class Database:
                 logger.error(f"Ошибка при получении права {permission_type} для ранга {rank} в чате {chat_id}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_rank_permission_sync)
+        return await self._pool.run(_get_rank_permission_sync)
     
     async def set_rank_permission(self, chat_id: int, rank: int, permission_type: str, value: bool) -> bool:
         """Установить право для ранга в чате"""
@@ -2316,7 +2679,7 @@ class Database:
         
         def _set_rank_permission_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT OR REPLACE INTO rank_permissions 
                         (chat_id, rank, permission_type, permission_value) 
@@ -2328,13 +2691,15 @@ class Database:
                 logger.error(f"Ошибка при установке права {permission_type} для ранга {rank} в чате {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _set_rank_permission_sync)
+        result = await self._pool.write(_set_rank_permission_sync)
+        rank_cache.invalidate_permissions(chat_id)
+        return result
     
     async def get_all_rank_permissions(self, chat_id: int, rank: int) -> Dict[str, bool]:
         """Получить все права для ранга в чате"""
         def _get_all_rank_permissions_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT permission_type, permission_value FROM rank_permissions 
                         WHERE chat_id = ? AND rank = ?
@@ -2344,13 +2709,13 @@ class Database:
                 logger.error(f"Ошибка при получении всех прав для ранга {rank} в чате {chat_id}: {e}")
                 return {}
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_all_rank_permissions_sync)
+        return await self._pool.run(_get_all_rank_permissions_sync)
     
     async def reset_rank_permissions_to_default(self, chat_id: int, rank: int) -> bool:
         """Сбросить права ранга к стандартным"""
         def _reset_rank_permissions_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Удаляем все существующие права для этого ранга
                     db.execute("""
                         DELETE FROM rank_permissions 
@@ -2373,79 +2738,72 @@ class Database:
                 logger.error(f"Ошибка при сбросе прав для ранга {rank} в чате {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _reset_rank_permissions_sync)
+        result = await self._pool.write(_reset_rank_permissions_sync)
+        rank_cache.invalidate_permissions(chat_id)
+        return result
+    
+    async def get_chat_rank_permissions(self, chat_id: int) -> Dict[int, Dict[str, bool]]:
+        """Получить права всех рангов чата одним запросом (с кэшем, см. rank_cache)"""
+        permissions = rank_cache.get_permissions(chat_id)
+        if permissions is not None:
+            return permissions
+        
+        version = rank_cache.permissions_version(chat_id)
+        
+        def _get_permissions_sync():
+            with self._pool.connect() as db:
+                cursor = db.execute("""
+                    SELECT rank, permission_type, permission_value FROM rank_permissions 
+                    WHERE chat_id = ?
+                """, (chat_id,))
+                result: Dict[int, Dict[str, bool]] = {}
+                for rank, permission_type, permission_value in cursor.fetchall():
+                    result.setdefault(rank, {})[permission_type] = bool(permission_value)
+                return result
+        
+        try:
+            permissions = await self._pool.run(_get_permissions_sync)
+        except Exception as e:
+            logger.error(f"Ошибка при получении прав рангов чата {chat_id}: {e}")
+            return {}
+        
+        rank_cache.set_permissions(chat_id, permissions, version)
+        return permissions
     
     async def has_permission(self, chat_id: int, user_id: int, permission_type: str) -> Optional[bool]:
         """Проверить, есть ли у пользователя право. Возвращает None если права не настроены"""
-        async def _has_permission_async():
-            try:
-                # Сначала проверяем, является ли пользователь владельцем чата
-                # Владелец чата должен проверяться через Telegram API
-                from utils.permissions import get_effective_rank
-                effective_rank = await get_effective_rank(chat_id, user_id)
-                
-                # Если пользователь не является модератором (ранг 5), возвращаем None для fallback
-                if effective_rank == 5:
-                    return None
-                
-                rank = effective_rank
-                
-                # Теперь проверяем право для этого ранга в БД
-                def _check_permission_sync():
-                    try:
-                        with sqlite3.connect(self.db_path) as db:
-                            # Специальная защита: для ранга владельца (ранг 1) право can_config_ranks всегда должно быть True
-                            if rank == 1 and permission_type == 'can_config_ranks':
-                                # Проверяем, что в БД записано False, и если да - исправляем
-                                cursor = db.execute("""
-                                    SELECT permission_value FROM rank_permissions 
-                                    WHERE chat_id = ? AND rank = ? AND permission_type = ?
-                                """, (chat_id, rank, permission_type))
-                                row = cursor.fetchone()
-                                
-                                if row is not None and not bool(row[0]):
-                                    # Если право выключено, включаем его обратно
-                                    db.execute("""
-                                        UPDATE rank_permissions 
-                                        SET permission_value = 1 
-                                        WHERE chat_id = ? AND rank = ? AND permission_type = ?
-                                    """, (chat_id, rank, permission_type))
-                                    db.commit()
-                                    logger.warning(f"Автоматически включено право can_config_ranks для владельца в чате {chat_id}")
-                                
-                                # Всегда возвращаем True для владельца
-                                return True
-                            
-                            # Получаем право для этого ранга
-                            cursor = db.execute("""
-                                SELECT permission_value FROM rank_permissions 
-                                WHERE chat_id = ? AND rank = ? AND permission_type = ?
-                            """, (chat_id, rank, permission_type))
-                            row = cursor.fetchone()
-                            
-                            # Если право найдено в БД, возвращаем его значение (даже если False)
-                            if row is not None:
-                                return bool(row[0])
-                            
-                            # Если права нет в БД, возвращаем None для использования fallback
-                            # Это означает, что права для этого чата еще не были настроены
-                            return None
-                    except Exception as e:
-                        logger.error(f"Ошибка при проверке права {permission_type} для ранга {rank} в чате {chat_id}: {e}")
-                        return None
-                
-                return await asyncio.get_event_loop().run_in_executor(None, _check_permission_sync)
-            except Exception as e:
-                logger.error(f"Ошибка при проверке права {permission_type} для пользователя {user_id} в чате {chat_id}: {e}")
+        try:
+            # Владелец чата определяется через Telegram API (результат кэшируется)
+            from utils.permissions import get_effective_rank
+            rank = await get_effective_rank(chat_id, user_id)
+            
+            # Если пользователь не является модератором (ранг 5), возвращаем None для fallback
+            if rank == 5:
                 return None
-        
-        return await _has_permission_async()
+            
+            permissions = await self.get_chat_rank_permissions(chat_id)
+            value = permissions.get(rank, {}).get(permission_type)
+            
+            # Специальная защита: для ранга владельца (ранг 1) право can_config_ranks всегда должно быть True
+            if rank == 1 and permission_type == 'can_config_ranks':
+                if value is False:
+                    # Если право выключено, включаем его обратно
+                    await self.set_rank_permission(chat_id, rank, permission_type, True)
+                    logger.warning(f"Автоматически включено право can_config_ranks для владельца в чате {chat_id}")
+                return True
+            
+            # Если права нет в БД, возвращаем None для использования fallback
+            # Это означает, что права для этого чата еще не были настроены
+            return value
+        except Exception as e:
+            logger.error(f"Ошибка при проверке права {permission_type} для пользователя {user_id} в чате {chat_id}: {e}")
+            return None
     
     async def get_chat_stat_settings(self, chat_id: int) -> dict:
         """Получить настройки статистики для чата"""
         def _get_settings_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT stats_enabled, count_media, profile_enabled, userinfo_enabled
                         FROM chat_stat_settings 
@@ -2477,13 +2835,13 @@ class Database:
                     'userinfo_enabled': True,
                 }
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_settings_sync)
+        return await self._pool.run(_get_settings_sync)
     
     async def set_chat_stats_enabled(self, chat_id: int, enabled: bool) -> bool:
         """Включить/выключить статистику для чата"""
         def _set_stats_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT OR REPLACE INTO chat_stat_settings (chat_id, stats_enabled, count_media)
                         VALUES (
@@ -2499,13 +2857,15 @@ class Database:
                 logger.error(f"Ошибка при изменении настройки статистики для чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _set_stats_sync)
+        result = await self._pool.write(_set_stats_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
 
     async def set_chat_stats_count_media(self, chat_id: int, enabled: bool) -> bool:
         """Включить/выключить учет медиа-сообщений в статистике"""
         def _set_media_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT OR REPLACE INTO chat_stat_settings (chat_id, stats_enabled, count_media)
                         VALUES (
@@ -2520,13 +2880,15 @@ class Database:
                 logger.error(f"Ошибка при изменении настройки count_media для чата {chat_id}: {e}")
                 return False
 
-        return await asyncio.get_event_loop().run_in_executor(None, _set_media_sync)
+        result = await self._pool.write(_set_media_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def set_chat_stats_profile_enabled(self, chat_id: int, enabled: bool) -> bool:
         """Включить/выключить команду профиля в чате"""
         def _set_profile_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT OR REPLACE INTO chat_stat_settings (chat_id, stats_enabled, count_media, profile_enabled, userinfo_enabled)
                         VALUES (
@@ -2543,13 +2905,15 @@ class Database:
                 logger.error(f"Ошибка при изменении настройки profile_enabled для чата {chat_id}: {e}")
                 return False
 
-        return await asyncio.get_event_loop().run_in_executor(None, _set_profile_sync)
+        result = await self._pool.write(_set_profile_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def set_chat_stats_userinfo_enabled(self, chat_id: int, enabled: bool) -> bool:
         """Включить/выключить команду userinfo в чате"""
         def _set_userinfo_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT OR REPLACE INTO chat_stat_settings (chat_id, stats_enabled, count_media, profile_enabled, userinfo_enabled)
                         VALUES (
@@ -2566,13 +2930,15 @@ class Database:
                 logger.error(f"Ошибка при изменении настройки userinfo_enabled для чата {chat_id}: {e}")
                 return False
 
-        return await asyncio.get_event_loop().run_in_executor(None, _set_userinfo_sync)
+        result = await self._pool.write(_set_userinfo_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def set_user_mention_ping_enabled(self, user_id: int, enabled: bool) -> bool:
         """Включить/выключить кликабельные упоминания (ping) в статистике для пользователя (глобально)"""
         def _set_mention_ping_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Убедимся, что пользователь существует в базе
                     db.execute("""
                         INSERT OR IGNORE INTO users (user_id, mention_ping_enabled)
@@ -2589,7 +2955,7 @@ class Database:
                 logger.error(f"Ошибка при изменении настройки mention_ping_enabled для пользователя {user_id}: {e}")
                 return False
 
-        return await asyncio.get_event_loop().run_in_executor(None, _set_mention_ping_sync)
+        return await self._pool.write(_set_mention_ping_sync)
     
     async def get_user_mention_ping_enabled(self, user_id: int) -> bool:
         """Получить настройку кликабельных упоминаний для пользователя (по умолчанию True)"""
@@ -2601,9 +2967,13 @@ class Database:
     
     async def get_user_last_message_time(self, chat_id: int, user_id: int) -> str:
         """Получить время последнего сообщения от пользователя"""
+        pending_time = self._stats_buffer.get_last_message_time(chat_id, user_id)
+        if pending_time is not None:
+            return pending_time
+        
         def _get_last_message_time_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT last_message_time FROM user_last_message 
                         WHERE chat_id = ? AND user_id = ?
@@ -2618,7 +2988,7 @@ class Database:
                     logger.error(f"Ошибка при получении времени последнего сообщения: {e}")
                 return None
         
-        result = await asyncio.get_event_loop().run_in_executor(None, _get_last_message_time_sync)
+        result = await self._pool.run(_get_last_message_time_sync)
         
         # Автоматическое восстановление при обнаружении повреждения
         if self._corruption_detected and not self._recovery_in_progress:
@@ -2630,7 +3000,7 @@ class Database:
         """Обновить время последнего сообщения от пользователя"""
         def _update_last_message_time_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT OR REPLACE INTO user_last_message (chat_id, user_id, last_message_time)
                         VALUES (?, ?, ?)
@@ -2645,7 +3015,7 @@ class Database:
                     logger.error(f"Ошибка при обновлении времени последнего сообщения: {e}")
                 return False
         
-        result = await asyncio.get_event_loop().run_in_executor(None, _update_last_message_time_sync)
+        result = await self._pool.write(_update_last_message_time_sync)
         
         # Автоматическое восстановление при обнаружении повреждения
         if self._corruption_detected and not self._recovery_in_progress:
@@ -2655,9 +3025,40 @@ class Database:
     
     async def get_hourly_stats_today(self, chat_id: int, timezone_offset: int = 3) -> List[Dict[str, int]]:
         """Получение статистики сообщений по часам за сегодня с учетом часового пояса"""
+        start_hour, end_hour = _local_day_hours(timezone_offset)
+        if self._hourly_since is None or start_hour < self._hourly_since:
+            return await self._get_hourly_stats_today_estimate(chat_id, timezone_offset)
+        
+        def _get_hourly_stats_sync(pending):
+            try:
+                with self._pool.connect() as db:
+                    cursor = db.execute("""
+                        SELECT utc_hour, SUM(message_count) FROM user_hourly_stats
+                        WHERE chat_id = ? AND utc_hour >= ? AND utc_hour < ?
+                        GROUP BY utc_hour
+                    """, (chat_id, start_hour, end_hour))
+                    
+                    hourly_counts = [0] * 24
+                    for utc_hour, count in cursor.fetchall():
+                        hourly_counts[utc_hour - start_hour] += count
+                    for utc_hour, count in pending.items():
+                        hourly_counts[utc_hour - start_hour] += count
+                    
+                    # Час в результате - локальный час пользователя
+                    return [{'hour': hour, 'count': hourly_counts[hour]} for hour in range(24)]
+            except Exception as e:
+                logger.error(f"Ошибка при получении почасовой статистики для чата {chat_id}: {e}")
+                return []
+        
+        return await self._read_with_pending(
+            lambda: self._stats_buffer.get_chat_hour_counts(chat_id, start_hour, end_hour), _get_hourly_stats_sync
+        )
+    
+    async def _get_hourly_stats_today_estimate(self, chat_id: int, timezone_offset: int) -> List[Dict[str, int]]:
+        """Оценка распределения по часам по времени последнего сообщения (до появления почасовых счетчиков)"""
         def _get_hourly_stats_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Получаем дату сегодня с учетом часового пояса
                     ts = datetime.utcnow().timestamp() + (timezone_offset * 3600)
                     today = datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d')
@@ -2717,12 +3118,12 @@ class Database:
                 logger.error(f"Ошибка при получении почасовой статистики для чата {chat_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_hourly_stats_sync)
+        return await self._pool.run(_get_hourly_stats_sync)
     
     async def get_chat_users(self, chat_id: int) -> List[dict]:
         """Получить всех пользователей чата с их username из базы данных"""
         def _get_chat_users_sync():
-            with sqlite3.connect(self.db_path) as db:
+            with self._pool.connect() as db:
                 cursor = db.cursor()
                 cursor.execute("""
                     SELECT DISTINCT user_id, username 
@@ -2731,13 +3132,13 @@ class Database:
                 """, (chat_id,))
                 return [{'user_id': row[0], 'username': row[1]} for row in cursor.fetchall()]
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_chat_users_sync)
+        return await self._pool.run(_get_chat_users_sync)
     
     async def search_users_by_name_in_chat(self, chat_id: int, name: str) -> List[Dict[str, Any]]:
         """Поиск пользователей по имени в конкретном чате"""
         def _search_users_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     name_lower = name.lower()
                     # Ищем пользователей, которые когда-либо были в этом чате (через user_daily_stats)
                     # убираем условие message_count > 0, чтобы найти всех пользователей
@@ -2771,13 +3172,13 @@ class Database:
                 logger.error(f"Ошибка при поиске пользователей по имени '{name}' в чате {chat_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _search_users_sync)
+        return await self._pool.run(_search_users_sync)
     
     async def get_inactive_users(self, days: int = 30) -> List[int]:
         """Найти пользователей, у которых нет записей в user_daily_stats за последние N дней"""
         def _get_inactive_users_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Находим всех пользователей, у которых нет записей в user_daily_stats за последние N дней
                     cursor = db.execute(
                         f"""
@@ -2798,13 +3199,13 @@ class Database:
                 logger.error(f"Ошибка при поиске неактивных пользователей: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_inactive_users_sync)
+        return await self._pool.run(_get_inactive_users_sync)
     
     async def get_inactive_chats(self, days: int = 30) -> List[int]:
         """Найти чаты, у которых нет записей в daily_stats за последние N дней"""
         def _get_inactive_chats_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Находим все чаты, у которых нет записей в daily_stats за последние N дней
                     cursor = db.execute(
                         f"""
@@ -2825,13 +3226,16 @@ class Database:
                 logger.error(f"Ошибка при поиске неактивных чатов: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_inactive_chats_sync)
+        return await self._pool.run(_get_inactive_chats_sync)
     
     async def delete_user_completely(self, user_id: int) -> bool:
         """Удалить пользователя из всех таблиц основной БД"""
+        # Сначала записываем накопленную статистику, иначе она вернется после удаления
+        await self.flush_message_stats()
+        
         def _delete_user_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Удаляем в правильном порядке: сначала связанные данные, потом основные записи
                     
                     # 1. Удаляем из chat_moderators (модераторы)
@@ -2848,6 +3252,7 @@ class Database:
                     
                     # 5. Удаляем из user_daily_stats (статистика)
                     db.execute("DELETE FROM user_daily_stats WHERE user_id = ?", (user_id,))
+                    # user_hourly_stats не трогаем: индекса по user_id нет, записи уйдут в compact_hourly_stats
                     
                     # 6. Удаляем из rank_permissions (если есть связи через assigned_by)
                     # Сначала удаляем права, где пользователь был назначен модератором
@@ -2864,13 +3269,18 @@ class Database:
                 logger.error(f"Ошибка при удалении пользователя {user_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _delete_user_sync)
+        result = await self._pool.write(_delete_user_sync)
+        rank_cache.invalidate_user_everywhere(user_id)
+        return result
     
     async def delete_chat_completely(self, chat_id: int) -> bool:
         """Удалить чат из всех таблиц основной БД"""
+        # Сначала записываем накопленную статистику, иначе она вернется после удаления
+        await self.flush_message_stats()
+        
         def _delete_chat_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Удаляем в правильном порядке: сначала связанные данные, потом основные записи
                     
                     # 1. Удаляем из chat_moderators (все модераторы чата)
@@ -2893,9 +3303,11 @@ class Database:
                     
                     # 7. Удаляем из user_daily_stats (все записи чата)
                     db.execute("DELETE FROM user_daily_stats WHERE chat_id = ?", (chat_id,))
+                    db.execute("DELETE FROM user_hourly_stats WHERE chat_id = ?", (chat_id,))
                     
-                    # 8. Удаляем из daily_stats (статистика чата)
+                    # 8. Удаляем из daily_stats и сводки активности (статистика чата)
                     db.execute("DELETE FROM daily_stats WHERE chat_id = ?", (chat_id,))
+                    db.execute("DELETE FROM chat_activity WHERE chat_id = ?", (chat_id,))
                     
                     # 9. Удаляем из blacklisted_chats (если есть)
                     db.execute("DELETE FROM blacklisted_chats WHERE chat_id = ?", (chat_id,))
@@ -2910,7 +3322,10 @@ class Database:
                 logger.error(f"Ошибка при удалении чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _delete_chat_sync)
+        result = await self._pool.write(_delete_chat_sync)
+        chat_settings_cache.invalidate(chat_id)
+        rank_cache.invalidate_chat(chat_id)
+        return result
     
     async def cleanup_inactive_users_and_chats(self, days: int = 30) -> Dict[str, int]:
         """
@@ -2992,7 +3407,7 @@ class Database:
     async def get_user_top_chats(self, user_id: int, limit: int = 3) -> List[Dict]:
         """Получить топ чатов пользователя по активности за последние 6 дней"""
         def _get_user_top_chats_sync():
-            with sqlite3.connect(self.db_path) as db:
+            with self._pool.connect() as db:
                 cursor = db.execute("""
                     SELECT 
                         uds.chat_id,
@@ -3013,12 +3428,12 @@ class Database:
                     'total_messages': row[2]
                 } for row in cursor.fetchall()]
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_user_top_chats_sync)
+        return await self._pool.run(_get_user_top_chats_sync)
     
     async def get_common_chats(self, user_id_1: int, user_id_2: int) -> List[Dict]:
         """Получить общие чаты двух пользователей"""
         def _get_common_chats_sync():
-            with sqlite3.connect(self.db_path) as db:
+            with self._pool.connect() as db:
                 cursor = db.execute("""
                     SELECT DISTINCT 
                         c.chat_id, 
@@ -3042,7 +3457,7 @@ class Database:
                     'chat_title': row[1] or f"Чат {row[0]}"
                 } for row in cursor.fetchall()]
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_common_chats_sync)
+        return await self._pool.run(_get_common_chats_sync)
 
 
 # Глобальный экземпляр базы данных
@@ -0,0 +1,84 @@
+"""
+Версионные миграции схемы SQLite
+
+Каждый файл базы данных хранит номер своей схемы в таблице schema_version.
+Модуль БД описывает упорядоченный список миграций (версия, описание, функция),
+и при старте применяются только те, что новее сохраненной версии.
+После этого рабочие запросы могут рассчитывать на итоговую схему
+и не проверять наличие колонок через PRAGMA table_info.
+"""
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (версия, описание, функция миграции)
+Migration = Tuple[int, str, Callable[[sqlite3.Connection], None]]
+
+
+def add_column(db: sqlite3.Connection, table: str, column: str, definition: str):
+    """
+    Добавить колонку, если её еще нет.
+
+    Нужна для баз, созданных до появления schema_version: часть колонок
+    в них уже могла быть добавлена старым кодом инициализации.
+    """
+    cursor = db.execute(f"PRAGMA table_info({table})")
+    columns = {row[1] for row in cursor.fetchall()}
+    if column not in columns:
+        db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def get_schema_version(db: sqlite3.Connection) -> int:
+    """Текущая версия схемы (0 для новой или старой базы без schema_version)"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )
+    """)
+    cursor = db.execute("SELECT MAX(version) FROM schema_version")
+    row = cursor.fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(db: sqlite3.Connection, migrations: List[Migration], name: str) -> int:
+    """
+    Применить недостающие миграции по порядку.
+
+    Каждая миграция выполняется в своей транзакции вместе с записью
+    в schema_version, поэтому прерванный запуск продолжится с той же миграции.
+
+    Returns:
+        Итоговая версия схемы
+    """
+    current = get_schema_version(db)
+    db.commit()
+
+    versions = [version for version, _, _ in migrations]
+    if versions != sorted(set(versions)):
+        raise ValueError(f"Миграции {name} должны идти по возрастанию версий без повторов")
+
+    for version, description, migrate in migrations:
+        if version <= current:
+            continue
+
+        logger.info(f"[{name}] Миграция схемы {version}: {description}")
+        try:
+            db.execute("BEGIN")
+            migrate(db)
+            db.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().isoformat())
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[{name}] Ошибка миграции схемы {version}: {e}")
+            raise
+        current = version
+
+    return current
@@ -2,14 +2,17 @@
 Модуль для работы с базой данных модерации (наказания)
 Отдельная БД для изоляции данных модерации от основной статистики
 """
-import sqlite3
-import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 import os
 from pathlib import Path
 
+from databases.connection_pool import get_pool
+from databases.migrations import add_column, apply_migrations
+from databases.punishment_queue import EXPIRING_TYPES, parse_expiry, punishment_expiry_queue
+from databases.settings_cache import chat_settings_cache
+
 logger = logging.getLogger(__name__)
 
 # Импортируем BASE_PATH из config, если доступен
@@ -19,6 +22,115 @@ except ImportError:
     # Если файл в databases/, то корень проекта на уровень выше
     BASE_PATH = Path(__file__).parent.parent.absolute()
 
+
+def _migration_initial_schema(db):
+    """Базовые таблицы и индексы"""
+    # Таблица истории наказаний
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS punishments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            moderator_id INTEGER,
+            punishment_type TEXT,
+            reason TEXT,
+            duration_seconds INTEGER,
+            punishment_date TEXT,
+            expiry_date TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            user_username TEXT,
+            user_first_name TEXT,
+            user_last_name TEXT,
+            moderator_username TEXT,
+            moderator_first_name TEXT,
+            moderator_last_name TEXT
+        )
+    """)
+    
+    # Таблица варнов
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS warns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            moderator_id INTEGER,
+            reason TEXT,
+            warn_date TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            user_username TEXT,
+            user_first_name TEXT,
+            user_last_name TEXT,
+            moderator_username TEXT,
+            moderator_first_name TEXT,
+            moderator_last_name TEXT
+        )
+    """)
+    
+    # Таблица настроек варнов
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS warn_settings (
+            chat_id INTEGER PRIMARY KEY,
+            warn_limit INTEGER DEFAULT 3,
+            punishment_type TEXT DEFAULT 'kick',
+            mute_duration INTEGER DEFAULT NULL
+        )
+    """)
+    
+    # Таблица для хранения ручных банов каналов модераторами
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS banned_channels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            channel_id INTEGER,
+            channel_username TEXT,
+            channel_title TEXT,
+            moderator_id INTEGER,
+            moderator_username TEXT,
+            moderator_first_name TEXT,
+            moderator_last_name TEXT,
+            reason TEXT,
+            ban_date TEXT,
+            is_active BOOLEAN DEFAULT 1
+        )
+    """)
+    
+    # Создаем индексы для оптимизации
+    db.execute("CREATE INDEX IF NOT EXISTS idx_punishments_chat_user ON punishments (chat_id, user_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_punishments_chat_type ON punishments (chat_id, punishment_type)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_punishments_active ON punishments (is_active)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_punishments_expiry ON punishments (expiry_date)")
+    
+    # Индексы для варнов
+    db.execute("CREATE INDEX IF NOT EXISTS idx_warns_chat_user ON warns (chat_id, user_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_warns_active ON warns (is_active)")
+    
+    # Индексы для banned_channels
+    db.execute("CREATE INDEX IF NOT EXISTS idx_banned_channels_chat_channel ON banned_channels (chat_id, channel_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_banned_channels_active ON banned_channels (is_active)")
+
+
+def _migration_channel_punishments(db):
+    """Поле reason у варнов и channel_id у наказаний (баны каналов)"""
+    add_column(db, 'warns', 'reason', 'TEXT')
+    add_column(db, 'punishments', 'channel_id', 'INTEGER')
+    db.execute("CREATE INDEX IF NOT EXISTS idx_punishments_chat_channel ON punishments (chat_id, channel_id)")
+
+
+def _migration_expiry_index(db):
+    """Индекс для загрузки очереди истечения наказаний"""
+    db.execute("CREATE INDEX IF NOT EXISTS idx_punishments_active_expiry ON punishments (is_active, expiry_date)")
+    # Покрывается новым индексом по префиксу
+    db.execute("DROP INDEX IF EXISTS idx_punishments_active")
+
+
+# Порядок миграций менять нельзя - только дописывать новые в конец
+MIGRATIONS = [
+    (1, 'Базовые таблицы и индексы', _migration_initial_schema),
+    (2, 'Баны каналов в истории наказаний', _migration_channel_punishments),
+    (3, 'Индекс активных наказаний по сроку', _migration_expiry_index),
+]
+
+
 class ModerationDatabase:
     """Класс для работы с базой данных модерации"""
     
@@ -28,115 +140,16 @@ class ModerationDatabase:
         self.db_path = db_path
         # Создаем директорию data если её нет
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._pool = get_pool(self.db_path)
     
     async def init_db(self):
-        """Инициализация базы данных и создание таблиц"""
+        """Инициализация базы данных: применение миграций схемы"""
         def _init_sync():
-            with sqlite3.connect(self.db_path) as db:
-                # Таблица истории наказаний
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS punishments (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        moderator_id INTEGER,
-                        punishment_type TEXT,
-                        reason TEXT,
-                        duration_seconds INTEGER,
-                        punishment_date TEXT,
-                        expiry_date TEXT,
-                        is_active BOOLEAN DEFAULT 1,
-                        user_username TEXT,
-                        user_first_name TEXT,
-                        user_last_name TEXT,
-                        moderator_username TEXT,
-                        moderator_first_name TEXT,
-                        moderator_last_name TEXT
-                    )
-                """)
-                
-                # Таблица варнов
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS warns (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        moderator_id INTEGER,
-                        reason TEXT,
-                        warn_date TEXT,
-                        is_active BOOLEAN DEFAULT 1,
-                        user_username TEXT,
-                        user_first_name TEXT,
-                        user_last_name TEXT,
-                        moderator_username TEXT,
-                        moderator_first_name TEXT,
-                        moderator_last_name TEXT
-                    )
-                """)
-                
-                # Таблица настроек варнов
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS warn_settings (
-                        chat_id INTEGER PRIMARY KEY,
-                        warn_limit INTEGER DEFAULT 3,
-                        punishment_type TEXT DEFAULT 'kick',
-                        mute_duration INTEGER DEFAULT NULL
-                    )
-                """)
-                
-                # Миграция: добавляем поле reason в таблицу warns, если его нет
-                try:
-                    db.execute("ALTER TABLE warns ADD COLUMN reason TEXT")
-                    logger.info("Добавлено поле reason в таблицу warns")
-                except sqlite3.OperationalError:
-                    # Поле уже существует
-                    pass
-                
-                # Миграция: добавляем поле channel_id в таблицу punishments, если его нет
-                try:
-                    db.execute("ALTER TABLE punishments ADD COLUMN channel_id INTEGER")
-                    logger.info("Добавлено поле channel_id в таблицу punishments")
-                except sqlite3.OperationalError:
-                    # Поле уже существует
-                    pass
-                
-                # Таблица для хранения ручных банов каналов модераторами
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS banned_channels (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        channel_id INTEGER,
-                        channel_username TEXT,
-                        channel_title TEXT,
-                        moderator_id INTEGER,
-                        moderator_username TEXT,
-                        moderator_first_name TEXT,
-                        moderator_last_name TEXT,
-                        reason TEXT,
-                        ban_date TEXT,
-                        is_active BOOLEAN DEFAULT 1
-                    )
-                """)
-                
-                # Создаем индексы для оптимизации
-                db.execute("CREATE INDEX IF NOT EXISTS idx_punishments_chat_user ON punishments (chat_id, user_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_punishments_chat_channel ON punishments (chat_id, channel_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_punishments_chat_type ON punishments (chat_id, punishment_type)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_punishments_active ON punishments (is_active)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_punishments_expiry ON punishments (expiry_date)")
-                
-                # Индексы для варнов
-                db.execute("CREATE INDEX IF NOT EXISTS idx_warns_chat_user ON warns (chat_id, user_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_warns_active ON warns (is_active)")
-                
-                # Индексы для banned_channels
-                db.execute("CREATE INDEX IF NOT EXISTS idx_banned_channels_chat_channel ON banned_channels (chat_id, channel_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_banned_channels_active ON banned_channels (is_active)")
-                
-                db.commit()
-                logger.info("База данных модерации инициализирована")
+            with self._pool.connect() as db:
+                version = apply_migrations(db, MIGRATIONS, 'moderation')
+                logger.info(f"База данных модерации инициализирована (схема v{version})")
         
-        await asyncio.get_event_loop().run_in_executor(None, _init_sync)
+        await self._pool.run(_init_sync)
     
     async def add_punishment(self, chat_id: int, user_id: int = None, moderator_id: int = None, 
                            punishment_type: str = None, reason: str = None, 
@@ -147,51 +160,39 @@ class ModerationDatabase:
         """Добавление записи о наказании (для пользователей или каналов)"""
         def _add_punishment_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
-                    # Проверяем наличие channel_id в схеме
-                    cursor_columns = db.execute("PRAGMA table_info(punishments)")
-                    columns = [col[1] for col in cursor_columns.fetchall()]
-                    has_channel_id = 'channel_id' in columns
-                    
-                    if has_channel_id:
-                        db.execute("""
-                            INSERT INTO punishments 
-                            (chat_id, user_id, channel_id, moderator_id, punishment_type, reason, 
-                             duration_seconds, punishment_date, expiry_date,
-                             user_username, user_first_name, user_last_name,
-                             moderator_username, moderator_first_name, moderator_last_name)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (chat_id, user_id, channel_id, moderator_id, punishment_type, reason,
-                              duration_seconds, datetime.now().isoformat(), expiry_date,
-                              user_username, user_first_name, user_last_name,
-                              moderator_username, moderator_first_name, moderator_last_name))
-                    else:
-                        # Fallback для старых схем без channel_id
-                        db.execute("""
-                            INSERT INTO punishments 
-                            (chat_id, user_id, moderator_id, punishment_type, reason, 
-                             duration_seconds, punishment_date, expiry_date,
-                             user_username, user_first_name, user_last_name,
-                             moderator_username, moderator_first_name, moderator_last_name)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (chat_id, user_id if user_id else channel_id, moderator_id, punishment_type, reason,
-                              duration_seconds, datetime.now().isoformat(), expiry_date,
-                              user_username, user_first_name, user_last_name,
-                              moderator_username, moderator_first_name, moderator_last_name))
+                with self._pool.connect() as db:
+                    cursor = db.execute("""
+                        INSERT INTO punishments 
+                        (chat_id, user_id, channel_id, moderator_id, punishment_type, reason, 
+                         duration_seconds, punishment_date, expiry_date,
+                         user_username, user_first_name, user_last_name,
+                         moderator_username, moderator_first_name, moderator_last_name)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (chat_id, user_id, channel_id, moderator_id, punishment_type, reason,
+                          duration_seconds, datetime.now().isoformat(), expiry_date,
+                          user_username, user_first_name, user_last_name,
+                          moderator_username, moderator_first_name, moderator_last_name))
                     db.commit()
-                    return True
+                    return cursor.lastrowid
             except Exception as e:
                 target = f"канала {channel_id}" if channel_id else f"пользователя {user_id}"
                 logger.error(f"Ошибка при добавлении наказания для {target} в чате {chat_id}: {e}")
-                return False
+                return None
+        
+        punishment_id = await self._pool.write(_add_punishment_sync)
+        if punishment_id is None:
+            return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_punishment_sync)
+        expires_at = parse_expiry(expiry_date)
+        if user_id is not None and expires_at is not None:
+            punishment_expiry_queue.schedule(punishment_id, chat_id, punishment_type, expires_at)
+        return True
     
     async def get_user_punishments(self, chat_id: int, user_id: int, active_only: bool = True) -> List[Dict[str, Any]]:
         """Получение истории наказаний пользователя"""
         def _get_user_punishments_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     query = """
                         SELECT id, punishment_type, reason, duration_seconds, 
                                punishment_date, expiry_date, is_active,
@@ -224,13 +225,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при получении наказаний пользователя {user_id} в чате {chat_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_user_punishments_sync)
+        return await self._pool.run(_get_user_punishments_sync)
     
     async def deactivate_punishment(self, punishment_id: int) -> bool:
         """Деактивация наказания (например, при размуте). Возвращает True только если наказание было активно и успешно деактивировано."""
         def _deactivate_punishment_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Атомарно деактивируем только если наказание еще активно (защита от дублирования)
                     cursor = db.execute("""
                         UPDATE punishments SET is_active = 0 
@@ -243,34 +244,74 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при деактивации наказания {punishment_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _deactivate_punishment_sync)
+        result = await self._pool.write(_deactivate_punishment_sync)
+        if result:
+            punishment_expiry_queue.discard(punishment_id)
+        return result
+    
+    async def get_punishment(self, punishment_id: int) -> Optional[Dict[str, Any]]:
+        """Получение наказания по id (None, если записи нет). Ошибки БД пробрасываются вызывающему"""
+        def _get_punishment_sync():
+            with self._pool.connect() as db:
+                cursor = db.execute("""
+                    SELECT id, chat_id, user_id, punishment_type, expiry_date, is_active,
+                           user_username, user_first_name, user_last_name
+                    FROM punishments WHERE id = ?
+                """, (punishment_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                return {
+                    'id': row[0],
+                    'chat_id': row[1],
+                    'user_id': row[2],
+                    'punishment_type': row[3],
+                    'expiry_date': row[4],
+                    'is_active': bool(row[5]),
+                    'user_username': row[6],
+                    'user_first_name': row[7],
+                    'user_last_name': row[8]
+                }
+        
+        return await self._pool.run(_get_punishment_sync)
+    
+    async def load_expiry_queue(self) -> int:
+        """Заполнить очередь истечения активными мутами и банами со сроком. Возвращает число записей"""
+        def _load_sync():
+            with self._pool.connect() as db:
+                placeholders = ', '.join('?' * len(EXPIRING_TYPES))
+                cursor = db.execute(f"""
+                    SELECT id, chat_id, punishment_type, expiry_date
+                    FROM punishments
+                    WHERE is_active = 1 AND expiry_date IS NOT NULL
+                      AND user_id IS NOT NULL AND punishment_type IN ({placeholders})
+                """, EXPIRING_TYPES)
+                return cursor.fetchall()
+        
+        try:
+            rows = await self._pool.run(_load_sync)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке очереди истечения наказаний: {e}")
+            return 0
+        
+        for punishment_id, chat_id, punishment_type, expiry_date in rows:
+            expires_at = parse_expiry(expiry_date)
+            if expires_at is not None:
+                punishment_expiry_queue.schedule(punishment_id, chat_id, punishment_type, expires_at)
+        return len(punishment_expiry_queue)
     
     async def get_active_punishments(self, chat_id: int, punishment_type: str = None) -> List[Dict[str, Any]]:
         """Получение активных наказаний в чате"""
         def _get_active_punishments_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
-                    # Проверяем наличие channel_id в схеме
-                    cursor_columns = db.execute("PRAGMA table_info(punishments)")
-                    columns = [col[1] for col in cursor_columns.fetchall()]
-                    has_channel_id = 'channel_id' in columns
-                    
-                    if has_channel_id:
-                        query = """
-                            SELECT id, user_id, channel_id, punishment_type, reason, 
-                                   duration_seconds, punishment_date, expiry_date,
-                                   user_username, user_first_name, user_last_name
-                            FROM punishments
-                            WHERE chat_id = ? AND is_active = 1
-                        """
-                    else:
-                        query = """
-                            SELECT id, user_id, NULL as channel_id, punishment_type, reason, 
-                                   duration_seconds, punishment_date, expiry_date,
-                                   user_username, user_first_name, user_last_name
-                            FROM punishments
-                            WHERE chat_id = ? AND is_active = 1
-                        """
+                with self._pool.connect() as db:
+                    query = """
+                        SELECT id, user_id, channel_id, punishment_type, reason, 
+                               duration_seconds, punishment_date, expiry_date,
+                               user_username, user_first_name, user_last_name
+                        FROM punishments
+                        WHERE chat_id = ? AND is_active = 1
+                    """
                     
                     params = [chat_id]
                     
@@ -286,7 +327,7 @@ class ModerationDatabase:
                         {
                             'id': row[0],
                             'user_id': row[1],
-                            'channel_id': row[2] if has_channel_id else None,
+                            'channel_id': row[2],
                             'punishment_type': row[3],
                             'reason': row[4],
                             'duration_seconds': row[5],
@@ -302,13 +343,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при получении активных наказаний в чате {chat_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_active_punishments_sync)
+        return await self._pool.run(_get_active_punishments_sync)
     
     async def cleanup_expired_punishments(self) -> int:
         """Очистка истекших наказаний"""
         def _cleanup_expired_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         UPDATE punishments 
                         SET is_active = 0 
@@ -322,13 +363,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при очистке истекших наказаний: {e}")
                 return 0
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_expired_sync)
+        return await self._pool.write(_cleanup_expired_sync)
     
     async def cleanup_old_records(self, days_to_keep: int = 7) -> bool:
         """Автоматическая очистка старых записей (по умолчанию старше 7 дней)"""
         def _cleanup_old_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Вычисляем дату, старше которой удаляем записи
                     cutoff_date = (datetime.now() - timedelta(days=days_to_keep)).isoformat()
                     logger.info(f"🧹 Начало очистки записей модерации старше {cutoff_date} (сейчас {datetime.now().isoformat()})")
@@ -381,13 +422,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при автоматической очистке старых записей: {e}", exc_info=True)
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_old_sync)
+        return await self._pool.write(_cleanup_old_sync)
     
     async def get_bans_last_days(self, days: int = 3) -> List[Dict[str, Any]]:
         """Получить список банов за последние N дней по всем чатам."""
         def _get_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute(
                         """
                         SELECT chat_id, user_id, reason, punishment_date, expiry_date, user_username, user_first_name, user_last_name
@@ -414,7 +455,7 @@ class ModerationDatabase:
             except Exception as e:
                 logger.error(f"Ошибка при получении банов за {days} дней: {e}")
                 return []
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
     
     # ========== МЕТОДЫ ДЛЯ РАБОТЫ С ВАРНАМИ ==========
     
@@ -424,7 +465,7 @@ class ModerationDatabase:
         """Добавление варна пользователю"""
         def _add_warn_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT INTO warns 
                         (chat_id, user_id, moderator_id, reason, warn_date,
@@ -440,13 +481,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при добавлении варна для пользователя {user_id} в чате {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_warn_sync)
+        return await self._pool.write(_add_warn_sync)
     
     async def remove_warn(self, chat_id: int, user_id: int) -> bool:
         """Удаление последнего варна пользователя"""
         def _remove_warn_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Находим последний активный варн
                     cursor = db.execute("""
                         SELECT id FROM warns 
@@ -468,13 +509,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при удалении варна для пользователя {user_id} в чате {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _remove_warn_sync)
+        return await self._pool.write(_remove_warn_sync)
     
     async def get_user_warns(self, chat_id: int, user_id: int, active_only: bool = True) -> List[Dict[str, Any]]:
         """Получение истории варнов пользователя"""
         def _get_user_warns_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     query = """
                         SELECT id, reason, warn_date, is_active,
                                moderator_username, moderator_first_name, moderator_last_name
@@ -503,13 +544,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при получении варнов пользователя {user_id} в чате {chat_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_user_warns_sync)
+        return await self._pool.run(_get_user_warns_sync)
     
     async def get_user_warn_count(self, chat_id: int, user_id: int) -> int:
         """Получение количества активных варнов пользователя"""
         def _get_user_warn_count_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT COUNT(*) FROM warns 
                         WHERE chat_id = ? AND user_id = ? AND is_active = 1
@@ -519,13 +560,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при получении количества варнов пользователя {user_id} в чате {chat_id}: {e}")
                 return 0
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_user_warn_count_sync)
+        return await self._pool.run(_get_user_warn_count_sync)
     
     async def clear_user_warns(self, chat_id: int, user_id: int) -> bool:
         """Очистка всех варнов пользователя"""
         def _clear_user_warns_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         UPDATE warns SET is_active = 0 
                         WHERE chat_id = ? AND user_id = ? AND is_active = 1
@@ -536,13 +577,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при очистке варнов пользователя {user_id} в чате {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _clear_user_warns_sync)
+        return await self._pool.write(_clear_user_warns_sync)
     
     async def get_warn_settings(self, chat_id: int) -> Dict[str, Any]:
         """Получение настроек варнов для чата"""
         def _get_warn_settings_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT warn_limit, punishment_type, mute_duration
                         FROM warn_settings WHERE chat_id = ?
@@ -570,14 +611,14 @@ class ModerationDatabase:
                     'mute_duration': None
                 }
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_warn_settings_sync)
+        return await self._pool.run(_get_warn_settings_sync)
     
     async def update_warn_settings(self, chat_id: int, warn_limit: int = None, 
                                  punishment_type: str = None, mute_duration: int = None) -> bool:
         """Обновление настроек варнов для чата"""
         def _update_warn_settings_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Проверяем, есть ли уже настройки для этого чата
                     cursor = db.execute("SELECT chat_id FROM warn_settings WHERE chat_id = ?", (chat_id,))
                     exists = cursor.fetchone() is not None
@@ -617,13 +658,15 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при обновлении настроек варнов для чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_warn_settings_sync)
+        result = await self._pool.write(_update_warn_settings_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def delete_chat_data(self, chat_id: int) -> bool:
         """Удалить все данные чата из базы модерации"""
         def _delete_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("DELETE FROM punishments WHERE chat_id = ?", (chat_id,))
                     db.execute("DELETE FROM warns WHERE chat_id = ?", (chat_id,))
                     db.execute("DELETE FROM warn_settings WHERE chat_id = ?", (chat_id,))
@@ -635,7 +678,9 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при удалении данных чата {chat_id} из moderation_db: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _delete_sync)
+        result = await self._pool.write(_delete_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     # ========== МЕТОДЫ ДЛЯ РАБОТЫ С БАНАМИ КАНАЛОВ ==========
     
@@ -646,7 +691,7 @@ class ModerationDatabase:
         """Добавление ручного бана канала модератором (сохраняется в banned_channels и punishments)"""
         def _add_channel_ban_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Добавляем в таблицу banned_channels
                     db.execute("""
                         INSERT INTO banned_channels 
@@ -659,39 +704,19 @@ class ModerationDatabase:
                           reason, datetime.now().isoformat()))
                     
                     # Также добавляем в punishments для истории
-                    cursor_columns = db.execute("PRAGMA table_info(punishments)")
-                    columns = [col[1] for col in cursor_columns.fetchall()]
-                    has_channel_id = 'channel_id' in columns
-                    
-                    if has_channel_id:
-                        db.execute("""
-                            INSERT INTO punishments 
-                            (chat_id, user_id, channel_id, moderator_id, punishment_type, reason,
-                             duration_seconds, punishment_date, expiry_date,
-                             user_username, user_first_name, user_last_name,
-                             moderator_username, moderator_first_name, moderator_last_name)
-                            VALUES (?, NULL, ?, ?, 'ban', ?, NULL, ?, NULL,
-                                    ?, ?, ?,
-                                    ?, ?, ?)
-                        """, (chat_id, channel_id, moderator_id, reason,
-                              datetime.now().isoformat(),
-                              channel_username, channel_title, None,
-                              moderator_username, moderator_first_name, moderator_last_name))
-                    else:
-                        # Fallback для старых схем
-                        db.execute("""
-                            INSERT INTO punishments 
-                            (chat_id, user_id, moderator_id, punishment_type, reason,
-                             duration_seconds, punishment_date, expiry_date,
-                             user_username, user_first_name, user_last_name,
-                             moderator_username, moderator_first_name, moderator_last_name)
-                            VALUES (?, ?, ?, 'ban', ?, NULL, ?, NULL,
-                                    ?, ?, ?,
-                                    ?, ?, ?)
-                        """, (chat_id, channel_id, moderator_id, reason,
-                              datetime.now().isoformat(),
-                              channel_username, channel_title, None,
-                              moderator_username, moderator_first_name, moderator_last_name))
+                    db.execute("""
+                        INSERT INTO punishments 
+                        (chat_id, user_id, channel_id, moderator_id, punishment_type, reason,
+                         duration_seconds, punishment_date, expiry_date,
+                         user_username, user_first_name, user_last_name,
+                         moderator_username, moderator_first_name, moderator_last_name)
+                        VALUES (?, NULL, ?, ?, 'ban', ?, NULL, ?, NULL,
+                                ?, ?, ?,
+                                ?, ?, ?)
+                    """, (chat_id, channel_id, moderator_id, reason,
+                          datetime.now().isoformat(),
+                          channel_username, channel_title, None,
+                          moderator_username, moderator_first_name, moderator_last_name))
                     
                     db.commit()
                     return True
@@ -699,13 +724,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при добавлении бана канала {channel_id} в чате {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_channel_ban_sync)
+        return await self._pool.write(_add_channel_ban_sync)
     
     async def is_channel_banned(self, chat_id: int, channel_id: int) -> bool:
         """Проверить, забанен ли канал вручную модератором (проверяет только banned_channels)"""
         def _is_channel_banned_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT COUNT(*) FROM banned_channels
                         WHERE chat_id = ? AND channel_id = ? AND is_active = 1
@@ -715,13 +740,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при проверке бана канала {channel_id} в чате {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _is_channel_banned_sync)
+        return await self._pool.run(_is_channel_banned_sync)
     
     async def get_banned_channels(self, chat_id: int) -> List[Dict[str, Any]]:
         """Получить список забаненных каналов в чате"""
         def _get_banned_channels_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT id, channel_id, channel_username, channel_title,
                                moderator_username, moderator_first_name, moderator_last_name,
@@ -749,13 +774,13 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при получении списка забаненных каналов в чате {chat_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_banned_channels_sync)
+        return await self._pool.run(_get_banned_channels_sync)
     
     async def remove_channel_ban(self, chat_id: int, channel_id: int) -> bool:
         """Удалить ручной бан канала (деактивировать в banned_channels)"""
         def _remove_channel_ban_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         UPDATE banned_channels SET is_active = 0
                         WHERE chat_id = ? AND channel_id = ? AND is_active = 1
@@ -766,7 +791,7 @@ class ModerationDatabase:
                 logger.error(f"Ошибка при удалении бана канала {channel_id} в чате {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _remove_channel_ban_sync)
+        return await self._pool.write(_remove_channel_ban_sync)
     
     async def get_punishments_paginated(self, chat_id: int, page: int = 1, per_page: int = 10, 
                                        punishment_type: str = None, active_only: Optional[bool] = None) -> Dict[str, Any]:
@@ -785,7 +810,7 @@ class ModerationDatabase:
         """
         def _get_paginated_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Выполняем запросы отдельно и объединяем результаты
                     all_punishments = []
                     
@@ -913,7 +938,7 @@ class ModerationDatabase:
                     'page': 1
                 }
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_paginated_sync)
+        return await self._pool.run(_get_paginated_sync)
 
 
 # Глобальный экземпляр базы данных модерации
@@ -1,8 +1,6 @@
 """
 Модуль для работы с базой данных сетей чатов
 """
-import sqlite3
-import asyncio
 import logging
 import random
 from datetime import datetime, timedelta
@@ -10,6 +8,9 @@ from typing import Optional, List, Dict, Any
 import os
 from pathlib import Path
 
+from databases.connection_pool import get_pool
+from databases.migrations import add_column, apply_migrations
+
 logger = logging.getLogger(__name__)
 
 # Импортируем BASE_PATH из config, если доступен
@@ -19,6 +20,89 @@ except ImportError:
     # Если файл в databases/, то корень проекта на уровень выше
     BASE_PATH = Path(__file__).parent.parent.absolute()
 
+
+def _migration_initial_schema(db):
+    """Базовые таблицы и индексы"""
+    # Таблица сетей чатов
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS chat_networks (
+            network_id INTEGER PRIMARY KEY,
+            owner_id INTEGER,
+            created_date TEXT
+        )
+    """)
+    
+    # Таблица чатов в сетях
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS network_chats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            network_id INTEGER,
+            chat_id INTEGER,
+            joined_date TEXT,
+            is_primary BOOLEAN DEFAULT 0,
+            priority INTEGER DEFAULT 0,
+            FOREIGN KEY (network_id) REFERENCES chat_networks (network_id)
+        )
+    """)
+    
+    # Таблица кодов для связывания
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS network_codes (
+            code TEXT PRIMARY KEY,
+            network_id INTEGER,
+            code_type TEXT,
+            created_date TEXT,
+            expires_at TEXT,
+            used BOOLEAN DEFAULT 0,
+            FOREIGN KEY (network_id) REFERENCES chat_networks (network_id)
+        )
+    """)
+    
+    # Создаем индексы для оптимизации
+    db.execute("CREATE INDEX IF NOT EXISTS idx_network_chats_network_id ON network_chats (network_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_network_chats_chat_id ON network_chats (chat_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_network_codes_expires ON network_codes (expires_at)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_network_codes_used ON network_codes (used)")
+
+
+def _migration_reuse_network_ids(db):
+    """Пересоздание chat_networks без AUTOINCREMENT для переиспользования ID"""
+    cursor = db.execute("""
+        SELECT sql FROM sqlite_master 
+        WHERE type='table' AND name='chat_networks'
+    """)
+    table_sql = cursor.fetchone()
+    if not table_sql or 'AUTOINCREMENT' not in table_sql[0]:
+        return
+    
+    db.execute("""
+        CREATE TABLE chat_networks_new (
+            network_id INTEGER PRIMARY KEY,
+            owner_id INTEGER,
+            created_date TEXT
+        )
+    """)
+    db.execute("""
+        INSERT INTO chat_networks_new (network_id, owner_id, created_date)
+        SELECT network_id, owner_id, created_date FROM chat_networks
+    """)
+    db.execute("DROP TABLE chat_networks")
+    db.execute("ALTER TABLE chat_networks_new RENAME TO chat_networks")
+
+
+def _migration_chat_priority(db):
+    """Поле priority в network_chats"""
+    add_column(db, 'network_chats', 'priority', 'INTEGER DEFAULT 0')
+
+
+# Порядок миграций менять нельзя - только дописывать новые в конец
+MIGRATIONS = [
+    (1, 'Базовые таблицы и индексы', _migration_initial_schema),
+    (2, 'chat_networks без AUTOINCREMENT', _migration_reuse_network_ids),
+    (3, 'Приоритет чатов в сети', _migration_chat_priority),
+]
+
+
 class NetworkDatabase:
     """Класс для работы с базой данных сетей чатов"""
     
@@ -28,109 +112,22 @@ class NetworkDatabase:
         self.db_path = db_path
         # Создаем директорию data если её нет
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._pool = get_pool(self.db_path)
     
     async def init_db(self):
-        """Инициализация базы данных и создание таблиц"""
+        """Инициализация базы данных: применение миграций схемы"""
         def _init_sync():
-            with sqlite3.connect(self.db_path) as db:
-                # Проверяем, существует ли таблица с AUTOINCREMENT
-                cursor = db.execute("""
-                    SELECT sql FROM sqlite_master 
-                    WHERE type='table' AND name='chat_networks'
-                """)
-                table_sql = cursor.fetchone()
-                
-                # Если таблица существует с AUTOINCREMENT, пересоздаем её
-                if table_sql and 'AUTOINCREMENT' in table_sql[0]:
-                    logger.info("Миграция таблицы chat_networks для переиспользования ID...")
-                    
-                    # Создаем временную таблицу
-                    db.execute("""
-                        CREATE TABLE chat_networks_new (
-                            network_id INTEGER PRIMARY KEY,
-                            owner_id INTEGER,
-                            created_date TEXT
-                        )
-                    """)
-                    
-                    # Копируем данные
-                    db.execute("""
-                        INSERT INTO chat_networks_new (network_id, owner_id, created_date)
-                        SELECT network_id, owner_id, created_date FROM chat_networks
-                    """)
-                    
-                    # Удаляем старую таблицу
-                    db.execute("DROP TABLE chat_networks")
-                    
-                    # Переименовываем новую таблицу
-                    db.execute("ALTER TABLE chat_networks_new RENAME TO chat_networks")
-                    
-                    logger.info("Миграция завершена")
-                
-                # Таблица сетей чатов
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS chat_networks (
-                        network_id INTEGER PRIMARY KEY,
-                        owner_id INTEGER,
-                        created_date TEXT
-                    )
-                """)
-                
-                # Таблица чатов в сетях
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS network_chats (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        network_id INTEGER,
-                        chat_id INTEGER,
-                        joined_date TEXT,
-                        is_primary BOOLEAN DEFAULT 0,
-                        priority INTEGER DEFAULT 0,
-                        FOREIGN KEY (network_id) REFERENCES chat_networks (network_id)
-                    )
-                """)
-                
-                # Проверяем, нужно ли добавить поле priority в network_chats (после создания таблицы)
-                try:
-                    cursor = db.execute("PRAGMA table_info(network_chats)")
-                    columns = [column[1] for column in cursor.fetchall()]
-                    if 'priority' not in columns:
-                        logger.info("Добавление поля priority в таблицу network_chats...")
-                        db.execute("ALTER TABLE network_chats ADD COLUMN priority INTEGER DEFAULT 0")
-                        db.commit()
-                        logger.info("Поле priority добавлено")
-                except sqlite3.OperationalError:
-                    # Таблица еще не существует, это нормально - она уже создана выше
-                    pass
-                
-                # Таблица кодов для связывания
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS network_codes (
-                        code TEXT PRIMARY KEY,
-                        network_id INTEGER,
-                        code_type TEXT,
-                        created_date TEXT,
-                        expires_at TEXT,
-                        used BOOLEAN DEFAULT 0,
-                        FOREIGN KEY (network_id) REFERENCES chat_networks (network_id)
-                    )
-                """)
-                
-                # Создаем индексы для оптимизации
-                db.execute("CREATE INDEX IF NOT EXISTS idx_network_chats_network_id ON network_chats (network_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_network_chats_chat_id ON network_chats (chat_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_network_codes_expires ON network_codes (expires_at)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_network_codes_used ON network_codes (used)")
-                
-                db.commit()
-                logger.info("База данных сетей чатов инициализирована")
+            with self._pool.connect() as db:
+                version = apply_migrations(db, MIGRATIONS, 'network')
+                logger.info(f"База данных сетей чатов инициализирована (схема v{version})")
         
-        await asyncio.get_event_loop().run_in_executor(None, _init_sync)
+        await self._pool.run(_init_sync)
     
     async def create_network(self, owner_id: int) -> int:
         """Создание новой сети чатов"""
         def _create_network_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Получаем максимальный номер сетки
                     cursor = db.execute("SELECT MAX(network_id) FROM chat_networks")
                     max_id = cursor.fetchone()[0]
@@ -148,13 +145,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при создании сети для владельца {owner_id}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _create_network_sync)
+        return await self._pool.write(_create_network_sync)
     
     async def add_chat_to_network(self, network_id: int, chat_id: int, is_primary: bool = False) -> bool:
         """Добавление чата в сеть"""
         def _add_chat_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT INTO network_chats (network_id, chat_id, joined_date, is_primary)
                         VALUES (?, ?, ?, ?)
@@ -165,13 +162,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при добавлении чата {chat_id} в сеть {network_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_chat_sync)
+        return await self._pool.write(_add_chat_sync)
     
     async def remove_chat_from_network(self, chat_id: int) -> bool:
         """Удаление чата из сети"""
         def _remove_chat_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         DELETE FROM network_chats WHERE chat_id = ?
                     """, (chat_id,))
@@ -181,13 +178,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при удалении чата {chat_id} из сети: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _remove_chat_sync)
+        return await self._pool.write(_remove_chat_sync)
     
     async def get_network_by_chat(self, chat_id: int) -> Optional[Dict[str, Any]]:
         """Получение сети по ID чата"""
         def _get_network_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT cn.network_id, cn.owner_id, cn.created_date
                         FROM chat_networks cn
@@ -206,13 +203,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при получении сети для чата {chat_id}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_network_sync)
+        return await self._pool.run(_get_network_sync)
     
     async def get_network_chats(self, network_id: int) -> List[Dict[str, Any]]:
         """Получение всех чатов в сети"""
         def _get_network_chats_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT chat_id, joined_date, is_primary
                         FROM network_chats
@@ -232,13 +229,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при получении чатов сети {network_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_network_chats_sync)
+        return await self._pool.run(_get_network_chats_sync)
     
     async def get_user_networks(self, owner_id: int) -> List[Dict[str, Any]]:
         """Получение всех сетей пользователя"""
         def _get_user_networks_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT network_id, created_date
                         FROM chat_networks
@@ -257,13 +254,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при получении сетей пользователя {owner_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_user_networks_sync)
+        return await self._pool.run(_get_user_networks_sync)
     
     async def get_network_chat_count(self, network_id: int) -> int:
         """Получение количества чатов в сети"""
         def _get_chat_count_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT COUNT(*) FROM network_chats WHERE network_id = ?
                     """, (network_id,))
@@ -272,13 +269,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при получении количества чатов в сети {network_id}: {e}")
                 return 0
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_chat_count_sync)
+        return await self._pool.run(_get_chat_count_sync)
     
     async def delete_network(self, network_id: int) -> bool:
         """Удаление сети с переупорядочиванием номеров"""
         def _delete_network_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Получаем максимальный номер сетки
                     cursor = db.execute("SELECT MAX(network_id) FROM chat_networks")
                     max_id = cursor.fetchone()[0]
@@ -329,13 +326,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при удалении сети {network_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _delete_network_sync)
+        return await self._pool.write(_delete_network_sync)
     
     async def generate_code(self, network_id: int, code_type: str) -> Optional[str]:
         """Генерация кода для связывания чатов"""
         def _generate_code_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Очищаем истекшие коды
                     db.execute("""
                         DELETE FROM network_codes 
@@ -376,13 +373,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при генерации кода для сети {network_id}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _generate_code_sync)
+        return await self._pool.write(_generate_code_sync)
     
     async def validate_code(self, code: str) -> Optional[Dict[str, Any]]:
         """Проверка кода (без пометки как использованный)"""
         def _validate_code_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT network_id, code_type, expires_at, used
                         FROM network_codes
@@ -416,13 +413,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при проверке кода {code}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _validate_code_sync)
+        return await self._pool.write(_validate_code_sync)
     
     async def mark_code_as_used(self, code: str) -> bool:
         """Пометка кода как использованного"""
         def _mark_used_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("UPDATE network_codes SET used = 1 WHERE code = ?", (code,))
                     db.commit()
                     return cursor.rowcount > 0
@@ -430,13 +427,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при пометке кода {code} как использованного: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _mark_used_sync)
+        return await self._pool.write(_mark_used_sync)
     
     async def cleanup_expired_codes(self) -> int:
         """Очистка истекших кодов"""
         def _cleanup_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         DELETE FROM network_codes 
                         WHERE expires_at < datetime('now')
@@ -447,13 +444,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при очистке истекших кодов: {e}")
                 return 0
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_sync)
+        return await self._pool.write(_cleanup_sync)
     
     async def is_chat_in_network(self, chat_id: int) -> bool:
         """Проверка, находится ли чат в какой-либо сети"""
         def _check_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT 1 FROM network_chats WHERE chat_id = ?
                     """, (chat_id,))
@@ -462,13 +459,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при проверке чата {chat_id} в сети: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _check_sync)
+        return await self._pool.run(_check_sync)
     
     async def set_chat_priority(self, network_id: int, chat_id: int, priority: int) -> bool:
         """Установка приоритета чата в сети"""
         def _set_priority_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         UPDATE network_chats 
                         SET priority = ? 
@@ -480,13 +477,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при установке приоритета чата {chat_id} в сети {network_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _set_priority_sync)
+        return await self._pool.write(_set_priority_sync)
     
     async def get_network_chats_sorted(self, network_id: int, sort_by: str = 'priority') -> List[Dict[str, Any]]:
         """Получение чатов сети с сортировкой"""
         def _get_chats_sorted_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     if sort_by == 'priority':
                         # Сортировка по приоритету (больше = выше)
                         cursor = db.execute("""
@@ -522,13 +519,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при получении отсортированных чатов сети {network_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_chats_sorted_sync)
+        return await self._pool.run(_get_chats_sorted_sync)
     
     async def get_network_owner(self, network_id: int) -> Optional[int]:
         """Получение владельца сети"""
         def _get_owner_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT owner_id FROM chat_networks WHERE network_id = ?
                     """, (network_id,))
@@ -538,13 +535,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при получении владельца сети {network_id}: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_owner_sync)
+        return await self._pool.run(_get_owner_sync)
     
     async def cleanup_inactive_chats_from_networks(self, inactive_chat_ids: List[int]) -> bool:
         """Удалить неактивные чаты из сетей"""
         def _cleanup_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     if not inactive_chat_ids:
                         return True
                     
@@ -566,13 +563,13 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при удалении неактивных чатов из сетей: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_sync)
+        return await self._pool.write(_cleanup_sync)
     
     async def remove_chat_from_all_networks(self, chat_id: int) -> bool:
         """Удалить чат из всех сетей"""
         def _remove_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("DELETE FROM network_chats WHERE chat_id = ?", (chat_id,))
                     deleted_count = cursor.rowcount
                     db.commit()
@@ -583,7 +580,7 @@ class NetworkDatabase:
                 logger.error(f"Ошибка при удалении чата {chat_id} из сетей: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _remove_sync)
+        return await self._pool.write(_remove_sync)
 
 
 
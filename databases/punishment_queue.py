@@ -0,0 +1,107 @@
+"""
+Очередь истечения наказаний (мутов и банов)
+
+Min-heap ближайших expiry_date. Заполняется при старте планировщика одним
+запросом к punishments (is_active, expiry_date) и дополняется в
+ModerationDatabase.add_punishment; deactivate_punishment убирает наказание
+из очереди. Планировщик спит до ближайшего срока и обрабатывает только
+наступившие - без опроса всех чатов.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Типы наказаний, которые снимаются автоматически
+EXPIRING_TYPES = ('mute', 'ban')
+
+
+class DuePunishment(NamedTuple):
+    """Наказание, срок которого наступил"""
+    punishment_id: int
+    chat_id: int
+    punishment_type: str
+
+
+def parse_expiry(expiry_date: Optional[str]) -> Optional[float]:
+    """Срок наказания (ISO-строка из БД) в секундах UNIX-времени"""
+    if not expiry_date:
+        return None
+    try:
+        # Наивное время в БД записано локальным datetime.now()
+        return datetime.fromisoformat(expiry_date).timestamp()
+    except (TypeError, ValueError):
+        logger.warning(f"Некорректная дата окончания наказания: {expiry_date!r}")
+        return None
+
+
+class PunishmentExpiryQueue:
+    """Куча (срок, id) с ленивым удалением отмененных записей"""
+
+    def __init__(self):
+        self._heap: List[tuple] = []
+        # id -> (срок, chat_id, тип): актуальные записи; в куче могут остаться устаревшие
+        self._entries: Dict[int, tuple] = {}
+        # Будит планировщик, когда появился срок раньше текущего ближайшего
+        self.changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, punishment_id: int, chat_id: int, punishment_type: str, expires_at: float):
+        """Добавить или перенести наказание"""
+        if punishment_type not in EXPIRING_TYPES:
+            return
+        head = self.next_deadline()
+        self._entries[punishment_id] = (expires_at, chat_id, punishment_type)
+        heapq.heappush(self._heap, (expires_at, punishment_id))
+        if head is None or expires_at < head:
+            self.changed.set()
+
+    def discard(self, punishment_id: int):
+        """Убрать наказание (снято вручную или деактивировано)"""
+        self._entries.pop(punishment_id, None)
+
+    def _drop_stale_head(self):
+        while self._heap:
+            expires_at, punishment_id = self._heap[0]
+            entry = self._entries.get(punishment_id)
+            if entry is not None and entry[0] == expires_at:
+                return
+            heapq.heappop(self._heap)
+
+    def next_deadline(self) -> Optional[float]:
+        """Ближайший срок (UNIX-время) или None, если очередь пуста"""
+        self._drop_stale_head()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float = None) -> List[DuePunishment]:
+        """Забрать все наказания, срок которых наступил"""
+        if now is None:
+            now = time.time()
+        due = []
+        while True:
+            self._drop_stale_head()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, punishment_id = heapq.heappop(self._heap)
+            _, chat_id, punishment_type = self._entries.pop(punishment_id)
+            due.append(DuePunishment(punishment_id, chat_id, punishment_type))
+
+    async def wait_next(self):
+        """Ждать ближайшего срока или изменения очереди"""
+        self.changed.clear()
+        deadline = self.next_deadline()
+        timeout = None if deadline is None else max(deadline - time.time(), 0)
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+# Глобальная очередь истечения наказаний
+punishment_expiry_queue = PunishmentExpiryQueue()
@@ -1,15 +1,17 @@
 """
 Модуль для работы с базой данных защиты от рейдов
-Отдельная БД для отслеживания активности и настроек
+Отдельная БД для настроек, входов участников и инцидентов
 """
-import sqlite3
-import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 import os
 from pathlib import Path
 
+from databases.connection_pool import get_pool
+from databases.migrations import add_column, apply_migrations
+from databases.settings_cache import chat_settings_cache
+
 logger = logging.getLogger(__name__)
 
 # Импортируем BASE_PATH из config, если доступен
@@ -19,6 +21,135 @@ except ImportError:
     # Если файл в databases/, то корень проекта на уровень выше
     BASE_PATH = Path(__file__).parent.parent.absolute()
 
+
+def _migration_initial_schema(db):
+    """Базовые таблицы и индексы"""
+    # Таблица настроек защиты от рейдов для каждого чата
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS raid_protection_settings (
+            chat_id INTEGER PRIMARY KEY,
+            enabled BOOLEAN DEFAULT 1,
+            gif_limit INTEGER DEFAULT 3,
+            gif_time_window INTEGER DEFAULT 5,
+            sticker_limit INTEGER DEFAULT 5,
+            sticker_time_window INTEGER DEFAULT 10,
+            duplicate_text_limit INTEGER DEFAULT 3,
+            duplicate_text_window INTEGER DEFAULT 30,
+            mass_join_limit INTEGER DEFAULT 10,
+            mass_join_window INTEGER DEFAULT 60,
+            similarity_threshold REAL DEFAULT 0.7,
+            notification_mode INTEGER DEFAULT 1
+        )
+    """)
+    
+    # Таблица для отслеживания недавней активности пользователей
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS recent_activity (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            activity_type TEXT,
+            content_hash TEXT,
+            timestamp TEXT,
+            message_id INTEGER
+        )
+    """)
+    
+    # Таблица для отслеживания новых участников
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS recent_joins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            timestamp TEXT
+        )
+    """)
+    
+    # Таблица для отслеживания удаленных сообщений (для подсчета количества атакующих пользователей)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS recent_deleted_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            incident_type TEXT,
+            timestamp TEXT
+        )
+    """)
+    
+    # Таблица инцидентов рейдов
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS raid_incidents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            incident_type TEXT,
+            details TEXT,
+            message_id INTEGER,
+            timestamp TEXT,
+            action_taken TEXT
+        )
+    """)
+    
+    # Создаем индексы для оптимизации
+    db.execute("CREATE INDEX IF NOT EXISTS idx_recent_activity_chat_user ON recent_activity (chat_id, user_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_recent_activity_type ON recent_activity (activity_type)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_recent_activity_timestamp ON recent_activity (timestamp)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_recent_joins_chat ON recent_joins (chat_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_recent_joins_timestamp ON recent_joins (timestamp)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_recent_deleted_chat_timestamp ON recent_deleted_messages (chat_id, timestamp)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_raid_incidents_chat ON raid_incidents (chat_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_raid_incidents_timestamp ON raid_incidents (timestamp)")
+
+
+def _migration_added_columns(db):
+    """Колонки уведомлений и автомута"""
+    add_column(db, 'raid_protection_settings', 'notification_mode', 'INTEGER DEFAULT 1')
+    add_column(db, 'raid_protection_settings', 'last_notification_time', 'TEXT')
+    add_column(db, 'raid_protection_settings', 'auto_mute_duration', 'INTEGER DEFAULT 0')
+    add_column(db, 'raid_protection_settings', 'auto_mute_enabled', 'BOOLEAN DEFAULT 1')
+    add_column(db, 'raid_protection_settings', 'mute_silent', 'BOOLEAN DEFAULT 0')
+    add_column(db, 'raid_protection_settings', 'mute_duration', 'INTEGER DEFAULT 300')
+
+
+def _migration_drop_recent_activity(db):
+    """Окна активности перенесены в память (utils/raid_windows.py)"""
+    db.execute("DROP TABLE IF EXISTS recent_activity")
+
+
+def _migration_lockdown(db):
+    """Настройки и состояние локдауна при массовом входе (utils/raid_lockdown.py)"""
+    add_column(db, 'raid_protection_settings', 'lockdown_enabled', 'BOOLEAN DEFAULT 0')
+    add_column(db, 'raid_protection_settings', 'lockdown_action', "TEXT DEFAULT 'restrict'")
+    add_column(db, 'raid_protection_settings', 'lockdown_duration', 'INTEGER DEFAULT 600')
+    # Сохраненные права чата нужны, чтобы снять локдаун и после перезапуска бота
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS raid_lockdowns (
+            chat_id INTEGER PRIMARY KEY,
+            started_at REAL NOT NULL,
+            ends_at REAL NOT NULL,
+            saved_permissions TEXT
+        )
+    """)
+
+
+def _migration_coordinated_text(db):
+    """Отдельный порог похожего текста с разных аккаунтов (0 - проверка выключена)"""
+    add_column(db, 'raid_protection_settings', 'coordinated_text_limit', 'INTEGER DEFAULT 0')
+
+
+# Порядок миграций менять нельзя - только дописывать новые в конец
+MIGRATIONS = [
+    (1, 'Базовые таблицы и индексы', _migration_initial_schema),
+    (2, 'Колонки уведомлений и автомута', _migration_added_columns),
+    (3, 'Удаление таблицы recent_activity', _migration_drop_recent_activity),
+    (4, 'Локдаун при массовом входе', _migration_lockdown),
+    (5, 'Порог похожего текста с разных аккаунтов', _migration_coordinated_text),
+]
+
+
 class RaidProtectionDatabase:
     """Класс для работы с базой данных защиты от рейдов"""
     
@@ -28,153 +159,29 @@ class RaidProtectionDatabase:
         self.db_path = db_path
         # Создаем директорию data если её нет
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._pool = get_pool(self.db_path)
     
     async def init_db(self):
-        """Инициализация базы данных и создание таблиц"""
+        """Инициализация базы данных: применение миграций схемы"""
         def _init_sync():
-            with sqlite3.connect(self.db_path) as db:
-                # Таблица настроек защиты от рейдов для каждого чата
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS raid_protection_settings (
-                        chat_id INTEGER PRIMARY KEY,
-                        enabled BOOLEAN DEFAULT 1,
-                        gif_limit INTEGER DEFAULT 3,
-                        gif_time_window INTEGER DEFAULT 5,
-                        sticker_limit INTEGER DEFAULT 5,
-                        sticker_time_window INTEGER DEFAULT 10,
-                        duplicate_text_limit INTEGER DEFAULT 3,
-                        duplicate_text_window INTEGER DEFAULT 30,
-                        mass_join_limit INTEGER DEFAULT 10,
-                        mass_join_window INTEGER DEFAULT 60,
-                        similarity_threshold REAL DEFAULT 0.7,
-                        notification_mode INTEGER DEFAULT 1
-                    )
-                """)
-                
-                # Добавляем колонку notification_mode если её нет
-                try:
-                    db.execute("ALTER TABLE raid_protection_settings ADD COLUMN notification_mode INTEGER DEFAULT 1")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку last_notification_time если её нет
-                try:
-                    db.execute("ALTER TABLE raid_protection_settings ADD COLUMN last_notification_time TEXT")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку auto_mute_duration если её нет
-                try:
-                    db.execute("ALTER TABLE raid_protection_settings ADD COLUMN auto_mute_duration INTEGER DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку auto_mute_enabled если её нет
-                try:
-                    db.execute("ALTER TABLE raid_protection_settings ADD COLUMN auto_mute_enabled BOOLEAN DEFAULT 1")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку mute_silent если её нет
-                try:
-                    db.execute("ALTER TABLE raid_protection_settings ADD COLUMN mute_silent BOOLEAN DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку mute_duration если её нет
-                try:
-                    db.execute("ALTER TABLE raid_protection_settings ADD COLUMN mute_duration INTEGER DEFAULT 300")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Таблица для отслеживания недавней активности пользователей
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS recent_activity (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        activity_type TEXT,
-                        content_hash TEXT,
-                        timestamp TEXT,
-                        message_id INTEGER
-                    )
-                """)
-                
-                # Таблица для отслеживания новых участников
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS recent_joins (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        username TEXT,
-                        first_name TEXT,
-                        last_name TEXT,
-                        timestamp TEXT
-                    )
-                """)
-                
-                # Таблица для отслеживания удаленных сообщений (для подсчета количества атакующих пользователей)
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS recent_deleted_messages (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        incident_type TEXT,
-                        timestamp TEXT
-                    )
-                """)
-                
-                # Таблица инцидентов рейдов
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS raid_incidents (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        incident_type TEXT,
-                        details TEXT,
-                        message_id INTEGER,
-                        timestamp TEXT,
-                        action_taken TEXT
-                    )
-                """)
-                
-                # Создаем индексы для оптимизации
-                db.execute("CREATE INDEX IF NOT EXISTS idx_recent_activity_chat_user ON recent_activity (chat_id, user_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_recent_activity_type ON recent_activity (activity_type)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_recent_activity_timestamp ON recent_activity (timestamp)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_recent_joins_chat ON recent_joins (chat_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_recent_joins_timestamp ON recent_joins (timestamp)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_recent_deleted_chat_timestamp ON recent_deleted_messages (chat_id, timestamp)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_raid_incidents_chat ON raid_incidents (chat_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_raid_incidents_timestamp ON raid_incidents (timestamp)")
-                
-                db.commit()
-                logger.info("База данных защиты от рейдов инициализирована")
+            with self._pool.connect() as db:
+                version = apply_migrations(db, MIGRATIONS, 'raid_protection')
+                logger.info(f"База данных защиты от рейдов инициализирована (схема v{version})")
         
-        await asyncio.get_event_loop().run_in_executor(None, _init_sync)
+        await self._pool.run(_init_sync)
     
     async def get_settings(self, chat_id: int) -> Dict[str, Any]:
         """Получить настройки защиты от рейдов для чата"""
         def _get_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT enabled, gif_limit, gif_time_window, sticker_limit, sticker_time_window,
                                duplicate_text_limit, duplicate_text_window, mass_join_limit, mass_join_window,
                                similarity_threshold, notification_mode, auto_mute_duration,
-                               auto_mute_enabled, mute_silent, mute_duration
+                               auto_mute_enabled, mute_silent, mute_duration,
+                               lockdown_enabled, lockdown_action, lockdown_duration,
+                               coordinated_text_limit
                         FROM raid_protection_settings WHERE chat_id = ?
                     """, (chat_id,))
                     row = cursor.fetchone()
@@ -195,7 +202,11 @@ class RaidProtectionDatabase:
                             'auto_mute_duration': row[11] if len(row) > 11 else 0,
                             'auto_mute_enabled': bool(row[12]) if len(row) > 12 else True,
                             'mute_silent': bool(row[13]) if len(row) > 13 else False,
-                            'mute_duration': row[14] if len(row) > 14 else 300
+                            'mute_duration': row[14] if len(row) > 14 else 300,
+                            'lockdown_enabled': bool(row[15]),
+                            'lockdown_action': row[16] or 'restrict',
+                            'lockdown_duration': row[17] or 600,
+                            'coordinated_text_limit': row[18] or 0
                         }
                     else:
                         # Возвращаем настройки по умолчанию
@@ -215,7 +226,11 @@ class RaidProtectionDatabase:
                             'auto_mute_duration': 0,
                             'auto_mute_enabled': True,
                             'mute_silent': False,
-                            'mute_duration': 300
+                            'mute_duration': 300,
+                            'lockdown_enabled': False,
+                            'lockdown_action': 'restrict',
+                            'lockdown_duration': 600,
+                            'coordinated_text_limit': RAID_PROTECTION.get('coordinated_text_limit', 0)
                         }
             except Exception as e:
                 logger.error(f"Ошибка при получении настроек защиты от рейдов для чата {chat_id}: {e}")
@@ -235,16 +250,20 @@ class RaidProtectionDatabase:
                     'auto_mute_duration': 0,
                     'auto_mute_enabled': True,
                     'mute_silent': False,
-                    'mute_duration': 300
+                    'mute_duration': 300,
+                    'lockdown_enabled': False,
+                    'lockdown_action': 'restrict',
+                    'lockdown_duration': 600,
+                    'coordinated_text_limit': RAID_PROTECTION.get('coordinated_text_limit', 0)
                 }
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
     
     async def update_setting(self, chat_id: int, setting_name: str, value: Any) -> bool:
         """Обновить настройку защиты от рейдов для чата"""
         def _update_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Конвертируем bool в int если нужно
                     db_value = value
                     if isinstance(value, bool):
@@ -270,8 +289,9 @@ class RaidProtectionDatabase:
                             (chat_id, enabled, gif_limit, gif_time_window, sticker_limit, sticker_time_window,
                              duplicate_text_limit, duplicate_text_window, mass_join_limit, mass_join_window,
                              similarity_threshold, notification_mode, auto_mute_duration, auto_mute_enabled, 
-                             mute_silent, mute_duration)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                             mute_silent, mute_duration, lockdown_enabled, lockdown_action, lockdown_duration,
+                             coordinated_text_limit)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                         """, (
                             chat_id, 
                             defaults.get('enabled', 1), 
@@ -288,7 +308,11 @@ class RaidProtectionDatabase:
                             defaults.get('auto_mute_duration', 0),
                             1 if defaults.get('auto_mute_enabled', True) else 0,
                             1 if defaults.get('mute_silent', False) else 0,
-                            defaults.get('mute_duration', 300)
+                            defaults.get('mute_duration', 300),
+                            1 if defaults.get('lockdown_enabled', False) else 0,
+                            defaults.get('lockdown_action', 'restrict'),
+                            defaults.get('lockdown_duration', 600),
+                            defaults.get('coordinated_text_limit', 0)
                         ))
                     
                     db.commit()
@@ -297,7 +321,9 @@ class RaidProtectionDatabase:
                 logger.error(f"Ошибка при обновлении настройки {setting_name} для чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_sync)
+        result = await self._pool.write(_update_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def update_settings(self, chat_id: int, **kwargs) -> bool:
         """Обновить несколько настроек защиты от рейдов для чата"""
@@ -308,61 +334,12 @@ class RaidProtectionDatabase:
                 success = False
         return success
     
-    async def add_activity(self, chat_id: int, user_id: int, activity_type: str, content_hash: str = None, 
-                          message_id: int = None) -> bool:
-        """Добавить запись о активности пользователя"""
-        def _add_activity_sync():
-            try:
-                with sqlite3.connect(self.db_path) as db:
-                    db.execute("""
-                        INSERT INTO recent_activity 
-                        (chat_id, user_id, activity_type, content_hash, timestamp, message_id)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (chat_id, user_id, activity_type, content_hash, datetime.now().isoformat(), message_id))
-                    db.commit()
-                    return True
-            except Exception as e:
-                logger.error(f"Ошибка при добавлении активности: {e}")
-                return False
-        
-        return await asyncio.get_event_loop().run_in_executor(None, _add_activity_sync)
-    
-    async def get_recent_activity(self, chat_id: int, user_id: int, activity_type: str, 
-                                  time_window_seconds: int) -> List[Dict[str, Any]]:
-        """Получить недавнюю активность пользователя определенного типа"""
-        def _get_recent_sync():
-            try:
-                cutoff_time = (datetime.now() - timedelta(seconds=time_window_seconds)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
-                    cursor = db.execute("""
-                        SELECT id, content_hash, timestamp, message_id
-                        FROM recent_activity
-                        WHERE chat_id = ? AND user_id = ? AND activity_type = ? AND timestamp >= ?
-                        ORDER BY timestamp DESC
-                    """, (chat_id, user_id, activity_type, cutoff_time))
-                    
-                    rows = cursor.fetchall()
-                    return [
-                        {
-                            'id': row[0],
-                            'content_hash': row[1],
-                            'timestamp': row[2],
-                            'message_id': row[3]
-                        }
-                        for row in rows
-                    ]
-            except Exception as e:
-                logger.error(f"Ошибка при получении недавней активности: {e}")
-                return []
-        
-        return await asyncio.get_event_loop().run_in_executor(None, _get_recent_sync)
-    
     async def add_recent_join(self, chat_id: int, user_id: int, username: str = None, 
                              first_name: str = None, last_name: str = None) -> bool:
         """Добавить запись о недавнем присоединении"""
         def _add_join_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT INTO recent_joins 
                         (chat_id, user_id, username, first_name, last_name, timestamp)
@@ -374,14 +351,14 @@ class RaidProtectionDatabase:
                 logger.error(f"Ошибка при добавлении записи о присоединении: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_join_sync)
+        return await self._pool.write(_add_join_sync)
     
     async def get_recent_joins(self, chat_id: int, time_window_seconds: int) -> List[Dict[str, Any]]:
         """Получить недавние присоединения в чате"""
         def _get_joins_sync():
             try:
                 cutoff_time = (datetime.now() - timedelta(seconds=time_window_seconds)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT id, user_id, username, first_name, last_name, timestamp
                         FROM recent_joins
@@ -405,14 +382,14 @@ class RaidProtectionDatabase:
                 logger.error(f"Ошибка при получении недавних присоединений: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_joins_sync)
+        return await self._pool.run(_get_joins_sync)
     
     async def log_raid_incident(self, chat_id: int, user_id: int, incident_type: str, details: str = None,
                                message_id: int = None, action_taken: str = None) -> bool:
         """Записать инцидент рейда"""
         def _log_incident_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT INTO raid_incidents 
                         (chat_id, user_id, incident_type, details, message_id, timestamp, action_taken)
@@ -424,34 +401,14 @@ class RaidProtectionDatabase:
                 logger.error(f"Ошибка при записи инцидента рейда: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _log_incident_sync)
-    
-    async def cleanup_old_activity(self, days_to_keep: int = 1) -> bool:
-        """Очистить старые записи активности"""
-        def _cleanup_sync():
-            try:
-                cutoff_time = (datetime.now() - timedelta(days=days_to_keep)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
-                    cursor = db.execute("""
-                        DELETE FROM recent_activity WHERE timestamp < ?
-                    """, (cutoff_time,))
-                    deleted_count = cursor.rowcount
-                    db.commit()
-                    if deleted_count > 0:
-                        logger.info(f"Удалено {deleted_count} старых записей активности")
-                    return True
-            except Exception as e:
-                logger.error(f"Ошибка при очистке старых записей активности: {e}")
-                return False
-        
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_sync)
+        return await self._pool.write(_log_incident_sync)
     
     async def cleanup_old_joins(self, hours_to_keep: int = 2) -> bool:
         """Очистить старые записи о присоединениях"""
         def _cleanup_sync():
             try:
                 cutoff_time = (datetime.now() - timedelta(hours=hours_to_keep)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         DELETE FROM recent_joins WHERE timestamp < ?
                     """, (cutoff_time,))
@@ -464,13 +421,13 @@ class RaidProtectionDatabase:
                 logger.error(f"Ошибка при очистке старых записей о присоединениях: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_sync)
+        return await self._pool.write(_cleanup_sync)
     
     async def add_deleted_message(self, chat_id: int, user_id: int, incident_type: str) -> bool:
         """Добавить запись об удаленном сообщении"""
         def _add_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT INTO recent_deleted_messages 
                         (chat_id, user_id, incident_type, timestamp)
@@ -482,14 +439,14 @@ class RaidProtectionDatabase:
                 logger.error(f"Ошибка при добавлении записи об удаленном сообщении: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_sync)
+        return await self._pool.write(_add_sync)
     
     async def get_recent_deleted_count(self, chat_id: int, minutes: int = 1) -> int:
         """Получить количество уникальных пользователей с удаленными сообщениями за последние N минут"""
         def _get_sync():
             try:
                 cutoff_time = (datetime.now() - timedelta(minutes=minutes)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT COUNT(DISTINCT user_id)
                         FROM recent_deleted_messages
@@ -501,14 +458,14 @@ class RaidProtectionDatabase:
                 logger.error(f"Ошибка при получении количества удаленных сообщений: {e}")
                 return 0
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
     
     async def cleanup_old_deleted_messages(self, minutes_to_keep: int = 5) -> bool:
         """Очистить старые записи об удаленных сообщениях"""
         def _cleanup_sync():
             try:
                 cutoff_time = (datetime.now() - timedelta(minutes=minutes_to_keep)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         DELETE FROM recent_deleted_messages WHERE timestamp < ?
                     """, (cutoff_time,))
@@ -521,13 +478,13 @@ class RaidProtectionDatabase:
                 logger.error(f"Ошибка при очистке старых записей об удаленных сообщениях: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_sync)
+        return await self._pool.write(_cleanup_sync)
     
     async def get_last_notification_time(self, chat_id: int) -> Optional[str]:
         """Получить время последнего уведомления о рейде для чата"""
         def _get_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT last_notification_time 
                         FROM raid_protection_settings 
@@ -539,13 +496,13 @@ class RaidProtectionDatabase:
                 logger.error(f"Ошибка при получении времени последнего уведомления: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
     
     async def update_last_notification_time(self, chat_id: int, timestamp: str) -> bool:
         """Обновить время последнего уведомления о рейде"""
         def _update_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Проверяем, существуют ли настройки для этого чата
                     cursor = db.execute("SELECT chat_id FROM raid_protection_settings WHERE chat_id = ?", (chat_id,))
                     exists = cursor.fetchone() is not None
@@ -577,18 +534,74 @@ class RaidProtectionDatabase:
                 logger.error(f"Ошибка при обновлении времени последнего уведомления: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_sync)
+        return await self._pool.write(_update_sync)
+    
+    async def save_lockdown(self, chat_id: int, started_at: float, ends_at: float,
+                            saved_permissions: Optional[str]) -> bool:
+        """Сохранить состояние локдауна чата (права чата до локдауна - JSON)"""
+        def _save_sync():
+            try:
+                with self._pool.connect() as db:
+                    db.execute("""
+                        INSERT INTO raid_lockdowns (chat_id, started_at, ends_at, saved_permissions)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(chat_id) DO UPDATE SET ends_at = excluded.ends_at
+                    """, (chat_id, started_at, ends_at, saved_permissions))
+                    db.commit()
+                    return True
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении локдауна чата {chat_id}: {e}")
+                return False
+        
+        return await self._pool.write(_save_sync)
+    
+    async def delete_lockdown(self, chat_id: int) -> bool:
+        """Удалить состояние локдауна чата"""
+        def _delete_sync():
+            try:
+                with self._pool.connect() as db:
+                    db.execute("DELETE FROM raid_lockdowns WHERE chat_id = ?", (chat_id,))
+                    db.commit()
+                    return True
+            except Exception as e:
+                logger.error(f"Ошибка при удалении локдауна чата {chat_id}: {e}")
+                return False
+        
+        return await self._pool.write(_delete_sync)
+    
+    async def get_lockdowns(self) -> List[Dict[str, Any]]:
+        """Получить незавершенные локдауны (для восстановления после перезапуска)"""
+        def _get_sync():
+            try:
+                with self._pool.connect() as db:
+                    cursor = db.execute(
+                        "SELECT chat_id, started_at, ends_at, saved_permissions FROM raid_lockdowns"
+                    )
+                    return [
+                        {
+                            'chat_id': row[0],
+                            'started_at': row[1],
+                            'ends_at': row[2],
+                            'saved_permissions': row[3]
+                        }
+                        for row in cursor.fetchall()
+                    ]
+            except Exception as e:
+                logger.error(f"Ошибка при получении локдаунов: {e}")
+                return []
+        
+        return await self._pool.run(_get_sync)
     
     async def delete_chat_data(self, chat_id: int) -> bool:
         """Удалить все данные чата из базы защиты от рейдов"""
         def _delete_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("DELETE FROM raid_protection_settings WHERE chat_id = ?", (chat_id,))
-                    db.execute("DELETE FROM recent_activity WHERE chat_id = ?", (chat_id,))
                     db.execute("DELETE FROM recent_joins WHERE chat_id = ?", (chat_id,))
                     db.execute("DELETE FROM recent_deleted_messages WHERE chat_id = ?", (chat_id,))
                     db.execute("DELETE FROM raid_incidents WHERE chat_id = ?", (chat_id,))
+                    db.execute("DELETE FROM raid_lockdowns WHERE chat_id = ?", (chat_id,))
                     db.commit()
                     logger.info(f"Данные чата {chat_id} удалены из raid_protection_db")
                     return True
@@ -596,7 +609,9 @@ class RaidProtectionDatabase:
                 logger.error(f"Ошибка при удалении данных чата {chat_id} из raid_protection_db: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _delete_sync)
+        result = await self._pool.write(_delete_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
 
 
 # Глобальный экземпляр базы данных защиты от рейдов
@@ -0,0 +1,140 @@
+"""
+Кэш рангов и прав рангов
+
+Хранит эффективные ранги пользователей (с учетом владельца чата по данным
+Telegram) и полные карты прав рангов для чата «ранг -> {право: значение}».
+Записи живут недолго (TTL) и сбрасываются при назначении/снятии модераторов,
+изменении прав рангов и обновлениях chat_member/my_chat_member.
+
+Кэш только хранит значения; вычисление ранга - utils.permissions.get_effective_rank,
+загрузка прав - Database.get_chat_rank_permissions.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from config import RANK_CACHE
+except ImportError:
+    RANK_CACHE = {'ttl': 60, 'max_size': 20000}
+
+logger = logging.getLogger(__name__)
+
+
+class RankCache:
+    """TTL/LRU-кэш эффективных рангов и карт прав рангов"""
+
+    def __init__(self, ttl: float = 60, max_size: int = 20000):
+        self.ttl = ttl
+        self.max_size = max_size
+        # (chat_id, user_id) -> (ранг, время записи)
+        self._ranks: "OrderedDict[Tuple[int, int], tuple]" = OrderedDict()
+        # chat_id -> ({ранг: {право: значение}}, время записи)
+        self._permissions: "OrderedDict[int, tuple]" = OrderedDict()
+        # Версии для защиты от гонок: загрузка, начатая до записи, не попадает в кэш
+        self._chat_versions: Dict[int, int] = {}
+        self._user_versions: Dict[Tuple[int, int], int] = {}
+        self.rank_hits = 0
+        self.rank_misses = 0
+        self.permission_hits = 0
+        self.permission_misses = 0
+
+    def _fresh(self, stored_at: float) -> bool:
+        return time.monotonic() - stored_at < self.ttl
+
+    def _trim(self, entries: OrderedDict):
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+    # ---------- Ранги ----------
+
+    def rank_version(self, chat_id: int, user_id: int) -> tuple:
+        """Версия записи ранга - передается в set_rank после загрузки"""
+        return self._chat_versions.get(chat_id, 0), self._user_versions.get((chat_id, user_id), 0)
+
+    def get_rank(self, chat_id: int, user_id: int) -> Optional[int]:
+        key = (chat_id, user_id)
+        entry = self._ranks.get(key)
+        if entry is not None and self._fresh(entry[1]):
+            self._ranks.move_to_end(key)
+            self.rank_hits += 1
+            return entry[0]
+        self.rank_misses += 1
+        return None
+
+    def set_rank(self, chat_id: int, user_id: int, rank: int, version: tuple):
+        if version != self.rank_version(chat_id, user_id):
+            return
+        self._ranks[(chat_id, user_id)] = (rank, time.monotonic())
+        self._ranks.move_to_end((chat_id, user_id))
+        self._trim(self._ranks)
+
+    def invalidate_user(self, chat_id: int, user_id: int):
+        """Сбросить ранг пользователя в чате"""
+        key = (chat_id, user_id)
+        self._ranks.pop(key, None)
+        self._user_versions[key] = self._user_versions.get(key, 0) + 1
+        if len(self._user_versions) > self.max_size * 2:
+            # Сбрасываем счетчики пользователей, повышая версии всех чатов с записями
+            for c_id, _ in self._user_versions:
+                self._chat_versions[c_id] = self._chat_versions.get(c_id, 0) + 1
+            self._user_versions.clear()
+
+    def invalidate_user_everywhere(self, user_id: int):
+        """Сбросить ранги пользователя во всех чатах (удаление пользователя)"""
+        for chat_id, u_id in [key for key in self._ranks if key[1] == user_id]:
+            self.invalidate_user(chat_id, u_id)
+
+    # ---------- Права рангов ----------
+
+    def permissions_version(self, chat_id: int) -> int:
+        return self._chat_versions.get(chat_id, 0)
+
+    def get_permissions(self, chat_id: int) -> Optional[Dict[int, Dict[str, bool]]]:
+        entry = self._permissions.get(chat_id)
+        if entry is not None and self._fresh(entry[1]):
+            self._permissions.move_to_end(chat_id)
+            self.permission_hits += 1
+            return entry[0]
+        self.permission_misses += 1
+        return None
+
+    def set_permissions(self, chat_id: int, permissions: Dict[int, Dict[str, bool]], version: int):
+        if version != self.permissions_version(chat_id):
+            return
+        self._permissions[chat_id] = (permissions, time.monotonic())
+        self._permissions.move_to_end(chat_id)
+        self._trim(self._permissions)
+
+    # ---------- Инвалидация ----------
+
+    def invalidate_permissions(self, chat_id: int):
+        """Сбросить карту прав рангов чата"""
+        self._permissions.pop(chat_id, None)
+        self._chat_versions[chat_id] = self._chat_versions.get(chat_id, 0) + 1
+
+    def invalidate_chat(self, chat_id: int):
+        """Сбросить все ранги и права чата (смена владельца, статус бота, удаление чата)"""
+        self.invalidate_permissions(chat_id)
+        for key in [key for key in self._ranks if key[0] == chat_id]:
+            del self._ranks[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кэша"""
+        rank_total = self.rank_hits + self.rank_misses
+        permission_total = self.permission_hits + self.permission_misses
+        return {
+            'ranks': len(self._ranks),
+            'chats_with_permissions': len(self._permissions),
+            'rank_hits': self.rank_hits,
+            'rank_misses': self.rank_misses,
+            'rank_hit_rate': round(self.rank_hits / rank_total, 4) if rank_total else 0.0,
+            'permission_hits': self.permission_hits,
+            'permission_misses': self.permission_misses,
+            'permission_hit_rate': round(self.permission_hits / permission_total, 4) if permission_total else 0.0,
+        }
+
+
+# Глобальный экземпляр кэша рангов
+rank_cache = RankCache(ttl=RANK_CACHE['ttl'], max_size=RANK_CACHE['max_size'])
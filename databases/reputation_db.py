@@ -3,14 +3,15 @@
 Отдельная БД для отслеживания репутации и недавних наказаний
 """
 import bisect
-import sqlite3
-import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 import os
 from pathlib import Path
 
+from databases.connection_pool import get_pool
+from databases.migrations import apply_migrations
+
 logger = logging.getLogger(__name__)
 
 # Импортируем BASE_PATH из config, если доступен
@@ -20,6 +21,41 @@ except ImportError:
     # Если файл в databases/, то корень проекта на уровень выше
     BASE_PATH = Path(__file__).parent.parent.absolute()
 
+
+def _migration_initial_schema(db):
+    """Базовые таблицы и индексы"""
+    # Таблица репутации пользователей
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS user_reputation (
+            user_id INTEGER PRIMARY KEY,
+            reputation INTEGER DEFAULT 100,
+            last_updated TEXT
+        )
+    """)
+    
+    # Таблица недавних наказаний (за последние 3 дня)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS recent_punishments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            punishment_type TEXT,
+            punishment_date TEXT,
+            duration_seconds INTEGER
+        )
+    """)
+    
+    # Создаем индексы для оптимизации
+    db.execute("CREATE INDEX IF NOT EXISTS idx_reputation_user ON user_reputation (user_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_recent_punishments_user ON recent_punishments (user_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_recent_punishments_date ON recent_punishments (punishment_date)")
+
+
+# Порядок миграций менять нельзя - только дописывать новые в конец
+MIGRATIONS = [
+    (1, 'Базовые таблицы и индексы', _migration_initial_schema),
+]
+
+
 class ReputationDatabase:
     """Класс для работы с базой данных репутации"""
     
@@ -29,46 +65,22 @@ class ReputationDatabase:
         self.db_path = db_path
         # Создаем директорию data если её нет
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._pool = get_pool(self.db_path)
     
     async def init_db(self):
-        """Инициализация базы данных и создание таблиц"""
+        """Инициализация базы данных: применение миграций схемы"""
         def _init_sync():
-            with sqlite3.connect(self.db_path) as db:
-                # Таблица репутации пользователей
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS user_reputation (
-                        user_id INTEGER PRIMARY KEY,
-                        reputation INTEGER DEFAULT 100,
-                        last_updated TEXT
-                    )
-                """)
-                
-                # Таблица недавних наказаний (за последние 3 дня)
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS recent_punishments (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        punishment_type TEXT,
-                        punishment_date TEXT,
-                        duration_seconds INTEGER
-                    )
-                """)
-                
-                # Создаем индексы для оптимизации
-                db.execute("CREATE INDEX IF NOT EXISTS idx_reputation_user ON user_reputation (user_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_recent_punishments_user ON recent_punishments (user_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_recent_punishments_date ON recent_punishments (punishment_date)")
-                
-                db.commit()
-                logger.info("База данных репутации инициализирована")
+            with self._pool.connect() as db:
+                version = apply_migrations(db, MIGRATIONS, 'reputation')
+                logger.info(f"База данных репутации инициализирована (схема v{version})")
         
-        await asyncio.get_event_loop().run_in_executor(None, _init_sync)
+        await self._pool.run(_init_sync)
     
     async def get_user_reputation(self, user_id: int) -> int:
         """Получить текущий рейтинг пользователя (по умолчанию 100)"""
         def _get_reputation_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT reputation FROM user_reputation WHERE user_id = ?
                     """, (user_id,))
@@ -78,13 +90,13 @@ class ReputationDatabase:
                 logger.error(f"Ошибка при получении репутации пользователя {user_id}: {e}")
                 return 100
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_reputation_sync)
+        return await self._pool.run(_get_reputation_sync)
     
     async def update_reputation(self, user_id: int, change: int) -> bool:
         """Изменить рейтинг пользователя (с ограничением 0-100)"""
         def _update_reputation_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Получаем текущий рейтинг
                     cursor = db.execute("""
                         SELECT reputation FROM user_reputation WHERE user_id = ?
@@ -108,13 +120,13 @@ class ReputationDatabase:
                 logger.error(f"Ошибка при обновлении репутации пользователя {user_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_reputation_sync)
+        return await self._pool.write(_update_reputation_sync)
     
     async def add_recent_punishment(self, user_id: int, punishment_type: str, duration_seconds: Optional[int] = None) -> bool:
         """Добавить недавнее наказание"""
         def _add_punishment_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT INTO recent_punishments 
                         (user_id, punishment_type, punishment_date, duration_seconds)
@@ -127,13 +139,13 @@ class ReputationDatabase:
                 logger.error(f"Ошибка при добавлении наказания для пользователя {user_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_punishment_sync)
+        return await self._pool.write(_add_punishment_sync)
     
     async def get_recent_punishments(self, user_id: int, days: int = 3) -> List[Dict[str, Any]]:
         """Получить наказания за последние N дней"""
         def _get_punishments_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
                     
                     cursor = db.execute("""
@@ -156,13 +168,13 @@ class ReputationDatabase:
                 logger.error(f"Ошибка при получении наказаний пользователя {user_id}: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_punishments_sync)
+        return await self._pool.run(_get_punishments_sync)
     
     async def get_recent_punishment_stats(self, user_id: int, days: int = 3) -> Dict[str, int]:
         """Получить статистику наказаний за последние N дней"""
         def _get_stats_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
                     
                     cursor = db.execute("""
@@ -188,13 +200,13 @@ class ReputationDatabase:
                 logger.error(f"Ошибка при получении статистики наказаний пользователя {user_id}: {e}")
                 return {'warn': 0, 'mute': 0, 'kick': 0, 'ban': 0}
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_stats_sync)
+        return await self._pool.run(_get_stats_sync)
     
     async def cleanup_old_punishments(self, days: int = 7) -> int:
         """Удалить наказания старше N дней (по умолчанию 7 дней)"""
         def _cleanup_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
                     
                     cursor = db.execute("""
@@ -213,7 +225,7 @@ class ReputationDatabase:
                 logger.error(f"Ошибка при очистке старых наказаний: {e}")
                 return 0
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_sync)
+        return await self._pool.write(_cleanup_sync)
     
     def calculate_reputation_penalty(self, punishment_type: str, duration_seconds: Optional[int] = None) -> int:
         """Рассчитать штраф за наказание"""
@@ -238,7 +250,7 @@ class ReputationDatabase:
         """Получить всех пользователей с репутацией (для восстановления)"""
         def _get_all_users_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT user_id, reputation FROM user_reputation
                         WHERE reputation < 100
@@ -256,13 +268,13 @@ class ReputationDatabase:
                 logger.error(f"Ошибка при получении всех пользователей с репутацией: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_all_users_sync)
+        return await self._pool.run(_get_all_users_sync)
     
     async def delete_user_reputation(self, user_id: int) -> bool:
         """Удалить репутацию и наказания пользователя"""
         def _delete_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Удаляем из recent_punishments (все записи пользователя)
                     db.execute("DELETE FROM recent_punishments WHERE user_id = ?", (user_id,))
                     
@@ -276,7 +288,7 @@ class ReputationDatabase:
                 logger.error(f"Ошибка при удалении репутации пользователя {user_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _delete_sync)
+        return await self._pool.write(_delete_sync)
 
 
 # Глобальный экземпляр базы данных репутации
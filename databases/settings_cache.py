@@ -0,0 +1,166 @@
+"""
+Кэш настроек чатов
+
+Для каждого сообщения в группе бот читает настройки чата из нескольких
+хранилищ: защита от рейдов, утилиты, статистика, префикс команд, сам чат,
+варны и гифки. ChatSettingsCache собирает их в один неизменяемый снимок
+на чат и держит его в памяти (LRU с ограничением размера и TTL).
+
+Все методы записи настроек вызывают invalidate(chat_id), поэтому следующее
+чтение загрузит актуальный снимок.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+
+try:
+    from config import CHAT_SETTINGS_CACHE
+except ImportError:
+    CHAT_SETTINGS_CACHE = {'max_size': 5000, 'ttl': 600}
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSettings(NamedTuple):
+    """Неизменяемый снимок настроек чата"""
+    chat_id: int
+    chat: Optional[Mapping[str, Any]]  # db.get_chat (None, если чата нет в БД)
+    raid: Mapping[str, Any]  # raid_protection_db.get_settings
+    utilities: Mapping[str, Any]  # utilities_db.get_settings
+    stats: Mapping[str, Any]  # db.get_chat_stat_settings
+    warns: Mapping[str, Any]  # moderation_db.get_warn_settings
+    russian_prefix: bool  # db.get_russian_commands_prefix_setting
+    gifs_enabled: bool  # utils.gifs.get_gifs_enabled
+
+
+def _freeze(value: Optional[Dict[str, Any]]) -> Optional[Mapping[str, Any]]:
+    return MappingProxyType(dict(value)) if value is not None else None
+
+
+async def _load_snapshot(chat_id: int) -> ChatSettings:
+    """Прочитать все настройки чата из хранилищ"""
+    # Импорт внутри функции: модули БД сами импортируют кэш для инвалидации
+    from databases.database import db
+    from databases.moderation_db import moderation_db
+    from databases.raid_protection_db import raid_protection_db
+    from databases.utilities_db import utilities_db
+    from utils.gifs import get_gifs_enabled
+
+    chat, raid, utilities, stats, warns, russian_prefix = await asyncio.gather(
+        db.get_chat(chat_id),
+        raid_protection_db.get_settings(chat_id),
+        utilities_db.get_settings(chat_id),
+        db.get_chat_stat_settings(chat_id),
+        moderation_db.get_warn_settings(chat_id),
+        db.get_russian_commands_prefix_setting(chat_id),
+    )
+    return ChatSettings(
+        chat_id=chat_id,
+        chat=_freeze(chat),
+        raid=_freeze(raid),
+        utilities=_freeze(utilities),
+        stats=_freeze(stats),
+        warns=_freeze(warns),
+        russian_prefix=bool(russian_prefix),
+        gifs_enabled=get_gifs_enabled(chat_id),
+    )
+
+
+class ChatSettingsCache:
+    """LRU-кэш снимков настроек чатов"""
+
+    def __init__(self, max_size: int = 5000, ttl: float = 600):
+        self.max_size = max_size
+        self.ttl = ttl
+        # chat_id -> (снимок, время загрузки)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # Загрузки в процессе: параллельные промахи по одному чату ждут одну загрузку
+        self._loading: Dict[int, asyncio.Future] = {}
+        # Счетчик инвалидаций: загрузка, начатая до записи, не попадет в кэш
+        self._generations: Dict[int, int] = {}
+        self._global_generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _generation(self, chat_id: int) -> tuple:
+        return self._global_generation, self._generations.get(chat_id, 0)
+
+    async def get(self, chat_id: int) -> ChatSettings:
+        """Получить снимок настроек чата"""
+        entry = self._entries.get(chat_id)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl:
+            self._entries.move_to_end(chat_id)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        task = self._loading.get(chat_id)
+        if task is None:
+            # Загрузка идет отдельной задачей: отмена одного из ожидающих её не прерывает
+            task = asyncio.ensure_future(self._load(chat_id))
+            self._loading[chat_id] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, chat_id: int) -> ChatSettings:
+        generation = self._generation(chat_id)
+        try:
+            snapshot = await _load_snapshot(chat_id)
+        finally:
+            # После invalidate() в _loading может уже лежать новая загрузка
+            if self._loading.get(chat_id) is asyncio.current_task():
+                del self._loading[chat_id]
+
+        if generation == self._generation(chat_id):
+            self._store(chat_id, snapshot)
+        return snapshot
+
+    def _store(self, chat_id: int, snapshot: ChatSettings):
+        self._entries[chat_id] = (snapshot, time.monotonic())
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, chat_id: int):
+        """Сбросить снимок чата (вызывается после каждой записи настроек)"""
+        self._entries.pop(chat_id, None)
+        self._generations[chat_id] = self._generations.get(chat_id, 0) + 1
+        # Загрузка, начатая до записи, вернет ожидающим старые данные - отвязываем её
+        self._loading.pop(chat_id, None)
+        self.invalidations += 1
+        if len(self._generations) > self.max_size * 2:
+            self._generations.clear()
+            self._global_generation += 1
+
+    def clear(self):
+        """Сбросить весь кэш (массовые операции над чатами)"""
+        self._entries.clear()
+        self._loading.clear()
+        self._generations.clear()
+        self._global_generation += 1
+        self.invalidations += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кэша"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+# Глобальный экземпляр кэша настроек чатов
+chat_settings_cache = ChatSettingsCache(
+    max_size=CHAT_SETTINGS_CACHE['max_size'],
+    ttl=CHAT_SETTINGS_CACHE['ttl']
+)
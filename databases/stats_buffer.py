@@ -0,0 +1,236 @@
+"""
+Буфер отложенной записи статистики сообщений
+
+Счетчики сообщений копятся в памяти и периодически сбрасываются в основную
+базу данных одной транзакцией (см. Database.flush_message_stats).
+Все методы вызываются только из потока цикла событий.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StatsBatch:
+    """Набор накопленных изменений статистики"""
+
+    __slots__ = ('chat_counts', 'user_counts', 'hour_counts', 'last_message', 'first_seen', 'users')
+
+    def __init__(self):
+        # (chat_id, date) -> количество сообщений
+        self.chat_counts: Dict[Tuple[int, str], int] = {}
+        # (chat_id, user_id, date) -> [количество, username, first_name, last_name]
+        self.user_counts: Dict[Tuple[int, int, str], List[Any]] = {}
+        # (chat_id, user_id, utc_hour) -> количество сообщений (utc_hour - часы от начала эпохи)
+        self.hour_counts: Dict[Tuple[int, int, int], int] = {}
+        # (chat_id, user_id) -> время последнего сообщения (ISO)
+        self.last_message: Dict[Tuple[int, int], str] = {}
+        # (chat_id, user_id) -> дата первого появления
+        self.first_seen: Dict[Tuple[int, int], str] = {}
+        # user_id -> (username, first_name, last_name, is_bot, last_seen)
+        self.users: Dict[int, Tuple[Any, ...]] = {}
+
+    def __len__(self) -> int:
+        return (len(self.chat_counts) + len(self.user_counts) + len(self.hour_counts)
+                + len(self.last_message) + len(self.first_seen) + len(self.users))
+
+    @property
+    def message_count(self) -> int:
+        return sum(self.chat_counts.values())
+
+
+class MessageStatsBuffer:
+    """
+    Накопитель счетчиков сообщений.
+
+    Изменения попадают в текущий пакет (pending). При сбросе пакет забирается
+    через take() и до подтверждения записи остается видимым для чтения,
+    поэтому счетчики не «пропадают» между сбросом и фиксацией транзакции.
+    Каждый take() увеличивает generation: чтение, совмещающее буфер и БД,
+    по нему узнает, что за время чтения пакет мог попасть в БД.
+    """
+
+    def __init__(self, max_keys: int = 50000):
+        self.max_keys = max_keys
+        self._pending = StatsBatch()
+        self._inflight: List[StatsBatch] = []
+        self.generation = 0
+        self.dropped_messages = 0
+
+    def add_message(self, chat_id: int, user_id: int, date: str, message_time: str, first_seen: str,
+                    username: str = None, first_name: str = None, last_name: str = None,
+                    is_bot: bool = False, utc_hour: Optional[int] = None):
+        """Учесть одно сообщение пользователя"""
+        pending = self._pending
+        chat_key = (chat_id, date)
+        pending.chat_counts[chat_key] = pending.chat_counts.get(chat_key, 0) + 1
+
+        user_key = (chat_id, user_id, date)
+        entry = pending.user_counts.get(user_key)
+        if entry is None:
+            pending.user_counts[user_key] = [1, username, first_name, last_name]
+        else:
+            entry[0] += 1
+            entry[1], entry[2], entry[3] = username, first_name, last_name
+
+        if utc_hour is not None:
+            hour_key = (chat_id, user_id, utc_hour)
+            pending.hour_counts[hour_key] = pending.hour_counts.get(hour_key, 0) + 1
+
+        pending.last_message[(chat_id, user_id)] = message_time
+        pending.first_seen.setdefault((chat_id, user_id), first_seen)
+        pending.users[user_id] = (username, first_name, last_name, is_bot, message_time)
+
+    def is_full(self) -> bool:
+        """Превышен ли лимит ключей в памяти (пора сбрасывать досрочно)"""
+        return len(self._pending) >= self.max_keys
+
+    def pending_size(self) -> int:
+        return len(self._pending)
+
+    def has_inflight(self) -> bool:
+        """Идет ли запись пакета в БД (пакет забран, но не подтвержден)"""
+        return bool(self._inflight)
+
+    def take(self) -> Optional[StatsBatch]:
+        """Забрать текущий пакет для записи в БД"""
+        if not len(self._pending):
+            return None
+        batch = self._pending
+        self._pending = StatsBatch()
+        self._inflight.append(batch)
+        self.generation += 1
+        return batch
+
+    def commit(self, batch: StatsBatch):
+        """Пакет записан в БД - больше не учитываем его при чтении"""
+        if batch in self._inflight:
+            self._inflight.remove(batch)
+
+    def restore(self, batch: StatsBatch):
+        """Запись не удалась - возвращаем изменения пакета в очередь"""
+        self.commit(batch)
+        if len(self._pending) + len(batch) > self.max_keys * 2:
+            # Защита памяти при длительной недоступности БД
+            self.dropped_messages += batch.message_count
+            logger.error(f"Буфер статистики переполнен, отброшено {batch.message_count} сообщений")
+            return
+
+        pending = self._pending
+        for key, count in batch.chat_counts.items():
+            pending.chat_counts[key] = pending.chat_counts.get(key, 0) + count
+        for key, entry in batch.user_counts.items():
+            current = pending.user_counts.get(key)
+            if current is None:
+                pending.user_counts[key] = list(entry)
+            else:
+                current[0] += entry[0]
+        for key, count in batch.hour_counts.items():
+            pending.hour_counts[key] = pending.hour_counts.get(key, 0) + count
+        for key, value in batch.last_message.items():
+            pending.last_message.setdefault(key, value)
+        for key, value in batch.first_seen.items():
+            pending.first_seen.setdefault(key, value)
+        for key, value in batch.users.items():
+            pending.users.setdefault(key, value)
+
+    def _batches(self) -> List[StatsBatch]:
+        """Пакеты в порядке от старых к новым"""
+        return self._inflight + [self._pending]
+
+    def get_last_message_time(self, chat_id: int, user_id: int) -> Optional[str]:
+        """Время последнего несохраненного сообщения пользователя"""
+        key = (chat_id, user_id)
+        for batch in reversed(self._batches()):
+            value = batch.last_message.get(key)
+            if value is not None:
+                return value
+        return None
+
+    def get_chat_counts(self, chat_id: int) -> Dict[str, int]:
+        """Несохраненные счетчики чата по датам"""
+        result: Dict[str, int] = {}
+        for batch in self._batches():
+            for (c_id, date), count in batch.chat_counts.items():
+                if c_id == chat_id:
+                    result[date] = result.get(date, 0) + count
+        return result
+
+    def get_user_counts(self, chat_id: int, user_id: int) -> Dict[str, int]:
+        """Несохраненные счетчики пользователя в чате по датам"""
+        result: Dict[str, int] = {}
+        for batch in self._batches():
+            for (c_id, u_id, date), entry in batch.user_counts.items():
+                if c_id == chat_id and u_id == user_id:
+                    result[date] = result.get(date, 0) + entry[0]
+        return result
+
+    def get_user_counts_all_chats(self, user_id: int) -> Dict[str, int]:
+        """Несохраненные счетчики пользователя по всем чатам по датам"""
+        result: Dict[str, int] = {}
+        for batch in self._batches():
+            for (_, u_id, date), entry in batch.user_counts.items():
+                if u_id == user_id:
+                    result[date] = result.get(date, 0) + entry[0]
+        return result
+
+    def get_chat_user_counts(self, chat_id: int, min_date: str, max_date: str = None) -> Dict[int, List[Any]]:
+        """
+        Несохраненные счетчики всех пользователей чата за диапазон дат.
+
+        Returns:
+            user_id -> [количество, username, first_name, last_name]
+        """
+        result: Dict[int, List[Any]] = {}
+        for batch in self._batches():
+            for (c_id, u_id, date), entry in batch.user_counts.items():
+                if c_id != chat_id or date < min_date or (max_date is not None and date > max_date):
+                    continue
+                current = result.get(u_id)
+                if current is None:
+                    result[u_id] = list(entry)
+                else:
+                    current[0] += entry[0]
+                    current[1:] = entry[1:]
+        return result
+
+    def get_chat_hour_counts(self, chat_id: int, start_hour: int, end_hour: int) -> Dict[int, int]:
+        """Несохраненные счетчики чата по UTC-часам из диапазона [start_hour, end_hour)"""
+        result: Dict[int, int] = {}
+        for batch in self._batches():
+            for (c_id, _, hour), count in batch.hour_counts.items():
+                if c_id == chat_id and start_hour <= hour < end_hour:
+                    result[hour] = result.get(hour, 0) + count
+        return result
+
+    def get_chat_user_hour_counts(self, chat_id: int, start_hour: int, end_hour: int) -> Dict[int, List[Any]]:
+        """
+        Несохраненные счетчики пользователей чата за UTC-часы [start_hour, end_hour).
+
+        Returns:
+            user_id -> [количество, username, first_name, last_name]
+        """
+        result: Dict[int, List[Any]] = {}
+        for batch in self._batches():
+            for (c_id, u_id, hour), count in batch.hour_counts.items():
+                if c_id != chat_id or not start_hour <= hour < end_hour:
+                    continue
+                current = result.get(u_id)
+                if current is None:
+                    result[u_id] = [count, None, None, None]
+                else:
+                    current[0] += count
+                profile = batch.users.get(u_id)
+                if profile is not None:
+                    result[u_id][1:] = profile[:3]
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики буфера"""
+        return {
+            'pending_keys': len(self._pending),
+            'pending_messages': self._pending.message_count,
+            'inflight_batches': len(self._inflight),
+            'max_keys': self.max_keys,
+            'dropped_messages': self.dropped_messages,
+        }
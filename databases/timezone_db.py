@@ -1,14 +1,15 @@
 """
 Модуль для работы с часовыми поясами пользователей
 """
-import sqlite3
-import asyncio
 import logging
 import os
 from datetime import datetime
 from typing import Optional
 from pathlib import Path
 
+from databases.connection_pool import get_pool
+from databases.migrations import apply_migrations
+
 logger = logging.getLogger(__name__)
 
 # Импортируем TIMEZONE_DB_PATH из config, если доступен
@@ -21,6 +22,23 @@ except ImportError:
     DEFAULT_DB_PATH = str(BASE_PATH / 'data' / 'timezones.db')
 
 
+def _migration_initial_schema(db):
+    """Таблица часовых поясов пользователей"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS user_timezones (
+            user_id INTEGER PRIMARY KEY,
+            timezone_offset INTEGER NOT NULL DEFAULT 3,
+            updated_at TEXT NOT NULL
+        )
+    """)
+
+
+# Порядок миграций менять нельзя - только дописывать новые в конец
+MIGRATIONS = [
+    (1, 'Таблица часовых поясов', _migration_initial_schema),
+]
+
+
 class TimezoneDatabase:
     """Класс для работы с часовыми поясами пользователей"""
     
@@ -30,21 +48,15 @@ class TimezoneDatabase:
         self.db_path = db_path
         # Создаем директорию data если её нет
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._pool = get_pool(self.db_path)
         self._init_database()
     
     def _init_database(self):
-        """Инициализация базы данных и создание таблиц"""
+        """Инициализация базы данных: применение миграций схемы"""
         try:
-            with sqlite3.connect(self.db_path) as db:
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS user_timezones (
-                        user_id INTEGER PRIMARY KEY,
-                        timezone_offset INTEGER NOT NULL DEFAULT 3,
-                        updated_at TEXT NOT NULL
-                    )
-                """)
-                db.commit()
-                logger.info(f"База данных часовых поясов инициализирована: {self.db_path}")
+            with self._pool.connect() as db:
+                version = apply_migrations(db, MIGRATIONS, 'timezones')
+                logger.info(f"База данных часовых поясов инициализирована: {self.db_path} (схема v{version})")
         except Exception as e:
             logger.error(f"Ошибка при инициализации базы данных часовых поясов: {e}")
     
@@ -52,7 +64,7 @@ class TimezoneDatabase:
         """Получить часовой пояс пользователя (по умолчанию UTC+3)"""
         def _get_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cur = db.execute(
                         "SELECT timezone_offset FROM user_timezones WHERE user_id = ?",
                         (user_id,)
@@ -65,7 +77,7 @@ class TimezoneDatabase:
                 logger.error(f"Ошибка при получении часового пояса пользователя {user_id}: {e}")
                 return 3
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
     
     async def set_user_timezone(self, user_id: int, offset: int) -> bool:
         """Установить часовой пояс пользователя"""
@@ -76,7 +88,7 @@ class TimezoneDatabase:
         
         def _set_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT OR REPLACE INTO user_timezones (user_id, timezone_offset, updated_at)
                         VALUES (?, ?, ?)
@@ -87,7 +99,7 @@ class TimezoneDatabase:
                 logger.error(f"Ошибка при установке часового пояса пользователя {user_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _set_sync)
+        return await self._pool.write(_set_sync)
     
     async def get_user_date(self, user_id: int) -> str:
         """Получить текущую дату с учетом часового пояса пользователя"""
@@ -97,7 +109,7 @@ class TimezoneDatabase:
         
         def _get_date_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     if sqlite_offset == 0:
                         cur = db.execute("SELECT date('now')")
                     else:
@@ -108,7 +120,7 @@ class TimezoneDatabase:
                 logger.error(f"Ошибка при получении даты для пользователя {user_id}: {e}")
                 return datetime.now().strftime('%Y-%m-%d')
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_date_sync)
+        return await self._pool.run(_get_date_sync)
     
     async def get_user_datetime(self, user_id: int) -> str:
         """Получить текущую дату и время с учетом часового пояса пользователя"""
@@ -118,7 +130,7 @@ class TimezoneDatabase:
         
         def _get_datetime_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     if sqlite_offset == 0:
                         cur = db.execute("SELECT datetime('now')")
                     else:
@@ -129,7 +141,7 @@ class TimezoneDatabase:
                 logger.error(f"Ошибка при получении даты и времени для пользователя {user_id}: {e}")
                 return datetime.now().isoformat()
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_datetime_sync)
+        return await self._pool.run(_get_datetime_sync)
     
     def format_timezone_offset(self, offset: int) -> str:
         """Форматировать смещение часового пояса в строку"""
@@ -155,7 +167,7 @@ class TimezoneDatabase:
         """Удалить часовой пояс пользователя"""
         def _delete_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("DELETE FROM user_timezones WHERE user_id = ?", (user_id,))
                     db.commit()
                     logger.info(f"Часовой пояс пользователя {user_id} удален")
@@ -164,4 +176,4 @@ class TimezoneDatabase:
                 logger.error(f"Ошибка при удалении часового пояса пользователя {user_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _delete_sync)
\ No newline at end of file
+        return await self._pool.write(_delete_sync)
\ No newline at end of file
@@ -2,14 +2,16 @@
 Модуль для работы с базой данных утилит
 Хранение настроек защиты от эмодзи спама и спама реакциями
 """
-import sqlite3
-import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 import os
 from pathlib import Path
 
+from databases.connection_pool import get_pool
+from databases.migrations import add_column, apply_migrations
+from databases.settings_cache import chat_settings_cache
+
 logger = logging.getLogger(__name__)
 
 # Импортируем BASE_PATH из config, если доступен
@@ -19,6 +21,96 @@ except ImportError:
     # Если файл в databases/, то корень проекта на уровень выше
     BASE_PATH = Path(__file__).parent.parent.absolute()
 
+
+def _migration_initial_schema(db):
+    """Базовые таблицы и индексы"""
+    # Таблица настроек утилит для каждого чата
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS utilities_settings (
+            chat_id INTEGER PRIMARY KEY,
+            emoji_spam_enabled BOOLEAN DEFAULT 0,
+            emoji_spam_limit INTEGER DEFAULT 10,
+            reaction_spam_enabled BOOLEAN DEFAULT 0,
+            reaction_spam_limit INTEGER DEFAULT 5,
+            reaction_spam_window INTEGER DEFAULT 120,
+            reaction_spam_warning_enabled BOOLEAN DEFAULT 1,
+            reaction_spam_punishment TEXT DEFAULT 'kick',
+            reaction_spam_ban_duration INTEGER DEFAULT 300,
+            fake_commands_enabled BOOLEAN DEFAULT 0
+        )
+    """)
+    
+    # Таблица для отслеживания реакций пользователей
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS reaction_activity (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            timestamp TEXT,
+            message_id INTEGER
+        )
+    """)
+    
+    # Таблица для отслеживания предупреждений пользователей
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS reaction_warnings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            timestamp TEXT
+        )
+    """)
+    
+    # Таблица для отслеживания примененных наказаний (защита от дублирования)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS reaction_punishments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            user_id INTEGER,
+            punishment_type TEXT,
+            timestamp TEXT
+        )
+    """)
+    
+    # Таблица для отслеживания команд в сообщениях (защита от спама командами)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS command_tracking (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            command_text TEXT,
+            first_detected_time TEXT,
+            last_used_time TEXT,
+            usage_count INTEGER DEFAULT 0,
+            is_active BOOLEAN DEFAULT 1,
+            UNIQUE(chat_id, command_text)
+        )
+    """)
+    
+    # Создаем индексы для оптимизации
+    db.execute("CREATE INDEX IF NOT EXISTS idx_reaction_activity_chat_user ON reaction_activity (chat_id, user_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_reaction_activity_timestamp ON reaction_activity (timestamp)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_reaction_warnings_chat_user ON reaction_warnings (chat_id, user_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_reaction_punishments_chat_user ON reaction_punishments (chat_id, user_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_reaction_punishments_timestamp ON reaction_punishments (timestamp)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_command_tracking_chat_command ON command_tracking (chat_id, command_text)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_command_tracking_last_used ON command_tracking (last_used_time)")
+
+
+def _migration_added_columns(db):
+    """Колонки фейковых команд, реакций и автобана каналов"""
+    add_column(db, 'utilities_settings', 'fake_commands_enabled', 'BOOLEAN DEFAULT 0')
+    add_column(db, 'utilities_settings', 'reaction_spam_silent', 'BOOLEAN DEFAULT 0')
+    add_column(db, 'utilities_settings', 'auto_ban_channels_enabled', 'BOOLEAN DEFAULT 0')
+    add_column(db, 'utilities_settings', 'auto_ban_channels_duration', 'INTEGER DEFAULT NULL')
+
+
+# Порядок миграций менять нельзя - только дописывать новые в конец
+MIGRATIONS = [
+    (1, 'Базовые таблицы и индексы', _migration_initial_schema),
+    (2, 'Колонки фейковых команд, реакций и автобана каналов', _migration_added_columns),
+]
+
+
 class UtilitiesDatabase:
     """Класс для работы с базой данных утилит"""
     
@@ -28,152 +120,35 @@ class UtilitiesDatabase:
         self.db_path = db_path
         # Создаем директорию data если её нет
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._pool = get_pool(self.db_path)
     
     async def init_db(self):
-        """Инициализация базы данных и создание таблиц"""
+        """Инициализация базы данных: применение миграций схемы"""
         def _init_sync():
-            with sqlite3.connect(self.db_path) as db:
-                # Таблица настроек утилит для каждого чата
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS utilities_settings (
-                        chat_id INTEGER PRIMARY KEY,
-                        emoji_spam_enabled BOOLEAN DEFAULT 0,
-                        emoji_spam_limit INTEGER DEFAULT 10,
-                        reaction_spam_enabled BOOLEAN DEFAULT 0,
-                        reaction_spam_limit INTEGER DEFAULT 5,
-                        reaction_spam_window INTEGER DEFAULT 120,
-                        reaction_spam_warning_enabled BOOLEAN DEFAULT 1,
-                        reaction_spam_punishment TEXT DEFAULT 'kick',
-                        reaction_spam_ban_duration INTEGER DEFAULT 300,
-                        fake_commands_enabled BOOLEAN DEFAULT 0
-                    )
-                """)
-                
-                # Добавляем колонку fake_commands_enabled если её нет
-                try:
-                    db.execute("ALTER TABLE utilities_settings ADD COLUMN fake_commands_enabled BOOLEAN DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку reaction_spam_silent если её нет
-                try:
-                    db.execute("ALTER TABLE utilities_settings ADD COLUMN reaction_spam_silent BOOLEAN DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку auto_ban_channels_enabled если её нет
-                try:
-                    db.execute("ALTER TABLE utilities_settings ADD COLUMN auto_ban_channels_enabled BOOLEAN DEFAULT 0")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Добавляем колонку auto_ban_channels_duration если её нет
-                try:
-                    db.execute("ALTER TABLE utilities_settings ADD COLUMN auto_ban_channels_duration INTEGER DEFAULT NULL")
-                    db.commit()
-                except sqlite3.OperationalError:
-                    # Колонка уже существует
-                    pass
-                
-                # Таблица для отслеживания реакций пользователей
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS reaction_activity (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        timestamp TEXT,
-                        message_id INTEGER
-                    )
-                """)
-                
-                # Таблица для отслеживания предупреждений пользователей
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS reaction_warnings (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        timestamp TEXT
-                    )
-                """)
-                
-                # Таблица для отслеживания примененных наказаний (защита от дублирования)
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS reaction_punishments (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        user_id INTEGER,
-                        punishment_type TEXT,
-                        timestamp TEXT
-                    )
-                """)
-                
-                # Таблица для отслеживания команд в сообщениях (защита от спама командами)
-                db.execute("""
-                    CREATE TABLE IF NOT EXISTS command_tracking (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        chat_id INTEGER,
-                        command_text TEXT,
-                        first_detected_time TEXT,
-                        last_used_time TEXT,
-                        usage_count INTEGER DEFAULT 0,
-                        is_active BOOLEAN DEFAULT 1,
-                        UNIQUE(chat_id, command_text)
-                    )
-                """)
-                
-                # Создаем индексы для оптимизации
-                db.execute("CREATE INDEX IF NOT EXISTS idx_reaction_activity_chat_user ON reaction_activity (chat_id, user_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_reaction_activity_timestamp ON reaction_activity (timestamp)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_reaction_warnings_chat_user ON reaction_warnings (chat_id, user_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_reaction_punishments_chat_user ON reaction_punishments (chat_id, user_id)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_reaction_punishments_timestamp ON reaction_punishments (timestamp)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_command_tracking_chat_command ON command_tracking (chat_id, command_text)")
-                db.execute("CREATE INDEX IF NOT EXISTS idx_command_tracking_last_used ON command_tracking (last_used_time)")
-                
-                db.commit()
-                logger.info("База данных утилит инициализирована")
+            with self._pool.connect() as db:
+                version = apply_migrations(db, MIGRATIONS, 'utilities')
+                logger.info(f"База данных утилит инициализирована (схема v{version})")
         
-        await asyncio.get_event_loop().run_in_executor(None, _init_sync)
+        await self._pool.run(_init_sync)
     
     async def get_settings(self, chat_id: int) -> Dict[str, Any]:
         """Получить настройки утилит для чата"""
         def _get_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
-                    # Проверяем наличие колонок в схеме
-                    cursor_columns = db.execute("PRAGMA table_info(utilities_settings)")
-                    columns = [col[1] for col in cursor_columns.fetchall()]
-                    has_silent = 'reaction_spam_silent' in columns
-                    has_auto_ban = 'auto_ban_channels_enabled' in columns
-                    has_auto_ban_duration = 'auto_ban_channels_duration' in columns
-                    
-                    # Формируем запрос в зависимости от наличия колонок
-                    select_fields = [
-                        'emoji_spam_enabled', 'emoji_spam_limit',
-                        'reaction_spam_enabled', 'reaction_spam_limit',
-                        'reaction_spam_window', 'reaction_spam_warning_enabled',
-                        'reaction_spam_punishment', 'reaction_spam_ban_duration',
-                        'fake_commands_enabled'
-                    ]
-                    if has_silent:
-                        select_fields.append('reaction_spam_silent')
-                    if has_auto_ban:
-                        select_fields.append('auto_ban_channels_enabled')
-                    if has_auto_ban_duration:
-                        select_fields.append('auto_ban_channels_duration')
-                    
-                    query = f"SELECT {', '.join(select_fields)} FROM utilities_settings WHERE chat_id = ?"
-                    cursor = db.execute(query, (chat_id,))
+                with self._pool.connect() as db:
+                    cursor = db.execute("""
+                        SELECT emoji_spam_enabled, emoji_spam_limit,
+                               reaction_spam_enabled, reaction_spam_limit,
+                               reaction_spam_window, reaction_spam_warning_enabled,
+                               reaction_spam_punishment, reaction_spam_ban_duration,
+                               fake_commands_enabled, reaction_spam_silent,
+                               auto_ban_channels_enabled, auto_ban_channels_duration
+                        FROM utilities_settings WHERE chat_id = ?
+                    """, (chat_id,))
                     row = cursor.fetchone()
                     
                     if row:
-                        result = {
+                        return {
                             'emoji_spam_enabled': bool(row[0]),
                             'emoji_spam_limit': row[1],
                             'reaction_spam_enabled': bool(row[2]),
@@ -182,18 +157,11 @@ class UtilitiesDatabase:
                             'reaction_spam_warning_enabled': bool(row[5]),
                             'reaction_spam_punishment': row[6],
                             'reaction_spam_ban_duration': row[7],
-                            'fake_commands_enabled': bool(row[8]) if len(row) > 8 else False,
+                            'fake_commands_enabled': bool(row[8]),
+                            'reaction_spam_silent': bool(row[9]),
+                            'auto_ban_channels_enabled': bool(row[10]),
+                            'auto_ban_channels_duration': row[11]
                         }
-                        idx = 9
-                        if has_silent:
-                            result['reaction_spam_silent'] = bool(row[idx]) if len(row) > idx else False
-                            idx += 1
-                        if has_auto_ban:
-                            result['auto_ban_channels_enabled'] = bool(row[idx]) if len(row) > idx else False
-                            idx += 1
-                        if has_auto_ban_duration:
-                            result['auto_ban_channels_duration'] = row[idx] if len(row) > idx else None
-                        return result
                     else:
                         # Возвращаем настройки по умолчанию
                         return {
@@ -227,13 +195,13 @@ class UtilitiesDatabase:
                     'auto_ban_channels_duration': None
                 }
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
     
     async def update_setting(self, chat_id: int, setting_name: str, value: Any) -> bool:
         """Обновить настройку утилит для чата"""
         def _update_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Конвертируем bool в int если нужно
                     db_value = value
                     if isinstance(value, bool):
@@ -270,8 +238,9 @@ class UtilitiesDatabase:
                             (chat_id, emoji_spam_enabled, emoji_spam_limit,
                              reaction_spam_enabled, reaction_spam_limit, reaction_spam_window,
                              reaction_spam_warning_enabled, reaction_spam_punishment, reaction_spam_ban_duration,
-                             fake_commands_enabled)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                             fake_commands_enabled, reaction_spam_silent,
+                             auto_ban_channels_enabled, auto_ban_channels_duration)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                         """, (
                             chat_id,
                             defaults.get('emoji_spam_enabled', 0),
@@ -282,7 +251,10 @@ class UtilitiesDatabase:
                             defaults.get('reaction_spam_warning_enabled', 1),
                             defaults.get('reaction_spam_punishment', 'kick'),
                             defaults.get('reaction_spam_ban_duration', 300),
-                            defaults.get('fake_commands_enabled', 0)
+                            defaults.get('fake_commands_enabled', 0),
+                            defaults.get('reaction_spam_silent', 0),
+                            defaults.get('auto_ban_channels_enabled', 0),
+                            defaults.get('auto_ban_channels_duration')
                         ))
                     
                     db.commit()
@@ -291,13 +263,15 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при обновлении настройки {setting_name} для чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_sync)
+        result = await self._pool.write(_update_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def update_settings(self, chat_id: int, **kwargs) -> bool:
         """Обновить несколько настроек утилит для чата"""
         def _update_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Проверяем, существуют ли настройки для этого чата
                     cursor = db.execute("SELECT chat_id FROM utilities_settings WHERE chat_id = ?", (chat_id,))
                     exists = cursor.fetchone() is not None
@@ -331,8 +305,9 @@ class UtilitiesDatabase:
                             (chat_id, emoji_spam_enabled, emoji_spam_limit,
                              reaction_spam_enabled, reaction_spam_limit, reaction_spam_window,
                              reaction_spam_warning_enabled, reaction_spam_punishment, reaction_spam_ban_duration,
-                             fake_commands_enabled)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                             fake_commands_enabled, reaction_spam_silent,
+                             auto_ban_channels_enabled, auto_ban_channels_duration)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                         """, (
                             chat_id,
                             defaults.get('emoji_spam_enabled', 0),
@@ -343,7 +318,10 @@ class UtilitiesDatabase:
                             defaults.get('reaction_spam_warning_enabled', 1),
                             defaults.get('reaction_spam_punishment', 'kick'),
                             defaults.get('reaction_spam_ban_duration', 300),
-                            defaults.get('fake_commands_enabled', 0)
+                            defaults.get('fake_commands_enabled', 0),
+                            defaults.get('reaction_spam_silent', 0),
+                            defaults.get('auto_ban_channels_enabled', 0),
+                            defaults.get('auto_ban_channels_duration')
                         ))
                     else:
                         # Обновляем существующие настройки
@@ -366,13 +344,15 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при обновлении настроек для чата {chat_id}: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _update_sync)
+        result = await self._pool.write(_update_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
     
     async def add_reaction_activity(self, chat_id: int, user_id: int, message_id: int = None) -> bool:
         """Добавить запись о реакции пользователя"""
         def _add_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT INTO reaction_activity 
                         (chat_id, user_id, timestamp, message_id)
@@ -384,14 +364,14 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при добавлении активности реакции: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_sync)
+        return await self._pool.write(_add_sync)
     
     async def get_recent_reactions(self, chat_id: int, user_id: int, time_window_seconds: int) -> List[Dict[str, Any]]:
         """Получить недавние реакции пользователя"""
         def _get_sync():
             try:
                 cutoff_time = (datetime.now() - timedelta(seconds=time_window_seconds)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT id, timestamp, message_id
                         FROM reaction_activity
@@ -412,13 +392,13 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при получении недавних реакций: {e}")
                 return []
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
     
     async def add_reaction_warning(self, chat_id: int, user_id: int) -> bool:
         """Добавить запись о предупреждении пользователя за спам реакциями"""
         def _add_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT INTO reaction_warnings 
                         (chat_id, user_id, timestamp)
@@ -430,14 +410,14 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при добавлении предупреждения: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_sync)
+        return await self._pool.write(_add_sync)
     
     async def has_recent_warning(self, chat_id: int, user_id: int, time_window_seconds: int = 300) -> bool:
         """Проверить, есть ли у пользователя недавнее предупреждение"""
         def _check_sync():
             try:
                 cutoff_time = (datetime.now() - timedelta(seconds=time_window_seconds)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT COUNT(*) FROM reaction_warnings
                         WHERE chat_id = ? AND user_id = ? AND timestamp >= ?
@@ -448,14 +428,14 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при проверке предупреждения: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _check_sync)
+        return await self._pool.run(_check_sync)
     
     async def cleanup_old_reactions(self, hours_to_keep: int = 1) -> bool:
         """Очистить старые записи о реакциях"""
         def _cleanup_sync():
             try:
                 cutoff_time = (datetime.now() - timedelta(hours=hours_to_keep)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         DELETE FROM reaction_activity WHERE timestamp < ?
                     """, (cutoff_time,))
@@ -468,14 +448,14 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при очистке старых записей о реакциях: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_sync)
+        return await self._pool.write(_cleanup_sync)
     
     async def cleanup_old_warnings(self, hours_to_keep: int = 1) -> bool:
         """Очистить старые записи о предупреждениях"""
         def _cleanup_sync():
             try:
                 cutoff_time = (datetime.now() - timedelta(hours=hours_to_keep)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         DELETE FROM reaction_warnings WHERE timestamp < ?
                     """, (cutoff_time,))
@@ -488,13 +468,13 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при очистке старых записей о предупреждениях: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_sync)
+        return await self._pool.write(_cleanup_sync)
     
     async def add_reaction_punishment(self, chat_id: int, user_id: int, punishment_type: str) -> bool:
         """Добавить запись о примененном наказании"""
         def _add_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("""
                         INSERT INTO reaction_punishments 
                         (chat_id, user_id, punishment_type, timestamp)
@@ -506,14 +486,14 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при добавлении записи о наказании: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_sync)
+        return await self._pool.write(_add_sync)
     
     async def has_recent_punishment(self, chat_id: int, user_id: int, time_window_seconds: int = 60) -> bool:
         """Проверить, было ли применено наказание недавно (защита от дублирования)"""
         def _check_sync():
             try:
                 cutoff_time = (datetime.now() - timedelta(seconds=time_window_seconds)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT COUNT(*) FROM reaction_punishments
                         WHERE chat_id = ? AND user_id = ? AND timestamp >= ?
@@ -524,14 +504,14 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при проверке недавних наказаний: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _check_sync)
+        return await self._pool.run(_check_sync)
     
     async def cleanup_old_punishments(self, hours_to_keep: int = 1) -> bool:
         """Очистить старые записи о наказаниях"""
         def _cleanup_sync():
             try:
                 cutoff_time = (datetime.now() - timedelta(hours=hours_to_keep)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         DELETE FROM reaction_punishments WHERE timestamp < ?
                     """, (cutoff_time,))
@@ -544,13 +524,13 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при очистке старых записей о наказаниях: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_sync)
+        return await self._pool.write(_cleanup_sync)
     
     async def add_command_detection(self, chat_id: int, command_text: str) -> bool:
         """Запомнить обнаруженную команду в сообщении"""
         def _add_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     now = datetime.now().isoformat()
                     # Используем INSERT OR REPLACE для обновления существующей записи
                     db.execute("""
@@ -564,13 +544,13 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при добавлении обнаруженной команды: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _add_sync)
+        return await self._pool.write(_add_sync)
     
     async def get_command_tracking(self, chat_id: int, command_text: str) -> Optional[Dict[str, Any]]:
         """Получить информацию об отслеживании команды"""
         def _get_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     cursor = db.execute("""
                         SELECT first_detected_time, last_used_time, usage_count, is_active
                         FROM command_tracking
@@ -590,13 +570,13 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при получении информации о команде: {e}")
                 return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _get_sync)
+        return await self._pool.run(_get_sync)
     
     async def increment_command_usage(self, chat_id: int, command_text: str) -> bool:
         """Увеличить счетчик использования команды и обновить время"""
         def _increment_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     now = datetime.now().isoformat()
                     # Обновляем счетчик и время последнего использования
                     db.execute("""
@@ -612,14 +592,14 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при обновлении использования команды: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _increment_sync)
+        return await self._pool.write(_increment_sync)
     
     async def cleanup_expired_commands(self, seconds_threshold: int = 60) -> bool:
         """Очистить истекшие команды (не использовались более указанного времени)"""
         def _cleanup_sync():
             try:
                 cutoff_time = (datetime.now() - timedelta(seconds=seconds_threshold)).isoformat()
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     # Деактивируем команды, которые не использовались более указанного времени
                     cursor = db.execute("""
                         UPDATE command_tracking 
@@ -645,13 +625,13 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при очистке истекших команд: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _cleanup_sync)
+        return await self._pool.write(_cleanup_sync)
     
     async def delete_chat_data(self, chat_id: int) -> bool:
         """Удалить все данные чата из базы утилит"""
         def _delete_sync():
             try:
-                with sqlite3.connect(self.db_path) as db:
+                with self._pool.connect() as db:
                     db.execute("DELETE FROM utilities_settings WHERE chat_id = ?", (chat_id,))
                     db.execute("DELETE FROM reaction_activity WHERE chat_id = ?", (chat_id,))
                     db.execute("DELETE FROM reaction_warnings WHERE chat_id = ?", (chat_id,))
@@ -664,7 +644,9 @@ class UtilitiesDatabase:
                 logger.error(f"Ошибка при удалении данных чата {chat_id} из utilities_db: {e}")
                 return False
         
-        return await asyncio.get_event_loop().run_in_executor(None, _delete_sync)
+        result = await self._pool.write(_delete_sync)
+        chat_settings_cache.invalidate(chat_id)
+        return result
 
 
 # Глобальный экземпляр базы данных утилит
@@ -27,6 +27,14 @@ from databases.raid_protection_db import raid_protection_db
 from databases.moderation_db import moderation_db
 from databases.utilities_db import utilities_db
 from databases.reputation_db import reputation_db
+from databases.settings_cache import chat_settings_cache
+from databases.rank_cache import rank_cache
+from utils.member_cache import member_cache
+from utils.rate_limiter import set_api_lane, LANE_MODERATION
+from utils.raid_lockdown import raid_lockdown
+from utils.join_rate import join_rate, KIND_JOIN, KIND_MESSAGE
+from middleware.update_context import UpdateContext
+from utils.chat_refresh import chat_refresh, MEMBERSHIP_WEIGHT
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +65,7 @@ def register_common_handlers(dispatcher: Dispatcher, bot_instance: Bot):
     dp.message.register(new_chat_member, F.new_chat_members)
     dp.message.register(left_chat_member, F.left_chat_member)
     dp.my_chat_member.register(handle_my_chat_member)
+    dp.chat_member.register(handle_chat_member)
     dp.chat_join_request.register(handle_chat_join_request)
     dp.message_reaction.register(reaction_spam_handler)
     
@@ -121,7 +130,7 @@ async def check_chat_active(callback: CallbackQuery) -> bool:
         if callback.message and callback.message.chat:
             chat_id = callback.message.chat.id
             if callback.message.chat.type in ['group', 'supergroup']:
-                chat_info = await db.get_chat(chat_id)
+                chat_info = (await chat_settings_cache.get(chat_id)).chat
                 if not chat_info:
                     return False
                 if not chat_info.get('is_active', True) or chat_info.get('frozen_at'):
@@ -209,7 +218,7 @@ async def update_chat_info_if_needed(chat_id: int) -> bool:
         invite_link_updated = False
         if not is_public and chat_info.type in ['group', 'supergroup']:
             try:
-                bot_member = await bot.get_chat_member(chat_id, bot.id)
+                bot_member = await member_cache.get(bot, chat_id, bot.id)
                 if bot_member.status in ['administrator', 'creator']:
                     chat_db_info = await db.get_chat(chat_id)
                     existing_invite_link = chat_db_info.get('invite_link') if chat_db_info else None
@@ -277,7 +286,11 @@ async def update_chat_info_if_needed(chat_id: int) -> bool:
         if invite_link_updated:
             update_params['invite_link'] = invite_link
         
-        await db.update_chat_info(**update_params)
+        # Не пишем в БД, если данные чата не изменились с последнего сохранения
+        changed = chat_refresh.is_changed(chat_id, update_params)
+        if changed:
+            await db.update_chat_info(**update_params)
+        chat_refresh.mark_refreshed(chat_id, update_params, written=changed)
         
         return True
     except Exception as e:
@@ -287,6 +300,7 @@ async def update_chat_info_if_needed(chat_id: int) -> bool:
                 logger.debug(f"Чат {chat_id} недоступен при обновлении информации (бот исключен или чат не найден): {e}")
             try:
                 await db.deactivate_chat(chat_id)
+                chat_refresh.forget(chat_id)
             except Exception:
                 pass
         else:
@@ -480,7 +494,7 @@ async def start_command(message: Message):
     )
 
 
-async def command_alias_handler(message: Message):
+async def command_alias_handler(message: Message, update_context: UpdateContext):
     """Универсальный обработчик алиасов команд"""
     from handlers.profile import myprofile_command
     from handlers.top_chats import top_users_command, top_users_all_chats_command
@@ -489,9 +503,8 @@ async def command_alias_handler(message: Message):
     from handlers.raid_protection import raid_protection_command
     
     text = message.text.strip() if message.text else ""
-    chat_id = message.chat.id
     
-    requires_prefix = await db.get_russian_commands_prefix_setting(chat_id)
+    requires_prefix = update_context.settings.russian_prefix if update_context.settings else False
     
     if requires_prefix:
         if not text.lower().startswith("пиксель"):
@@ -845,21 +858,25 @@ async def bot_mention_handler(message: Message):
         logger.debug(f"Ошибка при ответе на упоминание в чате {chat_id}: {e}")
 
 
-async def message_handler(message: Message):
+async def message_handler(message: Message, update_context: UpdateContext):
     """Обработчик сообщений: проверка на рейды и подсчет для статистики"""
     _cleanup_mute_cache()
     
     if message.chat.type in ['group', 'supergroup']:
         chat_id = message.chat.id
         user_id = message.from_user.id
+        chat_settings = update_context.settings
+        
+        if message.new_chat_title or message.new_chat_photo or message.delete_chat_photo:
+            chat_refresh.mark_dirty(chat_id)
+        else:
+            chat_refresh.note_activity(chat_id)
+            join_rate.add(chat_id, KIND_MESSAGE)
         
         try:
-            active_mutes = await moderation_db.get_active_punishments(chat_id, "mute")
-            user_mutes = [mute for mute in active_mutes if mute['user_id'] == user_id]
-            
-            if user_mutes:
+            if await update_context.is_muted_in_db():
                 try:
-                    chat_member = await bot.get_chat_member(chat_id, user_id)
+                    chat_member = await member_cache.get(bot, chat_id, user_id)
                     user_is_muted = False
                     
                     if hasattr(chat_member, 'status') and chat_member.status == 'restricted':
@@ -875,16 +892,18 @@ async def message_handler(message: Message):
         except Exception as e:
             logger.debug(f"Ошибка при проверке мута для пользователя {user_id} в чате {chat_id}: {e}")
         
-        is_raid, raid_type, message_id = await raid_protection.check_message(message)
+        is_raid, raid_type, message_id = await raid_protection.check_message(message, chat_settings.raid)
         
         if is_raid and message_id:
             logger.info(f"Обнаружен рейд типа {raid_type} от пользователя {user_id} в чате {chat_id}")
+            # Ответ на рейд (удаление, мут, уведомления) - в приоритетной полосе Bot API
+            set_api_lane(LANE_MODERATION)
             
             await raid_protection.delete_message(chat_id, message_id)
             await raid_protection_db.add_deleted_message(chat_id, user_id, raid_type)
             
-            settings = await raid_protection_db.get_settings(chat_id)
-            logger.info(f"Получены настройки для чата {chat_id}: {settings}")
+            settings = chat_settings.raid
+            logger.info(f"Получены настройки для чата {chat_id}: {dict(settings)}")
             notification_mode = settings.get('notification_mode', 1)
             mute_duration = settings.get('mute_duration', 300)
             auto_mute_enabled = settings.get('auto_mute_enabled', True)
@@ -917,12 +936,11 @@ async def message_handler(message: Message):
                         mute_until = datetime.now() + timedelta(seconds=mute_duration)
                         
                         # Проверяем активные наказания в БД перед применением
-                        active_punishments = await moderation_db.get_active_punishments(chat_id, "mute")
-                        user_is_muted_in_db = any(punish['user_id'] == user_id for punish in active_punishments)
+                        user_is_muted_in_db = await update_context.is_muted_in_db()
                         
                         user_is_muted = False
                         try:
-                            chat_member = await bot.get_chat_member(chat_id, user_id)
+                            chat_member = await member_cache.get(bot, chat_id, user_id)
                             logger.info(f"Статус пользователя {user_id} в чате {chat_id}: {chat_member.status}")
                             if hasattr(chat_member, 'status') and chat_member.status == 'restricted':
                                 if hasattr(chat_member, 'permissions') and chat_member.permissions:
@@ -974,8 +992,11 @@ async def message_handler(message: Message):
                                     moderator_username=None,
                                     moderator_first_name=BOT_NAME
                                 )
+                                update_context.forget_mutes()
                                 
                                 auto_mute_applied = True
+                                # Участник рейда замучен - удаляем и его предыдущие сообщения
+                                raid_protection.purge_user_messages(chat_id, user_id, raid_type, settings)
                                 duration_minutes = mute_duration // 60
                                 logger.info(f"Автоматический мут применен к пользователю {user_id} в чате {chat_id} на {duration_minutes} минут")
                             except Exception as mute_error:
@@ -1051,7 +1072,7 @@ async def message_handler(message: Message):
             logger.info(f"🚫 Сообщение от {user_id} в чате {chat_id} определено как рейд, статистика не засчитывается")
             return
         
-        utilities_settings = await utilities_db.get_settings(chat_id)
+        utilities_settings = chat_settings.utilities
         if utilities_settings.get('emoji_spam_enabled', False) and message.text:
             emoji_limit = utilities_settings.get('emoji_spam_limit', 10)
             
@@ -1131,7 +1152,7 @@ async def message_handler(message: Message):
                 # Не засчитываем статистику для сообщений от забаненных каналов
                 return
         
-        stat_settings = await db.get_chat_stat_settings(chat_id)
+        stat_settings = chat_settings.stats
         
         # Проверяем, включена ли статистика для чата
         if not stat_settings.get('stats_enabled', True):
@@ -1158,16 +1179,15 @@ async def message_handler(message: Message):
                     logger.warning(
                         f"⚠️ Некорректное время в БД для пользователя {user_name} ({message.from_user.id}) "
                         f"в чате \"{chat_name}\": время в БД ({last_message_time_str}) больше текущего. "
-                        f"Обновляю время в БД."
+                        f"Время будет перезаписано текущим."
                     )
-                    await db.update_user_last_message_time(chat_id, message.from_user.id, current_time.isoformat())
                 elif time_diff < 1:
                     logger.info(f"🚫 Сообщение пропущено от {user_name} ({message.from_user.id}) в чате \"{chat_name}\" (прошло {time_diff:.3f}с) - слишком быстро после предыдущего, статистика не засчитывается")
                     return
             except ValueError:
                 logger.warning(f"Неверный формат времени: {last_message_time_str}")
         
-        chat_info = await db.get_chat(chat_id)
+        chat_info = chat_settings.chat
         if not chat_info:
             owner_id = None
             try:
@@ -1185,38 +1205,21 @@ async def message_handler(message: Message):
                 owner_id=owner_id
             )
         
-        await db.add_user(
-            user_id=message.from_user.id,
-            username=message.from_user.username,
-            first_name=message.from_user.first_name,
-            last_name=message.from_user.last_name,
-            is_bot=message.from_user.is_bot
-        )
-        
         try:
-            await db.increment_message_count(chat_id)
-        except Exception as e:
-            logger.error(f"Ошибка при increment_message_count для чата {chat_id}: {e}", exc_info=True)
-        
-        try:
-            result2 = await db.increment_user_message_count(
+            # Счетчики, first_seen, время последнего сообщения и профиль пользователя
+            # копятся в памяти и записываются в БД пакетно (см. Database.flush_message_stats)
+            await db.record_message(
                 chat_id=chat_id,
                 user_id=message.from_user.id,
                 username=message.from_user.username,
                 first_name=message.from_user.first_name,
-                last_name=message.from_user.last_name
+                last_name=message.from_user.last_name,
+                is_bot=message.from_user.is_bot,
+                message_time=current_time
             )
-            if not result2:
-                logger.warning(f"⚠️ increment_user_message_count вернул False для пользователя {message.from_user.id} в чате {chat_id}")
-        except Exception as e:
-            logger.error(f"❌ Ошибка при increment_user_message_count для пользователя {message.from_user.id} в чате {chat_id}: {e}", exc_info=True)
-
-        try:
-            await db.ensure_user_first_seen(chat_id, message.from_user.id)
-            await db.update_user_last_message_time(chat_id, message.from_user.id, current_time.isoformat())
             logger.info(f"✅ Обработано сообщение от {user_name} ({message.from_user.id}) в чате \"{chat_name}\"")
         except Exception as e:
-            logger.error(f"Ошибка при обновлении метаданных пользователя {message.from_user.id} в чате {chat_id}: {e}", exc_info=True)
+            logger.error(f"Ошибка при учете сообщения от пользователя {message.from_user.id} в чате {chat_id}: {e}", exc_info=True)
     else:
         logger.debug(f"message_handler: чат {message.chat.id} не является group/supergroup (тип: {message.chat.type}), пропускаем")
 
@@ -1232,6 +1235,8 @@ async def new_chat_member(message: Message):
             break
     
     if not bot_member and message.chat.type in ['group', 'supergroup']:
+        chat_refresh.note_activity(message.chat.id, MEMBERSHIP_WEIGHT * len(message.new_chat_members))
+        join_rate.add(message.chat.id, KIND_JOIN, len(message.new_chat_members))
         for member in message.new_chat_members:
             await raid_protection_db.add_recent_join(
                 chat_id=message.chat.id,
@@ -1247,10 +1252,21 @@ async def new_chat_member(message: Message):
             except Exception as e:
                 logger.debug(f"Не удалось восстановить мут для пользователя {member.id} в чате {message.chat.id}: {e}")
         
-        settings = await raid_protection_db.get_settings(message.chat.id)
+        settings = (await chat_settings_cache.get(message.chat.id)).raid
         is_mass_join, recent_joins = await raid_protection.check_mass_join(message.chat.id, settings)
         
-        if is_mass_join:
+        if raid_lockdown.is_active(message.chat.id) or (is_mass_join and settings.get('lockdown_enabled')):
+            # Локдаун: участники рейда обрабатываются сразу, владелец получит один отчет при снятии
+            set_api_lane(LANE_MODERATION)
+            if not is_mass_join:
+                # Во время локдауна обрабатываются только новые участники
+                recent_joins = [
+                    {'user_id': member.id, 'username': member.username, 'first_name': member.first_name}
+                    for member in message.new_chat_members
+                ]
+            await raid_lockdown.on_joins(message.chat.id, settings, recent_joins, raid=is_mass_join)
+        elif is_mass_join:
+            set_api_lane(LANE_MODERATION)
             chat_title = message.chat.title or "Без названия"
             await raid_protection.notify_owner(
                 chat_id=message.chat.id,
@@ -1375,7 +1391,12 @@ async def left_chat_member(message: Message):
     if message.left_chat_member.id == bot.id:
         chat_id = message.chat.id
         await db.deactivate_chat(chat_id)
+        chat_refresh.forget(chat_id)
+        await raid_lockdown.forget(chat_id)
+        join_rate.discard_chat(chat_id)
         logger.info(f"Бот покинул чат {chat_id}, данные заморожены")
+    else:
+        chat_refresh.note_activity(message.chat.id, MEMBERSHIP_WEIGHT)
 
 
 async def handle_chat_join_request(event: ChatJoinRequest):
@@ -1384,6 +1405,10 @@ async def handle_chat_join_request(event: ChatJoinRequest):
         chat_id = event.chat.id
         user_id = event.from_user.id
         
+        if raid_lockdown.hold_join_request(chat_id):
+            logger.info(f"Заявка {user_id} в чат {chat_id} оставлена на ручное рассмотрение (локдаун)")
+            return
+        
         try:
             enabled = await db.get_auto_accept_join_requests(chat_id)
             if not enabled:
@@ -1439,12 +1464,12 @@ async def reaction_spam_handler(reaction_update: types.MessageReactionUpdated):
         
         user_id = reaction_update.user.id
         
-        utilities_settings = await utilities_db.get_settings(chat_id)
+        utilities_settings = (await chat_settings_cache.get(chat_id)).utilities
         if not utilities_settings.get('reaction_spam_enabled', False):
             return
         
         try:
-            member = await bot.get_chat_member(chat_id, user_id)
+            member = await member_cache.get(bot, chat_id, user_id)
             if member.status in ['administrator', 'creator']:
                 return
         except Exception:
@@ -1463,7 +1488,7 @@ async def reaction_spam_handler(reaction_update: types.MessageReactionUpdated):
         
         if len(recent_reactions) >= limit:
             try:
-                member = await bot.get_chat_member(chat_id, user_id)
+                member = await member_cache.get(bot, chat_id, user_id)
                 if member.status in ['kicked', 'left']:
                     logger.debug(f"Пользователь {user_id} уже не в чате {chat_id}, пропускаем наказание")
                     return
@@ -1501,7 +1526,7 @@ async def reaction_spam_handler(reaction_update: types.MessageReactionUpdated):
                 await utilities_db.add_reaction_punishment(chat_id, user_id, punishment)
                 
                 try:
-                    member_check = await bot.get_chat_member(chat_id, user_id)
+                    member_check = await member_cache.get(bot, chat_id, user_id)
                     if member_check.status in ['kicked', 'left']:
                         logger.debug(f"Пользователь {user_id} уже исключен другим обработчиком, пропускаем отправку сообщения")
                         return
@@ -1626,6 +1651,10 @@ async def handle_my_chat_member(update: ChatMemberUpdated):
     try:
         if update.new_chat_member and update.new_chat_member.user and update.new_chat_member.user.id == (await bot.get_me()).id:
             chat_id = update.chat.id
+            # Статус бота изменился - ранги и права чата перечитаем заново
+            rank_cache.invalidate_chat(chat_id)
+            member_cache.update(chat_id, update.new_chat_member)
+            chat_refresh.mark_dirty(chat_id)
             if await db.is_chat_blacklisted(chat_id):
                 try:
                     await bot.leave_chat(chat_id)
@@ -1642,6 +1671,9 @@ async def handle_my_chat_member(update: ChatMemberUpdated):
             
             if new_status in ['kicked', 'left']:
                 await db.deactivate_chat(chat_id)
+                chat_refresh.forget(chat_id)
+                await raid_lockdown.forget(chat_id)
+                join_rate.discard_chat(chat_id)
                 logger.info(f"Бот был удален из чата {chat_id} (статус: {new_status}), данные заморожены")
                 return
             
@@ -1695,3 +1727,22 @@ async def handle_my_chat_member(update: ChatMemberUpdated):
     except Exception as e:
         logger.error(f"Ошибка в handle_my_chat_member: {e}")
 
+
+async def handle_chat_member(update: ChatMemberUpdated):
+    """Обработчик изменения статуса участника чата (кэш статусов и рангов)"""
+    try:
+        chat_id = update.chat.id
+        if update.new_chat_member and update.new_chat_member.user:
+            member_cache.update(chat_id, update.new_chat_member)
+        
+        old_status = update.old_chat_member.status if update.old_chat_member else None
+        new_status = update.new_chat_member.status if update.new_chat_member else None
+
+        if 'creator' in (old_status, new_status):
+            # Смена владельца затрагивает ранги всех участников чата
+            rank_cache.invalidate_chat(chat_id)
+        elif update.new_chat_member and update.new_chat_member.user:
+            rank_cache.invalidate_user(chat_id, update.new_chat_member.user.id)
+    except Exception as e:
+        logger.error(f"Ошибка в handle_chat_member: {e}")
+
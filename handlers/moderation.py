@@ -17,6 +17,7 @@ from databases.database import db
 from databases.moderation_db import moderation_db
 from databases.reputation_db import reputation_db
 from databases.raid_protection_db import raid_protection_db
+from databases.settings_cache import chat_settings_cache
 from utils.permissions import get_effective_rank, check_permission
 from utils.formatting import (
     parse_mute_duration, get_user_mention_html, parse_command_with_reason,
@@ -1333,7 +1334,7 @@ async def warn_command(message: Message):
         await reputation_db.update_reputation(target_user.id, penalty)
         
         warn_count = await moderation_db.get_user_warn_count(chat_id, target_user.id)
-        warn_settings = await moderation_db.get_warn_settings(chat_id)
+        warn_settings = (await chat_settings_cache.get(chat_id)).warns
         warn_limit = warn_settings['warn_limit']
         
         username_display = get_user_mention_html(target_user)
@@ -1522,7 +1523,7 @@ async def unwarn_command(message: Message):
         
         new_warn_count = await moderation_db.get_user_warn_count(chat_id, target_user.id)
         
-        warn_settings = await moderation_db.get_warn_settings(chat_id)
+        warn_settings = (await chat_settings_cache.get(chat_id)).warns
         warn_limit = warn_settings['warn_limit']
         
         username_display = get_user_mention_html(target_user)
@@ -1587,7 +1588,7 @@ async def warns_command(message: Message):
         active_warns = await moderation_db.get_user_warns(chat_id, target_user.id, active_only=True)
         all_warns = await moderation_db.get_user_warns(chat_id, target_user.id, active_only=False)
         
-        warn_settings = await moderation_db.get_warn_settings(chat_id)
+        warn_settings = (await chat_settings_cache.get(chat_id)).warns
         warn_limit = warn_settings['warn_limit']
         
         username_display = get_user_mention_html(target_user)
@@ -898,6 +898,7 @@ async def sync_all_callback(callback: CallbackQuery):
                     mass_join_limit=raid_settings.get('mass_join_limit', 10),
                     mass_join_window=raid_settings.get('mass_join_window', 60),
                     similarity_threshold=raid_settings.get('similarity_threshold', 0.7),
+                    coordinated_text_limit=raid_settings.get('coordinated_text_limit', 0),
                     notification_mode=raid_settings.get('notification_mode', 1),
                     auto_mute_duration=raid_settings.get('auto_mute_duration', 0)
                 )
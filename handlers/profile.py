@@ -23,7 +23,7 @@ from utils.formatting import (
 )
 from utils.constants import RANK_NAMES
 from utils.cooldowns import check_timezone_cooldown, timezone_panel_owners, cleanup_old_timezone_panels
-from utils.image_generator import generate_modern_profile_card
+from utils.render_service import render_service, RenderError
 from handlers.common import require_admin_rights, parse_user_from_args, safe_answer_callback
 
 logger = logging.getLogger(__name__)
@@ -317,8 +317,6 @@ async def myprofile_command(message: Message):
     rank_emoji = rank_emojis.get(user_rank, "👤")
 
     try:
-        chart_buf = generate_modern_profile_card({}, monthly_stats, None)
-        
         user_name = get_user_mention_html(target_user)
         
         caption_lines = []
@@ -361,8 +359,15 @@ async def myprofile_command(message: Message):
 
         caption = "\n".join(caption_lines)
 
+        try:
+            chart_bytes = await render_service.profile_card(monthly_stats)
+        except RenderError as e:
+            logger.warning(f"График профиля не построен, отвечаем текстом: {e}")
+            await message.answer(caption, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+            return
+
         await message.answer_photo(
-            types.input_file.BufferedInputFile(chart_buf.read(), filename="profile.png"),
+            types.input_file.BufferedInputFile(chart_bytes, filename=render_service.filename("profile")),
             caption=caption, 
             parse_mode=ParseMode.HTML, 
             disable_web_page_preview=True
@@ -13,6 +13,8 @@ from aiogram.enums import ParseMode
 from databases.raid_protection_db import raid_protection_db
 from utils.permissions import get_effective_rank
 from utils.constants import RANK_OWNER, RANK_ADMIN
+from utils.raid_lockdown import raid_lockdown, ACTION_RESTRICT, ACTION_KICK
+from utils.join_rate import join_rate, KIND_JOIN, KIND_MESSAGE
 from handlers.common import require_admin_rights, safe_answer_callback
 
 logger = logging.getLogger(__name__)
@@ -20,6 +22,11 @@ logger = logging.getLogger(__name__)
 bot: Optional[Bot] = None
 dp: Optional[Dispatcher] = None
 
+LOCKDOWN_ACTION_NAMES = {ACTION_RESTRICT: 'ограничить', ACTION_KICK: 'исключить'}
+
+# Значения порога похожего текста с разных аккаунтов по кругу (0 - выключено)
+COORDINATED_TEXT_LIMITS = (0, 5, 8, 12)
+
 
 def register_raid_protection_handlers(dispatcher: Dispatcher, bot_instance: Bot):
     """Регистрация обработчиков Анти-Спама"""
@@ -38,6 +45,12 @@ def register_raid_protection_handlers(dispatcher: Dispatcher, bot_instance: Bot)
     dp.callback_query.register(raid_mute_settings_callback, F.data == "raid_mute_settings")
     dp.callback_query.register(raid_auto_mute_toggle_callback, F.data == "raid_auto_mute_toggle")
     dp.callback_query.register(raid_mute_silent_callback, F.data == "raid_mute_silent")
+    dp.callback_query.register(raid_coordinated_callback, F.data == "raid_coordinated")
+    dp.callback_query.register(raid_lockdown_toggle_callback, F.data == "raid_lockdown_toggle")
+    dp.callback_query.register(raid_lockdown_action_callback, F.data == "raid_lockdown_action")
+    dp.callback_query.register(raid_lockdown_settings_callback, F.data == "raid_lockdown_settings")
+    dp.callback_query.register(raid_lockdown_duration_callback, F.data.startswith("raid_lockdown_dur_"))
+    dp.callback_query.register(raid_lockdown_lift_callback, F.data == "raid_lockdown_lift")
     # Регистрируем raid_mute_callback последним, чтобы он не перехватывал другие callback'ы
     # Используем startswith, но проверяем в обработчике, что это не специальные callback'ы
     dp.callback_query.register(raid_mute_callback, F.data.startswith("raid_mute_"))
@@ -168,10 +181,33 @@ async def build_raid_settings_panel(chat_id: int):
         callback_data="raid_mute_silent"
     )
     
+    # Похожий текст с разных аккаунтов
+    coordinated_limit = settings.get('coordinated_text_limit', 0)
+    builder.button(
+        text=f"👥 Один текст с разных аккаунтов: {f'от {coordinated_limit}' if coordinated_limit else 'Выкл.'}",
+        callback_data="raid_coordinated"
+    )
+    
+    # Локдаун при массовом входе
+    lockdown_enabled = settings.get('lockdown_enabled', False)
+    lockdown_action = settings.get('lockdown_action', ACTION_RESTRICT)
+    builder.button(
+        text=f"{'✅' if lockdown_enabled else '❌'} Локдаун: {'Вкл.' if lockdown_enabled else 'Выкл.'}",
+        callback_data="raid_lockdown_toggle"
+    )
+    builder.button(
+        text=f"При локдауне: {LOCKDOWN_ACTION_NAMES.get(lockdown_action, 'ограничить')}",
+        callback_data="raid_lockdown_action"
+    )
+    builder.button(text="⏳ Длительность локдауна", callback_data="raid_lockdown_settings")
+    lockdown_active = raid_lockdown.is_active(chat_id)
+    if lockdown_active:
+        builder.button(text="🔓 Снять локдаун сейчас", callback_data="raid_lockdown_lift")
+    
     # Назад
     builder.button(text="🔙 Назад", callback_data="settings_main")
     
-    builder.adjust(1, 2, 3, 1, 1, 1, 1)
+    builder.adjust(1, 2, 3, 1, 1, 1, 1, 2, 1, *((1,) if lockdown_active else ()), 1)
     
     status_text = "✅ Включена" if enabled else "❌ Выключена"
     notif_modes = {0: "Отключены", 1: "Только мощные атаки (≥3)"}
@@ -186,6 +222,43 @@ async def build_raid_settings_panel(chat_id: int):
     auto_mute_text = "✅ Включен" if auto_mute_enabled else "❌ Выключен"
     mute_silent_text = "✅ Включен" if mute_silent else "❌ Выключен"
     
+    lockdown_duration = settings.get('lockdown_duration', 600)
+    if lockdown_active:
+        lockdown_text = "🔒 идет сейчас"
+    elif lockdown_enabled:
+        lockdown_text = (
+            f"✅ {LOCKDOWN_ACTION_NAMES.get(lockdown_action, 'ограничить')}, "
+            f"снятие через {lockdown_duration // 60} мин без рейда"
+        )
+    else:
+        lockdown_text = "❌ Выключен"
+    
+    # Обученный базовый уровень входов и сообщений (utils/join_rate.py)
+    mass_join_window = settings.get('mass_join_window', 60)
+    mass_join_limit = settings.get('mass_join_limit', 10)
+    joins_model = join_rate.describe(chat_id, KIND_JOIN, mass_join_window, mass_join_limit)
+    messages_model = join_rate.describe(chat_id, KIND_MESSAGE, mass_join_window)
+    if joins_model and joins_model['learned']:
+        mass_join_text = f"по уровню чата, сейчас порог {joins_model['threshold']} за {mass_join_window}с"
+    else:
+        mass_join_text = f"{mass_join_limit} за {mass_join_window}с"
+    baseline_lines = []
+    for label, model in (("Входы", joins_model), ("Сообщения", messages_model)):
+        if model is None:
+            baseline_lines.append(f"• {label}: нет данных")
+        elif model['learned']:
+            baseline_lines.append(f"• {label}: {model['per_minute']}/мин (±{model['sigma_per_minute']})")
+        else:
+            baseline_lines.append(
+                f"• {label}: обучение {model['learned_minutes']} из {model['warmup_minutes']} мин"
+            )
+    baseline_text = "\n".join(baseline_lines)
+    
+    if coordinated_limit:
+        coordinated_text = f"{coordinated_limit} аккаунтов за {settings.get('duplicate_text_window', 30)}с"
+    else:
+        coordinated_text = "выкл."
+    
     # Название текущего пресета для отображения
     preset_names = {'soft': 'Мягкий', 'medium': 'Средний', 'hard': 'Жесткий'}
     preset_display = preset_names.get(current_preset, 'Пользовательский') if enabled else '—'
@@ -197,11 +270,16 @@ async def build_raid_settings_panel(chat_id: int):
         f"<b>Уведомления:</b> {notif_text}\n"
         f"<b>Время мута:</b> {mute_text}\n"
         f"<b>Авто-мут:</b> {auto_mute_text}\n"
-        f"<b>Мут без уведомлений:</b> {mute_silent_text}\n\n"
+        f"<b>Мут без уведомлений:</b> {mute_silent_text}\n"
+        f"<b>Локдаун при массовом входе:</b> {lockdown_text}\n\n"
         f"<b>Текущие лимиты:</b>\n"
         f"• GIF-спам: {settings.get('gif_limit', 3)} за {settings.get('gif_time_window', 5)}с\n"
         f"• Стикеры: {settings.get('sticker_limit', 5)} за {settings.get('sticker_time_window', 10)}с\n"
-        f"• Дубликаты: {settings.get('duplicate_text_limit', 3)} за {settings.get('duplicate_text_window', 30)}с\n\n"
+        f"• Дубликаты: {settings.get('duplicate_text_limit', 3)} за {settings.get('duplicate_text_window', 30)}с\n"
+        f"• Один текст с разных аккаунтов: {coordinated_text}\n"
+        f"• Массовый вход: {mass_join_text}\n\n"
+        f"<b>Обычный уровень чата:</b>\n"
+        f"{baseline_text}\n\n"
         f"<b>Выберите режим защиты:</b>"
     )
     
@@ -428,3 +506,142 @@ async def raid_mute_silent_callback(callback: CallbackQuery):
     text, markup = await build_raid_settings_panel(chat_id)
     await callback.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=markup)
     await callback.answer(f"Мут без уведомлений {'включен' if new_status else 'выключен'}")
+
+
+async def raid_coordinated_callback(callback: CallbackQuery):
+    """Переключить порог похожего текста с разных аккаунтов"""
+    chat_id = callback.message.chat.id
+    user_id = callback.from_user.id
+    
+    effective_rank = await get_effective_rank(chat_id, user_id)
+    if effective_rank not in (RANK_OWNER, RANK_ADMIN):
+        await callback.answer("Недостаточно прав", show_alert=True)
+        return
+    
+    settings = await raid_protection_db.get_settings(chat_id)
+    current = settings.get('coordinated_text_limit', 0)
+    # Следующее значение по кругу (нестандартное значение сбрасывается в начало)
+    index = COORDINATED_TEXT_LIMITS.index(current) if current in COORDINATED_TEXT_LIMITS else -1
+    new_limit = COORDINATED_TEXT_LIMITS[(index + 1) % len(COORDINATED_TEXT_LIMITS)]
+    
+    await raid_protection_db.update_settings(chat_id, coordinated_text_limit=new_limit)
+    
+    text, markup = await build_raid_settings_panel(chat_id)
+    await callback.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=markup)
+    await callback.answer(f"Один текст с разных аккаунтов: {f'от {new_limit}' if new_limit else 'выключено'}")
+
+
+async def raid_lockdown_toggle_callback(callback: CallbackQuery):
+    """Переключить локдаун при массовом входе"""
+    chat_id = callback.message.chat.id
+    user_id = callback.from_user.id
+    
+    effective_rank = await get_effective_rank(chat_id, user_id)
+    if effective_rank not in (RANK_OWNER, RANK_ADMIN):
+        await callback.answer("Недостаточно прав", show_alert=True)
+        return
+    
+    settings = await raid_protection_db.get_settings(chat_id)
+    new_status = not settings.get('lockdown_enabled', False)
+    
+    await raid_protection_db.update_settings(chat_id, lockdown_enabled=new_status)
+    
+    text, markup = await build_raid_settings_panel(chat_id)
+    await callback.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=markup)
+    await callback.answer(f"Локдаун {'включен' if new_status else 'выключен'}")
+
+
+async def raid_lockdown_action_callback(callback: CallbackQuery):
+    """Переключить действие с участниками рейда: ограничить или исключить"""
+    chat_id = callback.message.chat.id
+    user_id = callback.from_user.id
+    
+    effective_rank = await get_effective_rank(chat_id, user_id)
+    if effective_rank not in (RANK_OWNER, RANK_ADMIN):
+        await callback.answer("Недостаточно прав", show_alert=True)
+        return
+    
+    settings = await raid_protection_db.get_settings(chat_id)
+    current = settings.get('lockdown_action', ACTION_RESTRICT)
+    new_action = ACTION_KICK if current == ACTION_RESTRICT else ACTION_RESTRICT
+    
+    await raid_protection_db.update_settings(chat_id, lockdown_action=new_action)
+    
+    text, markup = await build_raid_settings_panel(chat_id)
+    await callback.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=markup)
+    await callback.answer(f"При локдауне: {LOCKDOWN_ACTION_NAMES[new_action]}")
+
+
+async def raid_lockdown_settings_callback(callback: CallbackQuery):
+    """Открыть настройки длительности локдауна"""
+    chat_id = callback.message.chat.id
+    user_id = callback.from_user.id
+    
+    effective_rank = await get_effective_rank(chat_id, user_id)
+    if effective_rank not in (RANK_OWNER, RANK_ADMIN):
+        await callback.answer("Недостаточно прав", show_alert=True)
+        return
+    
+    settings = await raid_protection_db.get_settings(chat_id)
+    current_duration = settings.get('lockdown_duration', 600)
+    
+    builder = InlineKeyboardBuilder()
+    
+    durations = [(300, "5 мин"), (600, "10 мин"), (1800, "30 мин"), (3600, "1 час")]
+    
+    for duration, label in durations:
+        selected = "✅ " if duration == current_duration else ""
+        builder.button(text=f"{selected}{label}", callback_data=f"raid_lockdown_dur_{duration}")
+    
+    builder.button(text="🔙 Назад", callback_data="settings_open_raid")
+    builder.adjust(4, 1)
+    
+    text = (
+        "⏳ <b>Длительность локдауна</b>\n\n"
+        f"Текущее время: <b>{current_duration // 60} мин</b>\n\n"
+        "Локдаун снимается, если за это время не было нового массового входа. "
+        "Права чата восстанавливаются, владелец получает сводный отчет."
+    )
+    
+    await callback.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=builder.as_markup())
+    await callback.answer()
+
+
+async def raid_lockdown_duration_callback(callback: CallbackQuery):
+    """Установить длительность локдауна"""
+    chat_id = callback.message.chat.id
+    user_id = callback.from_user.id
+    
+    effective_rank = await get_effective_rank(chat_id, user_id)
+    if effective_rank not in (RANK_OWNER, RANK_ADMIN):
+        await callback.answer("Недостаточно прав", show_alert=True)
+        return
+    
+    try:
+        duration = int(callback.data.split("_")[3])
+    except (ValueError, IndexError):
+        logger.warning(f"Неверный формат callback_data для raid_lockdown_duration_callback: {callback.data}")
+        return
+    
+    await raid_protection_db.update_settings(chat_id, lockdown_duration=duration)
+    
+    text, markup = await build_raid_settings_panel(chat_id)
+    await callback.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=markup)
+    await callback.answer(f"Длительность локдауна: {duration // 60} мин")
+
+
+async def raid_lockdown_lift_callback(callback: CallbackQuery):
+    """Снять локдаун вручную"""
+    chat_id = callback.message.chat.id
+    user_id = callback.from_user.id
+    
+    effective_rank = await get_effective_rank(chat_id, user_id)
+    if effective_rank not in (RANK_OWNER, RANK_ADMIN):
+        await callback.answer("Недостаточно прав", show_alert=True)
+        return
+    
+    lifted = await raid_lockdown.lift(chat_id, reason=f"снят вручную ({user_id})")
+    
+    text, markup = await build_raid_settings_panel(chat_id)
+    await callback.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=markup)
+    await callback.answer("Локдаун снят" if lifted else "Локдаун уже не активен")
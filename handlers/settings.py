@@ -2596,6 +2596,7 @@ async def resetconfig_confirm_callback(callback: CallbackQuery):
             mass_join_limit=RAID_PROTECTION['mass_join_limit'],
             mass_join_window=RAID_PROTECTION['mass_join_window'],
             similarity_threshold=RAID_PROTECTION['similarity_threshold'],
+            coordinated_text_limit=RAID_PROTECTION.get('coordinated_text_limit', 0),
             notification_mode=1,
             auto_mute_duration=0
         )
@@ -19,7 +19,10 @@ from databases.timezone_db import TimezoneDatabase
 from config import TIMEZONE_DB_PATH, TOP_CHATS_DEFAULTS
 from utils.permissions import get_effective_rank
 from utils.formatting import get_user_mention_html
-from utils.image_generator import generate_top_chart
+from utils.image_generator import MAX_DISPLAY_USERS
+from utils.avatar_cache import avatar_cache
+from utils.chart_cache import chart_cache, ChartKey
+from utils.render_service import render_service, RenderError
 from handlers.common import require_admin_rights, safe_answer_callback
 
 logger = logging.getLogger(__name__)
@@ -47,6 +50,48 @@ def get_top_chat_settings(chat_id: int) -> dict:
         return TOP_CHATS_DEFAULTS.copy()
 
 
+async def render_top_users_chart(top_users: List[Dict[str, Any]], title: str, subtitle: str) -> bytes:
+    """
+    Изображение графика топа пользователей через пул рендеринга.
+    
+    Raises:
+        RenderError: график не построен (пул занят, timeout) - нужно ответить текстом
+    """
+    # Не запрашиваем аватарки, если график все равно не будет построен
+    render_service.check_capacity()
+    avatars = await avatar_cache.get_thumbnails(bot, [user['user_id'] for user in top_users[:MAX_DISPLAY_USERS]])
+    return await render_service.top_chart(top_users, title, subtitle, avatars)
+
+
+async def send_top_users_chart(message: Message, chart_key: ChartKey, top_users: List[Dict[str, Any]],
+                               title: str, subtitle: str, filename: str, **photo_params) -> Message:
+    """
+    Отправить график топа: по file_id из кэша, если содержимое не менялось,
+    иначе нарисовать, загрузить и запомнить file_id.
+    
+    Raises:
+        RenderError: график не построен - нужно ответить текстом
+    """
+    file_id = chart_cache.get(chart_key)
+    if file_id:
+        try:
+            return await message.answer_photo(photo=file_id, **photo_params)
+        except Exception as e:
+            if "TOPIC_CLOSED" in str(e):
+                raise
+            logger.warning(f"График по file_id не отправлен, рисуем заново: {e}")
+            chart_cache.reject(chart_key)
+    
+    chart_bytes = await render_top_users_chart(top_users, title, subtitle)
+    sent = await message.answer_photo(
+        photo=types.input_file.BufferedInputFile(chart_bytes, filename=render_service.filename(filename)),
+        **photo_params
+    )
+    if sent.photo:
+        chart_cache.put(chart_key, sent.photo[-1].file_id)
+    return sent
+
+
 async def get_top_chat_settings_async(chat_id: int) -> dict:
     """Получить настройки показа в топе для чата (асинхронная версия)"""
     try:
@@ -100,32 +145,14 @@ def register_top_chats_handlers(dispatcher: Dispatcher, bot_instance: Bot):
 
 async def get_top_chats_with_settings(days: int = 3, limit: int = 30) -> List[Dict[str, Any]]:
     """Получает топ чатов с учетом настроек показа в топе"""
-    all_chats = await db.get_top_chats_by_activity(
+    return await db.get_top_chats_by_activity(
         days=days, 
-        limit=limit * 3,
+        limit=limit,
         exclude_chat_ids=None,
         include_private=True,
-        min_activity_threshold=0  # Не используется, но оставляем для совместимости с БД
+        min_activity_threshold=0,  # Не используется, но оставляем для совместимости с БД
+        respect_top_settings=True
     )
-    
-    filtered_chats = []
-    
-    for chat in all_chats:
-        settings = await get_top_chat_settings_async(chat['chat_id'])
-        show_in_top = settings.get('show_in_top', 'public_only')
-        
-        if show_in_top == 'never':
-            continue
-        
-        if show_in_top == 'public_only' and not chat.get('is_public', False):
-            continue
-        
-        filtered_chats.append(chat)
-        
-        if len(filtered_chats) >= limit:
-            break
-    
-    return filtered_chats
 
 
 @require_admin_rights
@@ -192,14 +219,11 @@ async def top_users_command(message: Message):
     try:
         title = f"Топ активных участников - {today}"
         subtitle = f"За сутки{timezone_info}" if timezone_info else "За сутки"
-        chart_buf = await generate_top_chart(top_users, title=title, subtitle=subtitle, bot_instance=bot)
-        
-        chart_bytes = chart_buf.read()
-        chart_buf.seek(0)
+        chart_key = chart_cache.make_key(chat.id, f"day:{today_for_query}", top_users[:MAX_DISPLAY_USERS],
+                                         title, subtitle, user_timezone)
         
         try:
             photo_params = {
-                'photo': types.input_file.BufferedInputFile(chart_bytes, filename="top_users.png"),
                 'caption': top_text,
                 'parse_mode': ParseMode.HTML,
                 'disable_web_page_preview': True
@@ -207,7 +231,7 @@ async def top_users_command(message: Message):
             if message.chat.type == 'supergroup' and message.message_thread_id:
                 photo_params['message_thread_id'] = message.message_thread_id
             
-            await message.answer_photo(**photo_params)
+            await send_top_users_chart(message, chart_key, top_users, title, subtitle, "top_users", **photo_params)
         except Exception as photo_error:
             if "TOPIC_CLOSED" in str(photo_error):
                 logger.warning(f"Топик закрыт, отправляем только текст: {photo_error}")
@@ -218,7 +242,10 @@ async def top_users_command(message: Message):
             else:
                 raise photo_error
     except Exception as e:
-        logger.error(f"Ошибка при генерации графика активности для /top: {e}")
+        if isinstance(e, RenderError):
+            logger.warning(f"График для /top не построен, отвечаем текстом: {e}")
+        else:
+            logger.error(f"Ошибка при генерации графика активности для /top: {e}")
         try:
             await message.answer(top_text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
         except Exception as text_error:
@@ -268,14 +295,10 @@ async def top_users_all_chats_command(message: Message):
         try:
             title = f"Топ активных участников за {days} дней"
             subtitle = f"За последние {days} дней — этот чат"
-            chart_buf = await generate_top_chart(top_users, title=title, subtitle=subtitle, bot_instance=bot)
+            chart_key = chart_cache.make_key(chat.id, f"days:{days}", top_users[:MAX_DISPLAY_USERS], title, subtitle)
             
             try:
-                chart_bytes = chart_buf.read()
-                chart_buf.seek(0)
-                
                 photo_params = {
-                    'photo': types.input_file.BufferedInputFile(chart_bytes, filename="topall_users.png"),
                     'caption': text_message,
                     'parse_mode': ParseMode.HTML,
                     'disable_web_page_preview': True
@@ -283,7 +306,8 @@ async def top_users_all_chats_command(message: Message):
                 if message.chat.type == 'supergroup' and message.message_thread_id:
                     photo_params['message_thread_id'] = message.message_thread_id
                 
-                await message.answer_photo(**photo_params)
+                await send_top_users_chart(message, chart_key, top_users, title, subtitle, "topall_users",
+                                           **photo_params)
             except Exception as photo_error:
                 if "TOPIC_CLOSED" in str(photo_error):
                     logger.warning(f"Топик закрыт, отправляем только текст")
@@ -302,7 +326,10 @@ async def top_users_all_chats_command(message: Message):
                 else:
                     raise photo_error
         except Exception as e:
-            logger.error(f"Ошибка при генерации графика топ участников для /topall: {e}")
+            if isinstance(e, RenderError):
+                logger.warning(f"График для /topall не построен, отвечаем текстом: {e}")
+            else:
+                logger.error(f"Ошибка при генерации графика топ участников для /topall: {e}")
             try:
                 text_params = {
                     'text': text_message,
@@ -10,8 +10,6 @@ from collections import defaultdict
 from aiogram.dispatcher.middlewares.base import BaseMiddleware
 from aiogram.types import Message, TelegramObject
 
-from databases.database import db
-from utils.command_aliases import get_command_alias, is_command_alias
 
 logger = logging.getLogger(__name__)
 
@@ -84,44 +82,6 @@ class AutoSpamDetectionMiddleware(BaseMiddleware):
         
         self._last_cleanup_time = current_time
     
-    async def _normalize_command(self, message: Message) -> tuple[str, str]:
-        """
-        Нормализует команду (извлекает и преобразует в английский эквивалент)
-        Возвращает (original_command, normalized_command)
-        """
-        text = message.text.strip() if message.text else ""
-        
-        # Проверяем, это английская команда (начинается с /)
-        if text.startswith('/'):
-            command_text = text.split()[0] if text.split() else text
-            normalized = command_text.lstrip('/').lower()
-            return command_text, normalized
-        
-        # Это может быть русский алиас
-        # Проверяем настройку префикса
-        requires_prefix = False
-        try:
-            requires_prefix = await db.get_russian_commands_prefix_setting(message.chat.id)
-        except Exception as e:
-            logger.debug(f"Ошибка при получении настройки префикса: {e}")
-        
-        if requires_prefix:
-            # Если префикс обязателен, проверяем наличие "пиксель"
-            if text.lower().startswith("пиксель"):
-                text = text[7:].strip()
-            else:
-                # Префикс обязателен, но отсутствует - не команда
-                return "", ""
-        
-        # Получаем английский эквивалент
-        normalized = get_command_alias(text)
-        if not normalized:
-            # Не удалось определить команду
-            return "", ""
-        
-        command_text = text.split()[0] if text.split() else text
-        return command_text, normalized
-    
     def _is_moderation_command(self, normalized_command: str) -> bool:
         """Проверяет, является ли команда командой модерации"""
         return normalized_command in MODERATION_COMMANDS
@@ -198,34 +158,11 @@ class AutoSpamDetectionMiddleware(BaseMiddleware):
         # Выполняем периодическую очистку
         self._cleanup_old_entries()
         
-        # Проверяем, что это команда (начинается с /) или русский алиас
-        is_english_command = message.text and message.text.strip().startswith('/')
-        is_russian_alias = False
-        
-        if message.text and not is_english_command:
-            # Проверяем, является ли это русским алиасом
-            text = message.text.strip()
-            requires_prefix = await db.get_russian_commands_prefix_setting(message.chat.id)
-            
-            if requires_prefix:
-                # Если префикс обязателен, проверяем наличие "пиксель"
-                if text.lower().startswith("пиксель"):
-                    text_without_prefix = text[7:].strip()
-                    is_russian_alias = is_command_alias(text_without_prefix)
-            else:
-                # Если префикс не обязателен, проверяем с префиксом и без
-                is_russian_alias = is_command_alias(text)
-        
-        # Если это не команда, пропускаем
-        if not is_english_command and not is_russian_alias:
-            return await handler(event, data)
-        
-        # Нормализуем команду
-        original_command, normalized_command = await self._normalize_command(message)
-        
-        # Если не удалось определить команду, пропускаем
-        if not normalized_command:
+        # Команда или русский алиас уже разобраны в UpdateContextMiddleware
+        command = data['update_context'].command
+        if command is None:
             return await handler(event, data)
+        normalized_command = command.name
         
         # Команды модерации всегда разрешены
         if self._is_moderation_command(normalized_command):
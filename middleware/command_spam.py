@@ -9,10 +9,8 @@ from aiogram.dispatcher.middlewares.base import BaseMiddleware
 from aiogram.types import Message, TelegramObject
 
 from databases.utilities_db import utilities_db
-from databases.database import db
-from utils.permissions import get_effective_rank
+from middleware.update_context import UpdateContext
 from utils.constants import RANK_OWNER, RANK_ADMIN, RANK_SENIOR_MOD, RANK_JUNIOR_MOD
-from utils.command_aliases import get_command_alias, is_command_alias
 
 logger = logging.getLogger(__name__)
 
@@ -93,28 +91,14 @@ class CommandSpamMiddleware(BaseMiddleware):
         if message.chat.type not in ['group', 'supergroup']:
             return await handler(event, data)
         
-        # Проверяем, что это команда (начинается с /) или русский алиас
-        is_english_command = message.text and message.text.strip().startswith('/')
+        # Команда, алиас и настройки чата уже загружены в UpdateContextMiddleware
+        context: UpdateContext = data['update_context']
+        command = context.command
+        utilities_settings = context.settings.utilities
         
-        # Для русских алиасов проверяем также настройку префикса
-        is_russian_alias = False
-        if message.text and not is_english_command:
-            text = message.text.strip()
-            requires_prefix = await db.get_russian_commands_prefix_setting(message.chat.id)
-            
-            if requires_prefix:
-                # Если префикс обязателен, проверяем наличие "пиксель"
-                if text.lower().startswith("пиксель"):
-                    text_without_prefix = text[7:].strip()
-                    is_russian_alias = is_command_alias(text_without_prefix)
-            else:
-                # Если префикс не обязателен, проверяем с префиксом и без
-                is_russian_alias = is_command_alias(text)
-        
-        if not is_english_command and not is_russian_alias:
+        if command is None:
             # Но если в сообщении есть команды через entities - обнаруживаем их
             if message.text and message.entities:
-                utilities_settings = await utilities_db.get_settings(message.chat.id)
                 if utilities_settings.get('fake_commands_enabled', False):
                     # Ищем команды через entities (type == "bot_command")
                     for entity in message.entities:
@@ -128,25 +112,8 @@ class CommandSpamMiddleware(BaseMiddleware):
             logger.debug(f"CommandSpamMiddleware: не команда, пропускаем")
             return await handler(event, data)
         
-        logger.debug(f"CommandSpamMiddleware: обрабатываем команду")
-        
-        # Извлекаем команду из текста и нормализуем её
-        if is_english_command:
-            # Английская команда: извлекаем первое слово (например, "/top" -> "/top")
-            command_text = message.text.split()[0] if message.text.split() else message.text.strip()
-            # Нормализуем: убираем / и приводим к нижнему регистру для кулдауна
-            normalized_command = command_text.lstrip('/').lower()
-        else:
-            # Русский алиас: получаем английский эквивалент
-            text = message.text.strip()
-            # Учитываем префикс "пиксель" если он есть
-            if text.lower().startswith("пиксель"):
-                text = text[7:].strip()
-            normalized_command = get_command_alias(text)
-            if not normalized_command:
-                # Если не удалось определить команду, используем оригинальный текст
-                normalized_command = text.split()[0].lower() if text.split() else text.lower()
-            command_text = message.text.split()[0] if message.text.split() else message.text.strip()
+        command_text = command.text
+        normalized_command = command.name
         
         logger.debug(f"CommandSpamMiddleware: обрабатываем команду {command_text} (нормализовано: {normalized_command}) в чате {message.chat.id}")
         
@@ -156,7 +123,7 @@ class CommandSpamMiddleware(BaseMiddleware):
         # Проверяем ранг пользователя - модераторы и админы (ранги 1-4) освобождаются от кулдауна
         user_id = message.from_user.id
         chat_id = message.chat.id
-        user_rank = await get_effective_rank(chat_id, user_id)
+        user_rank = await context.get_rank()
         
         # Если пользователь модератор или админ (ранг <= 4), пропускаем проверку кулдауна
         if user_rank <= RANK_JUNIOR_MOD:
@@ -184,8 +151,6 @@ class CommandSpamMiddleware(BaseMiddleware):
                 return
         
         # Старая система отслеживания команд (только если fake_commands_enabled включен)
-        utilities_settings = await utilities_db.get_settings(message.chat.id)
-        
         if utilities_settings.get('fake_commands_enabled', False):
             # СНАЧАЛА проверяем tracking команды (до записи/обновления)
             tracking = await utilities_db.get_command_tracking(message.chat.id, command_text)
@@ -6,9 +6,7 @@ from aiogram.dispatcher.middlewares.base import BaseMiddleware
 from aiogram.types import CallbackQuery
 
 from utils.constants import SETTINGS_CALLBACK_PREFIXES, RANK_OWNER, RANK_ADMIN
-from utils.permissions import get_effective_rank
 from utils.formatting import get_philosophical_access_denied_message
-from databases.database import db
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +22,7 @@ class SettingsGuardMiddleware(BaseMiddleware):
                 chat_id = event.message.chat.id
                 if event.message.chat.type in ['group', 'supergroup']:
                     try:
-                        chat_info = await db.get_chat(chat_id)
+                        chat_info = data['update_context'].settings.chat
                         if chat_info and (not chat_info.get('is_active', True) or chat_info.get('frozen_at')):
                             logger.debug(f"Попытка использовать callback в неактивном/замороженном чате {chat_id}")
                             try:
@@ -47,7 +45,7 @@ class SettingsGuardMiddleware(BaseMiddleware):
             if not chat_id or not user_id:
                 return await handler(event, data)
 
-            rank = await get_effective_rank(chat_id, user_id)
+            rank = await data['update_context'].get_rank()
             if rank not in (RANK_OWNER, RANK_ADMIN):
                 quote = await get_philosophical_access_denied_message()
                 await event.answer(quote, show_alert=True)
@@ -0,0 +1,156 @@
+"""
+Контекст обновления: состояние чата и пользователя, загружаемое один раз
+
+Внешние middleware и обработчики одного сообщения повторяли одни и те же
+действия: чтение настройки префикса, разбор команды/алиаса, ранг
+пользователя, активные муты. UpdateContextMiddleware регистрируется первым
+и кладет в data['update_context'] объект UpdateContext:
+- settings - снимок настроек чата (databases.settings_cache);
+- command - разобранная команда или русский алиас (None, если не команда);
+- get_rank() - эффективный ранг пользователя (загружается при первом вызове);
+- get_active_mutes() / is_muted_in_db() - активные муты пользователя в чате
+  (загружаются при первом вызове).
+
+Следующие middleware и обработчики получают контекст аргументом
+update_context и не повторяют запросы.
+"""
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from databases.moderation_db import moderation_db
+from databases.settings_cache import ChatSettings, chat_settings_cache
+from utils.command_aliases import get_command_alias
+from utils.permissions import get_effective_rank
+
+logger = logging.getLogger(__name__)
+
+# Префикс русских команд ("пиксель топ")
+RUSSIAN_PREFIX = "пиксель"
+
+
+class ParsedCommand(NamedTuple):
+    """Команда сообщения"""
+    # Первое слово сообщения как написано ("/top@bot", "топ", "пиксель")
+    text: str
+    # Английская команда: для "/Top" - "top", для алиаса - результат get_command_alias
+    name: str
+    is_alias: bool
+    # Текст алиаса без префикса "пиксель" (для английской команды - весь текст)
+    body: str
+
+
+def parse_command(text: Optional[str], requires_prefix: bool) -> Optional[ParsedCommand]:
+    """Разобрать команду или русский алиас (None, если сообщение не команда)"""
+    if not text:
+        return None
+    text = text.strip()
+    words = text.split()
+    if not words:
+        return None
+    first_word = words[0]
+
+    if text.startswith('/'):
+        return ParsedCommand(first_word, first_word.lstrip('/').lower(), False, text)
+
+    body = text
+    if text.lower().startswith(RUSSIAN_PREFIX):
+        body = text[len(RUSSIAN_PREFIX):].strip()
+    elif requires_prefix:
+        # Префикс обязателен, но отсутствует - не команда
+        return None
+    name = get_command_alias(body)
+    if not name:
+        return None
+    return ParsedCommand(first_word, name, True, body)
+
+
+class UpdateContext:
+    """Состояние чата и пользователя для одного обновления"""
+
+    __slots__ = ('chat_id', 'user_id', 'is_group', 'settings', 'command', '_rank', '_mutes', '_stats')
+
+    def __init__(self, chat_id: int, user_id: Optional[int], is_group: bool,
+                 settings: Optional[ChatSettings], command: Optional[ParsedCommand], stats: Dict[str, int]):
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.is_group = is_group
+        self.settings = settings
+        self.command = command
+        self._rank: Optional[int] = None
+        self._mutes: Optional[List[Dict[str, Any]]] = None
+        self._stats = stats
+
+    async def get_rank(self) -> int:
+        """Эффективный ранг пользователя в чате"""
+        if self._rank is None:
+            self._rank = await get_effective_rank(self.chat_id, self.user_id)
+            self._stats['rank_loads'] += 1
+        else:
+            self._stats['rank_reuses'] += 1
+        return self._rank
+
+    async def get_active_mutes(self) -> List[Dict[str, Any]]:
+        """Активные муты пользователя в чате (из БД модерации)"""
+        if self._mutes is None:
+            punishments = await moderation_db.get_user_punishments(self.chat_id, self.user_id, active_only=True)
+            self._mutes = [punishment for punishment in punishments if punishment['punishment_type'] == 'mute']
+            self._stats['mute_loads'] += 1
+        else:
+            self._stats['mute_reuses'] += 1
+        return self._mutes
+
+    async def is_muted_in_db(self) -> bool:
+        """Есть ли у пользователя активный мут в БД"""
+        return bool(await self.get_active_mutes())
+
+    def forget_mutes(self):
+        """Сбросить загруженные муты (после выдачи или снятия мута в этом обновлении)"""
+        self._mutes = None
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """Внешний middleware: строит UpdateContext для сообщений и callback'ов из групп"""
+
+    def __init__(self):
+        self.stats = {'contexts': 0, 'rank_loads': 0, 'rank_reuses': 0, 'mute_loads': 0, 'mute_reuses': 0}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any]
+    ) -> Any:
+        if isinstance(event, Message):
+            message = event
+        elif isinstance(event, CallbackQuery) and event.message is not None:
+            # Для callback'а - сообщение с кнопкой (может быть недоступным, но чат известен)
+            message = event.message
+        else:
+            return await handler(event, data)
+
+        chat = message.chat
+        user = event.from_user
+        is_group = chat.type in ['group', 'supergroup']
+        settings = None
+        command = None
+        if is_group:
+            settings = await chat_settings_cache.get(chat.id)
+            if event is message:
+                command = parse_command(message.text, settings.russian_prefix)
+
+        data['update_context'] = UpdateContext(
+            chat.id, user.id if user else None, is_group, settings, command, self.stats
+        )
+        self.stats['contexts'] += 1
+        return await handler(event, data)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Метрики: сколько контекстов построено и сколько повторных загрузок сэкономлено"""
+        return dict(self.stats)
+
+
+# Глобальный middleware контекста (регистрируется в bot.py первым внешним)
+update_context_middleware = UpdateContextMiddleware()
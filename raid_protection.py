@@ -5,15 +5,39 @@
 import hashlib
 import re
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Tuple
-from difflib import SequenceMatcher
+from typing import Dict, Any, Mapping, Optional, List, Tuple
 from aiogram.types import Message
 from aiogram import Bot
+from databases.database import db
 from databases.raid_protection_db import raid_protection_db
+from databases.settings_cache import chat_settings_cache
+from utils.delete_queue import delete_queue
+from utils.join_rate import join_rate, KIND_JOIN
+from utils.raid_windows import raid_windows
+from utils.text_similarity import MIN_TEXT_LENGTH, text_similarity
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Минимальная длина текста (после нормализации) для поиска повторов между разными
+# пользователями: короткие фразы вроде «всем привет» легитимно совпадают
+COORDINATED_MIN_LENGTH = 24
+
+# Настройка окна обнаружения для каждого типа рейда (за это окно удаляются сообщения участника)
+DETECTION_WINDOWS = {
+    'gif_spam': ('gif_time_window', 5),
+    'sticker_spam': ('sticker_time_window', 10),
+    'duplicate_text': ('duplicate_text_window', 30),
+    'coordinated_text': ('duplicate_text_window', 30),
+}
+
+# Запас к окну обнаружения: время между проверкой сообщения и удалением (мут, запросы к API)
+PURGE_GRACE_SECONDS = 5
+
+# Нижняя граница coordinated_text_limit: два-три участника, ответивших одной
+# фразой на одно сообщение, - обычная переписка, а не рейд
+COORDINATED_MIN_USERS = 5
+
 
 class RaidProtection:
     """Класс для защиты от рейдов"""
@@ -24,11 +48,16 @@ class RaidProtection:
     def set_bot(self, bot: Bot):
         """Установить бота для отправки сообщений"""
         self.bot = bot
+        delete_queue.set_bot(bot)
     
-    async def check_message(self, message: Message) -> Tuple[bool, str, Optional[int]]:
+    async def check_message(self, message: Message,
+                            settings: Optional[Mapping[str, Any]] = None) -> Tuple[bool, str, Optional[int]]:
         """
         Проверить сообщение на признаки рейда
         
+        Args:
+            settings: настройки рейдов чата, если уже загружены (UpdateContext.settings.raid)
+        
         Returns:
             Tuple[bool, str, Optional[int]]: (is_raid, raid_type, message_id_to_delete)
             - is_raid: True если обнаружен рейд
@@ -36,10 +65,15 @@ class RaidProtection:
             - message_id_to_delete: ID сообщения для удаления
         """
         # Проверяем, включена ли защита для чата
-        settings = await raid_protection_db.get_settings(message.chat.id)
+        if settings is None:
+            settings = (await chat_settings_cache.get(message.chat.id)).raid
         if not settings.get('enabled', True):
             return False, None, None
         
+        # Запоминаем сообщение: при рейде можно удалить все недавние сообщения участника
+        if message.from_user:
+            raid_windows.remember_message(message.chat.id, message.from_user.id, message.message_id)
+        
         # Проверяем тип сообщения
         if message.animation:
             return await self._check_gif_spam(message, settings)
@@ -62,17 +96,14 @@ class RaidProtection:
         # Получаем хеш GIF-файла для отслеживания повторений
         gif_hash = await self._get_gif_hash(message)
         
-        # Добавляем запись о активности
-        await raid_protection_db.add_activity(chat_id, user_id, 'gif', gif_hash, message_id)
+        # Добавляем событие в окно и считаем недавнюю активность
+        recent_count, _ = raid_windows.add(chat_id, user_id, 'gif', gif_hash, time_window)
         
-        # Проверяем недавнюю активность
-        recent_activity = await raid_protection_db.get_recent_activity(chat_id, user_id, 'gif', time_window)
-        
-        if len(recent_activity) >= limit:
+        if recent_count >= limit:
             # Обнаружен рейд GIF-спама
             await raid_protection_db.log_raid_incident(
                 chat_id, user_id, 'gif_spam',
-                f"Отправлено {len(recent_activity)} GIF за {time_window} секунд",
+                f"Отправлено {recent_count} GIF за {time_window} секунд",
                 message_id, "delete_message"
             )
             return True, 'gif_spam', message_id
@@ -91,17 +122,14 @@ class RaidProtection:
         # Получаем ID стикера для отслеживания
         sticker_id = message.sticker.file_unique_id if message.sticker else None
         
-        # Добавляем запись о активности
-        await raid_protection_db.add_activity(chat_id, user_id, 'sticker', sticker_id, message_id)
-        
-        # Проверяем недавнюю активность
-        recent_activity = await raid_protection_db.get_recent_activity(chat_id, user_id, 'sticker', time_window)
+        # Добавляем событие в окно и считаем недавнюю активность
+        recent_count, _ = raid_windows.add(chat_id, user_id, 'sticker', sticker_id, time_window)
         
-        if len(recent_activity) >= limit:
+        if recent_count >= limit:
             # Обнаружен рейд стикер-спама
             await raid_protection_db.log_raid_incident(
                 chat_id, user_id, 'sticker_spam',
-                f"Отправлено {len(recent_activity)} стикеров за {time_window} секунд",
+                f"Отправлено {recent_count} стикеров за {time_window} секунд",
                 message_id, "delete_message"
             )
             return True, 'sticker_spam', message_id
@@ -117,38 +145,54 @@ class RaidProtection:
         limit = settings.get('duplicate_text_limit', 3)
         time_window = settings.get('duplicate_text_window', 30)
         similarity_threshold = settings.get('similarity_threshold', 0.7)
+        # Похожий текст с разных аккаунтов: отдельный порог, 0 - проверка выключена
+        coordinated_limit = settings.get('coordinated_text_limit', 0)
         
         # Нормализуем текст
         normalized_text = self._normalize_text(message.text)
-        text_hash = self._hash_text(normalized_text)
         
-        # Добавляем запись о активности
-        await raid_protection_db.add_activity(chat_id, user_id, 'text', text_hash, message_id)
-        
-        # Получаем недавние текстовые сообщения
-        recent_activity = await raid_protection_db.get_recent_activity(chat_id, user_id, 'text', time_window)
-        
-        if len(recent_activity) >= limit:
-            # Проверяем похожесть текстов
-            similar_count = 0
-            for activity in recent_activity:
-                if activity['content_hash'] == text_hash:
-                    similar_count += 1
+        if len(normalized_text) < MIN_TEXT_LENGTH:
+            # Короткие тексты: только точные повторы одного пользователя
+            text_hash = self._hash_text(normalized_text)
+            _, similar_count = raid_windows.add(chat_id, user_id, 'text', text_hash, time_window)
+        else:
+            # Похожие тексты всех пользователей чата за окно (LSH-индекс)
+            similar = text_similarity.check_and_add(
+                chat_id, user_id, normalized_text, time_window, similarity_threshold, message_id=message_id
+            )
+            similar_count = similar.same_user + 1
             
-            # Если есть похожие сообщения, это рейд
-            if similar_count >= limit:
-                await raid_protection_db.log_raid_incident(
-                    chat_id, user_id, 'duplicate_text',
-                    f"Обнаружено {similar_count} похожих сообщений за {time_window} секунд",
-                    message_id, "delete_message"
-                )
-                return True, 'duplicate_text', message_id
+            if coordinated_limit and similar_count < limit and len(normalized_text) >= COORDINATED_MIN_LENGTH:
+                # Одинаковый текст с разных аккаунтов - скоординированный рейд
+                users_count = similar.other_users + 1
+                if users_count >= max(coordinated_limit, COORDINATED_MIN_USERS):
+                    # Удаляем все найденные сообщения рейда, текущее удалит обработчик
+                    if self.bot and similar.message_ids:
+                        delete_queue.schedule(chat_id, similar.message_ids)
+                    await raid_protection_db.log_raid_incident(
+                        chat_id, user_id, 'coordinated_text',
+                        f"Похожие сообщения от {users_count} пользователей за {time_window} секунд "
+                        f"(удалено {len(similar.message_ids) + 1})",
+                        message_id, "delete_message"
+                    )
+                    return True, 'coordinated_text', message_id
+        
+        if similar_count >= limit:
+            await raid_protection_db.log_raid_incident(
+                chat_id, user_id, 'duplicate_text',
+                f"Обнаружено {similar_count} похожих сообщений за {time_window} секунд",
+                message_id, "delete_message"
+            )
+            return True, 'duplicate_text', message_id
         
         return False, None, None
     
     async def check_mass_join(self, chat_id: int, settings: Dict[str, Any]) -> Tuple[bool, List[Dict[str, Any]]]:
         """
-        Проверить на массовое присоединение участников
+        Проверить на массовое присоединение участников (входы учитываются в join_rate)
+        
+        Поток входов сравнивается с обученным базовым уровнем чата; недавние
+        присоединения читаются из БД только при срабатывании.
         
         Returns:
             Tuple[bool, List[Dict]]: (is_mass_join, recent_joins)
@@ -156,17 +200,22 @@ class RaidProtection:
         limit = settings.get('mass_join_limit', 10)
         time_window = settings.get('mass_join_window', 60)
         
-        recent_joins = await raid_protection_db.get_recent_joins(chat_id, time_window)
+        rate = join_rate.check(chat_id, KIND_JOIN, time_window, limit)
+        if not rate.is_anomaly:
+            return False, []
         
-        if len(recent_joins) >= limit:
-            await raid_protection_db.log_raid_incident(
-                chat_id, None, 'mass_join',
-                f"Присоединилось {len(recent_joins)} участников за {time_window} секунд",
-                None, "notify_owner"
+        recent_joins = await raid_protection_db.get_recent_joins(chat_id, rate.window)
+        if rate.learned:
+            details = (
+                f"Присоединилось {rate.count} участников за {rate.window} секунд "
+                f"(обычно {rate.expected:.1f}, порог {rate.threshold})"
             )
-            return True, recent_joins
-        
-        return False, recent_joins
+        else:
+            details = f"Присоединилось {rate.count} участников за {rate.window} секунд"
+        await raid_protection_db.log_raid_incident(
+            chat_id, None, 'mass_join', details, None, "notify_owner"
+        )
+        return True, recent_joins
     
     def _normalize_text(self, text: str) -> str:
         """Нормализовать текст для сравнения"""
@@ -193,16 +242,27 @@ class RaidProtection:
         return ""
     
     async def delete_message(self, chat_id: int, message_id: int) -> bool:
-        """Удалить сообщение"""
-        try:
-            if self.bot:
-                await self.bot.delete_message(chat_id=chat_id, message_id=message_id)
-                logger.info(f"Сообщение {message_id} удалено в чате {chat_id}")
-                return True
-        except Exception as e:
-            logger.error(f"Ошибка при удалении сообщения {message_id}: {e}")
+        """Поставить сообщение в очередь на пакетное удаление"""
+        if not self.bot:
             return False
-        return False
+        delete_queue.schedule(chat_id, [message_id])
+        return True
+    
+    def purge_user_messages(self, chat_id: int, user_id: int, raid_type: str,
+                            settings: Mapping[str, Any]) -> int:
+        """
+        Удалить сообщения участника рейда за окно обнаружения сработавшего правила
+        (или за RAID_WINDOWS['purge_seconds'], если оно больше). Возвращает число сообщений в очереди
+        """
+        if not self.bot:
+            return 0
+        setting_name, default = DETECTION_WINDOWS.get(raid_type, ('duplicate_text_window', 30))
+        seconds = max(settings.get(setting_name, default) + PURGE_GRACE_SECONDS, raid_windows.purge_seconds)
+        message_ids = raid_windows.recent_message_ids(chat_id, user_id, seconds)
+        delete_queue.schedule(chat_id, message_ids)
+        if message_ids:
+            logger.info(f"Недавние сообщения пользователя {user_id} в чате {chat_id} поставлены на удаление: {len(message_ids)}")
+        return len(message_ids)
     
     async def warn_user(self, chat_id: int, user_id: int, warning_message: str) -> bool:
         """Предупредить пользователя"""
@@ -221,95 +281,113 @@ class RaidProtection:
             return False
         return False
     
-    async def notify_owner(self, chat_id: int, raid_type: str, user_id: int = None, 
-                          details: str = None, recent_joins: List[Dict[str, Any]] = None) -> bool:
-        """Уведомить владельца чата о рейде"""
+    async def _resolve_owner(self, chat_id: int) -> Optional[int]:
+        """Найти создателя чата (БД, затем Telegram API)"""
+        # Получаем владельца чата из базы данных
+        owner_id = await db.get_chat_owner(chat_id)
+        
+        # Если владелец не найден в БД, пытаемся определить через Telegram API
+        if not owner_id:
+            try:
+                admins = await self.bot.get_chat_administrators(chat_id)
+                for admin in admins:
+                    if admin.status == 'creator':
+                        owner_id = admin.user.id
+                        # Обновляем базу данных с правильным владельцем
+                        await db.add_chat(
+                            chat_id=chat_id,
+                            chat_title=(await self.bot.get_chat(chat_id)).title or "Без названия",
+                            owner_id=owner_id
+                        )
+                        break
+            except Exception as e:
+                logger.warning(f"Не удалось определить владельца чата {chat_id} через API: {e}")
+        
+        if not owner_id:
+            logger.warning(f"Не удалось найти владельца чата {chat_id} для уведомления о рейде")
+            return None
+        
+        # Проверяем, что владелец действительно является создателем чата
+        try:
+            owner_member = await self.bot.get_chat_member(chat_id, owner_id)
+            if owner_member.status != 'creator':
+                logger.warning(f"Пользователь {owner_id} не является создателем чата {chat_id}, уведомление не отправлено")
+                return None
+        except Exception as e:
+            logger.warning(f"Не удалось проверить статус владельца {owner_id} в чате {chat_id}: {e}")
+            # Если не можем проверить, все равно отправляем (может быть временная проблема с API)
+        
+        return owner_id
+    
+    async def send_owner_message(self, chat_id: int, text: str) -> bool:
+        """Отправить сообщение владельцу чата в личные сообщения"""
         try:
             if not self.bot:
                 return False
             
-            # Получаем владельца чата из базы данных
-            from database import db
-            owner_id = await db.get_chat_owner(chat_id)
-            
-            # Если владелец не найден в БД, пытаемся определить через Telegram API
+            owner_id = await self._resolve_owner(chat_id)
             if not owner_id:
-                try:
-                    admins = await self.bot.get_chat_administrators(chat_id)
-                    for admin in admins:
-                        if admin.status == 'creator':
-                            owner_id = admin.user.id
-                            # Обновляем базу данных с правильным владельцем
-                            await db.add_chat(
-                                chat_id=chat_id,
-                                chat_title=(await self.bot.get_chat(chat_id)).title or "Без названия",
-                                owner_id=owner_id
-                            )
-                            break
-                except Exception as e:
-                    logger.warning(f"Не удалось определить владельца чата {chat_id} через API: {e}")
-            
-            if not owner_id:
-                logger.warning(f"Не удалось найти владельца чата {chat_id} для уведомления о рейде")
                 return False
             
-            # Проверяем, что владелец действительно является создателем чата
-            try:
-                owner_member = await self.bot.get_chat_member(chat_id, owner_id)
-                if owner_member.status != 'creator':
-                    logger.warning(f"Пользователь {owner_id} не является создателем чата {chat_id}, уведомление не отправлено")
-                    return False
-            except Exception as e:
-                logger.warning(f"Не удалось проверить статус владельца {owner_id} в чате {chat_id}: {e}")
-                # Если не можем проверить, все равно отправляем (может быть временная проблема с API)
-            
-            # Формируем сообщение для владельца
-            message_lines = [
-                "🚨 Обнаружен рейд!",
-                "",
-                f"Чат: {chat_id}",
-                f"Тип рейда: {self._get_raid_type_name(raid_type)}",
-            ]
-            
-            if user_id:
-                message_lines.append(f"Пользователь: {user_id}")
-            
-            if details:
-                message_lines.append(f"Детали: {details}")
-            
-            if recent_joins:
-                message_lines.append("")
-                message_lines.append("Участники рейда:")
-                for join in recent_joins[:20]:  # Показываем первых 20
-                    username = join.get('username', 'N/A')
-                    first_name = join.get('first_name', 'N/A')
-                    user_id_join = join.get('user_id', 'N/A')
-                    message_lines.append(f"  - {first_name} (@{username}) [{user_id_join}]")
-                
-                if len(recent_joins) > 20:
-                    message_lines.append(f"  ... и еще {len(recent_joins) - 20}")
-            
-            message_text = "\n".join(message_lines)
-            
             await self.bot.send_message(
                 chat_id=owner_id,
-                text=message_text,
+                text=text,
                 parse_mode=None
             )
-            
-            logger.info(f"Владелец чата {owner_id} уведомлен о рейде типа {raid_type} в чате {chat_id}")
             return True
             
         except Exception as e:
-            logger.error(f"Ошибка при уведомлении владельца о рейде: {e}")
+            logger.error(f"Ошибка при отправке сообщения владельцу чата {chat_id}: {e}")
             return False
     
+    async def notify_owner(self, chat_id: int, raid_type: str, user_id: int = None, 
+                          details: str = None, recent_joins: List[Dict[str, Any]] = None) -> bool:
+        """Уведомить владельца чата о рейде"""
+        # Формируем сообщение для владельца
+        message_lines = [
+            "🚨 Обнаружен рейд!",
+            "",
+            f"Чат: {chat_id}",
+            f"Тип рейда: {self._get_raid_type_name(raid_type)}",
+        ]
+        
+        if user_id:
+            message_lines.append(f"Пользователь: {user_id}")
+        
+        if details:
+            message_lines.append(f"Детали: {details}")
+        
+        if recent_joins:
+            message_lines.append("")
+            message_lines.append("Участники рейда:")
+            message_lines.extend(self.format_joins(recent_joins))
+        
+        if not await self.send_owner_message(chat_id, "\n".join(message_lines)):
+            return False
+        
+        logger.info(f"Владелец чата {chat_id} уведомлен о рейде типа {raid_type}")
+        return True
+    
+    def format_joins(self, joins: List[Dict[str, Any]], limit: int = 20) -> List[str]:
+        """Строки списка вошедших участников для уведомления (первые limit)"""
+        lines = []
+        for join in joins[:limit]:
+            username = join.get('username', 'N/A')
+            first_name = join.get('first_name', 'N/A')
+            user_id_join = join.get('user_id', 'N/A')
+            lines.append(f"  - {first_name} (@{username}) [{user_id_join}]")
+        
+        if len(joins) > limit:
+            lines.append(f"  ... и еще {len(joins) - limit}")
+        return lines
+    
     def _get_raid_type_name(self, raid_type: str) -> str:
         """Получить читаемое название типа рейда"""
         names = {
             'gif_spam': 'GIF спам',
             'sticker_spam': 'Стикер спам',
             'duplicate_text': 'Дублирующиеся сообщения',
+            'coordinated_text': 'Одинаковые сообщения от разных аккаунтов',
             'mass_join': 'Массовое присоединение'
         }
         return names.get(raid_type, raid_type)
@@ -12,9 +12,21 @@ from databases.database import db
 from databases.moderation_db import moderation_db
 from databases.reputation_db import reputation_db
 from databases.network_db import network_db
-from config import DEBUG
+from databases.punishment_queue import punishment_expiry_queue
+from databases.broadcast_db import broadcast_db
+from utils.member_cache import member_cache
+from utils.rate_limiter import api_lane, LANE_BACKGROUND
+from utils.chat_refresh import chat_refresh
+from utils.raid_windows import raid_windows
+from utils.text_similarity import text_similarity
+from utils.join_rate import join_rate
+from utils.avatar_cache import avatar_cache
+from config import DEBUG, MESSAGE_STATS, BROADCAST
 logger = logging.getLogger(__name__)
 
+# Через сколько секунд повторить снятие мута, если у бота нет прав администратора
+EXPIRY_RETRY_DELAY = 300
+
 
 def get_raid_protection_db():
     """Получить экземпляр базы данных защиты от рейдов"""
@@ -40,8 +52,7 @@ class TaskScheduler:
             asyncio.create_task(self.cleanup_duplicates_task()),
             asyncio.create_task(self.cleanup_old_stats_task()),
             asyncio.create_task(self.update_chat_info_task()),
-            asyncio.create_task(self.mute_expiry_task()),
-            asyncio.create_task(self.ban_expiry_task()),
+            asyncio.create_task(self.punishment_expiry_task()),
             asyncio.create_task(self.cleanup_old_moderation_records_task()),
             asyncio.create_task(self.reputation_recovery_task()),
             asyncio.create_task(self.cleanup_old_punishments_task()),
@@ -50,7 +61,8 @@ class TaskScheduler:
             asyncio.create_task(self.cleanup_raid_protection_task()),
             asyncio.create_task(self.cleanup_inactive_task()),
             asyncio.create_task(self.cleanup_expired_commands_task()),
-            asyncio.create_task(self.reset_daily_stats_task())
+            asyncio.create_task(self.reset_daily_stats_task()),
+            asyncio.create_task(self.flush_message_stats_task())
         ]
         
         await asyncio.gather(*self.tasks, return_exceptions=True)
@@ -90,6 +102,10 @@ class TaskScheduler:
             try:
                 await db.cleanup_old_stats(90)
                 await db.cleanup_old_user_stats(90)
+                await db.compact_hourly_stats()
+                await broadcast_db.cleanup_old_broadcasts(BROADCAST['retention_days'])
+                await avatar_cache.prune()
+                avatar_cache.snapshot()
                 logger.info("Автоматическая очистка старых записей выполнена")
             except Exception as e:
                 logger.error(f"Ошибка при автоматической очистке старых записей: {e}")
@@ -97,413 +113,298 @@ class TaskScheduler:
             await asyncio.sleep(3600)
     
     async def update_chat_info_task(self):
-        """Задача обновления информации о чатах каждую минуту"""
+        """Обновление информации о чатах: события и самые устаревшие чаты в пределах бюджета запросов"""
         while self.running:
             try:
                 chats = await db.get_all_chats_for_update()
+                chat_refresh.sync_chats(chats)
+                selected = chat_refresh.pick([chat['chat_id'] for chat in chats], interval=60)
                 
-                async def update_single_chat(chat):
+                async def update_single_chat(chat_id):
                     async with self.chat_semaphore:
                         try:
                             from handlers.common import update_chat_info_if_needed
-                            await update_chat_info_if_needed(chat['chat_id'])
+                            await update_chat_info_if_needed(chat_id)
                         except Exception as e:
                             error_str = str(e).lower()
                             if "chat not found" in error_str or "bad request" in error_str or "bot was kicked" in error_str or "forbidden" in error_str:
                                 if DEBUG:
-                                    logger.debug(f"Чат {chat['chat_id']} недоступен при обновлении информации (бот исключен или чат не найден): {e}")
+                                    logger.debug(f"Чат {chat_id} недоступен при обновлении информации (бот исключен или чат не найден): {e}")
                             else:
-                                logger.error(f"Ошибка при обновлении информации о чате {chat['chat_id']}: {e}")
+                                logger.error(f"Ошибка при обновлении информации о чате {chat_id}: {e}")
                 
-                await asyncio.gather(*[update_single_chat(chat) for chat in chats], return_exceptions=True)
+                # Фоновое обновление уступает модерации и ответам пользователям
+                with api_lane(LANE_BACKGROUND):
+                    await asyncio.gather(*[update_single_chat(chat_id) for chat_id in selected], return_exceptions=True)
                 
-                logger.debug(f"Автоматическое обновление информации о {len(chats)} чатах выполнено")
+                logger.debug(f"Обновлена информация о {len(selected)} из {len(chats)} чатов")
             except Exception as e:
                 logger.error(f"Ошибка при автоматическом обновлении информации о чатах: {e}")
             
             await asyncio.sleep(60)
     
-    async def mute_expiry_task(self):
-        """Задача проверки истечения мутов - сканирует каждые 10 сек если есть активные муты"""
-        if not hasattr(self, '_recently_processed_mutes'):
-            self._recently_processed_mutes = {}
+    async def punishment_expiry_task(self):
+        """Снятие истекших мутов и банов: сон до ближайшего срока из очереди вместо опроса всех чатов"""
+        loaded = await moderation_db.load_expiry_queue()
+        logger.info(f"Запущена задача истечения наказаний, в очереди {loaded} мутов и банов")
         
         while self.running:
             try:
-                current_time = time.time()
-                self._recently_processed_mutes = {
-                    mute_id: ts for mute_id, ts in self._recently_processed_mutes.items() 
-                    if current_time - ts < 60
-                }
-                
-                has_active_mutes = False
-                total_active_mutes = 0
-                
-                chats = await db.get_all_chats_for_update()
-                logger.debug(f"Проверяем муты в {len(chats)} чатах")
-                
-                async def process_chat_mutes(chat, recently_processed_ref, current_time_ref):
-                    async with self.chat_semaphore:
-                        try:
-                            import bot
-                            try:
-                                bot_member = await bot.bot.get_chat_member(chat['chat_id'], bot.bot.id)
-                            except Exception as e:
-                                error_str = str(e).lower()
-                                if "chat not found" in error_str or "bad request" in error_str or "bot was kicked" in error_str or "forbidden" in error_str:
-                                    if DEBUG:
-                                        logger.debug(f"Чат {chat['chat_id']} недоступен (бот исключен или чат не найден), деактивируем его: {e}")
-                                    try:
-                                        await db.deactivate_chat(chat['chat_id'])
-                                    except Exception:
-                                        pass
-                                    return 0
-                                raise
-                            
-                            if bot_member.status not in ['administrator', 'creator']:
-                                return 0
-                            
-                            active_mutes = await moderation_db.get_active_punishments(chat['chat_id'], "mute")
-                            
-                            if not active_mutes:
-                                return 0
-                            
-                            must_active_count = len(active_mutes)
-                            logger.debug(f"В чате {chat['chat_id']} найдено {must_active_count} активных мутов")
-                            
-                            expired_count = 0
-                            
-                            for mute in active_mutes:
-                                try:
-                                    mute_id = mute['id']
-                                    
-                                    if mute_id in recently_processed_ref:
-                                        time_since_processed = current_time_ref - recently_processed_ref[mute_id]
-                                        if time_since_processed < 30:
-                                            logger.debug(f"Мут {mute_id} был обработан {time_since_processed:.1f} сек назад, пропускаем")
-                                            continue
-                                    
-                                    if mute['expiry_date']:
-                                        expiry_date = datetime.fromisoformat(mute['expiry_date'])
-                                        now = datetime.now(expiry_date.tzinfo) if expiry_date.tzinfo else datetime.now()
-                                        
-                                        logger.debug(f"Проверяем мут {mute_id}: expiry={expiry_date}, now={now}, diff={(now - expiry_date).total_seconds()} сек")
-                                        
-                                        time_diff = (now - expiry_date).total_seconds()
-                                        if time_diff < 0:
-                                            continue
-                                        
-                                        if time_diff >= 0:
-                                            # Двойная проверка: если уже в recently_processed_ref, пропускаем
-                                            # (защита от race condition между первой проверкой и этой)
-                                            if mute_id in recently_processed_ref:
-                                                time_since = current_time_ref - recently_processed_ref[mute_id]
-                                                if time_since < 5:  # Очень недавно обработан
-                                                    logger.debug(f"Мут {mute_id} уже обрабатывается (race condition защита), пропускаем")
-                                                    continue
-                                            
-                                            # Отмечаем что обрабатываем этот мут до попытки деактивации
-                                            recently_processed_ref[mute_id] = current_time_ref
-                                            
-                                            deactivated = await moderation_db.deactivate_punishment(mute_id)
-                                            
-                                            if not deactivated:
-                                                logger.debug(f"Мут {mute_id} уже был обработан другим потоком, пропускаем")
-                                                continue
-                                            
-                                            logger.info(f"Мут истек для пользователя {mute['user_id']} в чате {chat['chat_id']}")
-                                            
-                                            import bot
-                                            from aiogram.types import ChatPermissions
-                                            try:
-                                                await bot.bot.restrict_chat_member(
-                                                    chat_id=chat['chat_id'],
-                                                    user_id=mute['user_id'],
-                                                    permissions=ChatPermissions(
-                                                        can_send_messages=True,
-                                                        can_send_audios=True,
-                                                        can_send_documents=True,
-                                                        can_send_photos=True,
-                                                        can_send_videos=True,
-                                                        can_send_video_notes=True,
-                                                        can_send_voice_notes=True,
-                                                        can_send_polls=True,
-                                                        can_send_other_messages=True,
-                                                        can_add_web_page_previews=True,
-                                                        can_change_info=True,
-                                                        can_invite_users=True,
-                                                        can_pin_messages=True,
-                                                        can_manage_topics=True
-                                                    )
-                                                )
-                                            except Exception as e:
-                                                error_str = str(e).lower()
-                                                if "chat not found" in error_str or "bad request" in error_str:
-                                                    if DEBUG:
-                                                        logger.debug(f"Чат {chat['chat_id']} не найден при снятии ограничений: {e}")
-                                                    try:
-                                                        await db.deactivate_chat(chat['chat_id'])
-                                                    except Exception:
-                                                        pass
-                                                else:
-                                                    logger.error(f"Ошибка при снятии ограничений для пользователя {mute['user_id']}: {e}")
-                                            
-                                            username_display = mute['user_first_name'] or f"@{mute['user_username']}" if mute['user_username'] else f"ID{mute['user_id']}"
-                                            
-                                            philosophical_quotes = [
-                                                "🗣️ Голос - это дар, который нужно беречь и использовать мудро",
-                                                "🔄 Второй шанс - это возможность стать лучше",
-                                                "🌅 После тишины приходит время для слов",
-                                                "🕊️ Свобода слова рождает понимание",
-                                                "💬 Каждое слово имеет значение, каждое молчание - тоже",
-                                                "🌟 Освобождение от ограничений открывает новые горизонты",
-                                                "🦋 Как бабочка выходит из кокона, так и слова выходят из молчания",
-                                                "🌊 Река слов снова течет свободно",
-                                                "🎵 После паузы музыка становится еще прекраснее",
-                                                "🌱 Из тишины рождается мудрость",
-                                                "🔓 Ключ к пониманию - это возможность быть услышанным",
-                                                "📖 Новая глава начинается с первого слова",
-                                                "🎭 Каждый актер заслуживает своего выхода на сцену",
-                                                "🌈 После бури всегда наступает затишье",
-                                                "🕯️ Свет разума рассеивает тьму непонимания"
-                                            ]
-                                            
-                                            import random
-                                            quote = random.choice(philosophical_quotes)
-                                            
-                                            # Проверяем настройку silent mute
-                                            raid_protection_db = get_raid_protection_db()
-                                            settings = await raid_protection_db.get_settings(chat['chat_id'])
-                                            mute_silent = settings.get('mute_silent', False)
-                                            
-                                            # Отправляем сообщение в чат только если silent mode выключен
-                                            if not mute_silent:
-                                                try:
-                                                    await bot.bot.send_message(
-                                                        chat['chat_id'],
-                                                        f"🔊 Участник <b>{username_display}</b> <i>освобожден(а) от тайм-аута</i>\n"
-                                                        f"🔸 <b>По истечению времени я автоматически снял ограничения, не нарушайте правила чата!</b>\n\n"
-                                                        f"<blockquote>{quote}</blockquote>",
-                                                        parse_mode=ParseMode.HTML
-                                                    )
-                                                    logger.info(f"✅ Автоматически снят мут пользователю {mute['user_id']} в чате {chat['chat_id']}")
-                                                except Exception as e:
-                                                    error_str = str(e).lower()
-                                                    if "chat not found" in error_str or "bad request" in error_str:
-                                                        if DEBUG:
-                                                            logger.debug(f"Чат {chat['chat_id']} не найден при отправке сообщения о размуте: {e}")
-                                                        try:
-                                                            await db.deactivate_chat(chat['chat_id'])
-                                                        except Exception:
-                                                            pass
-                                                    else:
-                                                        logger.error(f"Ошибка при отправке сообщения о размуте: {e}")
-                                            else:
-                                                logger.info(f"✅ Автоматически снят мут пользователю {mute['user_id']} в чате {chat['chat_id']} (silent mode)")
-                                            
-                                            expired_count += 1
-                                            
-                                except Exception as e:
-                                    logger.error(f"Ошибка при обработке мута {mute['id']}: {e}")
-                                    continue
-                            
-                            return must_active_count
-                                
-                        except Exception as e:
-                            error_str = str(e).lower()
-                            if "chat not found" in error_str or "bad request" in error_str or "bot was kicked" in error_str or "forbidden" in error_str:
-                                if DEBUG:
-                                    logger.debug(f"Чат {chat['chat_id']} недоступен при проверке мутов (бот исключен или чат не найден): {e}")
-                                try:
-                                    await db.deactivate_chat(chat['chat_id'])
-                                except Exception:
-                                    pass
-                            else:
-                                logger.error(f"Ошибка при проверке мутов в чате {chat['chat_id']}: {e}")
-                            return 0
-                
-                results = await asyncio.gather(*[process_chat_mutes(chat, self._recently_processed_mutes, current_time) for chat in chats], return_exceptions=True)
+                due = punishment_expiry_queue.pop_due()
+                if due:
+                    await asyncio.gather(*[self._expire_punishment(item) for item in due], return_exceptions=True)
+                    continue
                 
-                for result in results:
-                    if isinstance(result, int):
-                        if result > 0:
-                            total_active_mutes += result
-                            has_active_mutes = True
+                await punishment_expiry_queue.wait_next()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка в задаче истечения наказаний: {e}")
+                await asyncio.sleep(5)
+    
+    async def _expire_punishment(self, item):
+        """Снять одно наказание, срок которого наступил"""
+        async with self.chat_semaphore:
+            try:
+                punishment = await moderation_db.get_punishment(item.punishment_id)
+                if not punishment or not punishment['is_active']:
+                    # Снято вручную или удалено вместе с чатом
+                    return
                 
-                if has_active_mutes:
-                    logger.debug(f"Найдено {total_active_mutes} активных мутов - сканируем через 10 секунд")
-                    await asyncio.sleep(10)
+                if item.punishment_type == 'mute':
+                    await self._release_mute(punishment)
                 else:
-                    logger.debug("Нет активных мутов - сканируем через 60 секунд")
-                    await asyncio.sleep(60)
-                
+                    await self._release_ban(punishment)
             except Exception as e:
-                logger.error(f"Ошибка в задаче проверки мутов: {e}")
-                await asyncio.sleep(30)
+                # Элемент уже снят с очереди - без повторной постановки наказание не истечет до перезапуска
+                logger.error(
+                    f"Ошибка при обработке наказания {item.punishment_id} ({item.punishment_type}), "
+                    f"повтор через {EXPIRY_RETRY_DELAY}с: {e}"
+                )
+                punishment_expiry_queue.schedule(
+                    item.punishment_id, item.chat_id, item.punishment_type, time.time() + EXPIRY_RETRY_DELAY
+                )
     
-    async def ban_expiry_task(self):
-        """Задача для автоматического разбана истекших банов"""
-        logger.info("Запущена задача проверки истечения банов")
+    async def _release_mute(self, mute: dict):
+        """Снять истекший мут"""
+        import bot
+        chat_id = mute['chat_id']
+        try:
+            bot_member = await member_cache.get(bot.bot, chat_id, bot.bot.id)
+        except Exception as e:
+            error_str = str(e).lower()
+            if "chat not found" in error_str or "bad request" in error_str or "bot was kicked" in error_str or "forbidden" in error_str:
+                if DEBUG:
+                    logger.debug(f"Чат {chat_id} недоступен (бот исключен или чат не найден), деактивируем его: {e}")
+                try:
+                    await db.deactivate_chat(chat_id)
+                except Exception:
+                    pass
+                return
+            raise
         
-        while self.running:
+        if bot_member.status not in ['administrator', 'creator']:
+            # Без прав администратора снять ограничения нельзя - попробуем позже
+            punishment_expiry_queue.schedule(mute['id'], chat_id, 'mute', time.time() + EXPIRY_RETRY_DELAY)
+            return
+        
+        deactivated = await moderation_db.deactivate_punishment(mute['id'])
+        if not deactivated:
+            logger.debug(f"Мут {mute['id']} уже был обработан, пропускаем")
+            return
+        
+        logger.info(f"Мут истек для пользователя {mute['user_id']} в чате {chat_id}")
+        
+        from aiogram.types import ChatPermissions
+        try:
+            await bot.bot.restrict_chat_member(
+                chat_id=chat_id,
+                user_id=mute['user_id'],
+                permissions=ChatPermissions(
+                    can_send_messages=True,
+                    can_send_audios=True,
+                    can_send_documents=True,
+                    can_send_photos=True,
+                    can_send_videos=True,
+                    can_send_video_notes=True,
+                    can_send_voice_notes=True,
+                    can_send_polls=True,
+                    can_send_other_messages=True,
+                    can_add_web_page_previews=True,
+                    can_change_info=True,
+                    can_invite_users=True,
+                    can_pin_messages=True,
+                    can_manage_topics=True
+                )
+            )
+        except Exception as e:
+            error_str = str(e).lower()
+            if "chat not found" in error_str or "bad request" in error_str:
+                if DEBUG:
+                    logger.debug(f"Чат {chat_id} не найден при снятии ограничений: {e}")
+                try:
+                    await db.deactivate_chat(chat_id)
+                except Exception:
+                    pass
+            else:
+                logger.error(f"Ошибка при снятии ограничений для пользователя {mute['user_id']}: {e}")
+        
+        username_display = mute['user_first_name'] or f"@{mute['user_username']}" if mute['user_username'] else f"ID{mute['user_id']}"
+        
+        philosophical_quotes = [
+            "🗣️ Голос - это дар, который нужно беречь и использовать мудро",
+            "🔄 Второй шанс - это возможность стать лучше",
+            "🌅 После тишины приходит время для слов",
+            "🕊️ Свобода слова рождает понимание",
+            "💬 Каждое слово имеет значение, каждое молчание - тоже",
+            "🌟 Освобождение от ограничений открывает новые горизонты",
+            "🦋 Как бабочка выходит из кокона, так и слова выходят из молчания",
+            "🌊 Река слов снова течет свободно",
+            "🎵 После паузы музыка становится еще прекраснее",
+            "🌱 Из тишины рождается мудрость",
+            "🔓 Ключ к пониманию - это возможность быть услышанным",
+            "📖 Новая глава начинается с первого слова",
+            "🎭 Каждый актер заслуживает своего выхода на сцену",
+            "🌈 После бури всегда наступает затишье",
+            "🕯️ Свет разума рассеивает тьму непонимания"
+        ]
+        
+        import random
+        quote = random.choice(philosophical_quotes)
+        
+        # Проверяем настройку silent mute
+        raid_protection_db = get_raid_protection_db()
+        settings = await raid_protection_db.get_settings(chat_id)
+        mute_silent = settings.get('mute_silent', False)
+        
+        # Отправляем сообщение в чат только если silent mode выключен
+        if not mute_silent:
             try:
-                chats = await db.get_all_chats_for_update()
-                total_active_bans = 0
-                has_active_bans = False
-                
-                async def process_chat_bans(chat):
-                    async with self.chat_semaphore:
-                        try:
-                            active_bans = await moderation_db.get_active_punishments(chat['chat_id'], "ban")
-                            
-                            if not active_bans:
-                                return 0
-                            
-                            ban_count = len(active_bans)
-                            
-                            for ban in active_bans:
-                                try:
-                                    if ban['expiry_date']:
-                                        expiry_date = datetime.fromisoformat(ban['expiry_date'])
-                                        now = datetime.now(expiry_date.tzinfo) if expiry_date.tzinfo else datetime.now()
-                                        if now >= expiry_date:
-                                            deactivated = await moderation_db.deactivate_punishment(ban['id'])
-                                            
-                                            if not deactivated:
-                                                logger.warning(f"Бан {ban['id']} уже был обработан другим потоком, пропускаем")
-                                                continue
-                                            
-                                            logger.info(f"Бан истек для пользователя {ban['user_id']} в чате {chat['chat_id']}")
-                                            
-                                            import bot
-                                            try:
-                                                await bot.bot.unban_chat_member(
-                                                    chat_id=chat['chat_id'],
-                                                    user_id=ban['user_id']
-                                                )
-                                            except Exception as e:
-                                                error_str = str(e).lower()
-                                                if "chat not found" in error_str or "bad request" in error_str:
-                                                    if DEBUG:
-                                                        logger.debug(f"Чат {chat['chat_id']} не найден при разбане: {e}")
-                                                    try:
-                                                        await db.deactivate_chat(chat['chat_id'])
-                                                    except Exception:
-                                                        pass
-                                                else:
-                                                    logger.error(f"Ошибка при разбане пользователя {ban['user_id']}: {e}")
-                                            
-                                            username_display = ban['user_first_name'] or f"@{ban['user_username']}" if ban['user_username'] else f"ID{ban['user_id']}"
-                                            
-                                            philosophical_quotes = [
-                                                "🌅 Время лечит все раны, даже самые глубокие",
-                                                "🌊 Река находит путь к морю, преодолевая все препятствия",
-                                                "🕊️ Птица свободы всегда найдет путь домой",
-                                                "🌱 Из пепла может вырасти новая жизнь",
-                                                "🌙 Даже самая темная ночь заканчивается рассветом",
-                                                "🍃 Новый лист может вырасти на том же дереве",
-                                                "🌌 Звезды не исчезают навсегда, они просто ждут своего времени",
-                                                "🌿 Дерево может зацвести заново после зимы",
-                                                "🦋 Превращение требует времени, но результат стоит ожидания",
-                                                "🌅 Солнце всегда возвращается, даже после самой долгой ночи"
-                                            ]
-                                            
-                                            import random
-                                            quote = random.choice(philosophical_quotes)
-                                            
-                                            try:
-                                                await bot.bot.send_message(
-                                                    chat['chat_id'],
-                                                    f"✅ <b>{username_display}</b> <i>был(а) автоматически разбанен(а)</i>\n"
-                                                    f"🔸 <b>Срок наказания истек</b>\n\n"
-                                                    f"<blockquote>{quote}</blockquote>",
-                                                    parse_mode=ParseMode.HTML
-                                                )
-                                            except Exception as e:
-                                                error_str = str(e).lower()
-                                                if "chat not found" in error_str or "bad request" in error_str:
-                                                    if DEBUG:
-                                                        logger.debug(f"Чат {chat['chat_id']} не найден при отправке сообщения о разбане: {e}")
-                                                    try:
-                                                        await db.deactivate_chat(chat['chat_id'])
-                                                    except Exception:
-                                                        pass
-                                                else:
-                                                    logger.error(f"Ошибка при отправке сообщения о разбане: {e}")
-                                            
-                                            try:
-                                                try:
-                                                    chat_info = await bot.bot.get_chat(chat['chat_id'])
-                                                    chat_title = chat_info.title or "Неизвестный чат"
-                                                except Exception as e:
-                                                    error_str = str(e).lower()
-                                                    if "chat not found" in error_str or "bad request" in error_str:
-                                                        if DEBUG:
-                                                            logger.debug(f"Чат {chat['chat_id']} не найден при получении информации: {e}")
-                                                        chat_title = "неизвестный чат"
-                                                    else:
-                                                        raise
-                                                
-                                                from aiogram.utils.keyboard import InlineKeyboardBuilder
-                                                builder = InlineKeyboardBuilder()
-                                                try:
-                                                    builder.button(text="💬 Открыть чат", url=f"https://t.me/{chat_info.username}" if chat_info.username else f"https://t.me/c/{str(chat['chat_id'])[4:]}")
-                                                except:
-                                                    pass
-                                                
-                                                await bot.bot.send_message(
-                                                    ban['user_id'],
-                                                    f"✅ Вы были автоматически разбанены в чате \"{chat_title}\"\n"
-                                                    f"🔸 Срок наказания истек\n\n"
-                                                    f"<blockquote>{quote}</blockquote>",
-                                                    parse_mode=ParseMode.HTML,
-                                                    reply_markup=builder.as_markup() if builder else None
-                                                )
-                                            except Exception as e:
-                                                error_str = str(e).lower()
-                                                if "chat not found" in error_str or "bad request" in error_str:
-                                                    if DEBUG:
-                                                        logger.debug(f"Чат {chat['chat_id']} не найден при отправке уведомления: {e}")
-                                                else:
-                                                    logger.error(f"Ошибка при отправке уведомления пользователю {ban['user_id']}: {e}")
-                                            
-                                            logger.info(f"✅ Автоматически разбанен пользователь {ban['user_id']} в чате {chat['chat_id']}")
-                                            
-                                except Exception as e:
-                                    logger.error(f"Ошибка при обработке бана {ban['id']}: {e}")
-                            
-                            return ban_count
-                                    
-                        except Exception as e:
-                            error_str = str(e).lower()
-                            if "chat not found" in error_str or "bad request" in error_str:
-                                if DEBUG:
-                                    logger.debug(f"Чат {chat['chat_id']} не найден при проверке банов: {e}")
-                                try:
-                                    await db.deactivate_chat(chat['chat_id'])
-                                except Exception:
-                                    pass
-                            else:
-                                logger.error(f"Ошибка при проверке банов в чате {chat['chat_id']}: {e}")
-                            return 0
-                
-                results = await asyncio.gather(*[process_chat_bans(chat) for chat in chats], return_exceptions=True)
-                
-                for result in results:
-                    if isinstance(result, int):
-                        if result > 0:
-                            total_active_bans += result
-                            has_active_bans = True
-                if has_active_bans:
-                    logger.debug(f"Найдено {total_active_bans} активных банов - сканируем через 10 секунд")
-                    await asyncio.sleep(10)
+                await bot.bot.send_message(
+                    chat_id,
+                    f"🔊 Участник <b>{username_display}</b> <i>освобожден(а) от тайм-аута</i>\n"
+                    f"🔸 <b>По истечению времени я автоматически снял ограничения, не нарушайте правила чата!</b>\n\n"
+                    f"<blockquote>{quote}</blockquote>",
+                    parse_mode=ParseMode.HTML
+                )
+                logger.info(f"✅ Автоматически снят мут пользователю {mute['user_id']} в чате {chat_id}")
+            except Exception as e:
+                error_str = str(e).lower()
+                if "chat not found" in error_str or "bad request" in error_str:
+                    if DEBUG:
+                        logger.debug(f"Чат {chat_id} не найден при отправке сообщения о размуте: {e}")
+                    try:
+                        await db.deactivate_chat(chat_id)
+                    except Exception:
+                        pass
                 else:
-                    logger.debug("Нет активных банов - сканируем через 60 секунд")
-                    await asyncio.sleep(60)
-                
+                    logger.error(f"Ошибка при отправке сообщения о размуте: {e}")
+        else:
+            logger.info(f"✅ Автоматически снят мут пользователю {mute['user_id']} в чате {chat_id} (silent mode)")
+    
+    async def _release_ban(self, ban: dict):
+        """Снять истекший бан"""
+        chat_id = ban['chat_id']
+        deactivated = await moderation_db.deactivate_punishment(ban['id'])
+        if not deactivated:
+            logger.warning(f"Бан {ban['id']} уже был обработан другим потоком, пропускаем")
+            return
+        
+        logger.info(f"Бан истек для пользователя {ban['user_id']} в чате {chat_id}")
+        
+        import bot
+        try:
+            await bot.bot.unban_chat_member(
+                chat_id=chat_id,
+                user_id=ban['user_id']
+            )
+        except Exception as e:
+            error_str = str(e).lower()
+            if "chat not found" in error_str or "bad request" in error_str:
+                if DEBUG:
+                    logger.debug(f"Чат {chat_id} не найден при разбане: {e}")
+                try:
+                    await db.deactivate_chat(chat_id)
+                except Exception:
+                    pass
+            else:
+                logger.error(f"Ошибка при разбане пользователя {ban['user_id']}: {e}")
+        
+        username_display = ban['user_first_name'] or f"@{ban['user_username']}" if ban['user_username'] else f"ID{ban['user_id']}"
+        
+        philosophical_quotes = [
+            "🌅 Время лечит все раны, даже самые глубокие",
+            "🌊 Река находит путь к морю, преодолевая все препятствия",
+            "🕊️ Птица свободы всегда найдет путь домой",
+            "🌱 Из пепла может вырасти новая жизнь",
+            "🌙 Даже самая темная ночь заканчивается рассветом",
+            "🍃 Новый лист может вырасти на том же дереве",
+            "🌌 Звезды не исчезают навсегда, они просто ждут своего времени",
+            "🌿 Дерево может зацвести заново после зимы",
+            "🦋 Превращение требует времени, но результат стоит ожидания",
+            "🌅 Солнце всегда возвращается, даже после самой долгой ночи"
+        ]
+        
+        import random
+        quote = random.choice(philosophical_quotes)
+        
+        try:
+            await bot.bot.send_message(
+                chat_id,
+                f"✅ <b>{username_display}</b> <i>был(а) автоматически разбанен(а)</i>\n"
+                f"🔸 <b>Срок наказания истек</b>\n\n"
+                f"<blockquote>{quote}</blockquote>",
+                parse_mode=ParseMode.HTML
+            )
+        except Exception as e:
+            error_str = str(e).lower()
+            if "chat not found" in error_str or "bad request" in error_str:
+                if DEBUG:
+                    logger.debug(f"Чат {chat_id} не найден при отправке сообщения о разбане: {e}")
+                try:
+                    await db.deactivate_chat(chat_id)
+                except Exception:
+                    pass
+            else:
+                logger.error(f"Ошибка при отправке сообщения о разбане: {e}")
+        
+        try:
+            try:
+                chat_info = await bot.bot.get_chat(chat_id)
+                chat_title = chat_info.title or "Неизвестный чат"
             except Exception as e:
-                logger.error(f"Ошибка в задаче проверки банов: {e}")
-                await asyncio.sleep(30)
+                error_str = str(e).lower()
+                if "chat not found" in error_str or "bad request" in error_str:
+                    if DEBUG:
+                        logger.debug(f"Чат {chat_id} не найден при получении информации: {e}")
+                    chat_title = "неизвестный чат"
+                else:
+                    raise
+            
+            from aiogram.utils.keyboard import InlineKeyboardBuilder
+            builder = InlineKeyboardBuilder()
+            try:
+                builder.button(text="💬 Открыть чат", url=f"https://t.me/{chat_info.username}" if chat_info.username else f"https://t.me/c/{str(chat_id)[4:]}")
+            except:
+                pass
+            
+            await bot.bot.send_message(
+                ban['user_id'],
+                f"✅ Вы были автоматически разбанены в чате \"{chat_title}\"\n"
+                f"🔸 Срок наказания истек\n\n"
+                f"<blockquote>{quote}</blockquote>",
+                parse_mode=ParseMode.HTML,
+                reply_markup=builder.as_markup() if builder else None
+            )
+        except Exception as e:
+            error_str = str(e).lower()
+            if "chat not found" in error_str or "bad request" in error_str:
+                if DEBUG:
+                    logger.debug(f"Чат {chat_id} не найден при отправке уведомления: {e}")
+            else:
+                logger.error(f"Ошибка при отправке уведомления пользователю {ban['user_id']}: {e}")
+        
+        logger.info(f"✅ Автоматически разбанен пользователь {ban['user_id']} в чате {chat_id}")
     
     async def cleanup_old_moderation_records_task(self):
         """Задача очистки старых записей модерации"""
@@ -618,7 +519,10 @@ class TaskScheduler:
             try:
                 raid_db = get_raid_protection_db()
                 
-                await raid_db.cleanup_old_activity(1)
+                raid_windows.prune()
+                text_similarity.prune()
+                join_rate.prune()
+                join_rate.snapshot()
                 await raid_db.cleanup_old_joins(2)
                 await raid_db.cleanup_old_deleted_messages(5)
                 
@@ -671,6 +575,17 @@ class TaskScheduler:
             
             await asyncio.sleep(60)
     
+    async def flush_message_stats_task(self):
+        """Периодическая запись накопленной статистики сообщений в БД"""
+        logger.info("🔄 Задача записи статистики сообщений запущена")
+        
+        while self.running:
+            await asyncio.sleep(MESSAGE_STATS['flush_interval'])
+            try:
+                await db.flush_message_stats()
+            except Exception as e:
+                logger.error(f"Ошибка в задаче записи статистики сообщений: {e}")
+    
     async def cleanup_frozen_chats_task(self):
         """Задача очистки замороженных чатов (проверка раз в день)"""
         from datetime import timedelta
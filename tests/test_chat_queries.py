@@ -0,0 +1,43 @@
+"""
+Выборки чатов Database.get_all_active_chats и get_all_chats_for_update на реальной БД
+
+Запуск из корня проекта:
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("BASE_PATH", tempfile.mkdtemp(prefix="pixel_test_"))
+
+from databases.database import Database  # noqa: E402
+from databases.connection_pool import close_all_pools  # noqa: E402
+
+
+async def _load_chats(path):
+    database = Database(path)
+    await database.init_db()
+    await database.add_chat(-100, "Public chat", 1)
+    await database.update_chat_info(-100, chat_type="supergroup", member_count=42, is_public=True,
+                                    username="public_chat", invite_link="https://t.me/public_chat")
+    return await database.get_all_active_chats(), await database.get_all_chats_for_update()
+
+
+def test_chat_queries_return_selected_columns(tmp_path):
+    try:
+        active, for_update = asyncio.run(_load_chats(str(tmp_path / "bot.db")))
+    finally:
+        close_all_pools()
+
+    assert [chat['chat_id'] for chat in active] == [-100]
+    assert active[0]['member_count'] == 42
+    assert 'username' not in active[0]
+
+    assert len(for_update) == 1
+    chat = for_update[0]
+    assert chat['is_public'] is True
+    assert chat['username'] == "public_chat"
+    assert chat['invite_link'] == "https://t.me/public_chat"
@@ -0,0 +1,318 @@
+"""
+Кэш аватарок для графиков топа
+
+Для каждого /top и /topall график запрашивал get_user_profile_photos,
+get_file и download_file по каждому пользователю и заново декодировал,
+масштабировал и обрезал по кругу каждую аватарку. AvatarCache хранит готовые
+круглые миниатюры (PNG из image_generator.make_avatar_thumbnails) по
+file_unique_id фото:
+- в памяти - LRU на memory_size миниатюр;
+- на диске - файлы <file_unique_id>.png в directory (data/avatars), не
+  читавшиеся дольше disk_max_age_days удаляются при prune.
+
+Индекс user_id -> (file_unique_id, file_id, время проверки) определяет, нужна
+ли проверка: моложе ttl_hours - без запросов к API; старше - один запрос
+get_user_profile_photos, и скачивание только если фото сменилось.
+Отсутствие фото тоже кэшируется (negative_ttl_hours). Скачивается не самый
+большой размер фото, а наименьший не меньше миниатюры. Миниатюры создаются
+в пуле рендеринга. Индекс сохраняется в JSON между перезапусками.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+
+from utils.image_generator import AVATAR_SIZE, make_avatar_thumbnails
+from utils.render_service import render_service
+
+try:
+    from config import AVATAR_CACHE
+except ImportError:
+    AVATAR_CACHE = {
+        'directory': None, 'ttl_hours': 24, 'negative_ttl_hours': 6,
+        'memory_size': 512, 'disk_max_age_days': 30,
+    }
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+
+
+class _AvatarEntry:
+    """Последняя проверка фото пользователя"""
+
+    __slots__ = ('file_unique_id', 'file_id', 'checked_at')
+
+    def __init__(self, file_unique_id: Optional[str], file_id: Optional[str], checked_at: float):
+        # None - у пользователя нет фото (отрицательная запись)
+        self.file_unique_id = file_unique_id
+        self.file_id = file_id
+        self.checked_at = checked_at
+
+
+class AvatarCache:
+    """Двухуровневый кэш круглых миниатюр аватарок по file_unique_id"""
+
+    def __init__(self, directory: Optional[str] = None, ttl_hours: float = 24, negative_ttl_hours: float = 6,
+                 memory_size: int = 512, disk_max_age_days: float = 30):
+        self.directory = directory
+        self.ttl = ttl_hours * 3600
+        self.negative_ttl = negative_ttl_hours * 3600
+        self.memory_size = memory_size
+        self.disk_max_age = disk_max_age_days * 86400
+        self._index: Dict[int, _AvatarEntry] = {}
+        # file_unique_id -> PNG миниатюры
+        self._thumbnails: "OrderedDict[str, bytes]" = OrderedDict()
+        self.stats = {
+            'memory_hits': 0, 'disk_hits': 0, 'negative_hits': 0,
+            'revalidations': 0, 'unchanged': 0, 'downloads': 0, 'errors': 0,
+        }
+
+    # ---------- Миниатюры ----------
+
+    def _thumbnail_path(self, file_unique_id: str) -> str:
+        return os.path.join(self.directory, f"{file_unique_id}.png")
+
+    def _remember(self, file_unique_id: str, thumbnail: bytes):
+        self._thumbnails[file_unique_id] = thumbnail
+        self._thumbnails.move_to_end(file_unique_id)
+        while len(self._thumbnails) > self.memory_size:
+            self._thumbnails.popitem(last=False)
+
+    def _read_disk(self, file_unique_ids: List[str]) -> Dict[str, bytes]:
+        """Прочитать миниатюры с диска (в потоке, не в event loop)"""
+        found = {}
+        if not self.directory:
+            return found
+        for file_unique_id in file_unique_ids:
+            path = self._thumbnail_path(file_unique_id)
+            try:
+                with open(path, 'rb') as f:
+                    found[file_unique_id] = f.read()
+                # Время изменения - время последнего чтения (для prune)
+                os.utime(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.debug(f"Не удалось прочитать миниатюру {path}: {e}")
+        return found
+
+    def _write_disk(self, thumbnails: Dict[str, bytes]):
+        """Сохранить миниатюры на диск (в потоке, не в event loop)"""
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for file_unique_id, thumbnail in thumbnails.items():
+                path = self._thumbnail_path(file_unique_id)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(thumbnail)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Ошибка при сохранении миниатюр аватарок: {e}")
+
+    async def _load_thumbnails(self, file_unique_ids: List[str]) -> Dict[str, bytes]:
+        """Миниатюры из памяти, затем с диска"""
+        found = {}
+        missing = []
+        for file_unique_id in file_unique_ids:
+            thumbnail = self._thumbnails.get(file_unique_id)
+            if thumbnail is not None:
+                self._thumbnails.move_to_end(file_unique_id)
+                found[file_unique_id] = thumbnail
+                self.stats['memory_hits'] += 1
+            else:
+                missing.append(file_unique_id)
+        if missing and self.directory:
+            from_disk = await asyncio.to_thread(self._read_disk, missing)
+            for file_unique_id, thumbnail in from_disk.items():
+                self._remember(file_unique_id, thumbnail)
+                found[file_unique_id] = thumbnail
+            self.stats['disk_hits'] += len(from_disk)
+        return found
+
+    # ---------- Запросы к API ----------
+
+    @staticmethod
+    async def _lookup(bot: Bot, user_id: int) -> Tuple[int, bool, Optional[Any]]:
+        """(user_id, запрос успешен, PhotoSize для миниатюры или None - фото нет)"""
+        try:
+            photos = await bot.get_user_profile_photos(user_id, limit=1)
+        except Exception as e:
+            logger.debug(f"Не удалось получить фото профиля пользователя {user_id}: {e}")
+            return user_id, False, None
+        if not photos or photos.total_count == 0 or not photos.photos:
+            return user_id, True, None
+        sizes = photos.photos[0]
+        # Наименьший размер, из которого получается миниатюра без потери качества
+        suitable = [size for size in sizes if min(size.width, size.height) >= AVATAR_SIZE]
+        photo = min(suitable, key=lambda size: size.width * size.height) if suitable else sizes[-1]
+        return user_id, True, photo
+
+    @staticmethod
+    async def _download(bot: Bot, file_unique_id: str, file_id: str) -> Tuple[str, Optional[bytes]]:
+        try:
+            file = await bot.get_file(file_id)
+            data = await bot.download_file(file.file_path)
+            return file_unique_id, data.getvalue()
+        except Exception as e:
+            logger.debug(f"Не удалось скачать аватарку {file_unique_id}: {e}")
+            return file_unique_id, None
+
+    # ---------- Основной метод ----------
+
+    async def get_thumbnails(self, bot: Bot, user_ids: List[int]) -> Dict[int, bytes]:
+        """
+        Круглые миниатюры аватарок пользователей для render_top_chart.
+
+        Returns:
+            Dict[int, bytes]: user_id -> PNG миниатюры (пользователи без фото пропускаются)
+
+        Raises:
+            RenderError: пул рендеринга не смог создать новые миниатюры
+        """
+        now = time.time()
+        known: Dict[int, str] = {}
+        stale: List[int] = []
+        for user_id in user_ids:
+            entry = self._index.get(user_id)
+            if entry is None:
+                stale.append(user_id)
+            elif entry.file_unique_id is None:
+                if now - entry.checked_at < self.negative_ttl:
+                    self.stats['negative_hits'] += 1
+                else:
+                    stale.append(user_id)
+            elif now - entry.checked_at < self.ttl:
+                known[user_id] = entry.file_unique_id
+            else:
+                stale.append(user_id)
+
+        # Проверка устаревших записей: один запрос на пользователя
+        for user_id, ok, photo in await asyncio.gather(*(self._lookup(bot, user_id) for user_id in stale)):
+            if not ok:
+                self.stats['errors'] += 1
+                continue
+            previous = self._index.get(user_id)
+            if previous is not None:
+                self.stats['revalidations'] += 1
+            if photo is None:
+                self._index[user_id] = _AvatarEntry(None, None, now)
+                continue
+            if previous is not None and previous.file_unique_id == photo.file_unique_id:
+                self.stats['unchanged'] += 1
+            self._index[user_id] = _AvatarEntry(photo.file_unique_id, photo.file_id, now)
+            known[user_id] = photo.file_unique_id
+
+        thumbnails = await self._load_thumbnails(list(set(known.values())))
+
+        # Скачиваем только фото без готовой миниатюры
+        to_download = {
+            file_unique_id: self._index[user_id].file_id
+            for user_id, file_unique_id in known.items()
+            if file_unique_id not in thumbnails
+        }
+        if to_download:
+            files = {}
+            for file_unique_id, data in await asyncio.gather(
+                *(self._download(bot, file_unique_id, file_id) for file_unique_id, file_id in to_download.items())
+            ):
+                if data is None:
+                    self.stats['errors'] += 1
+                else:
+                    files[file_unique_id] = data
+            self.stats['downloads'] += len(files)
+            if files:
+                created = await render_service.run(make_avatar_thumbnails, files, AVATAR_SIZE)
+                for file_unique_id, thumbnail in created.items():
+                    self._remember(file_unique_id, thumbnail)
+                thumbnails.update(created)
+                await asyncio.to_thread(self._write_disk, created)
+
+        return {
+            user_id: thumbnails[file_unique_id]
+            for user_id, file_unique_id in known.items()
+            if file_unique_id in thumbnails
+        }
+
+    # ---------- Обслуживание ----------
+
+    def _prune_disk(self, cutoff: float) -> int:
+        removed = 0
+        if not self.directory or not os.path.isdir(self.directory):
+            return removed
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.png'):
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
+
+    async def prune(self) -> int:
+        """Удалить давно не проверявшиеся записи и не читавшиеся миниатюры. Возвращает число файлов"""
+        cutoff = time.time() - self.disk_max_age
+        for user_id in [user_id for user_id, entry in self._index.items() if entry.checked_at < cutoff]:
+            del self._index[user_id]
+        return await asyncio.to_thread(self._prune_disk, cutoff)
+
+    def snapshot(self) -> int:
+        """Сохранить индекс в JSON. Возвращает число записей"""
+        if not self.directory:
+            return 0
+        data = [
+            [user_id, entry.file_unique_id, entry.file_id, entry.checked_at]
+            for user_id, entry in self._index.items()
+        ]
+        path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'saved_at': time.time(), 'entries': data}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении индекса аватарок: {e}")
+            return 0
+        return len(data)
+
+    def restore(self) -> int:
+        """Загрузить индекс из JSON (записи старше ttl пропускаются). Возвращает число записей"""
+        if not self.directory:
+            return 0
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке индекса аватарок: {e}")
+            return 0
+        cutoff = time.time() - max(self.ttl, self.negative_ttl)
+        for user_id, file_unique_id, file_id, checked_at in data.get('entries', []):
+            if checked_at >= cutoff:
+                self._index[user_id] = _AvatarEntry(file_unique_id, file_id, checked_at)
+        return len(self._index)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кэша"""
+        return {
+            'users': len(self._index),
+            'thumbnails': len(self._thumbnails),
+            **self.stats,
+        }
+
+
+# Глобальный кэш аватарок
+avatar_cache = AvatarCache(**AVATAR_CACHE)
@@ -0,0 +1,198 @@
+"""
+Рассылка сообщений по чатам
+
+Отправляет параллельно несколькими воркерами; темп задает utils.rate_limiter
+(глобальный лимит Bot API и лимит на чат), рассылка идет в фоновой полосе.
+Статус доставки в каждый чат сохраняется пачками в broadcast_db, поэтому
+прерванная рассылка при повторном запуске продолжается с неотправленных чатов.
+Чаты, где бот исключен или которых больше нет, деактивируются одним запросом.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramForbiddenError,
+    TelegramMigrateToChat,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from databases.broadcast_db import (
+    STATUS_FAILED,
+    STATUS_GONE,
+    STATUS_SENT,
+    broadcast_db,
+    broadcast_key,
+)
+from databases.database import db
+from utils.rate_limiter import api_lane, LANE_BACKGROUND
+
+try:
+    from config import BROADCAST
+except ImportError:
+    BROADCAST = {'concurrency': 30, 'resume_hours': 6, 'max_attempts': 3}
+
+logger = logging.getLogger(__name__)
+
+# Ошибки BadRequest, после которых писать в чат больше некуда
+GONE_ERRORS = ('chat not found', 'group chat was deleted', 'bot was kicked', 'bot is not a member')
+
+# Результаты пишутся в БД пачками: не чаще раза в секунду или по накоплении
+SAVE_INTERVAL = 1.0
+SAVE_BATCH = 200
+PROGRESS_INTERVAL = 10.0
+
+
+def _is_gone(error: Exception) -> bool:
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    error_str = str(error).lower()
+    return any(marker in error_str for marker in GONE_ERRORS)
+
+
+async def _delete_after_delay(bot: Bot, chat_id: int, message_id: int, delay: int):
+    """Удаляет сообщение через указанное количество секунд"""
+    try:
+        await asyncio.sleep(delay)
+        with api_lane(LANE_BACKGROUND):
+            await bot.delete_message(chat_id=chat_id, message_id=message_id)
+        logger.debug(f"Сообщение удалено из чата {chat_id}")
+    except Exception as e:
+        # Игнорируем ошибки удаления (сообщение уже удалено, нет прав и т.д.)
+        logger.debug(f"Не удалось удалить сообщение из чата {chat_id}: {e}")
+
+
+async def broadcast(bot: Bot, chat_ids: List[int], text: str, parse_mode: Optional[str] = None,
+                    delete_after: int = None) -> Dict[str, Any]:
+    """
+    Разослать сообщение в чаты (или продолжить прерванную рассылку того же текста).
+
+    Returns:
+        Итоги: sent, failed, gone, migrated, skipped (уже доставлено ранее),
+        elapsed (сек) и rate (сообщений в секунду)
+    """
+    started = time.monotonic()
+    key = broadcast_key(text)
+    try:
+        await broadcast_db.init_db()
+        broadcast_id, pending, resumed = await broadcast_db.start_broadcast(
+            key, chat_ids, BROADCAST['resume_hours']
+        )
+    except Exception as e:
+        # Без сохранения состояния рассылка все равно должна уйти
+        logger.error(f"Не удалось сохранить состояние рассылки, отправка без возобновления: {e}")
+        broadcast_id, pending, resumed = None, list(chat_ids), False
+
+    summary = {
+        'sent': 0, 'failed': 0, 'gone': 0, 'migrated': 0,
+        'skipped': len(set(chat_ids)) - len(pending) if resumed else 0,
+    }
+    if resumed:
+        logger.info(
+            f"Продолжение прерванной рассылки {broadcast_id}: осталось {len(pending)} чатов, "
+            f"уже обработано {summary['skipped']}"
+        )
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for chat_id in pending:
+        queue.put_nowait(chat_id)
+
+    results: List[tuple] = []
+    gone_chats: List[int] = []
+    migrations: List[tuple] = []
+
+    async def save_results():
+        if broadcast_id is None or not results:
+            results.clear()
+            return
+        batch = results[:]
+        results.clear()
+        # Запись доводится до конца, даже если рассылку прервали во время нее
+        await asyncio.shield(broadcast_db.save_results(broadcast_id, batch))
+
+    async def send_to_chat(chat_id: int):
+        target_id = chat_id
+        for attempt in range(1, BROADCAST['max_attempts'] + 1):
+            try:
+                message = await bot.send_message(chat_id=target_id, text=text, parse_mode=parse_mode)
+            except TelegramRetryAfter as e:
+                # rate_limiter уже повторял запрос; ждем столько, сколько просит Telegram
+                if attempt == BROADCAST['max_attempts']:
+                    return STATUS_FAILED, None, str(e)
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramMigrateToChat as e:
+                migrations.append((target_id, e.migrate_to_chat_id))
+                target_id = e.migrate_to_chat_id
+                continue
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if attempt == BROADCAST['max_attempts']:
+                    return STATUS_FAILED, None, str(e)
+                await asyncio.sleep(attempt)
+                continue
+            except Exception as e:
+                if _is_gone(e):
+                    gone_chats.append(target_id)
+                    return STATUS_GONE, None, str(e)
+                logger.debug(f"Не удалось отправить сообщение рассылки в чат {target_id}: {e}")
+                return STATUS_FAILED, None, str(e)
+
+            if delete_after is not None and delete_after > 0:
+                asyncio.create_task(_delete_after_delay(bot, target_id, message.message_id, delete_after))
+            return STATUS_SENT, message.message_id, None
+        return STATUS_FAILED, None, 'attempts exhausted'
+
+    async def worker():
+        while True:
+            try:
+                chat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            status, message_id, error = await send_to_chat(chat_id)
+            summary[status] += 1
+            results.append((chat_id, status, message_id, error))
+            if len(results) >= SAVE_BATCH:
+                await save_results()
+
+    async def reporter():
+        last_progress = time.monotonic()
+        while True:
+            await asyncio.sleep(SAVE_INTERVAL)
+            await save_results()
+            now = time.monotonic()
+            if now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                done = summary['sent'] + summary['failed'] + summary['gone']
+                logger.info(
+                    f"Рассылка: {done}/{len(pending)} чатов, "
+                    f"{summary['sent'] / (now - started):.1f} сообщений/сек"
+                )
+
+    workers_count = max(1, min(BROADCAST['concurrency'], len(pending)))
+    reporter_task = asyncio.create_task(reporter())
+    try:
+        # Рассылка уступает модерации и ответам пользователям
+        with api_lane(LANE_BACKGROUND):
+            await asyncio.gather(*[worker() for _ in range(workers_count)])
+    finally:
+        reporter_task.cancel()
+        # Сохраняем накопленное и при прерывании: следующий запуск продолжит с этого места,
+        # а уже обработанные чаты в него не попадут
+        await save_results()
+        if gone_chats:
+            await db.deactivate_chats(gone_chats)
+        for old_chat_id, new_chat_id in migrations:
+            await db.update_chat_id(old_chat_id, new_chat_id)
+
+    summary['migrated'] = len(migrations)
+    if broadcast_id is not None:
+        await broadcast_db.finish_broadcast(broadcast_id)
+
+    elapsed = time.monotonic() - started
+    summary['elapsed'] = round(elapsed, 2)
+    summary['rate'] = round(summary['sent'] / elapsed, 2) if elapsed > 0 else 0.0
+    return summary
@@ -0,0 +1,111 @@
+"""
+Кэш готовых графиков топа по file_id Telegram
+
+Когда данные не менялись (несколько участников подряд вызвали /top, период
+/topall не сдвинулся), график заново рисовался и загружался в Telegram.
+ChartCache хранит file_id фото, полученный при первой отправке, и при том же
+содержимом график отправляется повторно по file_id - без рендеринга и
+загрузки.
+
+Запись одна на (чат, период, часовой пояс): в ней хеш содержимого графика
+(упорядоченный список пользователей с числом сообщений и подписями,
+заголовок, подзаголовок). Если числа сдвинулись, хеш не совпадает - запись
+считается устаревшей и заменяется после новой отправки. Размер ограничен
+(LRU), а записи старше max_age перерисовываются, чтобы подтянуть новые
+аватарки.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    from config import CHART_CACHE
+except ImportError:
+    CHART_CACHE = {'max_size': 256, 'max_age': 3600}
+
+logger = logging.getLogger(__name__)
+
+
+class ChartKey(NamedTuple):
+    """Ключ графика: ячейка кэша и хеш содержимого"""
+    slot: Tuple[int, str, int]
+    digest: str
+
+
+class ChartCache:
+    """LRU file_id отправленных графиков топа"""
+
+    def __init__(self, max_size: int = 256, max_age: float = 3600):
+        self.max_size = max_size
+        self.max_age = max_age
+        # (chat_id, период, часовой пояс) -> (хеш, file_id, время записи)
+        self._entries: "OrderedDict[Tuple[int, str, int], tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.rejected = 0
+
+    @staticmethod
+    def make_key(chat_id: int, period: str, top_users: List[Dict[str, Any]], title: str, subtitle: str,
+                 timezone: int = 0) -> ChartKey:
+        """
+        Ключ графика.
+
+        Args:
+            period: период статистики ("day:2025-01-31", "days:60")
+            top_users: пользователи в порядке графика (только отображаемые)
+        """
+        content = [
+            title, subtitle,
+            [[user['user_id'], user['message_count'], user.get('first_name'), user.get('username')]
+             for user in top_users],
+        ]
+        digest = hashlib.sha1(json.dumps(content, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return ChartKey((chat_id, period, timezone), digest)
+
+    def get(self, key: ChartKey) -> Optional[str]:
+        """file_id графика с тем же содержимым (None - нужно рисовать)"""
+        entry = self._entries.get(key.slot)
+        if entry is not None:
+            digest, file_id, stored_at = entry
+            if digest == key.digest and time.monotonic() - stored_at < self.max_age:
+                self._entries.move_to_end(key.slot)
+                self.hits += 1
+                return file_id
+            # Числа сдвинулись или запись устарела
+            del self._entries[key.slot]
+            self.invalidations += 1
+        self.misses += 1
+        return None
+
+    def put(self, key: ChartKey, file_id: str):
+        """Запомнить file_id отправленного графика"""
+        self._entries[key.slot] = (key.digest, file_id, time.monotonic())
+        self._entries.move_to_end(key.slot)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def reject(self, key: ChartKey):
+        """Отправка по file_id не удалась - удалить запись"""
+        if self._entries.pop(key.slot, None) is not None:
+            self.rejected += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кэша"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'invalidations': self.invalidations,
+            'rejected': self.rejected,
+        }
+
+
+# Глобальный кэш графиков топа
+chart_cache = ChartCache(**CHART_CACHE)
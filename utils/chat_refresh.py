@@ -0,0 +1,161 @@
+"""
+Планировщик обновления информации о чатах
+
+Раньше update_chat_info_task раз в минуту вызывал update_chat_info_if_needed
+для каждого чата (get_chat, get_chat_member_count, get_chat_member и запись в БД).
+ChatRefreshScheduler выбирает, какие чаты обновить на очередном шаге:
+- сначала чаты с событиями (my_chat_member, смена названия или фото);
+- затем по «устареванию»: возраст последнего обновления, умноженный на вес
+  активности (сообщения и вход/выход участников с прошлого обновления);
+- не больше, чем позволяет бюджет запросов к API в минуту.
+Снимок сохраненных полей чата позволяет не писать в БД, если ничего не изменилось.
+"""
+import logging
+import math
+import time
+from typing import Any, Dict, Iterable, List
+
+try:
+    from config import CHAT_REFRESH
+except ImportError:
+    CHAT_REFRESH = {'api_calls_per_minute': 60, 'min_interval': 600, 'max_age': 21600}
+
+logger = logging.getLogger(__name__)
+
+# Запросов к API на одно обновление: get_chat, get_chat_member_count, get_chat_member (часто из кэша)
+CALLS_PER_REFRESH = 3
+
+# Вес входа/выхода участника в активности чата (меняется member_count)
+MEMBERSHIP_WEIGHT = 20
+
+# Поля update_chat_info, которые сравниваются со снимком
+SNAPSHOT_FIELDS = ('title', 'chat_type', 'member_count', 'is_public', 'username', 'invite_link')
+
+
+class ChatRefreshScheduler:
+    """Очередь обновления информации о чатах с бюджетом запросов"""
+
+    def __init__(self, api_calls_per_minute: int = 60, min_interval: float = 600, max_age: float = 21600):
+        self.api_calls_per_minute = api_calls_per_minute
+        # Чат без событий не обновляется чаще min_interval секунд
+        self.min_interval = min_interval
+        # Возраст чата, еще не обновлявшегося с запуска бота
+        self.max_age = max_age
+        # chat_id -> момент последнего обновления (time.monotonic)
+        self._refreshed_at: Dict[int, float] = {}
+        # chat_id -> активность с последнего обновления
+        self._activity: Dict[int, int] = {}
+        # Чаты с событиями, в порядке поступления
+        self._dirty: Dict[int, None] = {}
+        # chat_id -> сохраненные в БД значения полей
+        self._snapshots: Dict[int, Dict[str, Any]] = {}
+        self.refreshes = 0
+        self.writes_skipped = 0
+
+    # ---------- События ----------
+
+    def mark_dirty(self, chat_id: int):
+        """Обновить чат на ближайшем шаге (изменились название, фото или статус бота)"""
+        self._dirty[chat_id] = None
+
+    def note_activity(self, chat_id: int, weight: int = 1):
+        """Учесть активность чата (сообщение, вход или выход участника)"""
+        self._activity[chat_id] = self._activity.get(chat_id, 0) + weight
+
+    def forget(self, chat_id: int):
+        """Чат деактивирован или удален"""
+        self._refreshed_at.pop(chat_id, None)
+        self._activity.pop(chat_id, None)
+        self._dirty.pop(chat_id, None)
+        self._snapshots.pop(chat_id, None)
+
+    # ---------- Снимки ----------
+
+    def sync_chats(self, chats: Iterable[Dict[str, Any]]):
+        """Обновить снимки из строк Database.get_all_chats_for_update и убрать неактивные чаты"""
+        active = set()
+        for chat in chats:
+            chat_id = chat['chat_id']
+            active.add(chat_id)
+            self._snapshots[chat_id] = {
+                'title': chat.get('chat_title'),
+                'chat_type': chat.get('chat_type'),
+                'member_count': chat.get('member_count'),
+                'is_public': chat.get('is_public'),
+                'username': chat.get('username'),
+                'invite_link': chat.get('invite_link'),
+            }
+        for chat_id in [chat_id for chat_id in self._snapshots if chat_id not in active]:
+            self.forget(chat_id)
+
+    def is_changed(self, chat_id: int, params: Dict[str, Any]) -> bool:
+        """Отличаются ли переданные (не None) поля от сохраненных в БД"""
+        snapshot = self._snapshots.get(chat_id)
+        if snapshot is None:
+            return True
+        for field in SNAPSHOT_FIELDS:
+            value = params.get(field)
+            if value is None:
+                continue
+            stored = snapshot.get(field)
+            if field == 'is_public':
+                stored = None if stored is None else bool(stored)
+            if value != stored:
+                return True
+        return False
+
+    def mark_refreshed(self, chat_id: int, params: Dict[str, Any], written: bool):
+        """Чат обновлен: сбросить активность и запомнить сохраненные значения"""
+        self._refreshed_at[chat_id] = time.monotonic()
+        self._activity.pop(chat_id, None)
+        self._dirty.pop(chat_id, None)
+        self.refreshes += 1
+        if not written:
+            self.writes_skipped += 1
+        snapshot = self._snapshots.setdefault(chat_id, {})
+        for field in SNAPSHOT_FIELDS:
+            if params.get(field) is not None:
+                snapshot[field] = params[field]
+
+    # ---------- Выбор чатов ----------
+
+    def staleness(self, chat_id: int, now: float) -> float:
+        """Возраст последнего обновления, взвешенный по активности"""
+        refreshed_at = self._refreshed_at.get(chat_id)
+        age = self.max_age if refreshed_at is None else now - refreshed_at
+        return age * (1 + math.log2(1 + self._activity.get(chat_id, 0)))
+
+    def pick(self, chat_ids: Iterable[int], interval: float = 60) -> List[int]:
+        """Чаты для обновления на шаге длиной interval секунд в пределах бюджета"""
+        limit = max(1, int(self.api_calls_per_minute * interval / 60) // CALLS_PER_REFRESH)
+        known = set(chat_ids)
+        selected = [chat_id for chat_id in self._dirty if chat_id in known][:limit]
+        if len(selected) >= limit:
+            return selected
+
+        now = time.monotonic()
+        chosen = set(selected)
+        candidates = []
+        for chat_id in known:
+            if chat_id in chosen:
+                continue
+            refreshed_at = self._refreshed_at.get(chat_id)
+            if refreshed_at is not None and now - refreshed_at < self.min_interval:
+                continue
+            candidates.append((self.staleness(chat_id, now), chat_id))
+        candidates.sort(reverse=True)
+        selected.extend(chat_id for _, chat_id in candidates[:limit - len(selected)])
+        return selected
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики планировщика"""
+        return {
+            'tracked': len(self._snapshots),
+            'dirty': len(self._dirty),
+            'refreshes': self.refreshes,
+            'writes_skipped': self.writes_skipped,
+        }
+
+
+# Глобальный планировщик обновления чатов
+chat_refresh = ChatRefreshScheduler(**CHAT_REFRESH)
@@ -0,0 +1,116 @@
+"""
+Пакетное удаление сообщений
+
+Во время рейда сообщения удалялись по одному запросу delete_message на
+сообщение. MessageDeleteQueue копит id по чатам DELETE_DELAY секунд и
+удаляет их одним delete_messages (до 100 id за запрос); при ошибке пакета
+сообщения удаляются по одному. Запросы идут через utils.rate_limiter
+в полосе модерации.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from aiogram import Bot
+
+from utils.rate_limiter import api_lane, LANE_MODERATION
+
+logger = logging.getLogger(__name__)
+
+# Сколько копить id перед отправкой пакета, секунд
+DELETE_DELAY = 0.3
+
+# Ограничение Bot API на число сообщений в одном deleteMessages
+MAX_BATCH = 100
+
+
+class MessageDeleteQueue:
+    """Очередь удаления сообщений с объединением в пакеты по чатам"""
+
+    def __init__(self, delay: float = DELETE_DELAY):
+        self.delay = delay
+        self.bot: Optional[Bot] = None
+        # chat_id -> id сообщений, ожидающих удаления (порядок добавления)
+        self._pending: Dict[int, Dict[int, None]] = {}
+        self._flush_tasks: Dict[int, asyncio.Task] = {}
+        self.requested = 0
+        self.batches = 0
+        self.single_fallbacks = 0
+
+    def set_bot(self, bot: Bot):
+        """Установить бота для удаления сообщений"""
+        self.bot = bot
+
+    def schedule(self, chat_id: int, message_ids: Iterable[int]):
+        """Поставить сообщения в очередь на удаление (не ждет выполнения)"""
+        pending = self._pending.setdefault(chat_id, {})
+        for message_id in message_ids:
+            if message_id not in pending:
+                pending[message_id] = None
+                self.requested += 1
+        if not pending:
+            del self._pending[chat_id]
+            return
+
+        task = self._flush_tasks.get(chat_id)
+        if len(pending) >= MAX_BATCH:
+            # Полный пакет отправляем сразу; ожидающая задача заберет остаток
+            self._start_flush(chat_id, delay=0)
+        elif task is None or task.done():
+            self._start_flush(chat_id, delay=self.delay)
+
+    def _start_flush(self, chat_id: int, delay: float):
+        task = self._flush_tasks.get(chat_id)
+        if task is not None and not task.done() and delay > 0:
+            return
+        self._flush_tasks[chat_id] = asyncio.create_task(self._flush_after(chat_id, delay))
+
+    async def _flush_after(self, chat_id: int, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        while True:
+            pending = self._pending.get(chat_id)
+            if not pending:
+                self._pending.pop(chat_id, None)
+                if self._flush_tasks.get(chat_id) is asyncio.current_task():
+                    del self._flush_tasks[chat_id]
+                return
+            batch = list(pending)[:MAX_BATCH]
+            for message_id in batch:
+                del pending[message_id]
+            await self._delete_batch(chat_id, batch)
+
+    async def _delete_batch(self, chat_id: int, message_ids: List[int]):
+        if not self.bot:
+            logger.error("Bot instance not set in delete queue")
+            return
+        with api_lane(LANE_MODERATION):
+            if len(message_ids) > 1:
+                try:
+                    await self.bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
+                    self.batches += 1
+                    logger.info(f"Удалено пакетом {len(message_ids)} сообщений в чате {chat_id}")
+                    return
+                except Exception as e:
+                    logger.warning(f"Пакетное удаление {len(message_ids)} сообщений в чате {chat_id} не удалось, удаляем по одному: {e}")
+                    self.single_fallbacks += 1
+
+            for message_id in message_ids:
+                try:
+                    await self.bot.delete_message(chat_id=chat_id, message_id=message_id)
+                    logger.info(f"Сообщение {message_id} удалено в чате {chat_id}")
+                except Exception as e:
+                    logger.error(f"Ошибка при удалении сообщения {message_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики очереди"""
+        return {
+            'pending': sum(len(pending) for pending in self._pending.values()),
+            'requested': self.requested,
+            'batches': self.batches,
+            'single_fallbacks': self.single_fallbacks,
+        }
+
+
+# Глобальная очередь удаления сообщений
+delete_queue = MessageDeleteQueue()
@@ -0,0 +1,180 @@
+"""
+Реестр шрифтов для генерации изображений
+
+Раньше каждый вызов _load_cyrillic_font обходил каталоги шрифтов и мог
+запускать fc-match, а график топа загружал шрифт шесть раз. FontRegistry
+находит файл шрифта с кириллицей один раз (resolve при запуске бота, до
+создания процессов рендеринга) и хранит объекты FreeTypeFont по
+(начертание, размер) в LRU. Путь к шрифту можно закрепить в конфиге
+(FONTS['path'] / FONT_PATH) - тогда поиск не выполняется вовсе.
+"""
+import logging
+import os
+import platform
+import subprocess
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import ImageFont
+
+try:
+    from config import FONTS
+except ImportError:
+    FONTS = {'path': None, 'cache_size': 32}
+
+logger = logging.getLogger(__name__)
+
+FACE_REGULAR = 'regular'
+
+# Локальный шрифт проекта (Noto Sans) - проверяется первым
+LOCAL_FONT_PATH = os.path.join("data", "fonts", "NotoSans-Regular.ttf")
+
+# Шрифты для проверки (в порядке приоритета)
+FONT_NAMES = [
+    "DejaVuSans",
+    "DejaVu Sans",
+    "LiberationSans-Regular",
+    "Liberation Sans",
+    "arial",
+    "Arial",
+    "Tahoma",
+    "tahoma",
+]
+
+FONT_EXTENSIONS = [".ttf", ".TTF"]
+
+
+def _font_dirs() -> List[str]:
+    """Системные каталоги шрифтов для текущей платформы"""
+    system = platform.system()
+    if system == "Windows":
+        return [os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts")]
+    if system == "Linux":
+        return [
+            "/usr/share/fonts/truetype/dejavu",
+            "/usr/share/fonts/truetype/liberation",
+            "/usr/share/fonts/TTF",
+            "/usr/share/fonts/truetype",
+            "/usr/local/share/fonts",
+            os.path.expanduser("~/.fonts"),
+        ]
+    return []
+
+
+def _can_load(path: str) -> bool:
+    try:
+        ImageFont.truetype(path, 12)
+        return True
+    except Exception as e:
+        logger.debug(f"Не удалось загрузить шрифт {path}: {e}")
+        return False
+
+
+def find_cyrillic_font() -> Optional[str]:
+    """
+    Найти файл шрифта с поддержкой кириллицы (Windows и Linux).
+
+    Обходит каталоги шрифтов и при необходимости вызывает fc-match, поэтому
+    вызывается один раз - из FontRegistry.resolve.
+    """
+    if os.path.exists(LOCAL_FONT_PATH) and _can_load(LOCAL_FONT_PATH):
+        return LOCAL_FONT_PATH
+
+    font_dirs = [font_dir for font_dir in _font_dirs() if os.path.exists(font_dir)]
+    for font_name in FONT_NAMES:
+        for font_dir in font_dirs:
+            for ext in FONT_EXTENSIONS:
+                # Пробуем разные варианты имени файла
+                for name in (
+                    f"{font_name}{ext}",
+                    f"{font_name.replace(' ', '')}{ext}",
+                    f"{font_name.replace(' ', '-')}{ext}",
+                ):
+                    font_path = os.path.join(font_dir, name)
+                    if os.path.exists(font_path) and _can_load(font_path):
+                        return font_path
+
+        # Имя без пути (PIL может найти системный шрифт сам)
+        if _can_load(font_name):
+            return font_name
+
+    # Любой доступный шрифт через fontconfig (Linux)
+    if platform.system() == "Linux":
+        try:
+            result = subprocess.run(
+                ["fc-match", "DejaVu Sans:style=Regular", "-f", "%{file}"],
+                capture_output=True,
+                text=True,
+                timeout=2
+            )
+            font_file = result.stdout.strip()
+            if result.returncode == 0 and font_file and os.path.exists(font_file) and _can_load(font_file):
+                return font_file
+        except Exception:
+            pass
+    return None
+
+
+class FontRegistry:
+    """Файлы шрифтов, найденные один раз, и LRU загруженных шрифтов по (начертание, размер)"""
+
+    def __init__(self, path: Optional[str] = None, cache_size: int = 32):
+        # Закрепленный в конфиге путь к шрифту обычного начертания
+        self.pinned_path = path
+        self.cache_size = cache_size
+        # Начертание -> файл шрифта (None - не найден, используется шрифт Pillow по умолчанию)
+        self._paths: Dict[str, Optional[str]] = {}
+        self._fonts: "OrderedDict[Tuple[str, int], ImageFont.ImageFont]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, face: str = FACE_REGULAR) -> Optional[str]:
+        """Найти файл шрифта начертания (поиск выполняется один раз)"""
+        if face in self._paths:
+            return self._paths[face]
+        path = None
+        if self.pinned_path:
+            if _can_load(self.pinned_path):
+                path = self.pinned_path
+            else:
+                logger.error(f"Шрифт из конфигурации {self.pinned_path} не загружается, ищем системный")
+        if path is None:
+            path = find_cyrillic_font()
+        if path is None:
+            logger.warning(
+                "Не удалось найти шрифт с поддержкой кириллицы (DejaVu Sans, Liberation Sans, Arial, Tahoma). "
+                "Используется шрифт Pillow по умолчанию; задайте FONT_PATH"
+            )
+        self._paths[face] = path
+        return path
+
+    def get(self, size: int, face: str = FACE_REGULAR) -> ImageFont.ImageFont:
+        """Шрифт заданного размера (из LRU или загруженный из найденного файла)"""
+        key = (face, size)
+        font = self._fonts.get(key)
+        if font is not None:
+            self._fonts.move_to_end(key)
+            self.hits += 1
+            return font
+        self.misses += 1
+        path = self.resolve(face)
+        font = None
+        if path is not None:
+            try:
+                font = ImageFont.truetype(path, size)
+            except Exception as e:
+                logger.error(f"Ошибка загрузки шрифта {path} размера {size}: {e}")
+        if font is None:
+            font = ImageFont.load_default(size)
+        self._fonts[key] = font
+        while len(self._fonts) > self.cache_size:
+            self._fonts.popitem(last=False)
+        return font
+
+    def get_stats(self) -> Dict[str, int]:
+        """Метрики LRU шрифтов (в текущем процессе)"""
+        return {'fonts': len(self._fonts), 'hits': self.hits, 'misses': self.misses}
+
+
+# Глобальный реестр шрифтов (в каждом процессе рендеринга - своя копия LRU)
+font_registry = FontRegistry(**FONTS)
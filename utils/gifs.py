@@ -10,6 +10,8 @@ from typing import Optional, Tuple
 from aiogram.types import Message, BufferedInputFile
 from aiogram.enums import ParseMode
 
+from databases.settings_cache import chat_settings_cache
+
 logger = logging.getLogger(__name__)
 
 # Путь к файлу настроек гифок
@@ -95,6 +97,7 @@ def set_gifs_enabled(chat_id: int, enabled: bool) -> bool:
         with open(GIFS_SETTINGS_PATH, 'w', encoding='utf-8') as f:
             json.dump(settings, f, ensure_ascii=False, indent=2)
         
+        chat_settings_cache.invalidate(chat_id)
         return True
         
     except Exception as e:
@@ -179,7 +182,8 @@ async def send_message_with_gif(message: Message, text: str, command_name: str,
         # Исключение: приветственное сообщение (welcome) всегда отправляется с гифкой
         chat_id = message.chat.id
         if message.chat.type in ['group', 'supergroup'] and command_name != "welcome":
-            if not get_gifs_enabled(chat_id):
+            chat_settings = await chat_settings_cache.get(chat_id)
+            if not chat_settings.gifs_enabled:
                 # Гифки выключены - отправляем только текст
                 await message.answer(text, parse_mode=parse_mode, reply_markup=reply_markup)
                 return
@@ -3,170 +3,201 @@
 """
 from datetime import datetime, timedelta
 from io import BytesIO
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, NamedTuple, Tuple
 from PIL import Image, ImageDraw, ImageFont
 import colorsys
-import os
-import platform
 import logging
 
+from utils.font_registry import font_registry
+
 logger = logging.getLogger(__name__)
 
 
-def _load_cyrillic_font(size: int) -> ImageFont.FreeTypeFont:
-    """
-    Загружает шрифт с поддержкой кириллицы, доступный на Windows и Linux
+# Фон графиков
+BACKGROUND_COLOR = '#2D3748'
+
+# Форматы вывода: формат Pillow, расширение файла
+OUTPUT_FORMATS = {
+    'png': ('PNG', 'png'),
+    'webp': ('WEBP', 'webp'),  # без потерь
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+# Уровни разрешения: масштаб относительно исходного размера (2880 px по ширине)
+RESOLUTION_TIERS = {
+    'full': 1.0,
+    'hd': 2 / 3,  # 1920 px
+    'compact': 0.5,  # 1440 px
+}
+
+
+class OutputProfile(NamedTuple):
+    """Профиль кодирования графиков"""
+    format: str = 'png'
+    resolution: str = 'full'
+    jpeg_quality: int = 92
+    png_compress_level: int = 6
+
+    @property
+    def extension(self) -> str:
+        return OUTPUT_FORMATS[self.format][1]
+
+
+DEFAULT_OUTPUT = OutputProfile()
+
+
+def make_output_profile(settings: Dict[str, Any]) -> OutputProfile:
+    """Профиль из настроек (неизвестные формат и разрешение заменяются исходными)"""
+    output_format = str(settings.get('format', 'png')).lower()
+    if output_format not in OUTPUT_FORMATS:
+        logger.warning(f"Неизвестный формат графиков {output_format}, используется png")
+        output_format = 'png'
+    resolution = str(settings.get('resolution', 'full')).lower()
+    if resolution not in RESOLUTION_TIERS:
+        logger.warning(f"Неизвестное разрешение графиков {resolution}, используется full")
+        resolution = 'full'
+    return OutputProfile(
+        output_format, resolution,
+        int(settings.get('jpeg_quality', 92)), int(settings.get('png_compress_level', 6))
+    )
+
+
+def _encode(image: Image.Image, output: OutputProfile) -> bytes:
+    """Масштабировать изображение по уровню разрешения и закодировать по профилю"""
+    scale = RESOLUTION_TIERS[output.resolution]
+    if scale != 1.0:
+        if scale == 0.5:
+            image = image.reduce(2)
+        else:
+            # BOX (усреднение по площади) - быстрее LANCZOS, а график из плоских
+            # заливок после него сжимается лучше
+            size = (round(image.width * scale), round(image.height * scale))
+            image = image.resize(size, Image.Resampling.BOX)
+    buf = BytesIO()
+    if output.format == 'jpeg':
+        # 4:4:4 без прореживания цвета - тонкие линии и текст остаются четкими
+        image.save(buf, format='JPEG', quality=output.jpeg_quality, subsampling=0)
+    elif output.format == 'webp':
+        # Минимальные усилия кодера, при которых WebP без потерь еще меньше PNG
+        image.save(buf, format='WEBP', lossless=True, quality=0, method=1)
+    else:
+        image.save(buf, format='PNG', compress_level=output.png_compress_level)
+    return buf.getvalue()
+
+# Статичные слои (фон, кружки в углах, водяной знак) по (ширина, высота, кружки);
+# в каждом процессе рендеринга свои
+_base_layers: Dict[Tuple[int, int, bool], Image.Image] = {}
+
+
+def _draw_corner_circles(image: Image.Image):
+    """Декоративные полупрозрачные кружки в углах изображения (вылезающие из углов)"""
+    width, height = image.size
+    circle_radius = 20  # Радиус декоративных кружков (увеличен для большего размера)
+    circle_alpha = 100  # Прозрачность (0-255, где 255 полностью непрозрачный)
+    circle_color_rgb = (220, 221, 223)  # Светлый цвет (RGB)
     
-    Args:
-        size: Размер шрифта
-        
-    Returns:
-        ImageFont.FreeTypeFont: Загруженный шрифт
-        
-    Raises:
-        OSError: Если не удалось найти ни один подходящий шрифт
-    """
-    # Список шрифтов для проверки (в порядке приоритета)
-    font_names = [
-        "DejaVuSans",
-        "DejaVu Sans",
-        "LiberationSans-Regular",
-        "Liberation Sans",
-        "arial",
-        "Arial",
-        "Tahoma",
-        "tahoma",
-    ]
+    # Создаем временное RGBA изображение для круга
+    circle_size = circle_radius * 2 + 2  # Немного больше для краев
+    circle_img = Image.new('RGBA', (circle_size, circle_size), (0, 0, 0, 0))
+    circle_draw = ImageDraw.Draw(circle_img)
     
-    # Расширения файлов шрифтов
-    font_extensions = [".ttf", ".TTF"]
-    
-    # Определяем платформу и пути к шрифтам
-    system = platform.system()
-    font_paths = []
-    
-    if system == "Windows":
-        # Windows системные шрифты
-        windows_font_dir = os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts")
-        font_paths.append(windows_font_dir)
-    elif system == "Linux":
-        # Linux системные шрифты
-        font_paths.extend([
-            "/usr/share/fonts/truetype/dejavu",
-            "/usr/share/fonts/truetype/liberation",
-            "/usr/share/fonts/TTF",
-            "/usr/share/fonts/truetype",
-            "/usr/local/share/fonts",
-            os.path.expanduser("~/.fonts"),
-        ])
-    
-    # Также проверяем локальный путь (Noto Sans)
-    local_font_path = "data/fonts/NotoSans-Regular.ttf"
-    if os.path.exists(local_font_path):
-        try:
-            return ImageFont.truetype(local_font_path, size)
-        except Exception:
-            pass
+    # Рисуем круг с альфа-каналом
+    circle_draw.ellipse([
+        1, 1,
+        circle_size - 1, circle_size - 1
+    ], fill=(*circle_color_rgb, circle_alpha))
     
-    # Перебираем шрифты и пути
-    for font_name in font_names:
-        for font_path_dir in font_paths:
-            if not os.path.exists(font_path_dir):
-                continue
-                
-            for ext in font_extensions:
-                # Пробуем разные варианты имени файла
-                possible_names = [
-                    f"{font_name}{ext}",
-                    f"{font_name.replace(' ', '')}{ext}",
-                    f"{font_name.replace(' ', '-')}{ext}",
-                ]
-                
-                for name in possible_names:
-                    font_path = os.path.join(font_path_dir, name)
-                    if os.path.exists(font_path):
-                        try:
-                            return ImageFont.truetype(font_path, size)
-                        except Exception as e:
-                            logger.debug(f"Не удалось загрузить шрифт {font_path}: {e}")
-                            continue
-        
-        # Также пробуем прямой путь без расширения (для PIL, который может найти системный шрифт)
-        try:
-            return ImageFont.truetype(font_name, size)
-        except Exception:
-            continue
+    # Левый верхний угол изображения (круг вылезает из угла)
+    # Центр круга в углу (0, 0), круг частично выходит за границы изображения
+    paste_x = -circle_radius
+    paste_y = -circle_radius
+    image.paste(circle_img, (paste_x, paste_y), circle_img)
     
-    # Если ничего не найдено, пробуем найти любой доступный шрифт через fontconfig (Linux)
-    if system == "Linux":
-        try:
-            import subprocess
-            result = subprocess.run(
-                ["fc-match", "DejaVu Sans:style=Regular", "-f", "%{file}"],
-                capture_output=True,
-                text=True,
-                timeout=2
-            )
-            if result.returncode == 0 and result.stdout.strip():
-                font_file = result.stdout.strip()
-                if os.path.exists(font_file):
-                    return ImageFont.truetype(font_file, size)
-        except Exception:
-            pass
+    # Правый верхний угол изображения (круг вылезает из угла)
+    # Центр круга в углу (width, 0), круг частично выходит за границы изображения
+    paste_x = width - circle_radius
+    paste_y = -circle_radius
+    image.paste(circle_img, (paste_x, paste_y), circle_img)
     
-    # Если ничего не сработало, генерируем ошибку
-    raise OSError(
-        f"Не удалось найти шрифт с поддержкой кириллицы. "
-        f"Проверьте наличие DejaVu Sans, Liberation Sans, Arial или Tahoma в системе."
-    )
+    # Левый нижний угол изображения (круг вылезает из угла)
+    # Центр круга в углу (0, height), круг частично выходит за границы изображения
+    paste_x = -circle_radius
+    paste_y = height - circle_radius
+    image.paste(circle_img, (paste_x, paste_y), circle_img)
+    
+    # Правый нижний угол изображения (круг вылезает из угла)
+    # Центр круга в углу (width, height), круг частично выходит за границы изображения
+    paste_x = width - circle_radius
+    paste_y = height - circle_radius
+    image.paste(circle_img, (paste_x, paste_y), circle_img)
+
+
+def _base_layer(width: int, height: int, corner_circles: bool) -> Image.Image:
+    """
+    Копия статичного слоя графика: фон, кружки в углах и водяной знак.
+    
+    Слой рисуется один раз на процесс; каждый график рисует поверх копии
+    только данные (заголовок, сетку, столбцы, подписи, аватарки).
+    """
+    key = (width, height, corner_circles)
+    base = _base_layers.get(key)
+    if base is None:
+        image = Image.new('RGB', (width, height), BACKGROUND_COLOR)
+        draw = ImageDraw.Draw(image)
+        
+        if corner_circles:
+            _draw_corner_circles(image)
+        
+        # Добавляем полупрозрачный текст в правом нижнем углу
+        watermark_text = "pixel-ut.pro"
+        watermark_font = font_registry.get(18)
+        
+        watermark_bbox = draw.textbbox((0, 0), watermark_text, font=watermark_font)
+        watermark_width = watermark_bbox[2] - watermark_bbox[0]
+        watermark_height = watermark_bbox[3] - watermark_bbox[1]
+        
+        # Позиция в правом нижнем углу с отступом
+        watermark_x = width - watermark_width - 30
+        watermark_y = height - watermark_height - 30
+        
+        # Полупрозрачный цвет (30% непрозрачности = 70% прозрачности)
+        # Смешиваем #FAFAFA (30%) с #333B45 (70%)
+        # R: 51 * 0.7 + 250 * 0.3 = 35.7 + 75 = 110.7 ≈ 111 = 6F
+        # G: 59 * 0.7 + 250 * 0.3 = 41.3 + 75 = 116.3 ≈ 116 = 74
+        # B: 69 * 0.7 + 250 * 0.3 = 48.3 + 75 = 123.3 ≈ 123 = 7B
+        watermark_color = '#6F747B'
+        draw.text((watermark_x, watermark_y), watermark_text, fill=watermark_color, font=watermark_font)
+        base = _base_layers[key] = image
+    return base.copy()
 
 
-def generate_modern_profile_card(
-    user_data: Dict[str, Any],
-    monthly_stats: List[Dict[str, Any]],
-    avatar_path: Optional[str] = None
-) -> BytesIO:
+def render_profile_card(monthly_stats: List[Dict[str, Any]], output: OutputProfile = DEFAULT_OUTPUT) -> bytes:
     """
     Генерация графика профиля пользователя за месяц
     
+    Выполняется в процессе рендеринга (utils.render_service), принимает
+    только простые данные.
+    
     Args:
-        user_data: Данные пользователя (не используется)
         monthly_stats: Статистика за 30 дней
-        avatar_path: Путь к файлу аватарки (не используется)
+        output: Профиль кодирования
     
     Returns:
-        BytesIO: Буфер с изображением PNG
+        bytes: Изображение в формате профиля
     """
     # Размеры графика в ультра-широком формате 
     width, height = 2880, 960  
     padding = 120  
     
-    # Создаем основное изображение с темно-серым фоном с легким синеватым оттенком
-    image = Image.new('RGB', (width, height), '#2D3748')
+    # Основное изображение - копия статичного слоя (фон и водяной знак)
+    image = _base_layer(width, height, corner_circles=False)
     draw = ImageDraw.Draw(image)
     
-    # Загружаем шрифты (с поддержкой кириллицы)
-    try:
-        font_title = _load_cyrillic_font(32)
-        font_medium = _load_cyrillic_font(20)
-        font_small = _load_cyrillic_font(16)
-        font_tiny = _load_cyrillic_font(14)
-    except OSError as e:
-        logger.error(f"Ошибка загрузки шрифта с поддержкой кириллицы: {e}")
-        # В критическом случае пробуем загрузить через PIL напрямую
-        # но это может не поддерживать кириллицу
-        try:
-            font_title = ImageFont.truetype("arial.ttf", 32)
-            font_medium = ImageFont.truetype("arial.ttf", 20)
-            font_small = ImageFont.truetype("arial.ttf", 16)
-            font_tiny = ImageFont.truetype("arial.ttf", 14)
-        except Exception:
-            # Последняя попытка - но это может не работать с кириллицей
-            logger.warning("Используется запасной шрифт, кириллица может отображаться некорректно")
-            font_title = ImageFont.load_default()
-            font_medium = ImageFont.load_default()
-            font_small = ImageFont.load_default()
-            font_tiny = ImageFont.load_default()
+    # Шрифты с поддержкой кириллицы (из реестра, без поиска файлов)
+    font_title = font_registry.get(32)
+    font_medium = font_registry.get(20)
+    font_small = font_registry.get(16)
+    font_tiny = font_registry.get(14)
     
     # Добавляем заголовок
     title = "Ваша активность за 30 дней"
@@ -206,33 +237,7 @@ def generate_modern_profile_card(
     x_label_width = x_label_bbox[2] - x_label_bbox[0]
     draw.text(((width - x_label_width) // 2, height - 30), x_label, fill='#ffffff', font=font_small)
     
-    # Добавляем полупрозрачный текст в правом нижнем углу
-    watermark_text = "pixel-ut.pro"
-    try:
-        watermark_font = _load_cyrillic_font(18)
-    except Exception:
-        watermark_font = font_small  # Fallback на font_small
-    
-    watermark_bbox = draw.textbbox((0, 0), watermark_text, font=watermark_font)
-    watermark_width = watermark_bbox[2] - watermark_bbox[0]
-    watermark_height = watermark_bbox[3] - watermark_bbox[1]
-    
-    # Позиция в правом нижнем углу с отступом
-    watermark_x = width - watermark_width - 30
-    watermark_y = height - watermark_height - 30
-    
-    # Полупрозрачный цвет (30% непрозрачности = 70% прозрачности)
-    # Смешиваем #FAFAFA (30%) с #2D3748 (70%) для нового фона
-    watermark_color = '#6F747B'
-    draw.text((watermark_x, watermark_y), watermark_text, fill=watermark_color, font=watermark_font)
-    
-    # Сохраняем в буфер с максимальным качеством
-    buf = BytesIO()
-    image.save(buf, format='PNG', optimize=False)  # Без оптимизации для максимального качества
-    buf.seek(0)
-    return buf
-
-
+    return _encode(image, output)
 
 
 def _generate_grid_values_smart(max_count: int, target_count: int = 5) -> List[int]:
@@ -599,25 +604,89 @@ def _create_modern_chart(draw: ImageDraw.Draw, monthly_stats: List[Dict[str, Any
     draw.line([x, y + height, x + width, y + height], fill='#9ca3af', width=2)  # Горизонтальная ось X (нижний контур)
 
 
-async def generate_top_chart(
+# Сколько пользователей помещается на графике без потери дизайна
+MAX_DISPLAY_USERS = 15
+
+# Размер аватарки на графике топа
+AVATAR_SIZE = 80
+
+
+def _load_avatar(avatar_bytes: bytes, avatar_size: int) -> Optional[Image.Image]:
+    """Круглая миниатюра аватарки из байтов файла (None, если файл не читается)"""
+    try:
+        avatar_img = Image.open(BytesIO(avatar_bytes)).convert('RGB')
+        avatar_img = avatar_img.resize((avatar_size, avatar_size), Image.Resampling.LANCZOS)
+        # Создаем круглую маску
+        mask = Image.new('L', (avatar_size, avatar_size), 0)
+        mask_draw = ImageDraw.Draw(mask)
+        mask_draw.ellipse([0, 0, avatar_size, avatar_size], fill=255)
+        avatar_img.putalpha(mask)
+        return avatar_img
+    except Exception as e:
+        logger.debug(f"Не удалось прочитать аватарку: {e}")
+        return None
+
+
+def make_avatar_thumbnails(files: Dict[str, bytes], avatar_size: int = AVATAR_SIZE) -> Dict[str, bytes]:
+    """
+    Круглые миниатюры аватарок для графика топа (PNG с прозрачностью).
+    
+    Выполняется в процессе рендеринга; результат хранит utils.avatar_cache.
+    
+    Args:
+        files: ключ (file_unique_id) -> байты скачанного файла аватарки
+    
+    Returns:
+        Dict[str, bytes]: ключ -> PNG миниатюры (нечитаемые файлы пропускаются)
+    """
+    thumbnails = {}
+    for key, avatar_bytes in files.items():
+        avatar_img = _load_avatar(avatar_bytes, avatar_size)
+        if avatar_img is None:
+            continue
+        buf = BytesIO()
+        avatar_img.save(buf, format='PNG')
+        thumbnails[key] = buf.getvalue()
+    return thumbnails
+
+
+def _open_thumbnail(thumbnail: bytes, avatar_size: int) -> Optional[Image.Image]:
+    """Готовая миниатюра из make_avatar_thumbnails (другого размера - пересоздается)"""
+    try:
+        avatar_img = Image.open(BytesIO(thumbnail))
+        if avatar_img.mode == 'RGBA' and avatar_img.size == (avatar_size, avatar_size):
+            return avatar_img
+    except Exception as e:
+        logger.debug(f"Не удалось прочитать миниатюру аватарки: {e}")
+        return None
+    return _load_avatar(thumbnail, avatar_size)
+
+
+def render_top_chart(
     top_users: List[Dict[str, Any]],
     title: str = "Топ активных пользователей",
     subtitle: str = "",
-    bot_instance = None
-) -> BytesIO:
+    avatars: Optional[Dict[int, bytes]] = None,
+    output: OutputProfile = DEFAULT_OUTPUT
+) -> bytes:
     """
     Генерация графика топ пользователей
     
+    Выполняется в процессе рендеринга (utils.render_service), принимает
+    только простые данные; миниатюры аватарок готовит utils.avatar_cache.
+    
     Args:
         top_users: Список пользователей с полями user_id, message_count, username, first_name
         title: Заголовок графика
         subtitle: Подзаголовок графика
+        avatars: user_id -> PNG круглой миниатюры аватарки (make_avatar_thumbnails)
+        output: Профиль кодирования
     
     Returns:
-        BytesIO: Буфер с изображением PNG
+        bytes: Изображение в формате профиля
     """
     # Цветовые константы
-    BG_COLOR = '#2D3748'  # Темно-серый с легким синеватым оттенком
+    BG_COLOR = BACKGROUND_COLOR  # Темно-серый с легким синеватым оттенком
     WHITE_COLOR = '#FAFAFA'
     GOLD_COLOR = '#EFBF04'  # #1
     SILVER_COLOR = '#909090'  # #2 (темный серый для контраста с белым столбцом)
@@ -634,25 +703,13 @@ async def generate_top_chart(
     width, height = 2880, 1620  # Формат 16:9 для горизонтальных столбцов
     padding = 120
     
-    # Создаем основное изображение с новым фоном
-    image = Image.new('RGB', (width, height), BG_COLOR)
+    # Основное изображение - копия статичного слоя (фон, кружки в углах, водяной знак)
+    image = _base_layer(width, height, corner_circles=True)
     draw = ImageDraw.Draw(image)
     
-    # Загружаем шрифты для всех элементов графика
-    try:
-        font_title = _load_cyrillic_font(40)
-        font_subtitle = _load_cyrillic_font(24)
-        font_medium = _load_cyrillic_font(20)
-        font_small = _load_cyrillic_font(16)
-        font_tiny = _load_cyrillic_font(14)
-    except Exception as e:
-        logger.error(f"Ошибка загрузки шрифта: {e}")
-        # Минимальный fallback на стандартный шрифт
-        font_title = ImageFont.load_default()
-        font_subtitle = ImageFont.load_default()
-        font_medium = ImageFont.load_default()
-        font_small = ImageFont.load_default()
-        font_tiny = ImageFont.load_default()
+    # Шрифты для всех элементов графика (из реестра, без поиска файлов)
+    font_title = font_registry.get(40)
+    font_medium = font_registry.get(20)
     
     # Заголовок
     title_y = 40
@@ -666,13 +723,9 @@ async def generate_top_chart(
         no_data_bbox = draw.textbbox((0, 0), no_data_text, font=font_medium)
         no_data_width = no_data_bbox[2] - no_data_bbox[0]
         draw.text(((width - no_data_width) // 2, height // 2), no_data_text, fill=GRID_COLOR, font=font_medium)
-        buf = BytesIO()
-        image.save(buf, format='PNG', optimize=False)
-        buf.seek(0)
-        return buf
+        return _encode(image, output)
     
     # Ограничиваем количество пользователей до оптимального значения для сохранения дизайна
-    MAX_DISPLAY_USERS = 15  # Оптимальное количество пользователей на графике
     top_users = top_users[:MAX_DISPLAY_USERS]
     
     # Подготовка данных
@@ -684,7 +737,7 @@ async def generate_top_chart(
     num_users = len(top_users)
     
     # Фиксированный размер аватарки для оптимального дизайна
-    avatar_size = 80  # Стандартный размер
+    avatar_size = AVATAR_SIZE
     
     chart_x = padding + avatar_size + 20 + 240  # Место для аватарок и подписей пользователей 
     chart_y = title_y + 105
@@ -734,36 +787,14 @@ async def generate_top_chart(
         draw.text((x_pos - label_width // 2, chart_y + chart_height + 5), 
                  label, fill=GRID_COLOR, font=font_medium)
     
-    # Получаем аватары параллельно для всех пользователей
+    # Готовые круглые миниатюры - только вставить
     avatar_images = {}
-    if bot_instance:
-        async def get_avatar(user_id: int):
-            try:
-                photos = await bot_instance.get_user_profile_photos(user_id, limit=1)
-                if photos and photos.total_count > 0:
-                    file = await bot_instance.get_file(photos.photos[0][-1].file_id)
-                    avatar_bytes = await bot_instance.download_file(file.file_path)
-                    avatar_img = Image.open(avatar_bytes)
-                    avatar_img = avatar_img.resize((avatar_size, avatar_size), Image.Resampling.LANCZOS)
-                    # Создаем круглую маску
-                    mask = Image.new('L', (avatar_size, avatar_size), 0)
-                    mask_draw = ImageDraw.Draw(mask)
-                    mask_draw.ellipse([0, 0, avatar_size, avatar_size], fill=255)
-                    avatar_img.putalpha(mask)
-                    return user_id, avatar_img
-            except Exception as e:
-                logger.debug(f"Не удалось загрузить аватар для пользователя {user_id}: {e}")
-            return user_id, None
-        
-        # Получаем все аватары параллельно
-        import asyncio
-        tasks = [get_avatar(user['user_id']) for user in top_users]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        for result in results:
-            if isinstance(result, tuple) and len(result) == 2:
-                user_id, avatar_img = result
-                if avatar_img:
-                    avatar_images[user_id] = avatar_img
+    for user in top_users:
+        thumbnail = (avatars or {}).get(user['user_id'])
+        if thumbnail:
+            avatar_img = _open_thumbnail(thumbnail, avatar_size)
+            if avatar_img:
+                avatar_images[user['user_id']] = avatar_img
     
     # Рисуем столбцы
     for i, user in enumerate(top_users):
@@ -908,74 +939,7 @@ async def generate_top_chart(
             text_color = BG_COLOR
             draw.text((count_x, count_y), count_text, fill=text_color, font=font_medium)
     
-    # Добавляем декоративные полупрозрачные кружки в углах изображения (вылезающие из углов)
-    circle_radius = 20  # Радиус декоративных кружков (увеличен для большего размера)
-    circle_alpha = 100  # Прозрачность (0-255, где 255 полностью непрозрачный)
-    circle_color_rgb = (220, 221, 223)  # Светлый цвет (RGB)
-    
-    # Создаем временное RGBA изображение для круга
-    circle_size = circle_radius * 2 + 2  # Немного больше для краев
-    circle_img = Image.new('RGBA', (circle_size, circle_size), (0, 0, 0, 0))
-    circle_draw = ImageDraw.Draw(circle_img)
-    
-    # Рисуем круг с альфа-каналом
-    circle_draw.ellipse([
-        1, 1,
-        circle_size - 1, circle_size - 1
-    ], fill=(*circle_color_rgb, circle_alpha))
-    
-    # Левый верхний угол изображения (круг вылезает из угла)
-    # Центр круга в углу (0, 0), круг частично выходит за границы изображения
-    paste_x = -circle_radius
-    paste_y = -circle_radius
-    image.paste(circle_img, (paste_x, paste_y), circle_img)
-    
-    # Правый верхний угол изображения (круг вылезает из угла)
-    # Центр круга в углу (width, 0), круг частично выходит за границы изображения
-    paste_x = width - circle_radius
-    paste_y = -circle_radius
-    image.paste(circle_img, (paste_x, paste_y), circle_img)
-    
-    # Левый нижний угол изображения (круг вылезает из угла)
-    # Центр круга в углу (0, height), круг частично выходит за границы изображения
-    paste_x = -circle_radius
-    paste_y = height - circle_radius
-    image.paste(circle_img, (paste_x, paste_y), circle_img)
-    
-    # Правый нижний угол изображения (круг вылезает из угла)
-    # Центр круга в углу (width, height), круг частично выходит за границы изображения
-    paste_x = width - circle_radius
-    paste_y = height - circle_radius
-    image.paste(circle_img, (paste_x, paste_y), circle_img)
-    
-    # Добавляем полупрозрачный текст в правом нижнем углу
-    watermark_text = "pixel-ut.pro"
-    try:
-        watermark_font = _load_cyrillic_font(18)
-    except Exception:
-        watermark_font = font_small  # Fallback на font_small
-    
-    watermark_bbox = draw.textbbox((0, 0), watermark_text, font=watermark_font)
-    watermark_width = watermark_bbox[2] - watermark_bbox[0]
-    watermark_height = watermark_bbox[3] - watermark_bbox[1]
-    
-    # Позиция в правом нижнем углу с отступом
-    watermark_x = width - watermark_width - 30
-    watermark_y = height - watermark_height - 30
-    
-    # Полупрозрачный цвет (30% непрозрачности = 70% прозрачности)
-    # Смешиваем #FAFAFA (30%) с #333B45 (70%)
-    # R: 51 * 0.7 + 250 * 0.3 = 35.7 + 75 = 110.7 ≈ 111 = 6F
-    # G: 59 * 0.7 + 250 * 0.3 = 41.3 + 75 = 116.3 ≈ 116 = 74
-    # B: 69 * 0.7 + 250 * 0.3 = 48.3 + 75 = 123.3 ≈ 123 = 7B
-    watermark_color = '#6F747B'
-    draw.text((watermark_x, watermark_y), watermark_text, fill=watermark_color, font=watermark_font)
-    
-    # Сохраняем в буфер
-    buf = BytesIO()
-    image.save(buf, format='PNG', optimize=False)
-    buf.seek(0)
-    return buf
+    return _encode(image, output)
 
 
 def _draw_rounded_top_rectangle(draw: ImageDraw.Draw, xy: tuple, fill: str, radius: int = 5):
@@ -0,0 +1,292 @@
+"""
+Обученные по каждому чату базовые уровни входов и сообщений
+
+Фиксированный mass_join_limit за mass_join_window не подходит чатам разного
+размера: в большом чате медленный рейд не набирает лимит за окно, в маленьком
+несколько входов подряд уже выглядят как рейд. Здесь для каждого чата и типа
+события (вход, сообщение) ведется модель потока:
+- счетчик событий текущей минутной корзины; при закрытии корзины ее значение
+  попадает в экспоненциальное среднее (EWMA) и дисперсию (EWMV) числа событий
+  в минуту. Значения выше порога аномалии обрезаются, чтобы рейд не сдвигал
+  базовый уровень;
+- deque времен событий за длинное окно для подсчета событий в окнах проверки.
+
+Обновление - O(1) амортизированно на событие, без обращения к БД. Аномалией
+считается число входов в коротком (mass_join_window) или длинном окне выше
+ожидаемого по базовому уровню на z_threshold стандартных отклонений. Пока
+модель не набрала warmup_minutes наблюдений, действует фиксированный
+mass_join_limit; после обучения он остается нижней границей порога, так что
+обученная модель может только поднять порог для активного чата. Модель
+сообщений на аномалию не проверяется и служит только для отображения уровня
+активности в панели настроек. Модели сохраняются в JSON периодически и при
+остановке бота.
+"""
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional, Tuple
+
+try:
+    from config import JOIN_RATE
+except ImportError:
+    JOIN_RATE = {
+        'bucket_seconds': 60, 'baseline_minutes': 360, 'warmup_minutes': 60, 'z_threshold': 4.0,
+        'min_joins': 5, 'long_window': 900, 'long_min_joins': 15, 'idle_days': 7, 'snapshot_path': None,
+    }
+
+logger = logging.getLogger(__name__)
+
+KIND_JOIN = 'join'
+KIND_MESSAGE = 'message'
+
+# Типы событий, которые проверяются на аномалию (для остальных ведется только базовый уровень)
+CHECKED_KINDS = (KIND_JOIN,)
+
+# Максимум хранимых времен событий одной модели (больше в длинном окне не нужно для порогов)
+MAX_RECENT_EVENTS = 10000
+
+
+class RateCheck(NamedTuple):
+    """Результат проверки потока событий чата"""
+    is_anomaly: bool
+    # Окно, в котором сработала (или проверялась) аномалия, секунд
+    window: int
+    count: int
+    threshold: int
+    # Ожидаемое по базовому уровню число событий в окне
+    expected: float
+    # Базовый уровень обучен (иначе действует фиксированный лимит)
+    learned: bool
+
+
+class _RateModel:
+    """Базовый уровень одного потока событий"""
+
+    __slots__ = ('bucket_start', 'bucket_count', 'mean', 'var', 'buckets', 'last_event', 'recent')
+
+    def __init__(self, bucket_start: float):
+        self.bucket_start = bucket_start
+        self.bucket_count = 0
+        # EWMA и EWMV числа событий за корзину
+        self.mean = 0.0
+        self.var = 0.0
+        # Сколько корзин учтено в модели
+        self.buckets = 0
+        self.last_event = bucket_start
+        self.recent: Deque[float] = deque(maxlen=MAX_RECENT_EVENTS)
+
+
+class JoinRateMonitor:
+    """Модели входов и сообщений по чатам"""
+
+    def __init__(self, bucket_seconds: int = 60, baseline_minutes: int = 360, warmup_minutes: int = 60,
+                 z_threshold: float = 4.0, min_joins: int = 5, long_window: int = 900,
+                 long_min_joins: int = 15, idle_days: float = 7, snapshot_path: Optional[str] = None):
+        self.bucket_seconds = bucket_seconds
+        # Вес новой корзины в среднем: период сглаживания baseline_minutes
+        self.alpha = 2 / (baseline_minutes * 60 / bucket_seconds + 1)
+        self.warmup_buckets = int(warmup_minutes * 60 / bucket_seconds)
+        self.z_threshold = z_threshold
+        self.min_joins = min_joins
+        self.long_window = long_window
+        self.long_min_joins = long_min_joins
+        self.idle_seconds = idle_days * 86400
+        self.snapshot_path = snapshot_path
+        # Пустые корзины после этого числа уже почти не меняют модель
+        self._max_idle_buckets = int(4 / self.alpha)
+        self._models: Dict[Tuple[int, str], _RateModel] = {}
+        self.events_added = 0
+        self.anomalies = 0
+
+    def _roll(self, model: _RateModel, now: float, idle_as_zero: bool = True):
+        """
+        Закрыть корзины, завершившиеся к моменту now.
+
+        idle_as_zero=False - прошедшие корзины не наблюдались (бот был остановлен):
+        в модель попадает только незакрытая корзина.
+        """
+        closed = int((now - model.bucket_start) // self.bucket_seconds)
+        if closed <= 0:
+            return
+        model.bucket_start += closed * self.bucket_seconds
+        if not idle_as_zero:
+            closed = 1
+        value = float(model.bucket_count)
+        if model.buckets >= self.warmup_buckets:
+            # Рейд не должен становиться нормой: обрезаем значение порогом аномалии
+            value = min(value, model.mean + self.z_threshold * math.sqrt(max(model.var, model.mean)))
+        for i in range(min(closed, self._max_idle_buckets)):
+            # Пока корзин мало, вес 1/n - обычное среднее без смещения к нулю начального значения
+            alpha = max(self.alpha, 1 / (model.buckets + i + 1))
+            diff = value - model.mean
+            increment = alpha * diff
+            model.mean += increment
+            model.var = (1 - alpha) * (model.var + diff * increment)
+            value = 0.0
+        model.buckets += closed
+        model.bucket_count = 0
+
+    def add(self, chat_id: int, kind: str, count: int = 1, now: float = None):
+        """Учесть count событий типа kind в чате"""
+        if now is None:
+            now = time.time()
+        key = (chat_id, kind)
+        model = self._models.get(key)
+        if model is None:
+            model = self._models[key] = _RateModel(now - now % self.bucket_seconds)
+        self._roll(model, now)
+        model.bucket_count += count
+        model.last_event = now
+        if kind in CHECKED_KINDS:
+            model.recent.extend([now] * count)
+        self.events_added += count
+
+    def _threshold(self, model: _RateModel, window: int, floor: int) -> Tuple[int, float]:
+        scale = window / self.bucket_seconds
+        expected = model.mean * scale
+        # Для счетных данных дисперсия не меньше среднего (пуассоновский поток)
+        sigma = math.sqrt(max(model.var, model.mean) * scale)
+        return max(floor, math.ceil(expected + self.z_threshold * sigma)), expected
+
+    def check(self, chat_id: int, kind: str, window: int, fallback_limit: int, now: float = None) -> RateCheck:
+        """
+        Проверить поток событий чата на аномалию.
+
+        Args:
+            window: короткое окно проверки (mass_join_window)
+            fallback_limit: фиксированный лимит, пока базовый уровень не обучен,
+                и нижняя граница порога после обучения
+        """
+        if now is None:
+            now = time.time()
+        model = self._models.get((chat_id, kind))
+        if model is None:
+            return RateCheck(False, window, 0, fallback_limit, 0.0, False)
+        self._roll(model, now)
+
+        recent = model.recent
+        long_cutoff = now - max(self.long_window, window)
+        while recent and recent[0] < long_cutoff:
+            recent.popleft()
+        # Событий в коротком окне мало относительно deque - считаем с конца
+        short_cutoff = now - window
+        short_count = 0
+        for ts in reversed(recent):
+            if ts < short_cutoff:
+                break
+            short_count += 1
+
+        if model.buckets < self.warmup_buckets:
+            return RateCheck(short_count >= fallback_limit, window, short_count, fallback_limit, 0.0, False)
+
+        threshold, expected = self._threshold(model, window, max(self.min_joins, fallback_limit))
+        if short_count >= threshold:
+            self.anomalies += 1
+            return RateCheck(True, window, short_count, threshold, expected, True)
+
+        long_count = len(recent)
+        long_threshold, long_expected = self._threshold(
+            model, self.long_window, max(self.long_min_joins, fallback_limit)
+        )
+        if self.long_window > window and long_count >= long_threshold:
+            self.anomalies += 1
+            return RateCheck(True, self.long_window, long_count, long_threshold, long_expected, True)
+        return RateCheck(False, window, short_count, threshold, expected, True)
+
+    def describe(self, chat_id: int, kind: str, window: int, fallback_limit: int = 0) -> Optional[Dict[str, Any]]:
+        """Состояние модели для панели настроек: уровень в минуту, порог за окно, обучение"""
+        model = self._models.get((chat_id, kind))
+        if model is None:
+            return None
+        per_minute = 60 / self.bucket_seconds
+        threshold, _ = self._threshold(model, window, max(self.min_joins, fallback_limit))
+        return {
+            'per_minute': round(model.mean * per_minute, 2),
+            'sigma_per_minute': round(math.sqrt(max(model.var, 0.0)) * per_minute, 2),
+            'threshold': threshold,
+            'learned': model.buckets >= self.warmup_buckets,
+            'learned_minutes': int(model.buckets * self.bucket_seconds / 60),
+            'warmup_minutes': int(self.warmup_buckets * self.bucket_seconds / 60),
+        }
+
+    def prune(self, now: float = None) -> int:
+        """Удалить модели чатов без событий за idle_days. Возвращает число удаленных"""
+        if now is None:
+            now = time.time()
+        cutoff = now - self.idle_seconds
+        stale = [key for key, model in self._models.items() if model.last_event < cutoff]
+        for key in stale:
+            del self._models[key]
+        return len(stale)
+
+    def discard_chat(self, chat_id: int):
+        """Удалить модели чата"""
+        for key in [key for key in self._models if key[0] == chat_id]:
+            del self._models[key]
+
+    # ---------- Сохранение между перезапусками ----------
+
+    def snapshot(self, path: str = None) -> int:
+        """Сохранить модели в JSON (без времен последних событий). Возвращает число моделей"""
+        path = path or self.snapshot_path
+        if not path:
+            return 0
+        data = [
+            [chat_id, kind, model.bucket_start, model.bucket_count, model.mean, model.var,
+             model.buckets, model.last_event]
+            for (chat_id, kind), model in self._models.items()
+        ]
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'saved_at': time.time(), 'bucket_seconds': self.bucket_seconds, 'models': data}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении базовых уровней входов: {e}")
+            return 0
+        return len(data)
+
+    def restore(self, path: str = None) -> int:
+        """Загрузить модели из JSON. Возвращает число моделей"""
+        path = path or self.snapshot_path
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке базовых уровней входов: {e}")
+            return 0
+        if data.get('bucket_seconds') != self.bucket_seconds:
+            logger.warning("Размер корзины базовых уровней изменился, модели обучаются заново")
+            return 0
+
+        cutoff = time.time() - self.idle_seconds
+        for chat_id, kind, bucket_start, bucket_count, mean, var, buckets, last_event in data.get('models', []):
+            if last_event < cutoff:
+                continue
+            model = self._models[(chat_id, kind)] = _RateModel(bucket_start)
+            model.bucket_count = bucket_count
+            model.mean = mean
+            model.var = var
+            model.buckets = buckets
+            model.last_event = last_event
+            self._roll(model, time.time(), idle_as_zero=False)
+        return len(self._models)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики моделей"""
+        return {
+            'models': len(self._models),
+            'learned': sum(1 for model in self._models.values() if model.buckets >= self.warmup_buckets),
+            'events_added': self.events_added,
+            'anomalies': self.anomalies,
+        }
+
+
+# Глобальные базовые уровни входов и сообщений
+join_rate = JoinRateMonitor(**JOIN_RATE)
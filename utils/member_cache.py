@@ -0,0 +1,179 @@
+"""
+Кэш статусов участников чатов
+
+bot.get_chat_member вызывается при каждой проверке мута, ранга и прав бота,
+а планировщик опрашивает статус бота во всех чатах каждые несколько секунд.
+ChatMemberCache хранит последний известный ChatMember по (chat_id, user_id):
+статус, ограничения (permissions) и until_date.
+
+Источники данных:
+- ответы get_chat_member (при промахе кэша);
+- обновления chat_member и my_chat_member (handlers/common.py);
+- MemberCacheRequestMiddleware сбрасывает запись после restrict/ban/unban/promote,
+  выполненных самим ботом.
+Если обновления не пришли (бот не администратор), запись устаревает по TTL.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import (
+    ApproveChatJoinRequest,
+    BanChatMember,
+    LeaveChat,
+    PromoteChatMember,
+    RestrictChatMember,
+    TelegramMethod,
+    UnbanChatMember,
+)
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import ChatMember
+
+try:
+    from config import MEMBER_CACHE
+except ImportError:
+    MEMBER_CACHE = {'ttl': 300, 'max_size': 50000}
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMemberCache:
+    """LRU-кэш ChatMember с TTL и счетчиком сэкономленных запросов"""
+
+    def __init__(self, ttl: float = 300, max_size: int = 50000):
+        self.ttl = ttl
+        self.max_size = max_size
+        # (chat_id, user_id) -> (ChatMember, момент устаревания по time.monotonic)
+        self._entries: "OrderedDict[Tuple[int, int], tuple]" = OrderedDict()
+        # Запросы в процессе: параллельные промахи по одному участнику ждут один запрос
+        self._loading: Dict[Tuple[int, int], asyncio.Future] = {}
+        # Счетчик изменений записи: ответ API, полученный до события, не перезапишет его
+        self._generations: Dict[Tuple[int, int], int] = {}
+        self.hits = 0
+        self.api_calls = 0
+        self.event_updates = 0
+        self.invalidations = 0
+
+    def _expires_at(self, member: ChatMember) -> float:
+        """Момент устаревания записи: TTL, но не позже окончания ограничения"""
+        expires_at = time.monotonic() + self.ttl
+        until_date = getattr(member, 'until_date', None)
+        if isinstance(until_date, datetime):
+            if until_date.tzinfo is None:
+                until_date = until_date.replace(tzinfo=timezone.utc)
+            remaining = (until_date - datetime.now(timezone.utc)).total_seconds()
+            # until_date=0 (1970-01-01) у бессрочных ограничений и прошедшая дата - срока нет
+            if remaining > 0:
+                expires_at = min(expires_at, time.monotonic() + remaining)
+        return expires_at
+
+    def _bump(self, key: Tuple[int, int]):
+        self._generations[key] = self._generations.get(key, 0) + 1
+        if len(self._generations) > self.max_size * 2:
+            # Незавершенные запросы просто не попадут в кэш
+            self._generations.clear()
+            self._loading.clear()
+
+    def _store(self, key: Tuple[int, int], member: ChatMember):
+        self._entries[key] = (member, self._expires_at(member))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, bot: Bot, chat_id: int, user_id: int) -> ChatMember:
+        """
+        Получить участника чата (из кэша или через get_chat_member).
+
+        Ошибки API пробрасываются вызывающему и не кэшируются.
+        """
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() < entry[1]:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(bot, key))
+            self._loading[key] = task
+        else:
+            # Запрос уже выполняется для другого вызова
+            self.hits += 1
+        return await asyncio.shield(task)
+
+    async def _load(self, bot: Bot, key: Tuple[int, int]) -> ChatMember:
+        generation = self._generations.get(key, 0)
+        self.api_calls += 1
+        try:
+            member = await bot.get_chat_member(*key)
+        finally:
+            if self._loading.get(key) is asyncio.current_task():
+                del self._loading[key]
+
+        if generation == self._generations.get(key, 0):
+            self._store(key, member)
+        return member
+
+    def update(self, chat_id: int, member: ChatMember):
+        """Записать актуальный статус из обновления chat_member/my_chat_member"""
+        key = (chat_id, member.user.id)
+        self._bump(key)
+        self._loading.pop(key, None)
+        self._store(key, member)
+        self.event_updates += 1
+
+    def invalidate(self, chat_id: int, user_id: int):
+        """Сбросить запись участника"""
+        key = (chat_id, user_id)
+        self._entries.pop(key, None)
+        self._loading.pop(key, None)
+        self._bump(key)
+        self.invalidations += 1
+
+    def invalidate_chat(self, chat_id: int):
+        """Сбросить все записи чата"""
+        for key in [key for key in self._entries if key[0] == chat_id]:
+            self.invalidate(*key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кэша: hits - сколько вызовов get_chat_member удалось не делать"""
+        total = self.hits + self.api_calls
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'api_calls': self.api_calls,
+            'saved_ratio': round(self.hits / total, 4) if total else 0.0,
+            'event_updates': self.event_updates,
+            'invalidations': self.invalidations,
+        }
+
+
+class MemberCacheRequestMiddleware(BaseRequestMiddleware):
+    """Сбрасывает кэш участника после действий бота, меняющих его статус"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        try:
+            return await make_request(bot, method)
+        finally:
+            # Сбрасываем и при ошибке: действие могло частично примениться
+            if isinstance(method, (RestrictChatMember, BanChatMember, UnbanChatMember,
+                                   PromoteChatMember, ApproveChatJoinRequest)):
+                if isinstance(method.chat_id, int):
+                    member_cache.invalidate(method.chat_id, method.user_id)
+            elif isinstance(method, LeaveChat) and isinstance(method.chat_id, int):
+                member_cache.invalidate_chat(method.chat_id)
+
+
+# Глобальный экземпляр кэша участников
+member_cache = ChatMemberCache(ttl=MEMBER_CACHE['ttl'], max_size=MEMBER_CACHE['max_size'])
@@ -2,10 +2,12 @@
 Функции для работы с правами и рангами
 """
 import logging
-from typing import Optional
+from typing import Dict, Optional
 from aiogram import Bot
 
 from databases.database import db
+from databases.rank_cache import rank_cache
+from utils.member_cache import member_cache
 from utils.constants import RANK_OWNER, RANK_USER, RANK_NAMES
 
 logger = logging.getLogger(__name__)
@@ -13,6 +15,9 @@ logger = logging.getLogger(__name__)
 # Глобальная переменная bot будет установлена при инициализации
 bot: Optional[Bot] = None
 
+# Последнее записанное в БД значение has_admin_rights по чатам
+_admin_rights_saved: Dict[int, bool] = {}
+
 def set_bot_instance(bot_instance: Bot):
     """Устанавливает экземпляр бота для использования в модуле"""
     global bot
@@ -31,24 +36,33 @@ async def get_effective_rank(chat_id: int, user_id: int) -> int:
     - Исключение: владелец чата автоматически получает ранг владельца
     - Не учитывает Telegram-статус других пользователей
     """
+    cached_rank = rank_cache.get_rank(chat_id, user_id)
+    if cached_rank is not None:
+        return cached_rank
+
+    version = rank_cache.rank_version(chat_id, user_id)
     try:
         # Проверяем, является ли пользователь владельцем чата
+        owner_checked = True
         try:
             if bot:
-                member = await bot.get_chat_member(chat_id, user_id)
+                member = await member_cache.get(bot, chat_id, user_id)
                 if member.status == 'creator':
-                    return RANK_OWNER  # Владелец чата всегда имеет ранг владельца
+                    # Владелец чата всегда имеет ранг владельца
+                    rank_cache.set_rank(chat_id, user_id, RANK_OWNER, version)
+                    return RANK_OWNER
         except Exception:
-            pass  # Игнорируем ошибки при проверке статуса
+            # Игнорируем ошибки при проверке статуса, но такой результат не кэшируем
+            owner_checked = False
         
         # Проверяем ранг в БД
         db_rank = await db.get_user_rank(chat_id, user_id)
         
-        # Возвращаем ранг из БД или обычного пользователя
-        if db_rank is not None:
-            return db_rank
-        else:
-            return RANK_USER  # Обычный пользователь по умолчанию
+        # Ранг из БД или обычный пользователь по умолчанию
+        rank = db_rank if db_rank is not None else RANK_USER
+        if owner_checked:
+            rank_cache.set_rank(chat_id, user_id, rank, version)
+        return rank
             
     except Exception as e:
         logger.error(f"Ошибка при получении ранга пользователя {user_id} в чате {chat_id}: {e}")
@@ -78,14 +92,16 @@ async def check_permission(chat_id: int, user_id: int, permission_type: str, fal
 async def check_admin_rights(bot: Bot, chat_id: int) -> bool:
     """Проверка прав администратора бота в чате"""
     try:
-        bot_member = await bot.get_chat_member(chat_id, bot.id)
+        bot_member = await member_cache.get(bot, chat_id, bot.id)
         has_admin = bot_member.status in ['administrator', 'creator']
         
-        # Обновляем информацию в базе данных
-        try:
-            await db.update_admin_rights(chat_id, has_admin)
-        except Exception as db_error:
-            logger.warning(f"Ошибка при обновлении прав администратора в БД для чата {chat_id}: {db_error}")
+        # Обновляем информацию в базе данных (только при изменении)
+        if _admin_rights_saved.get(chat_id) != has_admin:
+            try:
+                await db.update_admin_rights(chat_id, has_admin)
+                _admin_rights_saved[chat_id] = has_admin
+            except Exception as db_error:
+                logger.warning(f"Ошибка при обновлении прав администратора в БД для чата {chat_id}: {db_error}")
         
         return has_admin
     except Exception as e:
@@ -0,0 +1,318 @@
+"""
+Локдаун чата при массовом входе участников
+
+При срабатывании RaidProtection.check_mass_join (если в настройках рейдов
+включен lockdown_enabled) чат переводится в локдаун:
+- права чата сужаются до «только чтение», прежние права сохраняются в
+  raid_protection_db (таблица raid_lockdowns), чтобы восстановить их и после
+  перезапуска бота;
+- все участники из окна recent_joins и все входящие во время локдауна
+  ограничиваются или исключаются (lockdown_action) параллельно, через
+  utils.rate_limiter в полосе модерации, их недавние сообщения удаляются;
+- заявки на вступление не принимаются автоматически и ждут ручного решения.
+
+Каждое повторное срабатывание продлевает локдаун на lockdown_duration секунд;
+когда входы стихают, права восстанавливаются и владелец получает один
+сводный отчет вместо уведомления на каждый вход.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram.types import ChatPermissions
+
+from databases.raid_protection_db import raid_protection_db
+from raid_protection import PURGE_GRACE_SECONDS, raid_protection
+from utils.delete_queue import delete_queue
+from utils.raid_windows import raid_windows
+from utils.rate_limiter import api_lane, LANE_MODERATION
+
+try:
+    from config import RAID_LOCKDOWN
+except ImportError:
+    RAID_LOCKDOWN = {'check_interval': 5, 'restrict_hours': 24, 'min_persist_step': 30}
+
+logger = logging.getLogger(__name__)
+
+ACTION_RESTRICT = 'restrict'
+ACTION_KICK = 'kick'
+ACTIONS = (ACTION_RESTRICT, ACTION_KICK)
+
+# Права чата и участника на время локдауна: только чтение
+LOCKED_PERMISSIONS = ChatPermissions(
+    can_send_messages=False,
+    can_send_audios=False,
+    can_send_documents=False,
+    can_send_photos=False,
+    can_send_videos=False,
+    can_send_video_notes=False,
+    can_send_voice_notes=False,
+    can_send_polls=False,
+    can_send_other_messages=False,
+    can_add_web_page_previews=False,
+    can_change_info=False,
+    can_invite_users=False,
+    can_pin_messages=False,
+    can_manage_topics=False,
+)
+
+
+class _Lockdown:
+    """Состояние локдауна одного чата"""
+
+    __slots__ = ('chat_id', 'started_at', 'ends_at', 'persisted_ends_at', 'saved_permissions',
+                 'action', 'window', 'notify', 'handled', 'restricted', 'kicked', 'failed',
+                 'held_requests', 'peak_joins', 'task')
+
+    def __init__(self, chat_id: int, started_at: float, ends_at: float):
+        self.chat_id = chat_id
+        self.started_at = started_at
+        self.ends_at = ends_at
+        self.persisted_ends_at = 0.0
+        # JSON прав чата до локдауна; None - права не менялись
+        self.saved_permissions: Optional[str] = None
+        self.action = ACTION_RESTRICT
+        self.window = 60
+        self.notify = True
+        # user_id -> запись recent_joins уже обработанных участников
+        self.handled: Dict[int, Dict[str, Any]] = {}
+        self.restricted = 0
+        self.kicked = 0
+        self.failed = 0
+        self.held_requests = 0
+        self.peak_joins = 0
+        self.task: Optional[asyncio.Task] = None
+
+
+class RaidLockdown:
+    """Локдауны чатов при массовом входе"""
+
+    def __init__(self, check_interval: float = 5, restrict_hours: float = 24, min_persist_step: float = 30):
+        # Как часто проверять, не пора ли снять локдаун, секунд
+        self.check_interval = check_interval
+        # На сколько ограничивать участников рейда при действии restrict
+        self.restrict_seconds = int(restrict_hours * 3600)
+        # Продление локдауна пишется в БД не чаще, чем на этот шаг
+        self.min_persist_step = min_persist_step
+        self._active: Dict[int, _Lockdown] = {}
+        self.engaged = 0
+        self.lifted = 0
+        self.punished = 0
+
+    def is_active(self, chat_id: int) -> bool:
+        """Идет ли в чате локдаун"""
+        return chat_id in self._active
+
+    def hold_join_request(self, chat_id: int) -> bool:
+        """
+        Учесть заявку на вступление во время локдауна.
+
+        Returns:
+            True - заявку нужно оставить на ручное рассмотрение
+        """
+        state = self._active.get(chat_id)
+        if state is None:
+            return False
+        state.held_requests += 1
+        return True
+
+    async def on_joins(self, chat_id: int, settings: Dict[str, Any], recent_joins: List[Dict[str, Any]],
+                       raid: bool = True):
+        """
+        Обработать входы в чат: при raid включить или продлить локдаун,
+        затем ограничить/исключить еще не обработанных участников из recent_joins.
+        """
+        now = time.time()
+        duration = settings.get('lockdown_duration', 600)
+        state = self._active.get(chat_id)
+        if state is None:
+            if not raid:
+                return
+            # Состояние регистрируется до первого await, чтобы параллельные входы не начали второй локдаун
+            state = self._active[chat_id] = _Lockdown(chat_id, now, now + duration)
+            self._apply_settings(state, settings)
+            self.engaged += 1
+            logger.warning(f"Локдаун чата {chat_id}: {len(recent_joins)} входов за {state.window} сек")
+            with api_lane(LANE_MODERATION):
+                await self._lock_chat(state)
+            state.task = asyncio.create_task(self._watch(state))
+        elif raid:
+            state.ends_at = max(state.ends_at, now + duration)
+
+        if raid:
+            state.peak_joins = max(state.peak_joins, len(recent_joins))
+            if state.ends_at - state.persisted_ends_at >= self.min_persist_step:
+                state.persisted_ends_at = state.ends_at
+                await raid_protection_db.save_lockdown(chat_id, state.started_at, state.ends_at,
+                                                       state.saved_permissions)
+
+        targets = [join for join in recent_joins if join['user_id'] not in state.handled]
+        for join in targets:
+            state.handled[join['user_id']] = join
+        if targets:
+            with api_lane(LANE_MODERATION):
+                await asyncio.gather(*(self._punish(state, join['user_id']) for join in targets))
+
+    def _apply_settings(self, state: _Lockdown, settings: Dict[str, Any]):
+        action = settings.get('lockdown_action', ACTION_RESTRICT)
+        state.action = action if action in ACTIONS else ACTION_RESTRICT
+        state.window = settings.get('mass_join_window', 60)
+        state.notify = settings.get('notification_mode', 1) != 0
+
+    async def _lock_chat(self, state: _Lockdown):
+        """Сохранить права чата и сузить их до «только чтение»"""
+        bot = raid_protection.bot
+        try:
+            chat = await bot.get_chat(state.chat_id)
+        except Exception as e:
+            # Без исходных прав не сможем их вернуть - права не трогаем, участники обрабатываются
+            logger.error(f"Не удалось получить права чата {state.chat_id}, права чата не изменены: {e}")
+            return
+        permissions = chat.permissions or ChatPermissions()
+        try:
+            await bot.set_chat_permissions(
+                chat_id=state.chat_id,
+                permissions=LOCKED_PERMISSIONS,
+                use_independent_chat_permissions=True
+            )
+            state.saved_permissions = json.dumps(permissions.model_dump(exclude_none=True))
+        except Exception as e:
+            logger.error(f"Не удалось ограничить права чата {state.chat_id}: {e}")
+
+    async def _punish(self, state: _Lockdown, user_id: int):
+        bot = raid_protection.bot
+        if user_id == bot.id:
+            return
+        try:
+            if state.action == ACTION_KICK:
+                await bot.ban_chat_member(chat_id=state.chat_id, user_id=user_id)
+                await bot.unban_chat_member(chat_id=state.chat_id, user_id=user_id, only_if_banned=True)
+                state.kicked += 1
+            else:
+                await bot.restrict_chat_member(
+                    chat_id=state.chat_id,
+                    user_id=user_id,
+                    permissions=LOCKED_PERMISSIONS,
+                    use_independent_chat_permissions=True,
+                    until_date=int(time.time()) + self.restrict_seconds
+                )
+                state.restricted += 1
+            self.punished += 1
+        except Exception as e:
+            state.failed += 1
+            logger.warning(f"Локдаун чата {state.chat_id}: не удалось обработать пользователя {user_id}: {e}")
+            return
+        # Участник вошел не раньше окна входов до начала локдауна - старше его сообщений нет
+        seconds = time.time() - state.started_at + state.window + PURGE_GRACE_SECONDS
+        delete_queue.schedule(state.chat_id, raid_windows.recent_message_ids(state.chat_id, user_id, seconds))
+
+    async def _watch(self, state: _Lockdown):
+        """Снять локдаун, когда входы стихли на lockdown_duration секунд"""
+        try:
+            while True:
+                remaining = state.ends_at - time.time()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(self.check_interval, remaining))
+        except asyncio.CancelledError:
+            return
+        state.task = None
+        await self.lift(state.chat_id)
+
+    async def lift(self, chat_id: int, reason: str = 'входы прекратились') -> bool:
+        """Снять локдаун: вернуть права чата и отправить владельцу сводный отчет"""
+        state = self._active.pop(chat_id, None)
+        if state is None:
+            return False
+        if state.task is not None and state.task is not asyncio.current_task():
+            state.task.cancel()
+
+        restored = False
+        if state.saved_permissions is not None:
+            try:
+                with api_lane(LANE_MODERATION):
+                    await raid_protection.bot.set_chat_permissions(
+                        chat_id=chat_id,
+                        permissions=ChatPermissions(**json.loads(state.saved_permissions)),
+                        use_independent_chat_permissions=True
+                    )
+                restored = True
+            except Exception as e:
+                logger.error(f"Не удалось восстановить права чата {chat_id} после локдауна: {e}")
+
+        await raid_protection_db.delete_lockdown(chat_id)
+        self.lifted += 1
+
+        summary = (
+            f"Локдаун {int(time.time() - state.started_at) // 60} мин, "
+            f"ограничено {state.restricted}, исключено {state.kicked}, ошибок {state.failed}, "
+            f"заявок на ручное рассмотрение {state.held_requests}"
+        )
+        await raid_protection_db.log_raid_incident(chat_id, None, 'mass_join', summary, None, "lockdown")
+        logger.info(f"Локдаун чата {chat_id} снят ({reason}): {summary}")
+
+        if state.notify:
+            await raid_protection.send_owner_message(chat_id, self._build_report(state, reason, restored))
+        return True
+
+    async def forget(self, chat_id: int):
+        """Прекратить локдаун без восстановления прав (бот удален из чата)"""
+        state = self._active.pop(chat_id, None)
+        if state is None:
+            return
+        if state.task is not None:
+            state.task.cancel()
+        await raid_protection_db.delete_lockdown(chat_id)
+
+    def _build_report(self, state: _Lockdown, reason: str, restored: bool) -> str:
+        minutes = max(1, round((time.time() - state.started_at) / 60))
+        lines = [
+            "🔒 Локдаун снят",
+            "",
+            f"Чат: {state.chat_id}",
+            f"Причина снятия: {reason}",
+            f"Длительность: {minutes} мин",
+        ]
+        if state.peak_joins:
+            lines.append(f"Пик: {state.peak_joins} входов за {state.window} сек")
+        lines.append(f"Ограничено: {state.restricted}, исключено: {state.kicked}, ошибок: {state.failed}")
+        if state.held_requests:
+            lines.append(f"Заявок ждут ручного рассмотрения: {state.held_requests}")
+        if state.saved_permissions is None:
+            lines.append("Права чата не менялись")
+        else:
+            lines.append("Права чата восстановлены" if restored else "⚠️ Права чата восстановить не удалось")
+        if state.handled:
+            lines.append("")
+            lines.append("Участники рейда:")
+            lines.extend(raid_protection.format_joins(list(state.handled.values())))
+        return "\n".join(lines)
+
+    async def resume(self) -> int:
+        """Восстановить локдауны, начатые до перезапуска бота. Возвращает их число"""
+        for row in await raid_protection_db.get_lockdowns():
+            chat_id = row['chat_id']
+            if chat_id in self._active:
+                continue
+            state = _Lockdown(chat_id, row['started_at'], row['ends_at'])
+            state.persisted_ends_at = row['ends_at']
+            state.saved_permissions = row['saved_permissions']
+            self._apply_settings(state, await raid_protection_db.get_settings(chat_id))
+            self._active[chat_id] = state
+            state.task = asyncio.create_task(self._watch(state))
+        return len(self._active)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики локдаунов"""
+        return {
+            'active': len(self._active),
+            'engaged': self.engaged,
+            'lifted': self.lifted,
+            'punished': self.punished,
+        }
+
+
+# Глобальный менеджер локдаунов
+raid_lockdown = RaidLockdown(**RAID_LOCKDOWN)
@@ -0,0 +1,181 @@
+"""
+Скользящие окна активности для защиты от рейдов
+
+Для каждой тройки (чат, пользователь, тип: gif/sticker/text) хранится deque
+событий (время, хеш содержимого) и счетчик хешей. Добавление и удаление
+вышедших из окна событий - O(1) амортизированно, без обращения к БД.
+Там же хранятся id недавних сообщений пользователей - для удаления
+сообщений участника рейда. Окна живут в памяти; при остановке бота их можно сохранить в JSON и
+восстановить при запуске (snapshot/restore). Инциденты по-прежнему пишутся
+в raid_protection_db.
+"""
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+try:
+    from config import RAID_WINDOWS
+except ImportError:
+    RAID_WINDOWS = {'max_events': 64, 'idle_seconds': 600, 'purge_seconds': 0, 'snapshot_path': None}
+
+logger = logging.getLogger(__name__)
+
+WindowKey = Tuple[int, int, str]
+
+
+class _Window:
+    """События одного окна и число событий по хешу содержимого"""
+
+    __slots__ = ('events', 'counts')
+
+    def __init__(self):
+        self.events: Deque[Tuple[float, Optional[str]]] = deque()
+        self.counts: Dict[Optional[str], int] = {}
+
+    def _pop_oldest(self):
+        _, content = self.events.popleft()
+        count = self.counts[content] - 1
+        if count:
+            self.counts[content] = count
+        else:
+            del self.counts[content]
+
+
+class ActivityWindows:
+    """Скользящие окна событий по (chat_id, user_id, тип)"""
+
+    def __init__(self, max_events: int = 64, idle_seconds: float = 600, purge_seconds: float = 0,
+                 snapshot_path: Optional[str] = None):
+        # Лимиты в настройках рейдов - единицы событий, больше хранить незачем
+        self.max_events = max_events
+        # Окно без событий дольше idle_seconds удаляется при prune (настройки окон - до минут)
+        self.idle_seconds = idle_seconds
+        # Минимальный период удаления сообщений участника рейда (0 - только окно правила)
+        self.purge_seconds = min(purge_seconds, idle_seconds)
+        self.snapshot_path = snapshot_path
+        self._windows: Dict[WindowKey, _Window] = {}
+        # (chat_id, user_id) -> недавние (время, message_id) для удаления при рейде
+        self._messages: Dict[Tuple[int, int], Deque[Tuple[float, int]]] = {}
+        self.events_added = 0
+
+    def add(self, chat_id: int, user_id: int, kind: str, content: Optional[str],
+            window_seconds: float, now: float = None) -> Tuple[int, int]:
+        """
+        Добавить событие и убрать вышедшие из окна.
+
+        Returns:
+            (событий в окне, из них с тем же содержимым)
+        """
+        if now is None:
+            now = time.time()
+        key = (chat_id, user_id, kind)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _Window()
+
+        events = window.events
+        cutoff = now - window_seconds
+        while events and (events[0][0] < cutoff or len(events) >= self.max_events):
+            window._pop_oldest()
+        events.append((now, content))
+        window.counts[content] = window.counts.get(content, 0) + 1
+        self.events_added += 1
+        return len(events), window.counts[content]
+
+    def remember_message(self, chat_id: int, user_id: int, message_id: int, now: float = None):
+        """Запомнить сообщение пользователя (последние max_events за idle_seconds)"""
+        if now is None:
+            now = time.time()
+        key = (chat_id, user_id)
+        messages = self._messages.get(key)
+        if messages is None:
+            messages = self._messages[key] = deque(maxlen=self.max_events)
+        messages.append((now, message_id))
+
+    def recent_message_ids(self, chat_id: int, user_id: int, seconds: float, now: float = None) -> List[int]:
+        """id сообщений пользователя в чате за последние seconds секунд"""
+        if now is None:
+            now = time.time()
+        cutoff = now - seconds
+        messages = self._messages.get((chat_id, user_id), ())
+        return [message_id for ts, message_id in messages if ts >= cutoff]
+
+    def prune(self, now: float = None) -> int:
+        """Удалить окна без событий за idle_seconds. Возвращает число удаленных"""
+        if now is None:
+            now = time.time()
+        cutoff = now - self.idle_seconds
+        stale = [key for key, window in self._windows.items() if window.events[-1][0] < cutoff]
+        for key in stale:
+            del self._windows[key]
+        for key in [key for key, messages in self._messages.items() if messages[-1][0] < cutoff]:
+            del self._messages[key]
+        return len(stale)
+
+    def discard_chat(self, chat_id: int):
+        """Удалить окна чата"""
+        for key in [key for key in self._windows if key[0] == chat_id]:
+            del self._windows[key]
+        for key in [key for key in self._messages if key[0] == chat_id]:
+            del self._messages[key]
+
+    # ---------- Сохранение между перезапусками ----------
+
+    def snapshot(self, path: str = None) -> int:
+        """Сохранить окна в JSON. Возвращает число сохраненных окон"""
+        path = path or self.snapshot_path
+        if not path:
+            return 0
+        self.prune()
+        data = [
+            [chat_id, user_id, kind, list(window.events)]
+            for (chat_id, user_id, kind), window in self._windows.items()
+        ]
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'saved_at': time.time(), 'windows': data}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении окон защиты от рейдов: {e}")
+            return 0
+        return len(data)
+
+    def restore(self, path: str = None) -> int:
+        """Загрузить окна из JSON (устаревшие пропускаются). Возвращает число окон"""
+        path = path or self.snapshot_path
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке окон защиты от рейдов: {e}")
+            return 0
+
+        cutoff = time.time() - self.idle_seconds
+        for chat_id, user_id, kind, events in data.get('windows', []):
+            events = [(ts, content) for ts, content in events[-self.max_events:] if ts >= cutoff]
+            if not events:
+                continue
+            window = self._windows[(chat_id, user_id, kind)] = _Window()
+            for ts, content in events:
+                window.events.append((ts, content))
+                window.counts[content] = window.counts.get(content, 0) + 1
+        return len(self._windows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики окон"""
+        return {
+            'windows': len(self._windows),
+            'events': sum(len(window.events) for window in self._windows.values()),
+            'events_added': self.events_added,
+        }
+
+
+# Глобальные окна активности защиты от рейдов
+raid_windows = ActivityWindows(**RAID_WINDOWS)
@@ -0,0 +1,321 @@
+"""
+Планировщик исходящих запросов к Telegram Bot API
+
+Все вызовы bot.* (обработчики, планировщик, уведомления, RaidProtection)
+проходят через RateLimitRequestMiddleware сессии бота:
+- глобальный token bucket (~30 запросов/с на бота);
+- token bucket на чат для отправки сообщений (~20/мин в группах, ~1/с в личке);
+- приоритетные полосы: модерация и рейды, затем интерактивные ответы,
+  затем рассылки и фоновое обновление;
+- при 429 (TelegramRetryAfter) чат или весь бот ставится на паузу на
+  retry_after секунд, запрос повторяется автоматически.
+
+Полоса выбирается по методу (restrict/ban/delete - модерация, остальное -
+интерактивная) или явно на время блока через api_lane()/set_api_lane().
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    BanChatMember,
+    BanChatSenderChat,
+    DeclineChatJoinRequest,
+    DeleteMessage,
+    DeleteMessages,
+    RestrictChatMember,
+    SendChatAction,
+    SetChatPermissions,
+    TelegramMethod,
+    UnbanChatMember,
+    UnbanChatSenderChat,
+)
+from aiogram.methods.base import Response, TelegramType
+
+try:
+    from config import RATE_LIMITS
+except ImportError:
+    RATE_LIMITS = {
+        'global_per_second': 30,
+        'group_per_minute': 20,
+        'group_burst': 10,
+        'private_per_second': 1,
+        'private_burst': 3,
+        'max_retries': 3,
+        'max_retry_wait': 60,
+    }
+
+logger = logging.getLogger(__name__)
+
+# Полосы в порядке приоритета
+LANE_MODERATION = 'moderation'
+LANE_INTERACTIVE = 'interactive'
+LANE_BACKGROUND = 'background'
+LANES = (LANE_MODERATION, LANE_INTERACTIVE, LANE_BACKGROUND)
+
+# Методы, которые по умолчанию идут в полосу модерации
+MODERATION_METHODS = (
+    RestrictChatMember,
+    BanChatMember,
+    UnbanChatMember,
+    BanChatSenderChat,
+    UnbanChatSenderChat,
+    DeleteMessage,
+    DeleteMessages,
+    SetChatPermissions,
+    DeclineChatJoinRequest,
+)
+
+# Префиксы методов, отправляющих сообщения в чат (лимит на чат)
+CHAT_SEND_PREFIXES = ('Send', 'Forward', 'Copy')
+
+# Максимум корзин чатов до очистки простаивающих
+MAX_CHAT_BUCKETS = 10000
+
+_current_lane: ContextVar[Optional[str]] = ContextVar('api_lane', default=None)
+
+
+@contextmanager
+def api_lane(lane: str):
+    """Выполнять запросы блока в указанной полосе (задачи, созданные внутри, наследуют ее)"""
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def set_api_lane(lane: str):
+    """Полоса для оставшейся части текущей задачи (например, обработки одного апдейта)"""
+    _current_lane.set(lane)
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не более capacity в запасе"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # Пауза после 429 (момент по time.monotonic)
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Секунд до появления токена (с учетом паузы)"""
+        self._refill(now)
+        wait = max(self.paused_until - now, 0.0)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self):
+        self.tokens -= 1
+
+    def reserve(self, now: float) -> float:
+        """Занять токен в долг и вернуть, сколько ждать до его наступления"""
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def pause(self, now: float, seconds: float):
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+
+class ApiRateLimiter:
+    """Глобальный и початовый лимиты с приоритетными очередями"""
+
+    def __init__(self, global_per_second: float = 30, group_per_minute: float = 20,
+                 group_burst: float = 10, private_per_second: float = 1, private_burst: float = 3,
+                 max_retries: int = 3, max_retry_wait: float = 60):
+        self._global = TokenBucket(global_per_second, global_per_second)
+        self.group_rate = group_per_minute / 60
+        self.group_burst = group_burst
+        self.private_rate = private_per_second
+        self.private_burst = private_burst
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        # Ожидающие глобального токена, по полосам
+        self._queues: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self._lane_stats = {
+            lane: {'requests': 0, 'waited': 0, 'wait_total': 0.0, 'wait_max': 0.0} for lane in LANES
+        }
+        self.retry_after_count = 0
+        self.retried = 0
+
+    # ---------- Выбор полосы и корзины ----------
+
+    @staticmethod
+    def resolve_lane(method: TelegramMethod) -> str:
+        lane = _current_lane.get()
+        if lane is not None:
+            return lane
+        if isinstance(method, MODERATION_METHODS):
+            return LANE_MODERATION
+        return LANE_INTERACTIVE
+
+    @staticmethod
+    def is_chat_send(method: TelegramMethod) -> bool:
+        if isinstance(method, SendChatAction):
+            return False
+        return type(method).__name__.startswith(CHAT_SEND_PREFIXES)
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                now = time.monotonic()
+                self._chats = {key: b for key, b in self._chats.items() if not b.idle(now)}
+            # Личные чаты - положительные id, группы и каналы - отрицательные или @username
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    # ---------- Ожидание токенов ----------
+
+    def _next_waiter(self) -> Optional[Deque[asyncio.Future]]:
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue and queue[0].done():
+                queue.popleft()
+            if queue:
+                return queue
+        return None
+
+    async def _pump(self):
+        """Выдает глобальные токены ожидающим в порядке приоритета полос"""
+        while True:
+            queue = self._next_waiter()
+            if queue is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            wait = self._global.delay(time.monotonic())
+            if wait > 0:
+                # После сна заново выбираем полосу: мог прийти более важный запрос
+                await asyncio.sleep(wait)
+                continue
+            self._global.take()
+            queue.popleft().set_result(None)
+
+    async def _acquire_global(self, lane: str):
+        if self._next_waiter() is None and self._global.delay(time.monotonic()) == 0:
+            self._global.take()
+            return
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.ensure_future(self._pump())
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[lane].append(waiter)
+        self._wakeup.set()
+        await waiter
+
+    async def acquire(self, lane: str, chat_id: Union[int, str, None] = None):
+        """Дождаться разрешения на запрос (сначала лимит чата, затем глобальный)"""
+        started = time.monotonic()
+        if chat_id is not None:
+            wait = self._chat_bucket(chat_id).reserve(started)
+            if wait > 0:
+                await asyncio.sleep(wait)
+        await self._acquire_global(lane)
+
+        waited = time.monotonic() - started
+        stats = self._lane_stats[lane]
+        stats['requests'] += 1
+        if waited > 0.001:
+            stats['waited'] += 1
+            stats['wait_total'] += waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+
+    def pause(self, chat_id: Union[int, str, None], seconds: float):
+        """Пауза после 429: для чата, если он известен, иначе для всего бота"""
+        now = time.monotonic()
+        if chat_id is not None:
+            self._chat_bucket(chat_id).pause(now, seconds)
+        else:
+            self._global.pause(now, seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Глубина очередей и время ожидания по полосам"""
+        lanes = {}
+        for lane in LANES:
+            stats = self._lane_stats[lane]
+            lanes[lane] = {
+                'queued': sum(1 for waiter in self._queues[lane] if not waiter.done()),
+                'requests': stats['requests'],
+                'waited': stats['waited'],
+                'avg_wait_ms': round(stats['wait_total'] / stats['requests'] * 1000, 1) if stats['requests'] else 0.0,
+                'max_wait_ms': round(stats['wait_max'] * 1000, 1),
+            }
+        return {
+            'lanes': lanes,
+            'chat_buckets': len(self._chats),
+            'retry_after': self.retry_after_count,
+            'retried': self.retried,
+        }
+
+
+class RateLimitRequestMiddleware(BaseRequestMiddleware):
+    """Пропускает запросы бота через ApiRateLimiter и повторяет их после 429"""
+
+    def __init__(self, limiter: "ApiRateLimiter"):
+        self.limiter = limiter
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        lane = self.limiter.resolve_lane(method)
+        chat_id = getattr(method, 'chat_id', None)
+        send_chat_id = chat_id if self.limiter.is_chat_send(method) else None
+
+        attempt = 0
+        while True:
+            await self.limiter.acquire(lane, send_chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.limiter.retry_after_count += 1
+                self.limiter.pause(chat_id, e.retry_after)
+                if attempt >= self.limiter.max_retries or e.retry_after > self.limiter.max_retry_wait:
+                    raise
+                attempt += 1
+                self.limiter.retried += 1
+                logger.warning(
+                    f"Flood control на {type(method).__name__} (чат {chat_id}, полоса {lane}): "
+                    f"повтор через {e.retry_after} сек, попытка {attempt}/{self.limiter.max_retries}"
+                )
+                if chat_id is not None and send_chat_id is None:
+                    # Не отправка сообщения: лимит чата не ждется в acquire, ждем паузу здесь
+                    await asyncio.sleep(e.retry_after)
+
+
+# Глобальный планировщик запросов к Bot API
+api_rate_limiter = ApiRateLimiter(**RATE_LIMITS)
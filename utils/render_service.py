@@ -0,0 +1,229 @@
+"""
+Рендеринг изображений вне event loop
+
+Графики топа (2880×1620) и профиля рисовались Pillow и кодировались в PNG
+прямо в event loop: пока рисовался график, стояли обновления всех чатов.
+RenderService выполняет функции рендеринга из utils.image_generator в пуле
+процессов (ProcessPoolExecutor):
+- на вход - простые данные (статистика, байты аватарок), на выход - байты
+  изображения в формате профиля CHART_OUTPUT (PNG, WebP без потерь, JPEG);
+- очередь ограничена: если занятых и ожидающих задач больше workers + max_queue,
+  сразу выбрасывается RenderBusy, и обработчик отвечает текстом без картинки;
+- ожидание результата ограничено timeout (RenderTimeout);
+- метрики: длина очереди, время рендеринга в процессе и полное время ответа.
+
+Процессы создаются fork'ом (на Windows - spawn) при запуске бота (start), до
+открытия пулов БД и фоновых потоков.
+"""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.image_generator import make_output_profile, render_profile_card, render_top_chart
+
+try:
+    from config import RENDER
+except ImportError:
+    RENDER = {'workers': 2, 'max_queue': 8, 'timeout': 20}
+
+try:
+    from config import CHART_OUTPUT
+except ImportError:
+    CHART_OUTPUT = {'format': 'png', 'resolution': 'full', 'jpeg_quality': 92, 'png_compress_level': 6}
+
+logger = logging.getLogger(__name__)
+
+
+class RenderError(Exception):
+    """Изображение не получено - нужно ответить текстом"""
+
+
+class RenderBusy(RenderError):
+    """Пул рендеринга переполнен"""
+
+
+class RenderTimeout(RenderError):
+    """Рендеринг не уложился в timeout"""
+
+
+def _run_job(func: Callable[..., bytes], args: tuple) -> Tuple[bytes, float]:
+    """Выполняется в процессе пула: результат и время рендеринга"""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def _warm_up() -> bool:
+    return True
+
+
+class RenderService:
+    """Пул процессов для рендеринга графиков"""
+
+    def __init__(self, workers: int = 2, max_queue: int = 8, timeout: float = 20, output: dict = None):
+        self.workers = max(1, workers)
+        # Профиль кодирования графиков (формат и разрешение)
+        self.output = make_output_profile(output or {})
+        # Сколько задач может ждать свободный процесс сверх занятых
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Отправленные в пул и еще не завершенные задачи (включая оборвавшиеся по timeout)
+        self._in_flight = 0
+        self.stats = {
+            'submitted': 0, 'completed': 0, 'busy': 0, 'timeouts': 0, 'failures': 0,
+            'max_in_flight': 0, 'render_ms_total': 0.0, 'render_ms_max': 0.0,
+            'total_ms_total': 0.0, 'total_ms_max': 0.0,
+        }
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # fork недоступен на Windows - там процессы запускаются через spawn
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+
+    def start(self):
+        """Создать пул и сразу запустить процессы"""
+        if self._executor is not None:
+            return
+        self._executor = self._create_executor()
+        # С fork все процессы создаются при первой задаче - запускаем их сейчас
+        self._executor.submit(_warm_up).result()
+        logger.info(f"Пул рендеринга запущен: {self.workers} процессов, очередь {self.max_queue}")
+
+    def shutdown(self):
+        """Остановить пул (незавершенные задачи отменяются)"""
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def check_capacity(self):
+        """
+        Проверить, примет ли пул новую задачу (до подготовки данных для нее).
+
+        Raises:
+            RenderBusy: пул переполнен
+        """
+        if self._in_flight >= self.workers + self.max_queue:
+            self.stats['busy'] += 1
+            raise RenderBusy(f"Очередь рендеринга заполнена ({self._in_flight} задач)")
+
+    @property
+    def queue_length(self) -> int:
+        """Задачи, ожидающие свободного процесса"""
+        return max(0, self._in_flight - self.workers)
+
+    def _job_done(self):
+        self._in_flight -= 1
+
+    @staticmethod
+    def _call_in_loop(loop: asyncio.AbstractEventLoop, callback: Callable[[], None]):
+        # Колбэк future пула вызывается в его служебном потоке - счетчик меняем в event loop
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # Event loop уже закрыт (остановка бота)
+            pass
+
+    async def run(self, func: Callable[..., bytes], *args: Any) -> bytes:
+        """
+        Выполнить функцию рендеринга в пуле процессов.
+
+        Raises:
+            RenderBusy: пул переполнен
+            RenderTimeout: результат не получен за timeout
+            RenderError: пул не запущен или процесс завершился с ошибкой
+        """
+        self.check_capacity()
+        if self._executor is None:
+            # Пул не запущен при старте или пересоздается после сбоя процесса
+            self._executor = self._create_executor()
+
+        started = time.perf_counter()
+        try:
+            future = self._executor.submit(_run_job, func, args)
+        except BrokenProcessPool as e:
+            # Процесс пула упал - пересоздаем пул для следующих задач
+            logger.error(f"Пул рендеринга сломан, пересоздаем: {e}")
+            self._executor = None
+            self.stats['failures'] += 1
+            raise RenderError(str(e)) from e
+        self._in_flight += 1
+        self.stats['submitted'] += 1
+        self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self._in_flight)
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda _: self._call_in_loop(loop, self._job_done))
+
+        try:
+            result, render_seconds = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # Задача в процессе не прерывается, но ее результат уже не нужен
+            self.stats['timeouts'] += 1
+            raise RenderTimeout(f"Рендеринг {func.__name__} дольше {self.timeout} сек")
+        except BrokenProcessPool as e:
+            logger.error(f"Пул рендеринга сломан, пересоздаем: {e}")
+            self._executor = None
+            self.stats['failures'] += 1
+            raise RenderError(str(e)) from e
+        except Exception as e:
+            self.stats['failures'] += 1
+            raise RenderError(f"Ошибка рендеринга {func.__name__}: {e}") from e
+
+        render_ms = render_seconds * 1000
+        total_ms = (time.perf_counter() - started) * 1000
+        self.stats['completed'] += 1
+        self.stats['render_ms_total'] += render_ms
+        self.stats['render_ms_max'] = max(self.stats['render_ms_max'], render_ms)
+        self.stats['total_ms_total'] += total_ms
+        self.stats['total_ms_max'] = max(self.stats['total_ms_max'], total_ms)
+        return result
+
+    def filename(self, name: str) -> str:
+        """Имя файла графика с расширением формата вывода"""
+        return f"{name}.{self.output.extension}"
+
+    async def top_chart(self, top_users: List[Dict[str, Any]], title: str, subtitle: str,
+                        avatars: Dict[int, bytes]) -> bytes:
+        """Изображение графика топа пользователей"""
+        # В процесс передаются только нужные графику поля
+        users = [
+            {
+                'user_id': user['user_id'],
+                'message_count': user['message_count'],
+                'first_name': user.get('first_name'),
+                'username': user.get('username'),
+            }
+            for user in top_users
+        ]
+        return await self.run(render_top_chart, users, title, subtitle, avatars, self.output)
+
+    async def profile_card(self, monthly_stats: List[Dict[str, Any]]) -> bytes:
+        """Изображение графика активности пользователя за 30 дней"""
+        return await self.run(render_profile_card, [dict(day) for day in monthly_stats], self.output)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики рендеринга"""
+        completed = self.stats['completed']
+        return {
+            'workers': self.workers,
+            'in_flight': self._in_flight,
+            'queue_length': self.queue_length,
+            'max_in_flight': self.stats['max_in_flight'],
+            'submitted': self.stats['submitted'],
+            'completed': completed,
+            'busy': self.stats['busy'],
+            'timeouts': self.stats['timeouts'],
+            'failures': self.stats['failures'],
+            'avg_render_ms': round(self.stats['render_ms_total'] / completed, 1) if completed else 0.0,
+            'max_render_ms': round(self.stats['render_ms_max'], 1),
+            'avg_total_ms': round(self.stats['total_ms_total'] / completed, 1) if completed else 0.0,
+            'max_total_ms': round(self.stats['total_ms_max'], 1),
+        }
+
+
+# Глобальный пул рендеринга
+render_service = RenderService(**RENDER, output=CHART_OUTPUT)
@@ -0,0 +1,195 @@
+"""
+Поиск похожих сообщений для защиты от рейдов (MinHash + LSH)
+
+Для каждого текста строится MinHash-подпись по символьным шинглам
+(one permutation hashing: один хеш на шингл, подпись - минимумы по корзинам,
+пустые корзины заполняются соседними). Подписи недавних сообщений чата
+хранятся в LSH-индексе: подпись режется на полосы, сообщения с совпавшей
+полосой - кандидаты, их сходство (доля совпавших позиций подписи, оценка
+коэффициента Жаккара) сравнивается с similarity_threshold настроек рейдов.
+
+Индекс общий для всех пользователей чата, поэтому находит и повторы одного
+пользователя с небольшими изменениями, и одинаковый текст от разных аккаунтов.
+Вместе с подписью хранится id сообщения - при срабатывании удаляются все
+найденные похожие сообщения, а не только последнее.
+Проверка с добавлением - O(длина текста + число кандидатов), доли миллисекунды.
+"""
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Set, Tuple
+
+# Длина подписи, число полос и длина шингла
+NUM_HASHES = 32
+BANDS = 8
+ROWS = NUM_HASHES // BANDS
+SHINGLE_SIZE = 4
+
+# Более короткие тексты («+», «ок», «привет») сравниваются только точным совпадением
+MIN_TEXT_LENGTH = 12
+
+# Максимум сообщений в индексе одного чата (самые старые вытесняются)
+MAX_ENTRIES_PER_CHAT = 5000
+
+# Индекс чата без сообщений дольше этого удаляется при prune, секунд
+IDLE_SECONDS = 600
+
+_MASK = (1 << 64) - 1
+_EMPTY = 1 << 64
+
+
+def minhash_signature(text: str) -> Tuple[int, ...]:
+    """MinHash-подпись нормализованного текста по символьным шинглам"""
+    if len(text) <= SHINGLE_SIZE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+    signature = [_EMPTY] * NUM_HASHES
+    for shingle in shingles:
+        h = hash(shingle) & _MASK
+        slot = h % NUM_HASHES
+        value = h // NUM_HASHES
+        if value < signature[slot]:
+            signature[slot] = value
+
+    # Уплотнение: пустая корзина берет значение ближайшей непустой справа со сдвигом
+    if _EMPTY in signature:
+        for i in range(NUM_HASHES):
+            if signature[i] != _EMPTY:
+                continue
+            for distance in range(1, NUM_HASHES):
+                value = signature[(i + distance) % NUM_HASHES]
+                if value < _EMPTY:
+                    signature[i] = value + distance * _EMPTY
+                    break
+    return tuple(signature)
+
+
+def signature_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """Оценка коэффициента Жаккара по двум подписям"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+
+class SimilarMessages(NamedTuple):
+    """Похожие сообщения в окне (без текущего)"""
+    total: int
+    same_user: int
+    # Другие пользователи, отправившие похожий текст
+    other_users: int
+    # id похожих сообщений (и этого, и других пользователей)
+    message_ids: Tuple[int, ...] = ()
+
+
+class _ChatIndex:
+    """LSH-индекс недавних сообщений одного чата"""
+
+    __slots__ = ('entries', 'signatures', 'buckets', 'next_id')
+
+    def __init__(self):
+        # (время, id записи, ключи полос) в порядке поступления
+        self.entries: Deque[Tuple[float, int, List[tuple]]] = deque()
+        # id записи -> (user_id, подпись, message_id)
+        self.signatures: Dict[int, Tuple[int, Tuple[int, ...], Optional[int]]] = {}
+        # (номер полосы, значения полосы) -> id записей
+        self.buckets: Dict[tuple, Set[int]] = {}
+        self.next_id = 0
+
+    def pop_oldest(self):
+        _, entry_id, band_keys = self.entries.popleft()
+        del self.signatures[entry_id]
+        for key in band_keys:
+            bucket = self.buckets[key]
+            bucket.discard(entry_id)
+            if not bucket:
+                del self.buckets[key]
+
+
+class TextSimilarityIndex:
+    """LSH-индексы недавних сообщений по чатам"""
+
+    def __init__(self):
+        self._chats: Dict[int, _ChatIndex] = {}
+        self.checks = 0
+        self.check_time = 0.0
+
+    def check_and_add(self, chat_id: int, user_id: int, text: str, window_seconds: float,
+                      threshold: float, now: float = None, message_id: int = None) -> SimilarMessages:
+        """
+        Найти похожие сообщения чата за окно и добавить текущее в индекс.
+
+        Args:
+            text: нормализованный текст (RaidProtection._normalize_text)
+            threshold: минимальное сходство 0..1 (similarity_threshold)
+        """
+        started = time.perf_counter()
+        if now is None:
+            now = time.time()
+        index = self._chats.get(chat_id)
+        if index is None:
+            index = self._chats[chat_id] = _ChatIndex()
+
+        cutoff = now - window_seconds
+        entries = index.entries
+        while entries and (entries[0][0] < cutoff or len(entries) >= MAX_ENTRIES_PER_CHAT):
+            index.pop_oldest()
+
+        signature = minhash_signature(text)
+        band_keys = [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+        candidates: Set[int] = set()
+        for key in band_keys:
+            bucket = index.buckets.get(key)
+            if bucket:
+                candidates.update(bucket)
+
+        total = same_user = 0
+        other_users = set()
+        message_ids = []
+        for entry_id in candidates:
+            entry_user, entry_signature, entry_message_id = index.signatures[entry_id]
+            if signature_similarity(signature, entry_signature) < threshold:
+                continue
+            total += 1
+            if entry_message_id is not None:
+                message_ids.append(entry_message_id)
+            if entry_user == user_id:
+                same_user += 1
+            else:
+                other_users.add(entry_user)
+
+        entry_id = index.next_id
+        index.next_id += 1
+        entries.append((now, entry_id, band_keys))
+        index.signatures[entry_id] = (user_id, signature, message_id)
+        for key in band_keys:
+            index.buckets.setdefault(key, set()).add(entry_id)
+
+        self.checks += 1
+        self.check_time += time.perf_counter() - started
+        return SimilarMessages(total, same_user, len(other_users), tuple(message_ids))
+
+    def prune(self, now: float = None) -> int:
+        """Удалить индексы чатов без сообщений за IDLE_SECONDS. Возвращает число удаленных"""
+        if now is None:
+            now = time.time()
+        cutoff = now - IDLE_SECONDS
+        stale = [
+            chat_id for chat_id, index in self._chats.items()
+            if not index.entries or index.entries[-1][0] < cutoff
+        ]
+        for chat_id in stale:
+            del self._chats[chat_id]
+        return len(stale)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики индекса: среднее время проверки в микросекундах"""
+        return {
+            'chats': len(self._chats),
+            'entries': sum(len(index.entries) for index in self._chats.values()),
+            'checks': self.checks,
+            'avg_check_us': round(self.check_time / self.checks * 1e6, 1) if self.checks else 0.0,
+        }
+
+
+# Глобальный индекс похожих сообщений
+text_similarity = TextSimilarityIndex()